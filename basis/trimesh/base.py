@@ -26,6 +26,7 @@ from . import units
 
 from .io.export import export_mesh
 from .ray.ray_mesh import RayMeshIntersector, contains_points
+from .bvh import BVH
 from .voxel import Voxel
 from .points import transform_points
 from .constants import log, _log_time, tol
@@ -409,6 +410,20 @@ class Trimesh(object):
         self._cache['triangles'] = triangles
         return triangles
 
+    @property
+    def bvh(self):
+        """
+        A bounding volume hierarchy of the triangles for mesh-mesh, closest point, and ray queries.
+        It is built on the first access and cached until the mesh is changed
+        :return bvh: BVH
+        """
+        cached = self._cache['bvh']
+        if cached is not None:
+            return cached
+        bvh = BVH(self.triangles)
+        self._cache['bvh'] = bvh
+        return bvh
+
     def triangles_tree(self):
         """
         An R-tree containing each face of the mesh.
@@ -0,0 +1,548 @@
+"""
+A bounding volume hierarchy (aabb tree) over the triangles of a mesh, kept in flat numpy arrays
+The queries traverse the tree breadth first on arrays of (query, node) pairs,
+so that many rays, points, or triangle pairs are processed at once without python loops over the triangles
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+_CHUNK_SIZE = 50000  # maximum number of triangle pairs tested at once, bounds the memory of the narrow phase
+_POINT_CHUNK_SIZE = 5000  # maximum number of points traversed at once by closest_points
+_DISTANCE_CHUNK_SIZE = 1024  # triangle pairs computed at once by min_distance, in the order of their lower bounds
+_N_SEEDS = 8  # number of triangle pairs with the nearest centroids that give the initial bound of min_distance
+
+
+class BVH(object):
+
+    def __init__(self, triangles, leaf_size=4):
+        """
+        build the tree by recursively splitting the triangles at the median of their centroids
+        along the longest axis of the centroid bounds
+        :param triangles: nx3x3 nparray
+        :param leaf_size: maximum number of triangles in a leaf
+        """
+        self.triangles = np.array(triangles, dtype=np.float64).reshape(-1, 3, 3)
+        tri_mins = self.triangles.min(axis=1)
+        tri_maxs = self.triangles.max(axis=1)
+        centroids = self.triangles.mean(axis=1)
+        self.tri_ids = np.arange(len(self.triangles))  # reordered so that each node owns a contiguous range
+        node_mins, node_maxs, node_children, node_starts, node_counts = [], [], [], [], []
+        stack = [(0, len(self.triangles), -1, 0)]  # start, end, parent node id, child slot in the parent
+        while len(stack) > 0:
+            start, end, parent_id, slot = stack.pop()
+            node_id = len(node_mins)
+            if parent_id >= 0:
+                node_children[parent_id][slot] = node_id
+            ids = self.tri_ids[start:end]
+            node_mins.append(tri_mins[ids].min(axis=0) if end > start else np.zeros(3))
+            node_maxs.append(tri_maxs[ids].max(axis=0) if end > start else np.zeros(3))
+            node_children.append([-1, -1])
+            node_starts.append(start)
+            node_counts.append(end - start)
+            if end - start <= leaf_size:
+                continue
+            extents = centroids[ids].max(axis=0) - centroids[ids].min(axis=0)
+            axis = np.argmax(extents)
+            if extents[axis] <= 0:  # the centroids coincide and cannot be split
+                continue
+            mid = (end - start) // 2
+            self.tri_ids[start:end] = ids[np.argpartition(centroids[ids, axis], mid)]
+            stack.append((start + mid, end, node_id, 1))
+            stack.append((start, start + mid, node_id, 0))
+        self.node_mins = np.array(node_mins)
+        self.node_maxs = np.array(node_maxs)
+        self.node_children = np.array(node_children, dtype=int)
+        self.node_starts = np.array(node_starts, dtype=int)
+        self.node_counts = np.array(node_counts, dtype=int)
+        self._centroid_tree = None
+
+    def _leaf_tri_ids(self, query_ids, node_ids):
+        """
+        expand (query, leaf) pairs into (query, triangle) pairs
+        :return: query_ids, tri_ids
+        """
+        counts = self.node_counts[node_ids]
+        pair_ids = np.repeat(np.arange(len(node_ids)), counts)
+        offsets = np.arange(len(pair_ids)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return query_ids[pair_ids], self.tri_ids[self.node_starts[node_ids][pair_ids] + offsets]
+
+    def _traverse(self, query_ids, is_overlapped_fn, leaf_fn):
+        """
+        breadth first traversal of (query, node) pairs
+        :param query_ids: the queries start from the root
+        :param is_overlapped_fn: is_overlapped_fn(query_ids, node_ids) returns a bool nparray, false pairs are pruned
+        :param leaf_fn: leaf_fn(query_ids, tri_ids) is called for the triangles of the reached leaves,
+                        the traversal stops if it returns True
+        :return: True if leaf_fn stopped the traversal
+        """
+        node_ids = np.zeros(len(query_ids), dtype=int)
+        while len(query_ids) > 0:
+            is_kept = is_overlapped_fn(query_ids, node_ids)
+            query_ids, node_ids = query_ids[is_kept], node_ids[is_kept]
+            is_leaf = self.node_children[node_ids, 0] < 0
+            if np.any(is_leaf):
+                if leaf_fn(*self._leaf_tri_ids(query_ids[is_leaf], node_ids[is_leaf])):
+                    return True
+            query_ids = np.repeat(query_ids[~is_leaf], 2)
+            node_ids = self.node_children[node_ids[~is_leaf]].ravel()
+        return False
+
+    def is_collided(self, other, homomat=np.eye(4), other_homomat=np.eye(4), toggle_contacts=False):
+        """
+        check if the triangles of two meshes intersect
+        :param other: BVH
+        :param homomat: the pose of self
+        :param other_homomat: the pose of other
+        :param toggle_contacts: return the intersection points of the triangle edges if True
+        :return: bool, or [bool, a list of contact points] if toggle_contacts
+        """
+        # work in the frame of self
+        rel_homomat = np.linalg.solve(homomat, other_homomat)
+        rotmat, pos = rel_homomat[:3, :3], rel_homomat[:3, 3]
+        other_triangles = other.triangles @ rotmat.T + pos
+        tri_mins, tri_maxs = self.triangles.min(axis=1), self.triangles.max(axis=1)
+        other_tri_mins, other_tri_maxs = other_triangles.min(axis=1), other_triangles.max(axis=1)
+        other_centers = (other.node_mins + other.node_maxs) / 2 @ rotmat.T + pos
+        other_loc_half_extents = (other.node_maxs - other.node_mins) / 2
+        other_half_extents = other_loc_half_extents @ np.abs(rotmat).T
+        centers = (self.node_mins + self.node_maxs) / 2
+        half_extents = (self.node_maxs - self.node_mins) / 2
+        node_volumes = np.prod(self.node_maxs - self.node_mins, axis=1)
+        other_node_volumes = np.prod(other.node_maxs - other.node_mins, axis=1)
+        contact_points = []
+        node_ids = np.zeros(1, dtype=int)
+        other_node_ids = np.zeros(1, dtype=int)
+        while len(node_ids) > 0:
+            is_overlapped = np.all(
+                (self.node_mins[node_ids] <= other_centers[other_node_ids] + other_half_extents[other_node_ids]) &
+                (other_centers[other_node_ids] - other_half_extents[other_node_ids] <= self.node_maxs[node_ids]),
+                axis=1)
+            node_ids, other_node_ids = node_ids[is_overlapped], other_node_ids[is_overlapped]
+            # the axes of other are also tested, the aabbs of rotated nodes are loose
+            offsets = (other_centers[other_node_ids] - centers[node_ids]) @ rotmat
+            is_overlapped = np.all(np.abs(offsets) <= other_loc_half_extents[other_node_ids] +
+                                   half_extents[node_ids] @ np.abs(rotmat), axis=1)
+            node_ids, other_node_ids = node_ids[is_overlapped], other_node_ids[is_overlapped]
+            is_leaf = self.node_children[node_ids, 0] < 0
+            is_other_leaf = other.node_children[other_node_ids, 0] < 0
+            is_leaf_pair = is_leaf & is_other_leaf
+            if np.any(is_leaf_pair):
+                tri_pairs = _leaf_pairs_to_tri_pairs(self, node_ids[is_leaf_pair], other, other_node_ids[is_leaf_pair])
+                for tri_ids, other_tri_ids in tri_pairs:
+                    is_overlapped = np.all((tri_mins[tri_ids] <= other_tri_maxs[other_tri_ids]) &
+                                           (other_tri_mins[other_tri_ids] <= tri_maxs[tri_ids]), axis=1)
+                    tri_ids, other_tri_ids = tri_ids[is_overlapped], other_tri_ids[is_overlapped]
+                    is_intersected = is_triangles_intersected(self.triangles[tri_ids], other_triangles[other_tri_ids])
+                    if not np.any(is_intersected):
+                        continue
+                    if not toggle_contacts:
+                        return True
+                    contact_points += list(gen_triangles_intersection_points(self.triangles[tri_ids[is_intersected]],
+                                                                             other_triangles[
+                                                                                 other_tri_ids[is_intersected]]))
+            # split the larger internal node of each pair
+            is_split = ~is_leaf & (is_other_leaf | (node_volumes[node_ids] >= other_node_volumes[other_node_ids]))
+            is_other_split = ~is_leaf_pair & ~is_split
+            node_ids, other_node_ids = (np.concatenate([self.node_children[node_ids[is_split]].ravel(),
+                                                        np.repeat(node_ids[is_other_split], 2)]),
+                                        np.concatenate([np.repeat(other_node_ids[is_split], 2),
+                                                        other.node_children[other_node_ids[is_other_split]].ravel()]))
+        if toggle_contacts:
+            if len(contact_points) > 0:
+                contact_points = list(np.array(contact_points) @ homomat[:3, :3].T + homomat[:3, 3])
+            return len(contact_points) > 0, contact_points
+        return False
+
+    def ray_hits(self, origins, directions, max_distances=None):
+        """
+        all intersections of the rays and the triangles
+        :param origins: nx3 nparray
+        :param directions: nx3 nparray, normalized inside
+        :param max_distances: n nparray or None, the rays become segments if given
+        :return: [ray_ids, tri_ids, distances, locations], sorted by ray_ids and then by distances
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        directions = directions / np.linalg.norm(directions, axis=1, keepdims=True)
+        if max_distances is None:
+            max_distances = np.full(len(origins), np.inf)
+        max_distances = np.broadcast_to(np.asarray(max_distances, dtype=np.float64), (len(origins),))
+        with np.errstate(divide='ignore'):
+            inv_directions = 1 / directions
+        hits = []
+
+        def is_overlapped_fn(ray_ids, node_ids):
+            with np.errstate(invalid='ignore'):
+                t0 = (self.node_mins[node_ids] - origins[ray_ids]) * inv_directions[ray_ids]
+                t1 = (self.node_maxs[node_ids] - origins[ray_ids]) * inv_directions[ray_ids]
+            # fmin/fmax ignore the nans of rays lying on a slab plane
+            t_near = np.fmax.reduce(np.fmin(t0, t1), axis=1)
+            t_far = np.fmin.reduce(np.fmax(t0, t1), axis=1)
+            return (t_far >= np.maximum(t_near, 0)) & (t_near <= max_distances[ray_ids])
+
+        def leaf_fn(ray_ids, tri_ids):
+            distances = ray_triangle_distances(origins[ray_ids], directions[ray_ids], self.triangles[tri_ids])
+            is_hit = np.isfinite(distances) & (distances <= max_distances[ray_ids])
+            hits.append((ray_ids[is_hit], tri_ids[is_hit], distances[is_hit]))
+            return False
+
+        self._traverse(np.arange(len(origins)), is_overlapped_fn, leaf_fn)
+        ray_ids, tri_ids, distances = [np.concatenate(hit) for hit in zip(*hits)] if len(hits) > 0 else \
+            (np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0))
+        order = np.lexsort((distances, ray_ids))
+        ray_ids, tri_ids, distances = ray_ids[order], tri_ids[order], distances[order]
+        return ray_ids, tri_ids, distances, origins[ray_ids] + directions[ray_ids] * distances[:, None]
+
+    def closest_points(self, points):
+        """
+        the closest points on the triangles
+        :param points: nx3 nparray
+        :return: [closest_points, distances, tri_ids]
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if len(points) > _POINT_CHUNK_SIZE:
+            results = [self.closest_points(points[i:i + _POINT_CHUNK_SIZE])
+                       for i in range(0, len(points), _POINT_CHUNK_SIZE)]
+            return [np.concatenate(values) for values in zip(*results)]
+        # the triangles with the nearest centroids give the initial upper bounds of the distances
+        if self._centroid_tree is None:
+            self._centroid_tree = cKDTree(self.triangles.mean(axis=1))
+        _, best_tri_ids = self._centroid_tree.query(points)
+        best_points = closest_points_on_triangles(self.triangles[best_tri_ids], points)
+        best_sq_distances = np.sum((best_points - points) ** 2, axis=1)
+
+        def is_overlapped_fn(point_ids, node_ids):
+            gaps = np.maximum(np.maximum(self.node_mins[node_ids] - points[point_ids],
+                                         points[point_ids] - self.node_maxs[node_ids]), 0)
+            return np.sum(gaps ** 2, axis=1) <= best_sq_distances[point_ids]
+
+        tri_mins = self.triangles.min(axis=1)
+        tri_maxs = self.triangles.max(axis=1)
+
+        def leaf_fn(point_ids, tri_ids):
+            # the aabbs of the triangles are compared before computing the closest points
+            gaps = np.maximum(np.maximum(tri_mins[tri_ids] - points[point_ids], points[point_ids] - tri_maxs[tri_ids]), 0)
+            is_candidate = np.sum(gaps ** 2, axis=1) <= best_sq_distances[point_ids]
+            point_ids, tri_ids = point_ids[is_candidate], tri_ids[is_candidate]
+            candidates = closest_points_on_triangles(self.triangles[tri_ids], points[point_ids])
+            sq_distances = np.sum((candidates - points[point_ids]) ** 2, axis=1)
+            order = np.lexsort((sq_distances, point_ids))
+            point_ids, first_ids = np.unique(point_ids[order], return_index=True)
+            first_ids = order[first_ids]
+            is_closer = sq_distances[first_ids] < best_sq_distances[point_ids]
+            point_ids, first_ids = point_ids[is_closer], first_ids[is_closer]
+            best_sq_distances[point_ids] = sq_distances[first_ids]
+            best_points[point_ids] = candidates[first_ids]
+            best_tri_ids[point_ids] = tri_ids[first_ids]
+            return False
+
+        self._traverse(np.arange(len(points)), is_overlapped_fn, leaf_fn)
+        return best_points, np.sqrt(best_sq_distances), best_tri_ids
+
+    def min_distance(self, other, homomat=np.eye(4), other_homomat=np.eye(4), max_distance=np.inf):
+        """
+        the minimum distance between the triangles of two meshes, by branch and bound over pairs of nodes
+        the aabb distances of the nodes are the lower bounds, the closest triangle pairs found so far the upper bound
+        :param other: BVH
+        :param homomat: the pose of self
+        :param other_homomat: the pose of other
+        :param max_distance: pairs farther than max_distance are not refined
+        :return: [distance, point, other_point], the points are on self and other in the world frame;
+                 [np.inf, None, None] if the meshes are farther than max_distance
+        """
+        # work in the frame of self
+        rel_homomat = np.linalg.solve(homomat, other_homomat)
+        rotmat, pos = rel_homomat[:3, :3], rel_homomat[:3, 3]
+        other_triangles = other.triangles @ rotmat.T + pos
+        # the triangles with the nearest centroids give the initial upper bound
+        if self._centroid_tree is None:
+            self._centroid_tree = cKDTree(self.triangles.mean(axis=1))
+        seed_distances, seed_tri_ids = self._centroid_tree.query(other_triangles.mean(axis=1))
+        seed_other_tri_ids = np.argsort(seed_distances)[:_N_SEEDS]
+        seed_tri_ids = seed_tri_ids[seed_other_tri_ids]
+        points, other_points, distances = closest_points_between_triangles(self.triangles[seed_tri_ids],
+                                                                           other_triangles[seed_other_tri_ids])
+        best_id = np.argmin(distances)
+        best = [distances[best_id], points[best_id], other_points[best_id]]
+        upper_bound = min(best[0], max_distance)
+        tri_mins, tri_maxs = self.triangles.min(axis=1), self.triangles.max(axis=1)
+        other_tri_mins, other_tri_maxs = other_triangles.min(axis=1), other_triangles.max(axis=1)
+        other_centers = (other.node_mins + other.node_maxs) / 2 @ rotmat.T + pos
+        other_half_extents = (other.node_maxs - other.node_mins) / 2 @ np.abs(rotmat).T
+        other_mins, other_maxs = other_centers - other_half_extents, other_centers + other_half_extents
+        node_volumes = np.prod(self.node_maxs - self.node_mins, axis=1)
+        other_node_volumes = np.prod(other.node_maxs - other.node_mins, axis=1)
+        # a vertex of each node, the distances between the vertices of node pairs tighten the upper bound early
+        node_vertices = self.triangles[self.tri_ids[self.node_starts], 0]
+        other_node_vertices = other_triangles[other.tri_ids[other.node_starts], 0]
+        node_ids = np.zeros(1, dtype=int)
+        other_node_ids = np.zeros(1, dtype=int)
+        while len(node_ids) > 0 and upper_bound > 0:
+            upper_bound = min(upper_bound, np.min(np.linalg.norm(node_vertices[node_ids] -
+                                                                 other_node_vertices[other_node_ids], axis=1)))
+            lower_bounds = _aabb_distances(self.node_mins[node_ids], self.node_maxs[node_ids],
+                                           other_mins[other_node_ids], other_maxs[other_node_ids])
+            is_kept = lower_bounds <= upper_bound
+            node_ids, other_node_ids = node_ids[is_kept], other_node_ids[is_kept]
+            is_leaf = self.node_children[node_ids, 0] < 0
+            is_other_leaf = other.node_children[other_node_ids, 0] < 0
+            is_leaf_pair = is_leaf & is_other_leaf
+            if np.any(is_leaf_pair):
+                tri_ids, other_tri_ids = [np.concatenate(ids) for ids in zip(*_leaf_pairs_to_tri_pairs(
+                    self, node_ids[is_leaf_pair], other, other_node_ids[is_leaf_pair]))]
+                lower_bounds = _aabb_distances(tri_mins[tri_ids], tri_maxs[tri_ids],
+                                               other_tri_mins[other_tri_ids], other_tri_maxs[other_tri_ids])
+                # the nearer pairs are computed first, their distances prune the farther ones
+                order = np.argsort(lower_bounds)
+                for start in range(0, len(order), _DISTANCE_CHUNK_SIZE):
+                    chunk = order[start:start + _DISTANCE_CHUNK_SIZE]
+                    chunk = chunk[lower_bounds[chunk] <= upper_bound]
+                    if len(chunk) == 0:
+                        break
+                    chunk = chunk[_triangle_pair_lower_bounds(self.triangles[tri_ids[chunk]],
+                                                              other_triangles[other_tri_ids[chunk]]) <= upper_bound]
+                    if len(chunk) == 0:
+                        continue
+                    points, other_points, distances = closest_points_between_triangles(
+                        self.triangles[tri_ids[chunk]], other_triangles[other_tri_ids[chunk]])
+                    best_id = np.argmin(distances)
+                    if distances[best_id] < best[0]:
+                        best = [distances[best_id], points[best_id], other_points[best_id]]
+                        upper_bound = min(best[0], upper_bound)
+            # split the larger internal node of each pair
+            is_split = ~is_leaf & (is_other_leaf | (node_volumes[node_ids] >= other_node_volumes[other_node_ids]))
+            is_other_split = ~is_leaf_pair & ~is_split
+            node_ids, other_node_ids = (np.concatenate([self.node_children[node_ids[is_split]].ravel(),
+                                                        np.repeat(node_ids[is_other_split], 2)]),
+                                        np.concatenate([np.repeat(other_node_ids[is_split], 2),
+                                                        other.node_children[other_node_ids[is_other_split]].ravel()]))
+        if best[0] > max_distance:
+            return np.inf, None, None
+        return (best[0], homomat[:3, :3] @ best[1] + homomat[:3, 3], homomat[:3, :3] @ best[2] + homomat[:3, 3])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_centroid_tree'] = None
+        return state
+
+
+def _leaf_pairs_to_tri_pairs(bvh, node_ids, other_bvh, other_node_ids):
+    """
+    expand pairs of leaves into chunks of triangle pairs
+    :return: a generator of [tri_ids, other_tri_ids]
+    """
+    pair_ids, tri_ids = bvh._leaf_tri_ids(np.arange(len(node_ids)), node_ids)
+    counts = other_bvh.node_counts[other_node_ids][pair_ids]
+    expanded_ids = np.repeat(np.arange(len(pair_ids)), counts)
+    offsets = np.arange(len(expanded_ids)) - np.repeat(np.cumsum(counts) - counts, counts)
+    tri_ids = tri_ids[expanded_ids]
+    other_tri_ids = other_bvh.tri_ids[other_bvh.node_starts[other_node_ids][pair_ids][expanded_ids] + offsets]
+    for start in range(0, len(tri_ids), _CHUNK_SIZE):
+        yield tri_ids[start:start + _CHUNK_SIZE], other_tri_ids[start:start + _CHUNK_SIZE]
+
+
+def _aabb_distances(mins_a, maxs_a, mins_b, maxs_b):
+    """
+    the distances between n pairs of aabbs, 0 for overlapped ones
+    """
+    return np.linalg.norm(np.maximum(np.maximum(mins_a - maxs_b, mins_b - maxs_a), 0), axis=1)
+
+
+def _is_plane_separated(triangles0, triangles1, eps):
+    """
+    are the vertices of triangles1 strictly on one side of the planes of triangles0
+    """
+    normals0 = np.cross(triangles0[:, 1] - triangles0[:, 0], triangles0[:, 2] - triangles0[:, 0])
+    signed_dists = np.einsum('nvd,nd->nv', triangles1 - triangles0[:, :1], normals0)
+    return np.all(signed_dists > eps, axis=1) | np.all(signed_dists < -eps, axis=1)
+
+
+def is_triangles_intersected(triangles0, triangles1, eps=1e-12):
+    """
+    separating axis test of n pairs of triangles
+    the axes are the two normals, the nine cross products of the edges, and the in-plane normals of the six edges
+    (the last ones separate coplanar triangles); the pairs are prefiltered by their aabbs and the two normals
+    :param triangles0: nx3x3 nparray
+    :param triangles1: nx3x3 nparray
+    :return: n bool nparray
+    """
+    is_intersected = np.all((triangles0.min(axis=1) <= triangles1.max(axis=1)) &
+                            (triangles1.min(axis=1) <= triangles0.max(axis=1)), axis=1)
+    candidate_ids = np.flatnonzero(is_intersected)
+    is_separated = _is_plane_separated(triangles0[candidate_ids], triangles1[candidate_ids], eps)
+    candidate_ids = candidate_ids[~is_separated]
+    is_separated = _is_plane_separated(triangles1[candidate_ids], triangles0[candidate_ids], eps)
+    is_intersected[:] = False
+    candidate_ids = candidate_ids[~is_separated]
+    if len(candidate_ids) == 0:
+        return is_intersected
+    triangles0, triangles1 = triangles0[candidate_ids], triangles1[candidate_ids]
+    edges0 = np.roll(triangles0, -1, axis=1) - triangles0
+    edges1 = np.roll(triangles1, -1, axis=1) - triangles1
+    normals0 = np.cross(edges0[:, 0], edges0[:, 1])
+    normals1 = np.cross(edges1[:, 0], edges1[:, 1])
+    axes = np.concatenate([np.cross(edges0[:, :, None, :], edges1[:, None, :, :]).reshape(-1, 9, 3),
+                           np.cross(normals0[:, None, :], edges0),
+                           np.cross(normals1[:, None, :], edges1)], axis=1)
+    # degenerated axes (parallel edges) are ignored by zeroing them
+    axis_lengths = np.linalg.norm(axes, axis=2, keepdims=True)
+    axes = np.divide(axes, axis_lengths, out=np.zeros_like(axes), where=axis_lengths > eps)
+    projections0 = np.einsum('nkd,nvd->nkv', axes, triangles0)
+    projections1 = np.einsum('nkd,nvd->nkv', axes, triangles1)
+    is_separated = (projections0.max(axis=2) < projections1.min(axis=2) - eps) | \
+                   (projections1.max(axis=2) < projections0.min(axis=2) - eps)
+    is_intersected[candidate_ids] = ~np.any(is_separated, axis=1)
+    return is_intersected
+
+
+def ray_triangle_distances(origins, directions, triangles, eps=1e-12):
+    """
+    moller-trumbore intersection of n pairs of rays and triangles
+    :param origins: nx3 nparray
+    :param directions: nx3 nparray
+    :param triangles: nx3x3 nparray
+    :return: n nparray, the distances along the directions (in the unit of the directions), inf if missed
+    """
+    edges1 = triangles[:, 1] - triangles[:, 0]
+    edges2 = triangles[:, 2] - triangles[:, 0]
+    p = np.cross(directions, edges2)
+    det = np.sum(edges1 * p, axis=1)
+    is_valid = np.abs(det) > eps
+    inv_det = np.divide(1, det, out=np.zeros_like(det), where=is_valid)
+    s = origins - triangles[:, 0]
+    u = np.sum(s * p, axis=1) * inv_det
+    q = np.cross(s, edges1)
+    v = np.sum(directions * q, axis=1) * inv_det
+    t = np.sum(edges2 * q, axis=1) * inv_det
+    is_hit = is_valid & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0)
+    return np.where(is_hit, t, np.inf)
+
+
+def gen_triangles_intersection_points(triangles0, triangles1):
+    """
+    the points where the edges of each triangle pierce the other one
+    :param triangles0: nx3x3 nparray
+    :param triangles1: nx3x3 nparray
+    :return: mx3 nparray
+    """
+    intersection_points = []
+    for triangles_a, triangles_b in [(triangles0, triangles1), (triangles1, triangles0)]:
+        starts = triangles_a.reshape(-1, 3)
+        edges = (np.roll(triangles_a, -1, axis=1) - triangles_a).reshape(-1, 3)
+        distances = ray_triangle_distances(starts, edges, np.repeat(triangles_b, 3, axis=0))
+        is_hit = distances <= 1
+        intersection_points.append(starts[is_hit] + edges[is_hit] * distances[is_hit, None])
+    return np.concatenate(intersection_points)
+
+
+def closest_points_on_triangles(triangles, points):
+    """
+    the closest points on n triangles to n points, following the voronoi regions in Ericson's real-time cd
+    :param triangles: nx3x3 nparray
+    :param points: nx3 nparray
+    :return: nx3 nparray
+    """
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    ab, ac = b - a, c - a
+    ap, bp, cp = points - a, points - b, points - c
+    d1, d2 = np.sum(ab * ap, axis=1), np.sum(ac * ap, axis=1)
+    d3, d4 = np.sum(ab * bp, axis=1), np.sum(ac * bp, axis=1)
+    d5, d6 = np.sum(ab * cp, axis=1), np.sum(ac * cp, axis=1)
+    va, vb, vc = d3 * d6 - d5 * d4, d5 * d2 - d1 * d6, d1 * d4 - d3 * d2
+    results = np.empty_like(points)
+    is_done = np.zeros(len(points), dtype=bool)
+
+    def fill(selection, values_fn):
+        selection &= ~is_done
+        results[selection] = values_fn(selection)
+        is_done[selection] = True
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fill((d1 <= 0) & (d2 <= 0), lambda s: a[s])
+        fill((d3 >= 0) & (d4 <= d3), lambda s: b[s])
+        fill((d6 >= 0) & (d5 <= d6), lambda s: c[s])
+        fill((vc <= 0) & (d1 >= 0) & (d3 <= 0), lambda s: a[s] + (d1[s] / (d1[s] - d3[s]))[:, None] * ab[s])
+        fill((vb <= 0) & (d2 >= 0) & (d6 <= 0), lambda s: a[s] + (d2[s] / (d2[s] - d6[s]))[:, None] * ac[s])
+        fill((va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0),
+             lambda s: b[s] + ((d4[s] - d3[s]) / ((d4[s] - d3[s]) + (d5[s] - d6[s])))[:, None] * (c[s] - b[s]))
+        denom = va + vb + vc
+        fill(np.ones(len(points), dtype=bool),
+             lambda s: a[s] + (vb[s] / denom[s])[:, None] * ab[s] + (vc[s] / denom[s])[:, None] * ac[s])
+    return results
+
+
+def _triangle_pair_lower_bounds(triangles0, triangles1):
+    """
+    lower bounds of the distances of n pairs of triangles: the distance from the centroid of the smaller triangle
+    to the larger one minus the radius of the smaller one; tight when the triangles differ much in size
+    """
+    centroids0, centroids1 = triangles0.mean(axis=1), triangles1.mean(axis=1)
+    radii0 = np.linalg.norm(triangles0 - centroids0[:, None], axis=2).max(axis=1)
+    radii1 = np.linalg.norm(triangles1 - centroids1[:, None], axis=2).max(axis=1)
+    is_smaller0 = radii0 <= radii1
+    centroids = np.where(is_smaller0[:, None], centroids0, centroids1)
+    larger_triangles = np.where(is_smaller0[:, None, None], triangles1, triangles0)
+    distances = np.linalg.norm(closest_points_on_triangles(larger_triangles, centroids) - centroids, axis=1)
+    return distances - np.minimum(radii0, radii1)
+
+
+def closest_points_between_segments(starts0, ends0, starts1, ends1, eps=1e-12):
+    """
+    the closest points of n pairs of segments, following Ericson's real-time cd; degenerated segments are points
+    :param starts0: nx3 nparray
+    :param ends0: nx3 nparray
+    :param starts1: nx3 nparray
+    :param ends1: nx3 nparray
+    :return: [points0, points1], nx3 nparrays
+    """
+    d0, d1, r = ends0 - starts0, ends1 - starts1, starts0 - starts1
+    a, e = np.sum(d0 * d0, axis=1), np.sum(d1 * d1, axis=1)
+    b, c, f = np.sum(d0 * d1, axis=1), np.sum(d0 * r, axis=1), np.sum(d1 * r, axis=1)
+    is_valid0, is_valid1 = a > eps, e > eps
+    safe_a, safe_e = np.where(is_valid0, a, 1), np.where(is_valid1, e, 1)
+    denom = a * e - b * b
+    # parallel segments start from s=0
+    s = np.where(denom > eps, np.clip((b * f - c * e) / np.where(denom > eps, denom, 1), 0, 1), 0)
+    s = np.where(is_valid1, s, np.clip(-c / safe_a, 0, 1))
+    t = np.where(is_valid1, (b * s + f) / safe_e, 0)
+    # clamp t and recompute s
+    s = np.where(t < 0, np.clip(-c / safe_a, 0, 1), np.where(t > 1, np.clip((b - c) / safe_a, 0, 1), s))
+    t = np.clip(t, 0, 1)
+    s = np.where(is_valid0, s, 0)
+    t = np.where(is_valid0, t, np.where(is_valid1, np.clip(f / safe_e, 0, 1), 0))
+    return starts0 + s[:, None] * d0, starts1 + t[:, None] * d1
+
+
+def closest_points_between_triangles(triangles0, triangles1):
+    """
+    the closest points of n pairs of triangles
+    the closest points of separated triangles are either a vertex and its closest point on the other triangle,
+    or the closest points of two edges; intersected triangles have a distance of 0,
+    their points are both set to the middle of the closest features found
+    :param triangles0: nx3x3 nparray
+    :param triangles1: nx3x3 nparray
+    :return: [points0, points1, distances]
+    """
+    n = len(triangles0)
+    # vertices of triangles0 against triangles1 and vice versa
+    vertices0 = triangles0.reshape(-1, 3)
+    vertices1 = triangles1.reshape(-1, 3)
+    on_triangles1 = closest_points_on_triangles(np.repeat(triangles1, 3, axis=0), vertices0).reshape(n, 3, 3)
+    on_triangles0 = closest_points_on_triangles(np.repeat(triangles0, 3, axis=0), vertices1).reshape(n, 3, 3)
+    # the nine pairs of edges
+    edge_ids0, edge_ids1 = np.repeat(np.arange(3), 3), np.tile(np.arange(3), 3)
+    starts0, ends0 = triangles0[:, edge_ids0], triangles0[:, (edge_ids0 + 1) % 3]
+    starts1, ends1 = triangles1[:, edge_ids1], triangles1[:, (edge_ids1 + 1) % 3]
+    on_edges0, on_edges1 = closest_points_between_segments(starts0.reshape(-1, 3), ends0.reshape(-1, 3),
+                                                           starts1.reshape(-1, 3), ends1.reshape(-1, 3))
+    candidates0 = np.concatenate([triangles0, on_triangles0, on_edges0.reshape(n, 9, 3)], axis=1)
+    candidates1 = np.concatenate([on_triangles1, triangles1, on_edges1.reshape(n, 9, 3)], axis=1)
+    sq_distances = np.sum((candidates0 - candidates1) ** 2, axis=2)
+    best_ids = np.argmin(sq_distances, axis=1)
+    points0 = candidates0[np.arange(n), best_ids]
+    points1 = candidates1[np.arange(n), best_ids]
+    distances = np.sqrt(sq_distances[np.arange(n), best_ids])
+    is_intersected = is_triangles_intersected(triangles0, triangles1)
+    points0[is_intersected] = points1[is_intersected] = (points0[is_intersected] + points1[is_intersected]) / 2
+    distances[is_intersected] = 0
+    return points0, points1, distances
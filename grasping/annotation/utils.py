@@ -186,7 +186,7 @@ if __name__ == '__main__':
                                                  gl_rotation_ax=np.array([0, 0, 1]))
     for grasp_info in grasp_info_list:
         jaw_width, jaw_center_pos, jaw_center_rotmat, hnd_pos, hnd_rotmat = grasp_info
-        gic = gripper_s.copy()
+        gic = gripper_s.clone()
         gic.grip_at_with_jcpose(jaw_center_pos, jaw_center_rotmat, jaw_width)
         gic.gen_meshmodel().attach_to(base)
     base.run()
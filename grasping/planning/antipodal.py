@@ -127,7 +127,7 @@ if __name__ == '__main__':
     grasp_info_list = plan_grasps(gripper_s, objcm, min_dist_between_sampled_contact_points=.02)
     for grasp_info in grasp_info_list:
         jaw_width, gl_jaw_center_pos, gl_jaw_center_rotmat, hnd_pos, hnd_rotmat = grasp_info
-        gic = gripper_s.copy()
+        gic = gripper_s.clone()
         gic.fix_to(hnd_pos, hnd_rotmat)
         gic.jaw_to(jaw_width)
         print(hnd_pos, hnd_rotmat)
@@ -63,6 +63,7 @@ class PickPlacePlanner(adp.ADPlanner):
         # start reasoning
         previously_available_graspids = range(len(grasp_info_list))
         intermediate_available_graspids = []
+        unreachable_grasps_num = 0
         hndcollided_grasps_num = 0
         ikfailed_grasps_num = 0
         rbtcollided_grasps_num = 0
@@ -73,41 +74,61 @@ class PickPlacePlanner(adp.ADPlanner):
             graspid_and_graspinfo_list = zip(previously_available_graspids,  # need .copy()?
                                              [grasp_info_list[i] for i in previously_available_graspids])
             previously_available_graspids = []
+            # hnd_s cd first, the ik of the remaining grasps are solved at once
+            ik_graspid_list = []
+            ik_tgt_pos_list = []
+            ik_tgt_rotmat_list = []
             for graspid, grasp_info in graspid_and_graspinfo_list:
                 jaw_width, jaw_center_pos, jaw_center_rotmat, hnd_pos, hnd_rotmat = grasp_info
                 goal_jaw_center_pos = goal_pos + goal_rotmat.dot(jaw_center_pos)
                 goal_jaw_center_rotmat = goal_rotmat.dot(jaw_center_rotmat)
+                if not self.robot_s.is_likely_reachable(hand_name, goal_jaw_center_pos, goal_jaw_center_rotmat):
+                    # discarded by the reachability map before hnd_s cd and ik
+                    unreachable_grasps_num += 1
+                    continue
                 hnd_instance.grip_at_with_jcpose(goal_jaw_center_pos, goal_jaw_center_rotmat, jaw_width)
                 if not hnd_instance.is_mesh_collided(obstacle_list):  # hnd_s cd
-                    jnt_values = self.robot_s.ik(hand_name, goal_jaw_center_pos, goal_jaw_center_rotmat)
-                    if jnt_values is not None:  # common graspid with robot_s ik
-                        if toggle_debug:
-                            hnd_tmp = hnd_instance.copy()
-                            hnd_tmp.gen_meshmodel(rgba=[0, 1, 0, .2]).attach_to(base)
-                        self.robot_s.fk(hand_name, jnt_values)
-                        is_rbt_collided = self.robot_s.is_collided(obstacle_list)  # robot_s cd
-                        # TODO is_obj_collided
-                        is_obj_collided = False  # obj cd
-                        if (not is_rbt_collided) and (not is_obj_collided):  # hnd cdfree, rbs ikf/cdfree, obj cdfree
-                            if toggle_debug:
-                                self.robot_s.gen_meshmodel(rgba=[0, 1, 0, .5]).attach_to(base)
-                            previously_available_graspids.append(graspid)
-                        elif (not is_obj_collided):  # hnd_s cdfree, robot_s ikfeasible, robot_s collided
-                            rbtcollided_grasps_num += 1
-                            if toggle_debug:
-                                self.robot_s.gen_meshmodel(rgba=[1, 0, 1, .5]).attach_to(base)
-                    else:  # hnd_s cdfree, robot_s ik infeasible
-                        ikfailed_grasps_num += 1
-                        if toggle_debug:
-                            hnd_tmp = hnd_instance.copy()
-                            hnd_tmp.gen_meshmodel(rgba=[1, .6, 0, .2]).attach_to(base)
+                    ik_graspid_list.append(graspid)
+                    ik_tgt_pos_list.append(goal_jaw_center_pos)
+                    ik_tgt_rotmat_list.append(goal_jaw_center_rotmat)
                 else:  # hnd_s collided
                     hndcollided_grasps_num += 1
                     if toggle_debug:
-                        hnd_tmp = hnd_instance.copy()
+                        hnd_tmp = hnd_instance.clone()
                         hnd_tmp.gen_meshmodel(rgba=[1, 0, 1, .2]).attach_to(base)
+            if len(ik_graspid_list) > 0:
+                jnt_values_list = self.robot_s.ik_batch(hand_name, ik_tgt_pos_list, ik_tgt_rotmat_list)
+            else:
+                jnt_values_list = []
+            for graspid, jnt_values in zip(ik_graspid_list, jnt_values_list):
+                if toggle_debug:
+                    jaw_width, jaw_center_pos, jaw_center_rotmat, hnd_pos, hnd_rotmat = grasp_info_list[graspid]
+                    hnd_instance.grip_at_with_jcpose(goal_pos + goal_rotmat.dot(jaw_center_pos),
+                                                     goal_rotmat.dot(jaw_center_rotmat), jaw_width)
+                if jnt_values is not None:  # common graspid with robot_s ik
+                    if toggle_debug:
+                        hnd_tmp = hnd_instance.clone()
+                        hnd_tmp.gen_meshmodel(rgba=[0, 1, 0, .2]).attach_to(base)
+                    self.robot_s.fk(hand_name, jnt_values)
+                    is_rbt_collided = self.robot_s.is_collided(obstacle_list)  # robot_s cd
+                    # TODO is_obj_collided
+                    is_obj_collided = False  # obj cd
+                    if (not is_rbt_collided) and (not is_obj_collided):  # hnd cdfree, rbs ikf/cdfree, obj cdfree
+                        if toggle_debug:
+                            self.robot_s.gen_meshmodel(rgba=[0, 1, 0, .5]).attach_to(base)
+                        previously_available_graspids.append(graspid)
+                    elif (not is_obj_collided):  # hnd_s cdfree, robot_s ikfeasible, robot_s collided
+                        rbtcollided_grasps_num += 1
+                        if toggle_debug:
+                            self.robot_s.gen_meshmodel(rgba=[1, 0, 1, .5]).attach_to(base)
+                else:  # hnd_s cdfree, robot_s ik infeasible
+                    ikfailed_grasps_num += 1
+                    if toggle_debug:
+                        hnd_tmp = hnd_instance.clone()
+                        hnd_tmp.gen_meshmodel(rgba=[1, .6, 0, .2]).attach_to(base)
             intermediate_available_graspids.append(previously_available_graspids.copy())
             print('-----start-----')
+            print('Number of unreachable grasps at goal-' + str(goalid) + ': ', unreachable_grasps_num)
             print('Number of collided grasps at goal-' + str(goalid) + ': ', hndcollided_grasps_num)
             print('Number of failed IK at goal-' + str(goalid) + ': ', ikfailed_grasps_num)
             print('Number of collided robots at goal-' + str(goalid) + ': ', rbtcollided_grasps_num)
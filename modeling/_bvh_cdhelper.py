@@ -0,0 +1,184 @@
+# mesh collision detection helper using the numpy bvh of basis.trimesh
+# the interface is the same as _ode_cdhelper, no panda3d node is needed, so it also works in worker processes
+import weakref
+import numpy as np
+import basis.robot_math as rm
+import modeling.gjk as mgjk
+
+_cdparts_info_cache = weakref.WeakKeyDictionary()  # objtrm: {cdmesh_type: parts info}
+_CONVEX_CDMESH_TYPES = ['aabb', 'obb', 'convex_hull', 'convex_parts']
+
+
+def _gen_parts_info(objtrm_list, is_convex):
+    """
+    :return: a dictionary of the trimeshes, the local centers and radii of the bounding spheres of the parts, and
+             for convex parts, a list of the vertices of the parts
+    """
+    bounds = np.array([objtrm.bounds for objtrm in objtrm_list]).reshape(-1, 2, 3)
+    return {'trms': objtrm_list,
+            'centers': bounds.mean(axis=1),
+            'radii': np.linalg.norm(bounds[:, 1] - bounds[:, 0], axis=1) / 2,
+            'vertices': [np.asarray(objtrm.vertices) for objtrm in objtrm_list] if is_convex else None}
+
+
+def get_parts_info(objcm):
+    """
+    the convex parts of objcm, the cdmeshes of the other cdmesh_types are taken as one part
+    :param objcm: an instance of CollisionModel
+    :return: see _gen_parts_info
+    """
+    info_dict = _cdparts_info_cache.setdefault(objcm.objtrm, {})
+    if objcm.cdmesh_type not in info_dict:
+        if objcm.cdmesh_type == 'convex_parts':
+            info_dict['convex_parts'] = _gen_parts_info(objcm.get_convex_parts(), True)
+        else:
+            info_dict[objcm.cdmesh_type] = _gen_parts_info([objcm.get_local_cdmesh_trm()],
+                                                           objcm.cdmesh_type in _CONVEX_CDMESH_TYPES)
+    return info_dict[objcm.cdmesh_type]
+
+
+def is_parts_checked(objcm0, objcm1):
+    """
+    :return: True if the pair is checked part by part, i.e., one of them has convex parts or both are convex
+    """
+    return (objcm0.cdmesh_type == 'convex_parts' or objcm1.cdmesh_type == 'convex_parts' or
+            (objcm0.cdmesh_type in _CONVEX_CDMESH_TYPES and objcm1.cdmesh_type in _CONVEX_CDMESH_TYPES))
+
+
+def find_overlapped_parts(objcm0, objcm1):
+    """
+    :return: [ids0, ids1, overlaps], the pairs of parts whose bounding spheres overlap and the depths of the overlaps
+    """
+    parts_info0, parts_info1 = get_parts_info(objcm0), get_parts_info(objcm1)
+    centers0 = rm.homomat_transform_points(objcm0.get_homomat(), parts_info0['centers'])
+    centers1 = rm.homomat_transform_points(objcm1.get_homomat(), parts_info1['centers'])
+    overlaps = (parts_info0['radii'][:, None] + parts_info1['radii'][None, :] -
+                np.linalg.norm(centers0[:, None, :] - centers1[None, :, :], axis=2))
+    ids0, ids1 = np.nonzero(overlaps >= 0)
+    return ids0, ids1, overlaps[ids0, ids1]
+
+
+def is_convex_parts_collided(objcm0, objcm1, ids0, ids1, overlaps):
+    """
+    check the given pairs of convex parts by gjk, which also finds the parts inside the others
+    :param ids0, ids1, overlaps: see find_overlapped_parts
+    :return: [bool, a list of contact points]
+    """
+    homomat1 = objcm1.get_homomat()
+    vertices_list0, vertices_list1 = get_parts_info(objcm0)['vertices'], get_parts_info(objcm1)['vertices']
+    # in the local frame of objcm1, the pairs whose bounding spheres overlap more are checked first; the pairs
+    # are checked one by one, a batch of gjk is slower as most pairs finish in a few iterations
+    homomat = rm.homomat_inverse(homomat1) @ objcm0.get_homomat()
+    for i in np.argsort(-overlaps):
+        is_collided, point = mgjk.is_collided(vertices_list0[ids0[i]] @ homomat[:3, :3].T + homomat[:3, 3],
+                                              vertices_list1[ids1[i]])
+        if is_collided:
+            return True, [homomat1[:3, :3] @ point + homomat1[:3, 3]]
+    return False, []
+
+
+def _is_parts_collided(objcm0, objcm1):
+    """
+    the pairs of parts whose bounding spheres overlap are checked by gjk if both are convex, or by their bvhs otherwise
+    :return: [bool, a list of contact points]
+    """
+    ids0, ids1, overlaps = find_overlapped_parts(objcm0, objcm1)
+    if len(ids0) == 0:
+        return False, []
+    parts_info0, parts_info1 = get_parts_info(objcm0), get_parts_info(objcm1)
+    if parts_info0['vertices'] is not None and parts_info1['vertices'] is not None:
+        return is_convex_parts_collided(objcm0, objcm1, ids0, ids1, overlaps)
+    homomat0, homomat1 = objcm0.get_homomat(), objcm1.get_homomat()
+    for id0, id1 in zip(ids0, ids1):
+        is_collided, contact_points = parts_info0['trms'][id0].bvh.is_collided(parts_info1['trms'][id1].bvh,
+                                                                               homomat=homomat0,
+                                                                               other_homomat=homomat1,
+                                                                               toggle_contacts=True)
+        if is_collided:
+            return True, contact_points
+    return False, []
+
+
+def is_collided(objcm0, objcm1):
+    """
+    check if two objcm are collided after converting the specified cdmesh_type
+    the pairs of convex cdmeshes are checked by gjk as in _ode_cdhelper, so that the cdmeshes inside the others are
+    also found
+    :param objcm0: an instance of CollisionModel
+    :param objcm1: an instance of CollisionModel
+    :return: [bool, a list of contact points]
+    """
+    if is_parts_checked(objcm0, objcm1):
+        return _is_parts_collided(objcm0, objcm1)
+    return objcm0.get_local_cdmesh_trm().bvh.is_collided(objcm1.get_local_cdmesh_trm().bvh,
+                                                         homomat=objcm0.get_homomat(),
+                                                         other_homomat=objcm1.get_homomat(),
+                                                         toggle_contacts=True)
+
+
+def min_distance(objcm0, objcm1, homomat0=None, homomat1=None, max_distance=np.inf):
+    """
+    the minimum distance between two objcm after converting the specified cdmesh_type
+    the distances between convex cdmeshes are computed by gjk, they are zero if one cdmesh is inside the other
+    :param objcm0: an instance of CollisionModel
+    :param objcm1: an instance of CollisionModel
+    :param homomat0: the pose of objcm0, its current pose if None
+    :param homomat1: the pose of objcm1, its current pose if None
+    :param max_distance: see basis.trimesh.bvh.BVH.min_distance
+    :return: [distance, point on objcm0, point on objcm1], [np.inf, None, None] if farther than max_distance
+    """
+    homomat0 = objcm0.get_homomat() if homomat0 is None else homomat0
+    homomat1 = objcm1.get_homomat() if homomat1 is None else homomat1
+    # the merged convex parts are not convex, their distances are computed on the triangles
+    if (objcm0.cdmesh_type in _CONVEX_CDMESH_TYPES and objcm1.cdmesh_type in _CONVEX_CDMESH_TYPES and
+            'convex_parts' not in [objcm0.cdmesh_type, objcm1.cdmesh_type]):
+        distance, point0, point1 = mgjk.signed_distance(
+            rm.homomat_transform_points(homomat0, objcm0.get_local_cdmesh_trm().vertices),
+            rm.homomat_transform_points(homomat1, objcm1.get_local_cdmesh_trm().vertices), toggle_penetration=False)
+        return [distance, point0, point1] if distance <= max_distance else [np.inf, None, None]
+    return objcm0.get_local_cdmesh_trm().bvh.min_distance(objcm1.get_local_cdmesh_trm().bvh, homomat=homomat0,
+                                                    other_homomat=homomat1, max_distance=max_distance)
+
+
+def get_bounding_sphere(objcm):
+    """
+    a sphere enclosing the cdmesh, used to skip far pairs before computing distances
+    :param objcm: an instance of CollisionModel
+    :return: [center in the local frame of objcm, radius]
+    """
+    bounds = objcm.get_local_cdmesh_trm().bounds
+    return (bounds[0] + bounds[1]) / 2, np.linalg.norm(bounds[1] - bounds[0]) / 2
+
+
+def _rayhit(pfrom, pto, objcm):
+    homomat = objcm.get_homomat()
+    loc_pfrom, loc_pto = rm.homomat_transform_points(rm.homomat_inverse(homomat), np.array([pfrom, pto]))
+    length, direction = rm.unit_vector(loc_pto - loc_pfrom, toggle_length=True)
+    cdmesh_trm = objcm.get_local_cdmesh_trm()
+    _, tri_ids, _, loc_hit_points = cdmesh_trm.bvh.ray_hits(loc_pfrom, direction, max_distances=length)
+    hit_points = rm.homomat_transform_points(homomat, loc_hit_points)
+    hit_normals = cdmesh_trm.face_normals[tri_ids] @ homomat[:3, :3].T
+    return list(hit_points), list(hit_normals)
+
+
+def rayhit_closet(pfrom, pto, objcm):
+    """
+    :param pfrom:
+    :param pto:
+    :param objcm:
+    :return: [hit point, hit normal], the closest one to pfrom; [None, None] if nothing is hit
+    """
+    hit_points, hit_normals = _rayhit(pfrom, pto, objcm)
+    if len(hit_points) == 0:
+        return None, None
+    return hit_points[0], hit_normals[0]
+
+
+def rayhit_all(pfrom, pto, objcm):
+    """
+    :param pfrom:
+    :param pto:
+    :param objcm:
+    :return: [a list of hit points, a list of hit normals], sorted by the distances to pfrom
+    """
+    return _rayhit(pfrom, pto, objcm)
@@ -1,8 +1,18 @@
+import weakref
 import numpy as np
 import basis.robot_math as rm
 import basis.data_adapter as da
+import modeling._bvh_cdhelper as bcd
 from panda3d.ode import OdeTriMeshData, OdeTriMeshGeom, OdeUtil, OdeRayGeom
 
+# the trimesh data of a cdmesh is built once in the local frame of its objtrm (shared by the copies of a model),
+# each collision model keeps its own geom, only the transform of the geom is updated before a query
+_cdmesh_data_cache = weakref.WeakKeyDictionary()  # objtrm: {cdmesh_type: OdeTriMeshData}
+_cdmesh_geom_cache = weakref.WeakKeyDictionary()  # objcm: [OdeTriMeshData, OdeTriMeshGeom]
+# the parts of the 'convex_parts' cdmesh_type are checked pair by pair, see _is_parts_collided
+_cdparts_data_cache = weakref.WeakKeyDictionary()  # objtrm: OdeTriMeshDatas of the convex parts
+_cdparts_geom_cache = weakref.WeakKeyDictionary()  # objcm: [OdeTriMeshDatas, OdeTriMeshGeoms]
+
 
 # util functions
 def gen_cdmesh_vvnf(vertices, vertex_normals, faces):
@@ -17,6 +27,83 @@ def gen_cdmesh_vvnf(vertices, vertex_normals, faces):
     return obj_ot_geom
 
 
+def _get_cdmesh_data(objcm):
+    """
+    :param objcm:
+    :return: OdeTriMeshData of the cdmesh in the local frame of objcm
+    """
+    data_dict = _cdmesh_data_cache.setdefault(objcm.objtrm, {})
+    if objcm.cdmesh_type not in data_dict:
+        objtrm = objcm.get_local_cdmesh_trm()
+        objpdnp = da.nodepath_from_vvnf(objtrm.vertices, objtrm.vertex_normals, objtrm.faces)
+        data_dict[objcm.cdmesh_type] = OdeTriMeshData(objpdnp, True)
+    return data_dict[objcm.cdmesh_type]
+
+
+def _get_cdpart_geoms(objcm):
+    """
+    :param objcm: an instance of CollisionModel
+    :return: a list of OdeTriMeshGeoms, the geoms of convex parts are not posed
+    """
+    if objcm.cdmesh_type != 'convex_parts':
+        return [gen_cdmesh(objcm)]
+    data_list = _cdparts_data_cache.get(objcm.objtrm)
+    if data_list is None:
+        data_list = [OdeTriMeshData(da.nodepath_from_vvnf(hull.vertices, hull.vertex_normals, hull.faces), True)
+                     for hull in objcm.get_convex_parts()]
+        _cdparts_data_cache[objcm.objtrm] = data_list
+    cached = _cdparts_geom_cache.get(objcm)
+    if cached is None or cached[0] is not data_list:
+        cached = [data_list, [OdeTriMeshGeom(data) for data in data_list]]
+        _cdparts_geom_cache[objcm] = cached
+    return cached[1]
+
+
+def _is_parts_collided(objcm0, objcm1):
+    """
+    the pairs of parts whose bounding spheres overlap are checked by gjk if both are convex, which also finds the
+    parts inside the others, or by ode otherwise
+    :return: [bool, a list of contact points]
+    """
+    ids0, ids1, overlaps = bcd.find_overlapped_parts(objcm0, objcm1)
+    if len(ids0) == 0:
+        return False, []
+    if bcd.get_parts_info(objcm0)['vertices'] is not None and bcd.get_parts_info(objcm1)['vertices'] is not None:
+        return bcd.is_convex_parts_collided(objcm0, objcm1, ids0, ids1, overlaps)
+    homomat0, homomat1 = objcm0.get_homomat(), objcm1.get_homomat()
+    geoms0, geoms1 = _get_cdpart_geoms(objcm0), _get_cdpart_geoms(objcm1)
+    for objcm, geoms, ids, homomat in [(objcm0, geoms0, ids0, homomat0), (objcm1, geoms1, ids1, homomat1)]:
+        if objcm.cdmesh_type == 'convex_parts':
+            pos, quat = da.npv3_to_pdv3(homomat[:3, 3]), da.npmat3_to_pdquat(homomat[:3, :3])
+            for i in np.unique(ids):
+                geoms[i].setPosition(pos)
+                geoms[i].setQuaternion(quat)
+    for id0, id1 in zip(ids0, ids1):
+        contact_entry = OdeUtil.collide(geoms0[id0], geoms1[id1], max_contacts=10)
+        contact_points = [da.pdv3_to_npv3(point) for point in contact_entry.getContactPoints()]
+        if len(contact_points) > 0:
+            return True, contact_points
+    return False, []
+
+
+def gen_cdmesh(objcm):
+    """
+    the cached cdmesh of objcm moved to the current pose of objcm
+    the returned geom is reused by the following calls, do not keep it across pose changes
+    :param objcm: an instance of CollisionModel
+    :return: panda3d.ode.OdeTriMeshGeom
+    """
+    data = _get_cdmesh_data(objcm)
+    cached = _cdmesh_geom_cache.get(objcm)
+    if cached is None or cached[0] is not data:
+        cached = [data, OdeTriMeshGeom(data)]
+        _cdmesh_geom_cache[objcm] = cached
+    geom = cached[1]
+    geom.setPosition(da.npv3_to_pdv3(objcm.get_pos()))
+    geom.setQuaternion(da.npmat3_to_pdquat(objcm.get_rotmat()))
+    return geom
+
+
 # def gen_plane_cdmesh(updirection=np.array([0, 0, 1]), offset=0, name='autogen'):
 #     """
 #     generate a plane bulletrigidbody node
@@ -42,8 +129,11 @@ def is_collided(objcm0, objcm1):
     author: weiwei
     date: 20210118
     """
-    obj0 = gen_cdmesh_vvnf(*objcm0.extract_rotated_vvnf())
-    obj1 = gen_cdmesh_vvnf(*objcm1.extract_rotated_vvnf())
+    # the pairs of convex cdmeshes are checked by gjk
+    if bcd.is_parts_checked(objcm0, objcm1):
+        return _is_parts_collided(objcm0, objcm1)
+    obj0 = gen_cdmesh(objcm0)
+    obj1 = gen_cdmesh(objcm1)
     contact_entry = OdeUtil.collide(obj0, obj1, max_contacts=10)
     contact_points = [da.pdv3_to_npv3(point) for point in contact_entry.getContactPoints()]
     return (True, contact_points) if len(contact_points) > 0 else (False, contact_points)
@@ -57,7 +147,7 @@ def rayhit_closet(pfrom, pto, objcm):
     author: weiwei
     date: 20190805
     """
-    tgt_cdmesh = gen_cdmesh_vvnf(*objcm.extract_rotated_vvnf())
+    tgt_cdmesh = gen_cdmesh(objcm)
     ray = OdeRayGeom(length=1)
     length, dir = rm.unit_vector(pto - pfrom, toggle_length=True)
     ray.set(pfrom[0], pfrom[1], pfrom[2], dir[0], dir[1], dir[2])
@@ -77,7 +167,7 @@ def rayhit_all(pfrom, pto, objcm):
     author: weiwei
     date: 20190805
     """
-    tgt_cdmesh = gen_cdmesh_vvnf(*objcm.extract_rotated_vvnf())
+    tgt_cdmesh = gen_cdmesh(objcm)
     ray = OdeRayGeom(length=1)
     length, dir = rm.unit_vector(pto-pfrom, toggle_length=True)
     ray.set(pfrom[0], pfrom[1], pfrom[2], dir[0], dir[1], dir[2])
@@ -1,5 +1,6 @@
 import copy
 import math
+import weakref
 import numpy as np
 from panda3d.core import CollisionNode, CollisionBox, CollisionSphere, NodePath, BitMask32
 from visualization.panda.world import ShowBase
@@ -8,11 +9,18 @@ import basis.data_adapter as da
 import modeling.geometric_model as gm
 import modeling.model_collection as mc
 import modeling._panda_cdhelper as pcd
+import modeling.sdf as msdf
+import modeling.sphere_tree as mst
+import modeling.convex_decomposition as mcvxd
 import modeling._ode_cdhelper as mcd
+import modeling._bvh_cdhelper as bcd
+
+_DISTANCE_CACHE_SIZE = 1024  # maximum number of pairs kept by a distance cache, the oldest ones are dropped
 
 
 # import modeling._gimpact_cdhelper as mcd
 # import modeling._bullet_cdhelper as mcd
+# import modeling._bvh_cdhelper as mcd
 
 class CollisionModel(gm.GeometricModel):
     """
@@ -39,7 +47,7 @@ class CollisionModel(gm.GeometricModel):
         :param initor:
         :param btransparency:
         :param cdprimit_type: box, ball, cylinder, point_cloud, user_defined
-        :param cdmesh_type: aabb, obb, convex_hull, triangulation
+        :param cdmesh_type: aabb, obb, convex_hull, convex_parts, triangulation
         :param expand_radius:
         :param name:
         :param userdefined_cdprimitive_fn: the collision primitive will be defined in the provided function
@@ -66,6 +74,7 @@ class CollisionModel(gm.GeometricModel):
             self._objpdnp.getChild(1).setCollideMask(BitMask32(2 ** 31))
             self.cdmesh_type = cdmesh_type
             self._localframe = None
+        self._distance_cache = {}  # see query_min_distance
 
     def _update_cdprimit(self, cdprimitive_type, expand_radius, userdefined_cdprimitive_fn):
         if cdprimitive_type is not None and cdprimitive_type not in ['box',
@@ -107,6 +116,7 @@ class CollisionModel(gm.GeometricModel):
         if cdmesh_type is not None and cdmesh_type not in ['aabb',
                                                            'obb',
                                                            'convex_hull',
+                                                           'convex_parts',
                                                            'triangles']:
             raise ValueError("Wrong mesh collision model type name!")
         self._cdmesh_type = cdmesh_type
@@ -119,15 +129,23 @@ class CollisionModel(gm.GeometricModel):
     def cdmesh(self):
         return mcd.gen_cdmesh_vvnf(*self.extract_rotated_vvnf())
 
-    def extract_rotated_vvnf(self):
+    def get_local_cdmesh_trm(self):
+        """
+        :return: the trimesh of the specified cdmesh_type in the local frame of the cm
+        """
         if self.cdmesh_type == 'aabb':
-            objtrm = self.objtrm.bounding_box
+            return self.objtrm.bounding_box
         elif self.cdmesh_type == 'obb':
-            objtrm = self.objtrm.bounding_box_oriented
+            return self.objtrm.bounding_box_oriented
         elif self.cdmesh_type == 'convex_hull':
-            objtrm = self.objtrm.convex_hull
+            return self.objtrm.convex_hull
+        elif self.cdmesh_type == 'convex_parts':
+            return self.get_convex_parts(toggle_merged=True)
         elif self.cdmesh_type == 'triangles':
-            objtrm = self.objtrm
+            return self.objtrm
+
+    def extract_rotated_vvnf(self):
+        objtrm = self.get_local_cdmesh_trm()
         homomat = self.get_homomat()
         vertices = rm.homomat_transform_points(homomat, objtrm.vertices)
         vertex_normals = rm.homomat_transform_points(homomat, objtrm.vertex_normals)
@@ -248,6 +266,89 @@ class CollisionModel(gm.GeometricModel):
             contact_point, contact_normal = mcd.rayhit_closet(point_from, point_to, self)
             return contact_point, contact_normal
 
+    def get_sdf(self, voxel_size=None, padding=None):
+        """
+        the signed distance field of the mesh in its local frame, computed once and cached in memory and on disk
+        :param voxel_size: see modeling.sdf.gen_sdf
+        :param padding:
+        :return: modeling.sdf.SDF
+        """
+        cached = self.objtrm._cache['sdf']
+        if cached is None:
+            cached = {}
+            self.objtrm._cache['sdf'] = cached
+        if (voxel_size, padding) not in cached:
+            cached[(voxel_size, padding)] = msdf.gen_sdf(self.objtrm, voxel_size=voxel_size, padding=padding)
+        return cached[(voxel_size, padding)]
+
+    def query_sdf(self, points, toggle_gradients=False):
+        """
+        signed distances from world points to the mesh, negative inside, see modeling.sdf.SDF.query
+        :param points: ...x3 nparray
+        :param toggle_gradients: return the gradients in the world frame as well
+        :return: distances, or [distances, gradients]
+        """
+        rotmat = self.get_rotmat()
+        local_points = (np.asarray(points) - self.get_pos()) @ rotmat
+        if toggle_gradients:
+            distances, gradients = self.get_sdf().query(local_points, toggle_gradients=True)
+            return distances, gradients @ rotmat.T
+        return self.get_sdf().query(local_points)
+
+    def gen_surface_spheres(self, radius=.01):
+        """
+        spheres covering the surface of the mesh in its local frame, see modeling.sdf.gen_surface_spheres
+        :param radius:
+        :return: [centers, radii]
+        """
+        cached = self.objtrm._cache['surface_spheres']
+        if cached is None:
+            cached = {}
+            self.objtrm._cache['surface_spheres'] = cached
+        if radius not in cached:
+            cached[radius] = msdf.gen_surface_spheres(self.objtrm, radius=radius)
+        return cached[radius]
+
+    def get_sphere_tree(self, radius=.01):
+        """
+        a sphere tree of the mesh in its local frame, see modeling.sphere_tree.gen_sphere_tree
+        :param radius: the radius of the leaf spheres
+        :return: modeling.sphere_tree.SphereTree
+        """
+        cached = self.objtrm._cache['sphere_trees']
+        if cached is None:
+            cached = {}
+            self.objtrm._cache['sphere_trees'] = cached
+        if radius not in cached:
+            cached[radius] = mst.gen_sphere_tree(self.objtrm, radius=radius)
+        return cached[radius]
+
+    def get_convex_parts(self, toggle_merged=False):
+        """
+        an approximate convex decomposition of the mesh in its local frame, computed once and cached in memory and
+        on disk, see modeling.convex_decomposition.gen_convex_parts
+        :param toggle_merged: return the parts merged into one trimesh, which is the cdmesh of 'convex_parts'
+        :return: a list of basis.trimesh.Trimesh, or a basis.trimesh.Trimesh if toggle_merged is True
+        """
+        cached = self.objtrm._cache['convex_parts']
+        if cached is None:
+            hulls = mcvxd.gen_convex_parts(self.objtrm)
+            cached = [hulls, mcvxd.merge_parts(hulls)]
+            self.objtrm._cache['convex_parts'] = cached
+        return cached[1] if toggle_merged else cached[0]
+
+    def min_distance(self, objcm_list, max_distance=np.inf):
+        """
+        the minimum distance between the mesh of the cm and the meshes of the given cms, see query_min_distance
+        the results are cached by the poses of the pairs, querying again without moving them is free
+        :param objcm_list: one or a list of Collision Model object
+        :param max_distance: the cms farther than max_distance are skipped
+        :return: [distance, witness point on self, witness point on the nearest cm, index of the nearest cm]
+        """
+        if not isinstance(objcm_list, list):
+            objcm_list = [objcm_list]
+        return query_min_distance(self, objcm_list, max_distance=max_distance, cache=self._distance_cache)
+
     def show_cdmesh(self):
         vertices, vertex_normals, faces = self.extract_rotated_vvnf()
         objwm = gm.WireFrameModel(da.trm.Trimesh(vertices=vertices, vertex_normals=vertex_normals, faces=faces))
@@ -264,6 +365,49 @@ class CollisionModel(gm.GeometricModel):
         return copy.deepcopy(self)
 
 
+def query_min_distance(objcm, objcm_list, homomat=None, max_distance=np.inf, cache=None):
+    """
+    the minimum distance between objcm and the nearest one in objcm_list, computed on the cdmeshes by the numpy bvh
+    broad phase: the pairs are visited in the order of the gaps between their bounding spheres, which bound the mesh
+    distances from below; the remaining pairs are skipped once the gap exceeds the nearest distance found
+    :param objcm: an instance of CollisionModel
+    :param objcm_list: a list of CollisionModel
+    :param homomat: the pose of objcm, its current pose if None (e.g. for the links of robots)
+    :param max_distance: pairs farther than max_distance are skipped
+    :param cache: a dictionary keeping the results of pairs by their poses, None for no caching
+    :return: [distance, point on objcm, point on the nearest one, index of the nearest one in objcm_list],
+             [np.inf, None, None, -1] if all of them are farther than max_distance
+    """
+    homomat = objcm.get_homomat() if homomat is None else homomat
+    center, radius = bcd.get_bounding_sphere(objcm)
+    center = homomat[:3, :3] @ center + homomat[:3, 3]
+    gaps = []
+    for other in objcm_list:
+        other_center, other_radius = bcd.get_bounding_sphere(other)
+        other_center = other.get_rotmat() @ other_center + other.get_pos()
+        gaps.append(max(np.linalg.norm(other_center - center) - radius - other_radius, 0))
+    result = [np.inf, None, None, -1]
+    for i in np.argsort(gaps):
+        if gaps[i] > min(result[0], max_distance):
+            break
+        other = objcm_list[i]
+        key = (id(objcm), objcm.cdmesh_type, homomat.tobytes(), id(other), other.cdmesh_type,
+               other.get_homomat().tobytes(), max_distance)
+        cached = cache.get(key) if cache is not None else None
+        # the weak references make sure that the ids are not reused by new models
+        if cached is not None and cached[0]() is objcm and cached[1]() is other:
+            pair_result = cached[2]
+        else:
+            pair_result = bcd.min_distance(objcm, other, homomat0=homomat, max_distance=max_distance)
+            if cache is not None:
+                if len(cache) >= _DISTANCE_CACHE_SIZE:
+                    cache.pop(next(iter(cache)))
+                cache[key] = (weakref.ref(objcm), weakref.ref(other), pair_result)
+        if pair_result[0] < result[0]:
+            result = [*pair_result, int(i)]
+    return result
+
+
 def gen_box(extent=np.array([.1, .1, .1]), homomat=np.eye(4), rgba=np.array([1, 0, 0, 1])):
     """
     :param extent:
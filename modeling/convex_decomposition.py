@@ -0,0 +1,177 @@
+"""
+approximate convex decompositions of meshes, used by the 'convex_parts' cdmesh_type of collision models
+the mesh is voxelized (the voxels crossed by the surface and the voxels inside), and the voxels are split recursively
+into two halves; the part whose convex hull wastes the most volume is split first
+the hull of a part is computed from the points sampled on the surface and the centers of the inside voxels of the
+part, so that the parts follow the surface more closely than the voxels
+the parts are cached in the convex_parts subdirectory of the mesh cache, see modeling.mesh_cache
+"""
+import numpy as np
+import basis.data_adapter as da
+import modeling.mesh_cache as mch
+import modeling.sdf as msdf
+from scipy.spatial import ConvexHull, QhullError
+
+_N_ITERATIONS = 16  # the maximum number of iterations of 2-means
+_N_CANDIDATES = 8  # the number of candidate planes along each axis
+_PLANE_RATIO = .9  # a plane is chosen if the volumes of its hulls are less than this ratio of those of 2-means
+_MAX_SUBDIVISIONS = 64  # the maximum number of samples along an edge of a triangle
+_OVERLAP = .6  # the points within this ratio of the voxel size to a part are used by its hull
+
+
+def _sample_surface(objtrm, spacing):
+    """
+    the vertices, and grid points on the triangles whose edges are longer than spacing
+    :return: nx3 nparray
+    """
+    triangles = np.asarray(objtrm.vertices)[np.asarray(objtrm.faces)]
+    edge_lengths = np.linalg.norm(triangles - np.roll(triangles, 1, axis=1), axis=2).max(axis=1)
+    n_subdivisions = np.clip(np.ceil(edge_lengths / spacing), 1, _MAX_SUBDIVISIONS).astype(int)
+    points = [np.asarray(objtrm.vertices)]
+    for n in np.unique(n_subdivisions[n_subdivisions > 1]):
+        a, b = np.meshgrid(np.arange(n + 1), np.arange(n + 1), indexing='ij')
+        is_valid = a + b <= n
+        weights = np.stack([a[is_valid], b[is_valid], n - a[is_valid] - b[is_valid]], axis=1) / n
+        points.append(np.einsum('kj,njd->nkd', weights, triangles[n_subdivisions == n]).reshape(-1, 3))
+    return np.concatenate(points)
+
+
+def _hull_volume(ijks):
+    """
+    the volume of the convex hull of voxels, in voxel units
+    only the first and the last voxels of each column along z decide the hull
+    :param ijks: nx3 int nparray
+    :return:
+    """
+    order = np.lexsort((ijks[:, 2], ijks[:, 1], ijks[:, 0]))
+    ijks = ijks[order]
+    is_new_column = np.ones(len(ijks), dtype=bool)
+    is_new_column[1:] = np.any(ijks[1:, :2] != ijks[:-1, :2], axis=1)
+    is_end = np.roll(is_new_column, -1)
+    ijks = ijks[is_new_column | is_end]
+    corners = (ijks[:, None, :] + np.stack(np.meshgrid([0, 1], [0, 1], [0, 1], indexing='ij'),
+                                           axis=-1).reshape(-1, 3)).reshape(-1, 3)
+    try:
+        return ConvexHull(corners).volume
+    except QhullError:
+        return float(len(ijks))
+
+
+def _split(ijks):
+    """
+    the candidates are the two compact halves of 2-means, which starts from the median plane along the principal
+    axis, and the halves of axis-aligned planes; a plane is chosen only if the volumes of its hulls are clearly
+    smaller, as the planes that minimize the volumes tend to slice hollow parts (e.g. bowls) into rings whose hulls
+    are as large as the whole
+    :return: the mask of one half, None if the voxels cannot be split
+    """
+    points = ijks - ijks.mean(axis=0)
+    projections = points @ np.linalg.eigh(points.T @ points)[1][:, -1]
+    mask = projections < np.median(projections)
+    for _ in range(_N_ITERATIONS):
+        if np.all(mask) or not np.any(mask):
+            return None
+        centers = np.array([points[mask].mean(axis=0), points[~mask].mean(axis=0)])
+        new_mask = np.sum((points - centers[0]) ** 2, axis=1) < np.sum((points - centers[1]) ** 2, axis=1)
+        if np.array_equal(new_mask, mask):
+            break
+        mask = new_mask
+    if np.all(mask) or not np.any(mask):
+        return None
+    best_cost, best_mask = (_hull_volume(ijks[mask]) + _hull_volume(ijks[~mask])) * _PLANE_RATIO, mask
+    for axis in range(3):
+        low, high = ijks[:, axis].min(), ijks[:, axis].max()
+        for position in np.unique(np.round(np.linspace(low + 1, high, _N_CANDIDATES)).astype(int)):
+            if position <= low or position > high:
+                continue
+            mask = ijks[:, axis] < position
+            cost = _hull_volume(ijks[mask]) + _hull_volume(ijks[~mask])
+            if cost < best_cost:
+                best_cost, best_mask = cost, mask
+    return best_mask
+
+
+def _gen_hull(points):
+    try:
+        return mch.convex_hull_of_points(points)
+    except QhullError:
+        # flat parts, e.g. the parts of open meshes without inside voxels
+        return mch.convex_hull_of_points(points, qhull_options='QJ')
+
+
+def gen_convex_parts(objtrm, resolution=32, max_concavity=.01, max_parts=32):
+    """
+    :param objtrm: basis.trimesh.Trimesh, the local frame is kept
+    :param resolution: the number of voxels along the largest extent of the mesh
+    :param max_concavity: a part is split if its hull wastes more volume than max_concavity x the volume of the mesh
+    :param max_parts:
+    :return: a list of basis.trimesh.Trimesh, the convex hulls of the parts
+    """
+    cache_path = mch.gen_derived_cache_path(objtrm, 'convex_parts', [resolution, max_concavity, max_parts])
+    cached = mch.load_derived_cache(cache_path)
+    if cached is not None:
+        vertex_starts = np.cumsum(cached['vertex_counts']) - cached['vertex_counts']
+        face_starts = np.cumsum(cached['face_counts']) - cached['face_counts']
+        return [da.trm.Trimesh(vertices=cached['vertices'][vertex_start:vertex_start + n_vertices],
+                               faces=cached['faces'][face_start:face_start + n_faces])
+                for vertex_start, n_vertices, face_start, n_faces in zip(vertex_starts, cached['vertex_counts'],
+                                                                         face_starts, cached['face_counts'])]
+    bounds = np.asarray(objtrm.bounds)
+    voxel_size = (bounds[1] - bounds[0]).max() / resolution
+    shape = np.maximum(np.ceil((bounds[1] - bounds[0]) / voxel_size).astype(int), 1)
+    # the voxels crossed by the surface and the voxels inside
+    surface_points = _sample_surface(objtrm, voxel_size / 2)
+    surface_ijks = np.clip(np.floor((surface_points - bounds[0]) / voxel_size).astype(int), 0, shape - 1)
+    axes = [bounds[0][i] + (np.arange(shape[i]) + .5) * voxel_size for i in range(3)]
+    is_inside = msdf.is_inside_grid(objtrm.bvh, np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1), shape)
+    is_occupied = is_inside.copy()
+    is_occupied[tuple(surface_ijks.T)] = True
+    ijks = np.argwhere(is_occupied)
+    # the surface crosses the voxels that are not inside, they are counted as half full
+    volumes = np.where(is_inside[tuple(ijks.T)], 1, .5)
+    # split the part that wastes the most volume first
+    parts = [np.arange(len(ijks))]
+    wastes = [_hull_volume(ijks) - volumes.sum()]
+    while len(parts) < max_parts:
+        i = int(np.argmax(wastes))
+        if wastes[i] <= max_concavity * volumes.sum():
+            break
+        mask = _split(ijks[parts[i]])
+        if mask is None:
+            wastes[i] = 0
+            continue
+        parts += [parts[i][mask], parts[i][~mask]]
+        wastes += [_hull_volume(ijks[part]) - volumes[part].sum() for part in parts[-2:]]
+        parts.pop(i)
+        wastes.pop(i)
+    labels = np.full(shape, -1, dtype=int)
+    for part_id, part in enumerate(parts):
+        labels[tuple(ijks[part].T)] = part_id
+    # a point is also given to the parts of the voxels near it, so that the hulls of neighbouring parts overlap
+    # instead of leaving gaps between the samples on their two sides
+    points = np.concatenate([surface_points, bounds[0] + (np.argwhere(is_inside) + .5) * voxel_size])
+    offsets = np.stack(np.meshgrid([-1, 1], [-1, 1], [-1, 1], indexing='ij'), axis=-1).reshape(-1, 3)
+    point_ids = np.repeat(np.arange(len(points)), len(offsets))
+    point_labels = labels[tuple(np.clip(np.floor((points[point_ids] + np.tile(offsets, (len(points), 1)) *
+                                                  voxel_size * _OVERLAP - bounds[0]) / voxel_size).astype(int),
+                                        0, shape - 1).T)]
+    labeled_pairs = np.unique(np.stack([point_labels, point_ids], axis=1)[point_labels >= 0], axis=0)
+    hulls = [_gen_hull(points[labeled_pairs[labeled_pairs[:, 0] == part_id, 1]]) for part_id in range(len(parts))]
+    mch.save_derived_cache(cache_path,
+                           vertices=np.concatenate([hull.vertices for hull in hulls]),
+                           faces=np.concatenate([hull.faces for hull in hulls]),
+                           vertex_counts=np.array([len(hull.vertices) for hull in hulls]),
+                           face_counts=np.array([len(hull.faces) for hull in hulls]))
+    return hulls
+
+
+def merge_parts(hulls):
+    """
+    put the parts into one trimesh, used as the cdmesh of the 'convex_parts' cdmesh_type
+    :param hulls: a list of basis.trimesh.Trimesh
+    :return: basis.trimesh.Trimesh
+    """
+    counts = np.array([len(hull.vertices) for hull in hulls])
+    offsets = np.cumsum(counts) - counts
+    return da.trm.Trimesh(vertices=np.concatenate([hull.vertices for hull in hulls]),
+                          faces=np.concatenate([hull.faces + offset for hull, offset in zip(hulls, offsets)]))
@@ -3,12 +3,16 @@ import basis.data_adapter as da
 import basis.trimesh_generator as trihelper
 import basis.robot_math as rm
 import modeling.model_collection as mc
+import modeling.mesh_cache as mcache
 import numpy as np
 import open3d as o3d
 from panda3d.core import NodePath, LineSegs, GeomNode, TransparencyAttrib, RenderModeAttrib
 from visualization.panda.world import ShowBase
 import warnings as wrn
 
+# copy.deepcopy(x, {SHARE_IN_DEEPCOPY: True}) returns a copy of x whose geometric models are shared with x
+SHARE_IN_DEEPCOPY = 'share_geometric_models'
+
 
 class StaticGeometricModel(object):
     """
@@ -36,7 +40,7 @@ class StaticGeometricModel(object):
             self._objpdnp = NodePath(name)
             if isinstance(initor, str):
                 self._objpath = initor
-                self._objtrm = da.trm.load(self._objpath)
+                self._objtrm = mcache.load_trimesh(self._objpath)
                 objpdnp_raw = da.trimesh_to_nodepath(self._objtrm, name='pdnp_raw')
                 objpdnp_raw.reparentTo(self._objpdnp)
             elif isinstance(initor, da.trm.Trimesh):
@@ -173,6 +177,17 @@ class StaticGeometricModel(object):
     def copy(self):
         return copy.deepcopy(self)
 
+    def __deepcopy__(self, memo):
+        """
+        the models are shared instead of copied if memo has the SHARE_IN_DEEPCOPY key, see RobotInterface.clone
+        """
+        if memo.get(SHARE_IN_DEEPCOPY, False):
+            return self
+        self_copy = self.__class__.__new__(self.__class__)
+        memo[id(self)] = self_copy
+        self_copy.__dict__.update(copy.deepcopy(self.__dict__, memo))
+        return self_copy
+
 
 class WireFrameModel(StaticGeometricModel):
 
@@ -0,0 +1,394 @@
+"""
+gjk and epa on the vertices of convex shapes (e.g. convex hulls, bounding boxes, and the parts of 'convex_parts')
+gjk finds the closest points of the minkowski difference to the origin, the distance is zero if the shapes are
+collided; epa then expands the final simplex of gjk into a polytope to find the penetration depth
+the pairs of a batch run gjk at once: each iteration adds a support point to the simplex of every unfinished pair,
+and the closest point of a simplex is found by projecting the origin onto all its faces; a single pair runs on
+python floats instead, as the overhead of numpy dominates the small arrays of one simplex
+the vertices are given in a common frame, e.g. the world frame or the local frame of one shape
+"""
+import numpy as np
+
+_MAX_ITERATIONS = 64  # the maximum number of support points added by gjk
+_MAX_EPA_ITERATIONS = 128
+_REL_TOLERANCE = 1e-6  # the relative error of distances
+_EPS = 1e-12
+# the faces of a simplex containing its first point, which is the newest support point; the closest point of the
+# previous simplex, made of the other points, can only be improved by these faces
+_FACES = np.array([[0, 0, 0, 0], [0, 1, 1, 1], [0, 2, 2, 2], [0, 3, 3, 3],
+                   [0, 1, 2, 2], [0, 1, 3, 3], [0, 2, 3, 3], [0, 1, 2, 3]])
+_FACE_SIZES = np.array([1, 2, 2, 2, 3, 3, 3, 4])
+_FACE_MAX_SLOTS = _FACES.max(axis=1)
+_FACE_MASKS = (np.arange(4)[None, :] < _FACE_SIZES[:, None]).astype(float)
+_FACE_EDGES = np.array([[k + 1 in face for k in range(3)] for face in _FACES], dtype=float)  # the edges in faces
+_FACE_EDGE_PAIRS = _FACE_EDGES[:, :, None] * _FACE_EDGES[:, None, :]
+_FACE_EDGE_COMPLEMENTS = np.eye(3) * (1 - _FACE_EDGES)[:, None, :]
+_EYE3 = np.eye(3)
+
+
+def pad_vertices(vertices_list):
+    """
+    put the vertices of shapes into one array for the batch queries, which can be cached by the callers
+    :param vertices_list: a list of nx3 nparrays
+    :return: n x max_n x 3 nparray, the shorter arrays are padded by their first vertex
+    """
+    n_max = max(len(vertices) for vertices in vertices_list)
+    return np.array([np.concatenate([vertices, np.repeat(vertices[:1], n_max - len(vertices), axis=0)])
+                     for vertices in vertices_list])
+
+
+def _support(vertices, directions):
+    """
+    :param vertices: m x 3 nparray shared by all pairs, or k x m x 3 nparray
+    :param directions: k x 3 nparray
+    :return: k x 3 nparray
+    """
+    if vertices.ndim == 2:
+        return vertices[np.argmax(directions @ vertices.T, axis=1)]
+    return vertices[np.arange(len(directions)), np.argmax((vertices @ directions[:, :, None])[..., 0], axis=1)]
+
+
+def _closest_on_simplices(simplices, counts):
+    """
+    the point of each simplex closest to the origin, the origin is projected onto the faces containing the first
+    point, and the closest projection inside its face is chosen
+    the projection onto a face solves gram x coords = rhs over the edges from the first point in the face, the
+    other coords are fixed to zero by the identity rows; the faces of all simplices are solved at once
+    :param simplices: n x 4 x 3 nparray, the first counts[i] points of simplices[i] are used
+    :param counts: n int nparray
+    :return: [n x 3 nparray of the closest points, n x 4 nparray of their barycentric weights, n ids of _FACES]
+    """
+    n = len(simplices)
+    edges = simplices[:, 1:] - simplices[:, :1]
+    gram = edges @ edges.transpose(0, 2, 1)
+    matrices = gram[:, None] * _FACE_EDGE_PAIRS + _FACE_EDGE_COMPLEMENTS
+    rhs = -(edges @ simplices[:, 0, :, None]).transpose(0, 2, 1) * _FACE_EDGES
+    # the faces are degenerate if their gram determinants are tiny compared with the products of the edge lengths
+    is_degenerate = (np.linalg.det(matrices) <=
+                     1e-12 * np.prod(np.diagonal(gram, axis1=1, axis2=2)[:, None, :] ** _FACE_EDGES, axis=2))
+    matrices[is_degenerate] = _EYE3
+    coords = np.linalg.solve(matrices, rhs[..., None])[..., 0]
+    weights = np.concatenate([1 - coords.sum(axis=2, keepdims=True), coords], axis=2)
+    candidates = weights @ simplices
+    distances = np.einsum('nfd,nfd->nf', candidates, candidates)
+    distances[is_degenerate | (weights.min(axis=2) < 0) | (_FACE_MAX_SLOTS >= counts[:, None])] = np.inf
+    face_ids = np.argmin(distances, axis=1)
+    rows = np.arange(n)
+    return candidates[rows, face_ids], weights[rows, face_ids], face_ids
+
+
+def _closest_on_simplex(points):
+    """
+    _closest_on_simplices for one simplex in python floats, which is much faster than numpy for the small arrays
+    :param points: a list of 1 to 4 points (lists of 3 floats), the first one is the newest support point
+    :return: [the closest point, its barycentric weights, the ids of the points of the closest face]
+    """
+    p0 = points[0]
+    edges = [[p[0] - p0[0], p[1] - p0[1], p[2] - p0[2]] for p in points[1:]]
+    lengths = [e[0] * e[0] + e[1] * e[1] + e[2] * e[2] for e in edges]
+    rhs = [-(e[0] * p0[0] + e[1] * p0[1] + e[2] * p0[2]) for e in edges]
+    best = [p0[0] * p0[0] + p0[1] * p0[1] + p0[2] * p0[2], list(p0), [1.], [0]]
+
+    def update(coords, ids):
+        point = [p0[k] + sum(coord * edges[i][k] for coord, i in zip(coords, ids)) for k in range(3)]
+        squared = point[0] * point[0] + point[1] * point[1] + point[2] * point[2]
+        if squared < best[0]:
+            best[:] = [squared, point, [1 - sum(coords), *coords], [0, *[i + 1 for i in ids]]]
+
+    for i in range(len(edges)):
+        if lengths[i] > _EPS ** 2 and 0 <= rhs[i] <= lengths[i]:
+            update([rhs[i] / lengths[i]], [i])
+    for i, j in [(0, 1), (0, 2), (1, 2)]:
+        if j >= len(edges):
+            continue
+        product = edges[i][0] * edges[j][0] + edges[i][1] * edges[j][1] + edges[i][2] * edges[j][2]
+        det = lengths[i] * lengths[j] - product ** 2
+        if det > 1e-12 * lengths[i] * lengths[j] + _EPS ** 2:
+            coord_i = (rhs[i] * lengths[j] - rhs[j] * product) / det
+            coord_j = (rhs[j] * lengths[i] - rhs[i] * product) / det
+            if coord_i >= 0 and coord_j >= 0 and coord_i + coord_j <= 1:
+                update([coord_i, coord_j], [i, j])
+    if len(edges) == 3:
+        (ax, ay, az), (bx, by, bz), (cx, cy, cz) = edges
+        crosses = [[by * cz - bz * cy, bz * cx - bx * cz, bx * cy - by * cx],
+                   [cy * az - cz * ay, cz * ax - cx * az, cx * ay - cy * ax],
+                   [ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx]]
+        det = ax * crosses[0][0] + ay * crosses[0][1] + az * crosses[0][2]
+        if abs(det) > 1e-9 * (lengths[0] * lengths[1] * lengths[2]) ** .5 + _EPS ** 3:
+            coords = [-(c[0] * p0[0] + c[1] * p0[1] + c[2] * p0[2]) / det for c in crosses]
+            if min(coords) >= 0 and sum(coords) <= 1:
+                return [0., 0., 0.], [1 - sum(coords), *coords], [0, 1, 2, 3]
+    return best[1:]
+
+
+def _gjk_pair(vertices0, vertices1, toggle_boolean=False):
+    """
+    _gjk for one pair, the simplices are kept in python lists
+    :param vertices0: m0 x 3 nparray
+    :param vertices1: m1 x 3 nparray
+    :return: see _gjk, n = 1
+    """
+    # the tolerance is relative to the support points, which are cheaper than the extents of the vertices
+    simplex = [(vertices0[0], vertices1[0])]
+    points = [(vertices0[0] - vertices1[0]).tolist()]
+    closest, weights = points[0], [1.]
+    max_squared = closest[0] * closest[0] + closest[1] * closest[1] + closest[2] * closest[2]
+    is_collided = False
+    for _ in range(_MAX_ITERATIONS):
+        direction = np.array([-closest[0], -closest[1], -closest[2]])
+        support = (vertices0[np.argmax(vertices0 @ direction)], vertices1[np.argmin(vertices1 @ direction)])
+        point = (support[0] - support[1]).tolist()
+        squared = closest[0] * closest[0] + closest[1] * closest[1] + closest[2] * closest[2]
+        support_projection = -(closest[0] * point[0] + closest[1] * point[1] + closest[2] * point[2])
+        if squared + support_projection <= _REL_TOLERANCE * squared or (toggle_boolean and support_projection < 0):
+            break
+        max_squared = max(max_squared, point[0] * point[0] + point[1] * point[1] + point[2] * point[2])
+        closest, weights, ids = _closest_on_simplex([point, *points])
+        simplex = [([support, *simplex])[i] for i in ids]
+        points = [([point, *points])[i] for i in ids]
+        if len(ids) == 4 or closest[0] ** 2 + closest[1] ** 2 + closest[2] ** 2 <= _REL_TOLERANCE ** 2 * max_squared:
+            is_collided = True
+            break
+    simplices = np.zeros((1, 4, 6))
+    simplices[0, :len(simplex)] = [np.concatenate(pair) for pair in simplex]
+    point0 = np.dot(weights, simplices[0, :len(simplex), :3])
+    point1 = np.dot(weights, simplices[0, :len(simplex), 3:])
+    return (np.array([is_collided]), np.array([0. if is_collided else np.linalg.norm(closest)]), point0[None],
+            point1[None], simplices, np.array([len(simplex)]))
+
+
+def _gjk(vertices0, vertices1, toggle_boolean=False, toggle_any=False):
+    """
+    :param vertices0: m0 x 3 nparray shared by all pairs, or n x m0 x 3 nparray
+    :param vertices1: n x m1 x 3 nparray
+    :param toggle_boolean: stop a pair once it is known to be separated, the distances are then upper bounds
+    :param toggle_any: stop all pairs once one of them is collided, the unfinished ones are taken as separated
+    :return: [is_collided (n bool nparray), distances, points0, points1, simplices, counts], the simplices are
+             n x 4 x 6 nparrays keeping the vertices of the two shapes making the support points
+    """
+    n = len(vertices1)
+    if n == 1:
+        return _gjk_pair(vertices0.reshape(-1, 3), vertices1[0], toggle_boolean=toggle_boolean)
+    extents = np.ptp(vertices1.reshape(-1, 3), axis=0).max() + np.ptp(vertices0.reshape(-1, 3), axis=0).max()
+    tolerance = max(extents, _EPS) * _REL_TOLERANCE
+    simplices = np.zeros((n, 4, 6))
+    counts = np.ones(n, dtype=int)
+    weights = np.zeros((n, 4))
+    closest = np.zeros((n, 3))
+    is_collided = np.zeros(n, dtype=bool)
+    # the states of the unfinished pairs, they are written back once the pairs finish
+    ids = np.arange(n)
+    active_vertices0 = vertices0
+    active_vertices1 = vertices1
+    # start from the support point along the direction between the centers of the vertices
+    directions = vertices1.mean(axis=1) - vertices0.mean(axis=-2)
+    active_simplices = np.zeros((n, 4, 6))
+    active_simplices[:, 0, :3] = _support(vertices0, directions)
+    active_simplices[:, 0, 3:] = _support(vertices1, -directions)
+    active_counts = np.ones(n, dtype=int)
+    active_weights = np.zeros((n, 4))
+    active_weights[:, 0] = 1
+    active_closest = active_simplices[:, 0, :3] - active_simplices[:, 0, 3:]
+    for _ in range(_MAX_ITERATIONS):
+        directions = -active_closest
+        supports = np.hstack([_support(active_vertices0, directions), _support(active_vertices1, -directions)])
+        squared = np.einsum('kd,kd->k', directions, directions)
+        support_projections = np.einsum('kd,kd->k', directions, supports[:, :3] - supports[:, 3:])
+        is_done = squared + support_projections <= _REL_TOLERANCE * squared
+        if toggle_boolean:
+            is_done |= support_projections < 0
+        is_finished = is_done.copy()
+        if np.any(is_done):
+            # keep the closest points of the previous simplices
+            done_ids = ids[is_done]
+            simplices[done_ids] = active_simplices[is_done]
+            counts[done_ids] = active_counts[is_done]
+            weights[done_ids] = active_weights[is_done]
+            closest[done_ids] = active_closest[is_done]
+        # the new point goes to the first slot
+        active_simplices = np.concatenate([supports[:, None], active_simplices[:, :3]], axis=1)
+        active_closest, face_weights, face_ids = _closest_on_simplices(
+            active_simplices[..., :3] - active_simplices[..., 3:], active_counts + 1)
+        # keep the points of the closest face
+        rows = np.arange(len(face_ids))[:, None]
+        slots = _FACES[face_ids]
+        active_counts = _FACE_SIZES[face_ids]
+        active_simplices = active_simplices[rows, slots]
+        active_weights = face_weights[rows, slots] * _FACE_MASKS[face_ids]
+        is_inside = ~is_done & ((active_counts == 4) |
+                                (np.einsum('kd,kd->k', active_closest, active_closest) <= tolerance ** 2))
+        if np.any(is_inside):
+            inside_ids = ids[is_inside]
+            is_collided[inside_ids] = True
+            simplices[inside_ids] = active_simplices[is_inside]
+            counts[inside_ids] = active_counts[is_inside]
+            weights[inside_ids] = active_weights[is_inside]
+            if toggle_any:
+                break
+            is_finished |= is_inside
+        if np.any(is_finished):
+            if np.all(is_finished):
+                break
+            is_active = ~is_finished
+            ids = ids[is_active]
+            active_simplices, active_counts = active_simplices[is_active], active_counts[is_active]
+            active_weights, active_closest = active_weights[is_active], active_closest[is_active]
+            if active_vertices0.ndim == 3:
+                active_vertices0 = active_vertices0[is_active]
+            active_vertices1 = active_vertices1[is_active]
+    else:
+        simplices[ids], counts[ids], weights[ids], closest[ids] = (active_simplices, active_counts,
+                                                                   active_weights, active_closest)
+    points0 = np.einsum('ns,nsd->nd', weights, simplices[..., :3])
+    points1 = np.einsum('ns,nsd->nd', weights, simplices[..., 3:])
+    distances = np.where(is_collided, 0, np.linalg.norm(closest, axis=1))
+    return is_collided, distances, points0, points1, simplices, counts
+
+
+def _epa(vertices0, vertices1, simplex0, simplex1):
+    """
+    the penetration depth of a collided pair
+    :param vertices0: m0 x 3 nparray
+    :param vertices1: m1 x 3 nparray
+    :param simplex0, simplex1: k x 3 nparrays, the final simplex of gjk, which contains the origin
+    :return: [depth, point0, point1], point0 - point1 is the shortest translation separating the shapes
+    """
+    extents = np.ptp(vertices0, axis=0).max() + np.ptp(vertices1, axis=0).max()
+    tolerance = max(extents, _EPS) * _REL_TOLERANCE
+    points0, points1 = list(simplex0), list(simplex1)
+
+    def add_support(direction):
+        support0 = vertices0[np.argmax(vertices0 @ direction)]
+        support1 = vertices1[np.argmin(vertices1 @ direction)]
+        points0.append(support0)
+        points1.append(support1)
+        return support0 - support1
+
+    # blow up the simplex into a tetrahedron
+    axes = np.vstack([np.eye(3), -np.eye(3)])
+    while len(points0) < 4:
+        points = np.array(points0) - np.array(points1)
+        if len(points) == 1:
+            directions = axes
+        elif len(points) == 2:
+            normal = np.cross(points[1] - points[0], axes[np.argmin(np.abs(points[1] - points[0]))])
+            normal /= np.linalg.norm(normal)
+            binormal = np.cross(points[1] - points[0], normal)
+            binormal /= np.linalg.norm(binormal)
+            angles = np.arange(6) * np.pi / 3
+            directions = np.cos(angles)[:, None] * normal + np.sin(angles)[:, None] * binormal
+        else:
+            normal = np.cross(points[1] - points[0], points[2] - points[0])
+            directions = np.array([normal, -normal]) / max(np.linalg.norm(normal), _EPS)
+        for direction in directions:
+            support = add_support(direction)
+            if len(points) == 1:
+                offset = np.linalg.norm(support - points[0])
+            elif len(points) == 2:
+                axis = (points[1] - points[0]) / np.linalg.norm(points[1] - points[0])
+                offset = np.linalg.norm(np.cross(support - points[0], axis))
+            else:
+                offset = abs(direction @ (support - points[0]))
+            if offset > tolerance:
+                break
+            points0.pop()
+            points1.pop()
+        else:
+            # the minkowski difference is flat, the shapes only touch
+            return 0., simplex0[0], simplex1[0]
+    points = np.array(points0) - np.array(points1)
+    faces = np.array([[0, 1, 2], [0, 3, 1], [0, 2, 3], [1, 3, 2]])
+    if np.dot(np.cross(points[1] - points[0], points[2] - points[0]), points[3] - points[0]) > 0:
+        faces = faces[:, ::-1]
+
+    def face_planes(faces):
+        normals = np.cross(points[faces[:, 1]] - points[faces[:, 0]], points[faces[:, 2]] - points[faces[:, 0]])
+        lengths = np.linalg.norm(normals, axis=1)
+        normals = normals / np.maximum(lengths, _EPS)[:, None]
+        distances = np.where(lengths > _EPS, np.einsum('fd,fd->f', normals, points[faces[:, 0]]), np.inf)
+        return normals, distances
+
+    normals, distances = face_planes(faces)
+    for _ in range(_MAX_EPA_ITERATIONS):
+        face_id = np.argmin(distances)
+        support = add_support(normals[face_id])
+        if support @ normals[face_id] - distances[face_id] <= tolerance:
+            points0.pop()
+            points1.pop()
+            break
+        points = np.vstack([points, support])
+        is_visible = np.einsum('fd,fd->f', normals, support - points[faces[:, 0]]) > 0
+        is_visible[face_id] = True
+        # the edges of the visible faces whose reversed edges are not visible form the horizon
+        edges = faces[is_visible][:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+        edge_set = set(map(tuple, edges))
+        horizon = np.array([edge for edge in edges if (edge[1], edge[0]) not in edge_set]).reshape(-1, 2)
+        new_faces = np.hstack([horizon, np.full((len(horizon), 1), len(points) - 1)])
+        new_normals, new_distances = face_planes(new_faces)
+        faces = np.vstack([faces[~is_visible], new_faces])
+        normals = np.vstack([normals[~is_visible], new_normals])
+        distances = np.concatenate([distances[~is_visible], new_distances])
+    face_id = np.argmin(distances)
+    triangle = points[faces[face_id]]
+    edges = triangle[1:] - triangle[0]
+    gram = edges @ edges.T
+    coords = np.linalg.lstsq(gram, edges @ (normals[face_id] * distances[face_id] - triangle[0]), rcond=None)[0]
+    weights = np.clip(np.array([1 - coords.sum(), *coords]), 0, 1)
+    weights /= weights.sum()
+    points0, points1 = np.array(points0), np.array(points1)
+    return max(distances[face_id], 0.), weights @ points0[faces[face_id]], weights @ points1[faces[face_id]]
+
+
+def is_collided_batch(vertices0, vertices1_list, toggle_any=False):
+    """
+    :param vertices0: m0 x 3 nparray, e.g. a moving shape; or n x m0 x 3 nparray, paired with vertices1_list
+    :param vertices1_list: a list of nx3 nparrays, e.g. static shapes; an n x m1 x 3 nparray is also accepted
+    :param toggle_any: return once a collided pair is found, the other pairs may be missed
+    :return: [n bool nparray, n x 3 nparray of points inside both shapes of the collided pairs]
+    """
+    vertices1 = vertices1_list if isinstance(vertices1_list, np.ndarray) else pad_vertices(vertices1_list)
+    is_collided, _, points0, _, _, _ = _gjk(np.asarray(vertices0, dtype=np.float64), vertices1, toggle_boolean=True,
+                                            toggle_any=toggle_any)
+    return is_collided, points0
+
+
+def is_collided(vertices0, vertices1):
+    """
+    :param vertices0: nx3 nparray
+    :param vertices1: mx3 nparray
+    :return: [bool, a point inside both shapes if collided]
+    """
+    is_collided, points = is_collided_batch(vertices0, np.asarray(vertices1, dtype=np.float64)[None])
+    return bool(is_collided[0]), points[0]
+
+
+def signed_distance_batch(vertices0, vertices1_list, toggle_penetration=True):
+    """
+    the distances between a convex shape and many convex shapes
+    :param vertices0: m0 x 3 nparray, or n x m0 x 3 nparray paired with vertices1_list
+    :param vertices1_list: a list of nx3 nparrays, an n x m1 x 3 nparray is also accepted
+    :param toggle_penetration: compute the penetration depths of the collided pairs by epa, 0 if False
+    :return: [n nparray of the distances, negative for the penetration depths, n x 3 nparray of the closest points
+             on the shape of vertices0, n x 3 nparray of those on the other shapes]
+    """
+    vertices0 = np.asarray(vertices0, dtype=np.float64)
+    vertices1 = vertices1_list if isinstance(vertices1_list, np.ndarray) else pad_vertices(vertices1_list)
+    is_collided, distances, points0, points1, simplices, counts = _gjk(vertices0, vertices1)
+    if toggle_penetration:
+        for i in np.flatnonzero(is_collided):
+            depth, points0[i], points1[i] = _epa(vertices0 if vertices0.ndim == 2 else vertices0[i], vertices1[i],
+                                                 simplices[i, :counts[i], :3], simplices[i, :counts[i], 3:])
+            distances[i] = -depth
+    return distances, points0, points1
+
+
+def signed_distance(vertices0, vertices1, toggle_penetration=True):
+    """
+    :param vertices0: nx3 nparray
+    :param vertices1: mx3 nparray
+    :param toggle_penetration: see signed_distance_batch
+    :return: [distance, negative for the penetration depth, closest point on shape 0, closest point on shape 1]
+    """
+    distances, points0, points1 = signed_distance_batch(vertices0, np.asarray(vertices1, dtype=np.float64)[None],
+                                                        toggle_penetration=toggle_penetration)
+    return distances[0], points0[0], points1[0]
@@ -0,0 +1,194 @@
+"""
+an on-disk cache of preprocessed mesh files
+the processed trimesh (merged vertices, normals), its convex hull, and its aabb are saved as a pickle file
+named by the md5 of the mesh file, so that loading a robot skips parsing and processing the meshes
+the obb is not cached, computing it costs seconds per mesh and only the 'obb' cdmesh_type needs it
+the data derived from processed meshes (sdf, spheres, convex parts) are saved as npz files in subdirectories
+the cache directory is $WRS_MESH_CACHE_DIR or ~/.cache/wrs/meshes, use set_cache_dir(None) to disable the cache
+"""
+import os
+import pickle
+import hashlib
+import tempfile
+import numpy as np
+import basis.data_adapter as da
+from scipy.spatial import ConvexHull
+from basis.trimesh import primitives
+from basis.trimesh.io.load import mesh_formats
+
+_CACHE_VERSION = 1  # increase when the saved contents change
+_DERIVED_CACHE_VERSION = 1  # increase when the saved contents of the derived data change
+_cache_dir = os.environ.get('WRS_MESH_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'wrs', 'meshes'))
+
+
+def set_cache_dir(path):
+    """
+    :param path: a directory, None disables the cache
+    :return:
+    """
+    global _cache_dir
+    _cache_dir = path
+
+
+def get_cache_dir():
+    return _cache_dir
+
+
+def _cache_path(objpath):
+    md5 = hashlib.md5()
+    with open(objpath, 'rb') as f:
+        md5.update(f.read())
+    md5.update(str(_CACHE_VERSION).encode())
+    return os.path.join(_cache_dir, md5.hexdigest() + '.pkl')
+
+
+def _convex_hull(objtrm):
+    """
+    the convex hull computed by qhull directly, objtrm.convex_hull takes about a second to fix the normals
+    :param objtrm:
+    :return:
+    """
+    return convex_hull_of_points(objtrm.vertices)
+
+
+def convex_hull_of_points(vertices, qhull_options=None):
+    """
+    the faces are oriented using the outward normals of the qhull facets
+    :param vertices: nx3 nparray
+    :param qhull_options: see scipy.spatial.ConvexHull
+    :return:
+    """
+    vertices = np.asarray(vertices)
+    qhull = ConvexHull(vertices, qhull_options=qhull_options)
+    faces = qhull.simplices.copy()
+    face_normals = np.cross(vertices[faces[:, 1]] - vertices[faces[:, 0]], vertices[faces[:, 2]] - vertices[faces[:, 0]])
+    is_inward = (face_normals * qhull.equations[:, :3]).sum(axis=1) < 0
+    faces[is_inward] = faces[is_inward][:, ::-1]
+    used_ids, faces = np.unique(faces, return_inverse=True)
+    return da.trm.Trimesh(vertices=vertices[used_ids],
+                          faces=faces.reshape(-1, 3),
+                          face_normals=qhull.equations[:, :3])
+
+
+def gen_derived_cache_path(objtrm, kind, params):
+    """
+    the path of the data derived from a processed trimesh, named by the md5 of its vertices, faces, and the parameters
+    :param objtrm:
+    :param kind: the subdirectory, e.g., 'sdf', 'spheres', or 'convex_parts'
+    :param params: the parameters of the cached data
+    :return: None if the cache is disabled
+    """
+    if _cache_dir is None:
+        return None
+    md5 = hashlib.md5()
+    md5.update(np.ascontiguousarray(objtrm.vertices, dtype=np.float64).tobytes())
+    md5.update(np.ascontiguousarray(objtrm.faces, dtype=np.int64).tobytes())
+    md5.update(np.array(list(params) + [_DERIVED_CACHE_VERSION], dtype=np.float64).tobytes())
+    return os.path.join(_cache_dir, kind, md5.hexdigest() + '.npz')
+
+
+def load_derived_cache(cache_path):
+    """
+    :return: a dictionary of nparrays, None if there is no readable cache
+    """
+    if cache_path is None or not os.path.isfile(cache_path):
+        return None
+    try:
+        with np.load(cache_path) as data:
+            return dict(data)
+    except Exception as e:
+        print(f"Failed to read the cache {cache_path}: {e}, regenerating it.")
+        return None
+
+
+def save_derived_cache(cache_path, **arrays):
+    if cache_path is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # write to a temporary file first so that concurrent processes never read a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Failed to write the cache {cache_path}: {e}.")
+
+
+def _trimesh_to_arrays(objtrm, hull):
+    # np.asarray drops the TrackedArray subclass of trimesh
+    return {'vertices': np.asarray(objtrm.vertices),
+            'faces': np.asarray(objtrm.faces),
+            'face_normals': np.asarray(objtrm.face_normals),
+            'vertex_normals': np.asarray(objtrm.vertex_normals),
+            'bounds': np.asarray(objtrm.bounds),
+            'hull_vertices': np.asarray(hull.vertices),
+            'hull_faces': np.asarray(hull.faces),
+            'hull_face_normals': np.asarray(hull.face_normals)}
+
+
+def _trimesh_from_arrays(arrays):
+    """
+    the convex hull and the aabb are put into the cache of the trimesh
+    """
+    objtrm = da.trm.Trimesh(vertices=arrays['vertices'],
+                            faces=arrays['faces'],
+                            face_normals=arrays['face_normals'],
+                            vertex_normals=arrays['vertex_normals'])
+    objtrm.metadata['processed'] = True
+    hull = da.trm.Trimesh(vertices=arrays['hull_vertices'],
+                          faces=arrays['hull_faces'],
+                          face_normals=arrays['hull_face_normals'])
+    _set_cached_hull(objtrm, hull, arrays['bounds'])
+    return objtrm
+
+
+def _set_cached_hull(objtrm, hull, bounds):
+    objtrm._cache.update({'face_normals': objtrm.face_normals,
+                          'vertex_normals': objtrm.vertex_normals,
+                          'bounds': bounds,
+                          'convex_hull': hull,
+                          'aabb': primitives.Box(box_center=bounds.mean(axis=0), box_extents=bounds[1] - bounds[0])})
+
+
+def load_trimesh(objpath):
+    """
+    load a mesh file as a processed trimesh, using the cache if it is available
+    files that are not meshes (e.g. paths) and failures of reading or writing the cache fall back to da.trm.load
+    :param objpath:
+    :return:
+    """
+    if _cache_dir is None or objpath.split('.')[-1].lower() not in mesh_formats():
+        return da.trm.load(objpath)
+    cache_path = _cache_path(objpath)
+    if os.path.isfile(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                return _trimesh_from_arrays(pickle.load(f))
+        except Exception as e:
+            print(f"Failed to read the mesh cache {cache_path}: {e}, regenerating it.")
+    objtrm = da.trm.load(objpath)
+    hull = _convex_hull(objtrm)
+    _set_cached_hull(objtrm, hull, objtrm.bounds)
+    try:
+        os.makedirs(_cache_dir, exist_ok=True)
+        # write to a temporary file first so that concurrent processes never read a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=_cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(_trimesh_to_arrays(objtrm, hull), f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Failed to write the mesh cache {cache_path}: {e}.")
+    return objtrm
+
+
+def clear_cache():
+    """
+    remove all cached meshes
+    :return:
+    """
+    if _cache_dir is None or not os.path.isdir(_cache_dir):
+        return
+    for file_name in os.listdir(_cache_dir):
+        if file_name.endswith('.pkl'):
+            os.remove(os.path.join(_cache_dir, file_name))
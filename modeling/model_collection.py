@@ -1,3 +1,4 @@
+import numpy as np
 import basis.robot_math as rm
 import modeling._ode_cdhelper as mcd
 
@@ -32,19 +33,12 @@ class ModelCollection(object):
         vertex_normals = []
         faces = []
         for objcm in self._cm_list:
-            if objcm.cdmesh_type == 'aabb':
-                objtrm = objcm.objtrm.bounding_box
-            elif objcm.cdmesh_type == 'obb':
-                objtrm = objcm.objtrm.bounding_box_oriented
-            elif objcm.cdmesh_type == 'convexhull':
-                objtrm = objcm.objtrm.convex_hull
-            elif objcm.cdmesh_type == 'triangles':
-                objtrm = objcm.objtrm
+            objtrm = objcm.get_local_cdmesh_trm()
             homomat = objcm.get_homomat()
-            vertices += rm.homomat_transform_points(homomat, objtrm.vertices)
-            vertex_normals += rm.homomat_transform_points(homomat, objtrm.vertex_normals)
-            faces += (objtrm.faces+len(faces))
-        return mcd.gen_cdmesh_vvnf(vertices, vertex_normals, faces)
+            faces.append(objtrm.faces + sum([len(each_vertices) for each_vertices in vertices]))
+            vertices.append(rm.homomat_transform_points(homomat, objtrm.vertices))
+            vertex_normals.append(rm.homomat_transform_points(homomat, objtrm.vertex_normals))
+        return mcd.gen_cdmesh_vvnf(np.vstack(vertices), np.vstack(vertex_normals), np.vstack(faces))
 
     @property
     def cdmesh_list(self):
@@ -0,0 +1,132 @@
+"""
+occupancy maps of point clouds (e.g. the depth frames of a sensor), used as obstacles by the collision checkers
+the occupied voxels are kept in a sparse grid: their keys are sorted by the blocks of 8x8x8 voxels containing them,
+so that the voxels in an aabb are found by looking up the occupied blocks overlapping the aabb
+the points are given in the world frame
+"""
+import numpy as np
+
+_BLOCK_BITS = 3  # a block has 2**3 voxels along each axis
+_AXIS_BITS = 17  # the map spans 2**17 blocks along each axis, centered at the origin
+_AXIS_OFFSET = 2 ** (_AXIS_BITS - 1)
+
+
+def _encode_blocks(block_ijks):
+    block_ijks = block_ijks + _AXIS_OFFSET
+    return (block_ijks[:, 0] << (2 * _AXIS_BITS)) | (block_ijks[:, 1] << _AXIS_BITS) | block_ijks[:, 2]
+
+
+def _decode_blocks(block_codes):
+    mask = (1 << _AXIS_BITS) - 1
+    return np.stack([block_codes >> (2 * _AXIS_BITS), (block_codes >> _AXIS_BITS) & mask, block_codes & mask],
+                    axis=1) - _AXIS_OFFSET
+
+
+class OccupancyMap(object):
+
+    def __init__(self, points=None, resolution=.01, name="occupancy_map"):
+        """
+        :param points: nx3 nparray, None for an empty map
+        :param resolution: the edge length of the voxels
+        :param name:
+        """
+        self.name = name
+        self.resolution = resolution
+        self.version = 0  # increased when the map is changed
+        self._voxel_keys = np.zeros(0, dtype=np.int64)  # sorted, block code << 9 | local code
+        self._voxel_ijks = np.zeros((0, 3), dtype=np.int64)
+        self._block_codes = np.zeros(0, dtype=np.int64)  # the occupied blocks, sorted
+        self._block_ijks = np.zeros((0, 3), dtype=np.int64)
+        self._block_starts = np.zeros(0, dtype=int)  # the voxels of the i-th block start at self._block_starts[i]
+        self._block_counts = np.zeros(0, dtype=int)
+        if points is not None:
+            self.add_points(points)
+
+    def _to_voxel_ijks(self, points):
+        return np.floor(points / self.resolution).astype(np.int64)
+
+    def _set_voxel_keys(self, voxel_keys):
+        self._voxel_keys = voxel_keys
+        block_codes = voxel_keys >> (3 * _BLOCK_BITS)
+        local_mask = (1 << _BLOCK_BITS) - 1
+        self._block_codes, self._block_starts, self._block_counts = np.unique(block_codes, return_index=True,
+                                                                              return_counts=True)
+        self._block_ijks = _decode_blocks(self._block_codes)
+        self._voxel_ijks = (_decode_blocks(block_codes) << _BLOCK_BITS) + np.stack(
+            [(voxel_keys >> (2 * _BLOCK_BITS)) & local_mask, (voxel_keys >> _BLOCK_BITS) & local_mask,
+             voxel_keys & local_mask], axis=1)
+        self.version += 1
+
+    def add_points(self, points):
+        """
+        mark the voxels containing the points as occupied, the points that are not finite (e.g. invalid depths) are
+        skipped
+        :param points: nx3 nparray
+        :return:
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        voxel_ijks = self._to_voxel_ijks(points[np.all(np.isfinite(points), axis=1)])
+        if np.any(np.abs(voxel_ijks >> _BLOCK_BITS) >= _AXIS_OFFSET):
+            raise ValueError("The points are out of the range of the occupancy map!")
+        local_ijks = voxel_ijks & ((1 << _BLOCK_BITS) - 1)
+        voxel_keys = ((_encode_blocks(voxel_ijks >> _BLOCK_BITS) << (3 * _BLOCK_BITS)) |
+                      (local_ijks[:, 0] << (2 * _BLOCK_BITS)) | (local_ijks[:, 1] << _BLOCK_BITS) | local_ijks[:, 2])
+        self._set_voxel_keys(np.union1d(self._voxel_keys, voxel_keys))
+
+    def clear(self):
+        self._set_voxel_keys(np.zeros(0, dtype=np.int64))
+
+    def get_n_voxels(self):
+        return len(self._voxel_keys)
+
+    def get_voxel_centers(self, voxel_ids=None):
+        """
+        :param voxel_ids: None for all occupied voxels
+        :return: nx3 nparray
+        """
+        voxel_ijks = self._voxel_ijks if voxel_ids is None else self._voxel_ijks[voxel_ids]
+        return (voxel_ijks + .5) * self.resolution
+
+    def get_homomat(self):
+        return np.eye(4)
+
+    def query_aabbs(self, mins, maxs):
+        """
+        the occupied voxels overlapping the given aabbs
+        :param mins: nx3 nparray
+        :param maxs: nx3 nparray
+        :return: [query_ids, voxel_ids], the overlapped pairs
+        """
+        if len(self._block_codes) == 0 or len(mins) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        voxel_mins, voxel_maxs = self._to_voxel_ijks(mins), self._to_voxel_ijks(maxs)
+        block_mins, block_maxs = voxel_mins >> _BLOCK_BITS, voxel_maxs >> _BLOCK_BITS
+        spans = block_maxs - block_mins + 1
+        n_blocks = np.prod(spans.astype(np.float64), axis=1)
+        # the aabbs covering more blocks than the occupied ones are compared with the occupied blocks instead
+        is_small = n_blocks <= len(self._block_codes)
+        small_ids = np.flatnonzero(is_small)
+        n_blocks = n_blocks[is_small].astype(int)
+        query_ids = np.repeat(small_ids, n_blocks)
+        offsets = np.arange(len(query_ids)) - np.repeat(np.cumsum(n_blocks) - n_blocks, n_blocks)
+        spans = spans[query_ids]
+        block_codes = _encode_blocks(block_mins[query_ids] + np.stack([offsets % spans[:, 0],
+                                                                       offsets // spans[:, 0] % spans[:, 1],
+                                                                       offsets // (spans[:, 0] * spans[:, 1])],
+                                                                      axis=1))
+        block_ids = np.minimum(np.searchsorted(self._block_codes, block_codes), len(self._block_codes) - 1)
+        is_occupied = self._block_codes[block_ids] == block_codes
+        query_ids, block_ids = query_ids[is_occupied], block_ids[is_occupied]
+        large_ids, large_block_ids = np.nonzero(
+            np.all((block_mins[~is_small][:, None, :] <= self._block_ijks[None, :, :]) &
+                   (self._block_ijks[None, :, :] <= block_maxs[~is_small][:, None, :]), axis=2))
+        query_ids = np.concatenate([query_ids, np.flatnonzero(~is_small)[large_ids]])
+        block_ids = np.concatenate([block_ids, large_block_ids])
+        # the voxels of the blocks
+        counts = self._block_counts[block_ids]
+        voxel_ids = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) +
+                     np.repeat(self._block_starts[block_ids], counts))
+        query_ids = np.repeat(query_ids, counts)
+        voxel_ijks = self._voxel_ijks[voxel_ids]
+        is_overlapped = np.all((voxel_mins[query_ids] <= voxel_ijks) & (voxel_ijks <= voxel_maxs[query_ids]), axis=1)
+        return query_ids[is_overlapped], voxel_ids[is_overlapped]
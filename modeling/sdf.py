@@ -0,0 +1,226 @@
+"""
+signed distance fields (sdf) of meshes, sampled on voxel grids in the local frame of the meshes
+the distances are interpolated trilinearly, so that both the distances and their gradients are continuous inside cells
+negative distances are inside the meshes; the signs are decided by the parity of ray crossings along x, y, and z
+grids are cached in the sdf subdirectory of the mesh cache (see modeling.mesh_cache), named by the md5 of the mesh
+the spheres covering the surfaces of meshes (gen_surface_spheres) are cached in the spheres subdirectory likewise
+"""
+import numpy as np
+import modeling.mesh_cache as mch
+
+
+class SDF(object):
+
+    def __init__(self, distances, origin, voxel_size):
+        """
+        :param distances: nx x ny x nz nparray, the signed distances at the grid points
+        :param origin: 1x3 nparray, the position of grid point [0,0,0]
+        :param voxel_size: the distance between neighbouring grid points
+        """
+        self.distances = np.asarray(distances, dtype=np.float64)
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.voxel_size = float(voxel_size)
+        self.shape = np.array(self.distances.shape)
+        self.grid_max = self.origin + (self.shape - 1) * self.voxel_size
+
+    def query(self, points, toggle_gradients=False):
+        """
+        interpolated signed distances of local points
+        outside the grid, a lower bound is returned: the mesh is inside the grid, so the distance is at least the
+        distance to the grid, and at least the distance at the closest grid point minus the distance to the grid;
+        use a padding (see gen_sdf) larger than the distances of interest to keep such points inside the grid
+        :param points: ...x3 nparray, in the local frame of the mesh
+        :param toggle_gradients:
+        :return: distances (... nparray), or [distances, gradients (...x3 nparray)] if toggle_gradients is True
+        """
+        points = np.asarray(points, dtype=np.float64)
+        leading_shape = points.shape[:-1]
+        points = points.reshape(-1, 3)
+        clamped_points = np.clip(points, self.origin, self.grid_max)
+        outside_vecs = points - clamped_points
+        outside_distances = np.linalg.norm(outside_vecs, axis=1)
+        uvw = (clamped_points - self.origin) / self.voxel_size
+        ids = np.clip(np.floor(uvw).astype(int), 0, self.shape - 2)
+        fracs = uvw - ids
+        i, j, k = ids[:, 0], ids[:, 1], ids[:, 2]
+        # the 8 corners of the cells, c[x][y][z]
+        c = [[[self.distances[i + dx, j + dy, k + dz] for dz in (0, 1)] for dy in (0, 1)] for dx in (0, 1)]
+        fx, fy, fz = fracs[:, 0], fracs[:, 1], fracs[:, 2]
+        c00 = c[0][0][0] * (1 - fx) + c[1][0][0] * fx
+        c01 = c[0][0][1] * (1 - fx) + c[1][0][1] * fx
+        c10 = c[0][1][0] * (1 - fx) + c[1][1][0] * fx
+        c11 = c[0][1][1] * (1 - fx) + c[1][1][1] * fx
+        c0 = c00 * (1 - fy) + c10 * fy
+        c1 = c01 * (1 - fy) + c11 * fy
+        clamped_distances = c0 * (1 - fz) + c1 * fz
+        distances = np.where(outside_distances > 0,
+                             np.maximum(outside_distances, clamped_distances - outside_distances),
+                             clamped_distances)
+        if not toggle_gradients:
+            return distances.reshape(leading_shape)
+        gradients = np.empty_like(points)
+        dx0 = (c[1][0][0] - c[0][0][0]) * (1 - fy) + (c[1][1][0] - c[0][1][0]) * fy
+        dx1 = (c[1][0][1] - c[0][0][1]) * (1 - fy) + (c[1][1][1] - c[0][1][1]) * fy
+        gradients[:, 0] = dx0 * (1 - fz) + dx1 * fz
+        gradients[:, 1] = (c10 - c00) * (1 - fz) + (c11 - c01) * fz
+        gradients[:, 2] = c1 - c0
+        gradients /= self.voxel_size
+        is_outside = outside_distances > 0
+        outside_dirs = outside_vecs[is_outside] / outside_distances[is_outside, None]
+        is_grid_bound = (clamped_distances - outside_distances < outside_distances)[is_outside]
+        # the clamped point only moves along the axes on which the point is inside the grid
+        gradients[is_outside] = np.where(is_grid_bound[:, None],
+                                         outside_dirs,
+                                         gradients[is_outside] * (outside_vecs[is_outside] == 0) - outside_dirs)
+        return distances.reshape(leading_shape), gradients.reshape(leading_shape + (3,))
+
+    def query_lower_bounds(self, points):
+        """
+        lower bounds of the exact signed distances of local points, used for conservative checks
+        the distances are 1-lipschitz, so the interpolated values exceed the exact ones by at most a cell diagonal;
+        outside the grid, it is combined with the distance to the grid as in self.query
+        :param points: ...x3 nparray
+        :return: ... nparray
+        """
+        points = np.asarray(points, dtype=np.float64)
+        clamped_points = np.clip(points, self.origin, self.grid_max)
+        outside_distances = np.linalg.norm(points - clamped_points, axis=-1)
+        clamped_lower_bounds = self.query(clamped_points) - self.voxel_size * np.sqrt(3)
+        return np.where(outside_distances > 0,
+                        np.maximum(outside_distances, clamped_lower_bounds - outside_distances),
+                        clamped_lower_bounds)
+
+    def query_spheres(self, centers, radii, toggle_gradients=False):
+        """
+        clearances of local spheres, negative values are penetrations
+        :param centers: ...x3 nparray
+        :param radii: ... nparray, broadcast to the leading shape of centers
+        :param toggle_gradients: the gradients are with respect to the centers
+        :return: see self.query
+        """
+        if toggle_gradients:
+            distances, gradients = self.query(centers, toggle_gradients=True)
+            return distances - radii, gradients
+        return self.query(centers) - radii
+
+
+def is_inside_grid(bvh, grid_points, shape):
+    """
+    decide the signs by counting the crossings of rays along the grid rows; the result of each of the x, y, and z
+    rows is a vote, and a grid point is inside if at least two rows say so
+    :param bvh: basis.trimesh.bvh.BVH
+    :param grid_points: nx x ny x nz x 3 nparray
+    :param shape: [nx, ny, nz]
+    :return: nx x ny x nz nparray of bool
+    """
+    votes = np.zeros(shape, dtype=int)
+    for axis in range(3):
+        # move the axis of the rows to the end
+        row_points = np.moveaxis(grid_points, axis, -2)
+        origins = row_points[..., 0, :].reshape(-1, 3)
+        direction = np.zeros(3)
+        direction[axis] = 1
+        # shift the rays off the grid so that they do not run along the edges and faces of axis-aligned meshes
+        origins = origins + np.roll([0, 1.3e-6, 0.7e-6], axis)
+        ray_ids, _, hit_distances, _ = bvh.ray_hits(origins, np.tile(direction, (len(origins), 1)))
+        row_distances = row_points[..., axis] - row_points[..., :1, axis]
+        row_distances = row_distances.reshape(len(origins), -1)
+        # the number of crossings before each grid point of each row, the hits of all rows are searched at once
+        # by offsetting the distances of the i-th row by i*row_length
+        row_length = row_distances.max() + hit_distances.max(initial=0) + 1
+        hit_keys = ray_ids * row_length + hit_distances
+        point_keys = np.arange(len(origins))[:, None] * row_length + row_distances
+        hit_counts = np.bincount(ray_ids, minlength=len(origins))
+        hit_starts = np.cumsum(hit_counts) - hit_counts
+        crossings = np.searchsorted(hit_keys, point_keys) - hit_starts[:, None]
+        votes += np.moveaxis((crossings % 2 == 1).reshape(row_points.shape[:-1]), -1, axis)
+    return votes >= 2
+
+
+def gen_sdf(objtrm, voxel_size=None, padding=None):
+    """
+    sample the signed distance field of a mesh, the result is cached on disk
+    :param objtrm: basis.trimesh.Trimesh, the local frame is kept
+    :param voxel_size: 1/64 of the largest extent of the mesh if None
+    :param padding: the margin around the bounds of the mesh, 4 voxels if None
+    :return: SDF
+    """
+    bounds = np.asarray(objtrm.bounds)
+    if voxel_size is None:
+        voxel_size = (bounds[1] - bounds[0]).max() / 64
+    if padding is None:
+        padding = voxel_size * 4
+    cache_path = mch.gen_derived_cache_path(objtrm, 'sdf', [voxel_size, padding])
+    cached = mch.load_derived_cache(cache_path)
+    if cached is not None:
+        return SDF(cached['distances'], cached['origin'], cached['voxel_size'])
+    origin = bounds[0] - padding
+    shape = np.ceil((bounds[1] + padding - origin) / voxel_size).astype(int) + 1
+    axes = [origin[i] + np.arange(shape[i]) * voxel_size for i in range(3)]
+    grid_points = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1)
+    _, distances, _ = objtrm.bvh.closest_points(grid_points.reshape(-1, 3))
+    distances = distances.reshape(shape)
+    distances[is_inside_grid(objtrm.bvh, grid_points, shape)] *= -1
+    sdf = SDF(distances, origin, voxel_size)
+    mch.save_derived_cache(cache_path, distances=sdf.distances, origin=sdf.origin, voxel_size=sdf.voxel_size)
+    return sdf
+
+
+def gen_surface_spheres(objtrm, radius=.01):
+    """
+    a deterministic set of spheres covering the surface of a mesh
+    the bounds are divided into cubes whose circumscribed spheres have the given radius,
+    and a sphere is kept for each cube that may touch the surface;
+    the cubes are found by subdividing an octree, only the cubes that may touch the surface are subdivided;
+    the result is cached on disk
+    :param objtrm:
+    :param radius:
+    :return: [centers, radii], nx3 and n nparrays in the local frame of the mesh
+    """
+    cache_path = mch.gen_derived_cache_path(objtrm, 'spheres', [radius])
+    cached = mch.load_derived_cache(cache_path)
+    if cached is not None:
+        return cached['centers'], cached['radii']
+    bounds = np.asarray(objtrm.bounds)
+    cube_size = radius * 2 / np.sqrt(3)
+    n_levels = int(np.ceil(np.log2(max((bounds[1] - bounds[0]).max() / cube_size, 1))))
+    cube_size = cube_size * 2 ** n_levels
+    centers = (bounds[0] + cube_size / 2).reshape(1, 3)
+    offsets = np.stack(np.meshgrid([-1, 1], [-1, 1], [-1, 1], indexing='ij'), axis=-1).reshape(-1, 3) / 4
+    for level in range(n_levels + 1):
+        _, distances, _ = objtrm.bvh.closest_points(centers)
+        # a cube may touch the surface if its center is within half of its diagonal
+        centers = centers[distances <= cube_size * np.sqrt(3) / 2]
+        if level < n_levels:
+            centers = (centers[:, None, :] + offsets * cube_size).reshape(-1, 3)
+            cube_size /= 2
+    radii = np.full(len(centers), radius)
+    mch.save_derived_cache(cache_path, centers=centers, radii=radii)
+    return centers, radii
+
+
+def query_spheres_clearances(objcm_list, centers, radii, toggle_gradients=False):
+    """
+    the clearances between world spheres and a list of collision models, i.e. the smallest ones among the models
+    :param objcm_list: collision models, see CollisionModel.get_sdf
+    :param centers: ...x3 nparray, in the world frame
+    :param radii: ... nparray, broadcast to the leading shape of centers
+    :param toggle_gradients: the world gradients with respect to the centers
+    :return: clearances (... nparray, inf if objcm_list is empty), or [clearances, gradients]
+    """
+    centers = np.asarray(centers, dtype=np.float64)
+    clearances = np.full(centers.shape[:-1], np.inf)
+    gradients = np.zeros(centers.shape)
+    for objcm in objcm_list:
+        if toggle_gradients:
+            objcm_clearances, objcm_gradients = objcm.query_sdf(centers, toggle_gradients=True)
+        else:
+            objcm_clearances = objcm.query_sdf(centers)
+        objcm_clearances = objcm_clearances - radii
+        is_closer = objcm_clearances < clearances
+        clearances[is_closer] = objcm_clearances[is_closer]
+        if toggle_gradients:
+            gradients[is_closer] = objcm_gradients[is_closer]
+    if toggle_gradients:
+        return clearances, gradients
+    return clearances
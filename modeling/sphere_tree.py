@@ -0,0 +1,210 @@
+"""
+sphere trees (hierarchies of bounding spheres) of meshes, and numpy collision checks between them and against sdfs
+and occupancy maps
+the leaves are the surface spheres of modeling.sdf.gen_surface_spheres, which cover every point on the surface of
+the mesh, and each node bounds all spheres below it; a check is thus conservative: when it reports no collision,
+the surfaces of the meshes do not intersect
+the checks traverse the trees breadth first on arrays of (batch, node, node) triples, so that a batch of poses
+is checked at once
+"""
+import numpy as np
+import modeling.sdf as msdf
+
+
+class SphereTree(object):
+
+    def __init__(self, centers, radii):
+        """
+        build the tree by recursively splitting the spheres at the median of their centers along the longest axis;
+        all nodes of a level are split at once, and the nodes are numbered level by level
+        :param centers: nx3 nparray, the leaf spheres
+        :param radii: n nparray
+        """
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+        radii = np.asarray(radii, dtype=np.float64).reshape(-1)
+        n_nodes = max(2 * len(radii) - 1, 0)
+        self.node_centers = np.zeros((n_nodes, 3))
+        self.node_radii = np.zeros(n_nodes)
+        self.node_children = np.full((n_nodes, 2), -1, dtype=int)
+        order = np.arange(len(radii))
+        # the nodes of the current level own order[starts[i]:ends[i]]
+        starts = np.zeros(min(len(radii), 1), dtype=int)
+        ends = np.full(len(starts), len(radii))
+        node_ids = np.arange(len(starts))
+        while len(starts) > 0:
+            counts = ends - starts
+            seg_offsets = np.cumsum(counts) - counts
+            seg_ids = np.repeat(np.arange(len(starts)), counts)
+            positions = np.arange(len(seg_ids)) - np.repeat(seg_offsets, counts) + np.repeat(starts, counts)
+            member_ids = order[positions]
+            member_centers = centers[member_ids]
+            member_radii = radii[member_ids]
+            node_centers = (np.minimum.reduceat(member_centers - member_radii[:, None], seg_offsets) +
+                            np.maximum.reduceat(member_centers + member_radii[:, None], seg_offsets)) / 2
+            self.node_centers[node_ids] = node_centers
+            self.node_radii[node_ids] = np.maximum.reduceat(
+                np.linalg.norm(member_centers - node_centers[seg_ids], axis=1) + member_radii, seg_offsets)
+            # sort the members of each node along its longest axis and split them at the middle
+            axes = np.argmax(np.maximum.reduceat(member_centers, seg_offsets) -
+                             np.minimum.reduceat(member_centers, seg_offsets), axis=1)
+            sorted_ids = np.lexsort((member_centers[np.arange(len(seg_ids)), axes[seg_ids]], seg_ids))
+            order[positions] = member_ids[sorted_ids]
+            is_inner = counts > 1
+            mids = starts + counts // 2
+            child_ids = node_ids.max() + 1 + np.arange(2 * is_inner.sum()).reshape(-1, 2)
+            self.node_children[node_ids[is_inner]] = child_ids
+            starts = np.stack([starts[is_inner], mids[is_inner]], axis=1).ravel()
+            ends = np.stack([mids[is_inner], ends[is_inner]], axis=1).ravel()
+            node_ids = child_ids.ravel()
+
+
+def gen_sphere_tree(objtrm, radius=.01):
+    """
+    :param objtrm: basis.trimesh.Trimesh
+    :param radius: the radius of the leaf spheres
+    :return: SphereTree in the local frame of the mesh
+    """
+    return SphereTree(*msdf.gen_surface_spheres(objtrm, radius=radius))
+
+
+def concatenate_trees(tree_list):
+    """
+    put a list of trees into one forest, the trees are moved by their own poses in the checks
+    :param tree_list:
+    :return: a dictionary of the concatenated node arrays, the roots of the trees (-1 for empty trees),
+             and the tree ids of the nodes
+    """
+    counts = np.array([len(tree.node_radii) for tree in tree_list], dtype=int)
+    offsets = np.cumsum(counts) - counts
+    children = [np.where(tree.node_children >= 0, tree.node_children + offset, -1)
+                for tree, offset in zip(tree_list, offsets)]
+    return {'centers': np.concatenate([np.zeros((0, 3))] + [tree.node_centers for tree in tree_list]),
+            'radii': np.concatenate([np.zeros(0)] + [tree.node_radii for tree in tree_list]),
+            'children': np.concatenate([np.zeros((0, 2), dtype=int)] + children),
+            'roots': np.where(counts > 0, offsets, -1),
+            'tree_ids': np.repeat(np.arange(len(tree_list)), counts)}
+
+
+def pose_forest(forest, homomats, inflations=None):
+    """
+    move the trees of a forest to a batch of poses; the nodes are transformed when they are visited by the checks
+    the trees whose poses are the same over the whole batch (e.g. the links that are not driven) use the first pose
+    :param forest: see concatenate_trees
+    :param homomats: n_batch x m x4x4 nparray, the poses of the m trees
+    :param inflations: n_batch x m nparray, added to the radii of all nodes of the trees, e.g. to cover the motion of
+                       the trees around the given poses; None for no inflation
+    :return: a dictionary used by _get_world_centers and _get_radii
+    """
+    return {'homomats': homomats,
+            'is_static': np.all(homomats == homomats[:1], axis=(0, 2, 3)),
+            'inflations': inflations}
+
+
+def _get_world_centers(forest, posed_forest, batch_ids, node_ids):
+    tree_ids = forest['tree_ids'][node_ids]
+    homomats = posed_forest['homomats'][np.where(posed_forest['is_static'][tree_ids], 0, batch_ids), tree_ids]
+    return np.einsum('nij,nj->ni', homomats[:, :3, :3], forest['centers'][node_ids]) + homomats[:, :3, 3]
+
+
+def _get_radii(forest, posed_forest, batch_ids, node_ids):
+    if posed_forest['inflations'] is None:
+        return forest['radii'][node_ids]
+    return forest['radii'][node_ids] + posed_forest['inflations'][batch_ids, forest['tree_ids'][node_ids]]
+
+
+def is_forests_collided(forest_a, posed_forest_a, forest_b, posed_forest_b, n_batch, batch_ids, node_ids_a,
+                        node_ids_b):
+    """
+    check the given (batch, node_a, node_b) triples by descending both forests, the node with the larger radius
+    is split first; a batch is collided once any pair of its leaves overlaps
+    :param forest_a: see concatenate_trees
+    :param posed_forest_a: see pose_forest
+    :param forest_b:
+    :param posed_forest_b: the batch size is either n_batch or 1, the latter for forests that do not move
+    :param n_batch:
+    :param batch_ids: the starting triples
+    :param node_ids_a:
+    :param node_ids_b:
+    :return: a n_batch nparray of bool
+    """
+    is_collided = np.zeros(n_batch, dtype=bool)
+    while len(batch_ids) > 0:
+        radii_a = _get_radii(forest_a, posed_forest_a, batch_ids, node_ids_a)
+        radii_b = _get_radii(forest_b, posed_forest_b, batch_ids, node_ids_b)
+        gaps = np.linalg.norm(_get_world_centers(forest_a, posed_forest_a, batch_ids, node_ids_a) -
+                              _get_world_centers(forest_b, posed_forest_b, batch_ids, node_ids_b), axis=1)
+        # all leaves below a pair overlap if the inflations exceed the gap plus the sizes of the nodes
+        is_inflation_covered = gaps + 2 * (forest_a['radii'][node_ids_a] + forest_b['radii'][node_ids_b]) <= \
+                               radii_a + radii_b
+        is_collided[batch_ids[is_inflation_covered]] = True
+        is_kept = (gaps <= radii_a + radii_b) & ~is_collided[batch_ids]
+        batch_ids, node_ids_a, node_ids_b = batch_ids[is_kept], node_ids_a[is_kept], node_ids_b[is_kept]
+        radii_a, radii_b = radii_a[is_kept], radii_b[is_kept]
+        is_leaf_a = forest_a['children'][node_ids_a, 0] < 0
+        is_leaf_b = forest_b['children'][node_ids_b, 0] < 0
+        is_collided[batch_ids[is_leaf_a & is_leaf_b]] = True
+        is_split_a = ~is_leaf_a & (is_leaf_b | (radii_a >= radii_b))
+        is_split_b = ~is_leaf_b & ~is_split_a
+        batch_ids = np.concatenate([np.repeat(batch_ids[is_split_a], 2), np.repeat(batch_ids[is_split_b], 2)])
+        node_ids_a, node_ids_b = (
+            np.concatenate([forest_a['children'][node_ids_a[is_split_a]].ravel(),
+                            np.repeat(node_ids_a[is_split_b], 2)]),
+            np.concatenate([np.repeat(node_ids_b[is_split_a], 2),
+                            forest_b['children'][node_ids_b[is_split_b]].ravel()]))
+    return is_collided
+
+
+def is_forest_sdf_collided(forest, posed_forest, objcm, n_batch, batch_ids, node_ids):
+    """
+    check the given (batch, node) pairs against the sdf of a collision model using the lower bounds of the sdf
+    :param forest: see concatenate_trees
+    :param posed_forest: see pose_forest
+    :param objcm: a collision model, see CollisionModel.get_sdf
+    :param n_batch:
+    :param batch_ids:
+    :param node_ids:
+    :return: a n_batch nparray of bool
+    """
+    sdf = objcm.get_sdf()
+    pos, rotmat = objcm.get_pos(), objcm.get_rotmat()
+    is_collided = np.zeros(n_batch, dtype=bool)
+    while len(batch_ids) > 0:
+        local_centers = (_get_world_centers(forest, posed_forest, batch_ids, node_ids) - pos) @ rotmat
+        is_kept = ((sdf.query_lower_bounds(local_centers) <= _get_radii(forest, posed_forest, batch_ids, node_ids)) &
+                   ~is_collided[batch_ids])
+        batch_ids, node_ids = batch_ids[is_kept], node_ids[is_kept]
+        is_leaf = forest['children'][node_ids, 0] < 0
+        is_collided[batch_ids[is_leaf]] = True
+        batch_ids = np.repeat(batch_ids[~is_leaf], 2)
+        node_ids = forest['children'][node_ids[~is_leaf]].ravel()
+    return is_collided
+
+
+def is_forest_occupancy_collided(forest, posed_forest, occupancy_map, n_batch, batch_ids, node_ids):
+    """
+    check the given (batch, node) pairs against the occupied voxels of an occupancy map, the voxels are looked up by
+    the aabbs of the spheres
+    :param forest: see concatenate_trees
+    :param posed_forest: see pose_forest
+    :param occupancy_map: modeling.occupancy_map.OccupancyMap
+    :param n_batch:
+    :param batch_ids:
+    :param node_ids:
+    :return: a n_batch nparray of bool
+    """
+    half_extent = occupancy_map.resolution / 2
+    is_collided = np.zeros(n_batch, dtype=bool)
+    while len(batch_ids) > 0:
+        centers = _get_world_centers(forest, posed_forest, batch_ids, node_ids)
+        radii = _get_radii(forest, posed_forest, batch_ids, node_ids)
+        query_ids, voxel_ids = occupancy_map.query_aabbs(centers - radii[:, None], centers + radii[:, None])
+        gaps = np.maximum(np.abs(occupancy_map.get_voxel_centers(voxel_ids) - centers[query_ids]) - half_extent, 0)
+        is_kept = np.zeros(len(batch_ids), dtype=bool)
+        is_kept[query_ids[np.sum(gaps ** 2, axis=1) <= radii[query_ids] ** 2]] = True
+        is_kept &= ~is_collided[batch_ids]
+        batch_ids, node_ids = batch_ids[is_kept], node_ids[is_kept]
+        is_leaf = forest['children'][node_ids, 0] < 0
+        is_collided[batch_ids[is_leaf]] = True
+        batch_ids = np.repeat(batch_ids[~is_leaf], 2)
+        node_ids = forest['children'][node_ids[~is_leaf]].ravel()
+    return is_collided
@@ -10,7 +10,15 @@ import basis.robot_math as rm
 
 class FKOptBasedIK(object):
 
-    def __init__(self, robot, component_name, obstacle_list=[], toggle_debug=False):
+    def __init__(self, robot, component_name, obstacle_list=[], min_clearance=None, toggle_debug=False):
+        """
+        :param robot:
+        :param component_name:
+        :param obstacle_list:
+        :param min_clearance: if given, the collision constraint is replaced by a smooth one that keeps the links of
+                              the component min_clearance away from the obstacles, using their sdfs
+        :param toggle_debug:
+        """
         self.rbt = robot
         self.jlc_name = component_name
         self.result = None
@@ -32,6 +40,7 @@ class FKOptBasedIK(object):
         self._y_limit = 1e-6
         self._z_limit = 1e-6
         self.obstacle_list = obstacle_list
+        self.min_clearance = min_clearance
         self.toggle_debug = toggle_debug
 
     def _get_bnds(self, jlc_name):
@@ -79,6 +88,10 @@ class FKOptBasedIK(object):
         else:
             return 1
 
+    def _constraint_clearance(self, jnt_values):
+        clearances = self.rbt.get_clearances_batch(self.jlc_name, jnt_values[None, :], self.obstacle_list)
+        return clearances.min() - self.min_clearance
+
     def add_constraint(self, fun, type="ineq"):
         self.cons.append({'type': type, 'fun': fun})
 
@@ -106,7 +119,10 @@ class FKOptBasedIK(object):
         self.add_constraint(self._constraint_x, type="ineq")
         self.add_constraint(self._constraint_y, type="ineq")
         self.add_constraint(self._constraint_z, type="ineq")
-        self.add_constraint(self._constraint_collision, type="ineq")
+        if self.min_clearance is not None and len(self.obstacle_list) > 0:
+            self.add_constraint(self._constraint_clearance, type="ineq")
+        else:
+            self.add_constraint(self._constraint_collision, type="ineq")
         time_start = time.time()
         sol = minimize(self.optimization_goal,
                        seed_jnt_values,
@@ -47,18 +47,22 @@ class IncrementalNIK(object):
                 print("IK not solvable in gen_linear_motion!")
                 self.robot_s.fk(component_name, jnt_values_bk)
                 return None
-            else:
-                self.robot_s.fk(component_name, jnt_values)
-                cd_result, ct_points = self.robot_s.is_collided(obstacle_list, toggle_contact_points=True)
-                if cd_result:
-                    if toggle_debug:
-                        for ct_pnt in ct_points:
-                            gm.gen_sphere(ct_pnt).attach_to(base)
-                    print("Intermediate pose collided in gen_linear_motion!")
-                    self.robot_s.fk(component_name, jnt_values_bk)
-                    return None
             jnt_values_list.append(jnt_values)
             seed_jnt_values = jnt_values
+        # the ik solutions are checked at once
+        _, first_collided_id = self.robot_s.is_collided_batch(component_name,
+                                                              jnt_values_list,
+                                                              obstacle_list=obstacle_list,
+                                                              stop_at_first=True)
+        if first_collided_id >= 0:
+            if toggle_debug:
+                self.robot_s.fk(component_name, jnt_values_list[first_collided_id])
+                _, ct_points = self.robot_s.is_collided(obstacle_list, toggle_contact_points=True)
+                for ct_pnt in ct_points:
+                    gm.gen_sphere(ct_pnt).attach_to(base)
+            print("Intermediate pose collided in gen_linear_motion!")
+            self.robot_s.fk(component_name, jnt_values_bk)
+            return None
         self.robot_s.fk(component_name, jnt_values_bk)
         return jnt_values_list
 
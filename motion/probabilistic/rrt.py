@@ -11,10 +11,44 @@ from operator import itemgetter
 class RRT(object):
 
     def __init__(self, robot_s):
-        self.robot_s = robot_s.copy()
+        self.robot_s = robot_s.clone()
         self.roadmap = nx.Graph()
         self.start_conf = None
         self.goal_conf = None
+        self.is_primitive_precheck_enabled = False
+        self.continuous_check = None  # {'min_step': ..., 'max_step': ...} if enabled
+        self._swept_radii = {}  # component_name: see RobotInterface.gen_swept_radii
+
+    def enable_primitive_precheck(self):
+        """
+        check the configurations of an edge at once with numpy first (see RobotInterface.is_primitive_collided_batch),
+        only those that may be collided are checked by robot_s.is_collided; the pre-check uses the same primitives as
+        robot_s.is_collided, the configurations it finds collision-free are also collision-free for robot_s.is_collided
+        :return:
+        """
+        if self.robot_s.cc is None:
+            raise ValueError("The primitive pre-check requires a robot with a collision checker!")
+        self.is_primitive_precheck_enabled = True
+
+    def disable_primitive_precheck(self):
+        self.is_primitive_precheck_enabled = False
+
+    def enable_continuous_check(self, min_step=.05, max_step=.2):
+        """
+        check the edges continuously (see RobotInterface.is_edge_collided) instead of checking their discretized
+        configurations; the certified parts of an edge are collision-free for robot_s.is_collided, the configurations
+        near obstacles are still checked by robot_s.is_collided at the resolution of min_step
+        :param min_step: the joint-space length of the shortest segments
+        :param max_step: the joint-space length of the longest segments
+        :return:
+        """
+        if self.robot_s.cc is None:
+            raise ValueError("The continuous check requires a robot with a collision checker!")
+        self.continuous_check = {'min_step': min_step, 'max_step': max_step}
+        self._swept_radii = {}
+
+    def disable_continuous_check(self):
+        self.continuous_check = None
 
     def _is_collided(self,
                      component_name,
@@ -24,6 +58,56 @@ class RRT(object):
         self.robot_s.fk(component_name=component_name, jnt_values=conf)
         return self.robot_s.is_collided(obstacle_list=obstacle_list, otherrobot_list=otherrobot_list)
 
+    def _is_collided_batch(self,
+                           component_name,
+                           conf_list,
+                           obstacle_list=[],
+                           otherrobot_list=[]):
+        """
+        :return: the id of the first collided conf in conf_list, -1 if none of them is collided
+        """
+        candidate_ids = np.arange(len(conf_list))
+        if self.is_primitive_precheck_enabled:
+            candidate_ids = np.flatnonzero(self.robot_s.is_primitive_collided_batch(component_name,
+                                                                                    conf_list,
+                                                                                    obstacle_list=obstacle_list,
+                                                                                    otherrobot_list=otherrobot_list))
+            if len(candidate_ids) == 0:
+                return -1
+        _, first_collided_id = self.robot_s.is_collided_batch(component_name,
+                                                              [conf_list[i] for i in candidate_ids],
+                                                              obstacle_list=obstacle_list,
+                                                              otherrobot_list=otherrobot_list,
+                                                              stop_at_first=True)
+        return int(candidate_ids[first_collided_id]) if first_collided_id >= 0 else -1
+
+    def _get_first_collided_id(self,
+                               component_name,
+                               start_conf,
+                               conf_list,
+                               obstacle_list=[],
+                               otherrobot_list=[]):
+        """
+        :param start_conf: a collision-free conf, conf_list are on the straight edge from it to conf_list[-1]
+        :return: the id of the first conf in conf_list that cannot be reached from start_conf, -1 if all of them can
+        """
+        if self.continuous_check is None or len(conf_list) == 0:
+            return self._is_collided_batch(component_name, conf_list, obstacle_list, otherrobot_list)
+        if component_name not in self._swept_radii:
+            self._swept_radii[component_name] = self.robot_s.gen_swept_radii(component_name)
+        is_collided, free_ratio = self.robot_s.is_edge_collided(component_name,
+                                                                start_conf,
+                                                                conf_list[-1],
+                                                                obstacle_list=obstacle_list,
+                                                                otherrobot_list=otherrobot_list,
+                                                                min_step=self.continuous_check['min_step'],
+                                                                max_step=self.continuous_check['max_step'],
+                                                                swept_radii=self._swept_radii[component_name])
+        if not is_collided:
+            return -1
+        ratios = np.linalg.norm(np.array(conf_list) - start_conf, axis=1) / np.linalg.norm(conf_list[-1] - start_conf)
+        return int(np.argmax(ratios >= free_ratio))
+
     def _sample_conf(self, component_name, rand_rate, default_conf):
         if random.randint(0, 99) < rand_rate:
             return self.robot_s.rand_conf(component_name=component_name)
@@ -89,26 +173,27 @@ class RRT(object):
         """
         nearest_nid = self._get_nearest_nid(roadmap, conf)
         new_conf_list = self._extend_conf(roadmap.nodes[nearest_nid]['conf'], conf, ext_dist)[1:]
+        # the confs after the first collided one are discarded
+        first_collided_id = self._get_first_collided_id(component_name, roadmap.nodes[nearest_nid]['conf'],
+                                                        new_conf_list, obstacle_list, otherrobot_list)
+        if first_collided_id >= 0:
+            new_conf_list = new_conf_list[:first_collided_id]
         for new_conf in new_conf_list:
-            if self._is_collided(component_name, new_conf, obstacle_list, otherrobot_list):
-                return nearest_nid
-            else:
-                new_nid = random.randint(0, 1e16)
-                roadmap.add_node(new_nid, conf=new_conf)
-                roadmap.add_edge(nearest_nid, new_nid)
-                nearest_nid = new_nid
-                # all_sampled_confs.append([new_node.point, False])
-                if animation:
-                    self.draw_wspace([roadmap], self.start_conf, self.goal_conf,
-                                     obstacle_list, [roadmap.nodes[nearest_nid]['conf'], conf],
-                                     new_conf, '^c')
-                # check goal
-                if self._goal_test(conf=roadmap.nodes[new_nid]['conf'], goal_conf=goal_conf, threshold=ext_dist):
-                    roadmap.add_node('connection', conf=goal_conf)  # TODO current name -> connection
-                    roadmap.add_edge(new_nid, 'connection')
-                    return 'connection'
-        else:
-            return nearest_nid
+            new_nid = random.randint(0, 1e16)
+            roadmap.add_node(new_nid, conf=new_conf)
+            roadmap.add_edge(nearest_nid, new_nid)
+            nearest_nid = new_nid
+            # all_sampled_confs.append([new_node.point, False])
+            if animation:
+                self.draw_wspace([roadmap], self.start_conf, self.goal_conf,
+                                 obstacle_list, [roadmap.nodes[nearest_nid]['conf'], conf],
+                                 new_conf, '^c')
+            # check goal
+            if self._goal_test(conf=roadmap.nodes[new_nid]['conf'], goal_conf=goal_conf, threshold=ext_dist):
+                roadmap.add_node('connection', conf=goal_conf)  # TODO current name -> connection
+                roadmap.add_edge(new_nid, 'connection')
+                return 'connection'
+        return nearest_nid
 
     def _goal_test(self, conf, goal_conf, threshold):
         dist = np.linalg.norm(conf - goal_conf)
@@ -147,11 +232,11 @@ class RRT(object):
             #                                                            obstacle_list=obstacle_list,
             #                                                            otherrobot_list=otherrobot_list)
             #                                      for conf in shortcut):
-            if all(not self._is_collided(component_name=component_name,
-                                         conf=conf,
-                                         obstacle_list=obstacle_list,
-                                         otherrobot_list=otherrobot_list)
-                                                 for conf in shortcut):
+            if self._get_first_collided_id(component_name=component_name,
+                                           start_conf=smoothed_path[i],
+                                           conf_list=shortcut,
+                                           obstacle_list=obstacle_list,
+                                           otherrobot_list=otherrobot_list) < 0:
                 smoothed_path = smoothed_path[:i] + shortcut + smoothed_path[j + 1:]
             if animation:
                 self.draw_wspace([self.roadmap], self.start_conf, self.goal_conf,
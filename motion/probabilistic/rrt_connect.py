@@ -28,23 +28,27 @@ class RRTConnect(rrt.RRT):
         """
         nearest_nid = self._get_nearest_nid(roadmap, conf)
         new_conf_list = self._extend_conf(roadmap.nodes[nearest_nid]['conf'], conf, ext_dist)[1:]
+        # the confs before the first collided one are added, -1 is returned if the goal is not reached before it
+        first_collided_id = self._get_first_collided_id(component_name, roadmap.nodes[nearest_nid]['conf'],
+                                                        new_conf_list, obstacle_list, otherrobot_list)
+        if first_collided_id >= 0:
+            new_conf_list = new_conf_list[:first_collided_id]
         for new_conf in new_conf_list:
-            if self._is_collided(component_name, new_conf, obstacle_list, otherrobot_list):
-                return -1
-            else:
-                new_nid = random.randint(0, 1e16)
-                roadmap.add_node(new_nid, conf=new_conf)
-                roadmap.add_edge(nearest_nid, new_nid)
-                nearest_nid = new_nid
-                # all_sampled_confs.append([new_node.point, False])
-                if animation:
-                    self.draw_wspace([self.roadmap_start, self.roadmap_goal], self.start_conf, self.goal_conf,
-                                     obstacle_list, [roadmap.nodes[nearest_nid]['conf'], conf], new_conf, '^c')
-                # check goal
-                if self._goal_test(conf=roadmap.nodes[new_nid]['conf'], goal_conf=goal_conf, threshold=ext_dist):
-                    roadmap.add_node('connection', conf=goal_conf)  # TODO current name -> connection
-                    roadmap.add_edge(new_nid, 'connection')
-                    return 'connection'
+            new_nid = random.randint(0, 1e16)
+            roadmap.add_node(new_nid, conf=new_conf)
+            roadmap.add_edge(nearest_nid, new_nid)
+            nearest_nid = new_nid
+            # all_sampled_confs.append([new_node.point, False])
+            if animation:
+                self.draw_wspace([self.roadmap_start, self.roadmap_goal], self.start_conf, self.goal_conf,
+                                 obstacle_list, [roadmap.nodes[nearest_nid]['conf'], conf], new_conf, '^c')
+            # check goal
+            if self._goal_test(conf=roadmap.nodes[new_nid]['conf'], goal_conf=goal_conf, threshold=ext_dist):
+                roadmap.add_node('connection', conf=goal_conf)  # TODO current name -> connection
+                roadmap.add_edge(new_nid, 'connection')
+                return 'connection'
+        if first_collided_id >= 0:
+            return -1
         return nearest_nid
 
     def _smooth_path(self,
@@ -66,11 +70,11 @@ class RRTConnect(rrt.RRT):
             if j < i:
                 i, j = j, i
             shortcut = self._extend_conf(smoothed_path[i], smoothed_path[j], granularity)
-            if (len(shortcut) <= (j - i) + 1) and all(not self._is_collided(component_name=component_name,
-                                                                            conf=conf,
-                                                                            obstacle_list=obstacle_list,
-                                                                            otherrobot_list=otherrobot_list)
-                                                      for conf in shortcut):
+            if (len(shortcut) <= (j - i) + 1) and self._get_first_collided_id(component_name=component_name,
+                                                                              start_conf=smoothed_path[i],
+                                                                              conf_list=shortcut,
+                                                                              obstacle_list=obstacle_list,
+                                                                              otherrobot_list=otherrobot_list) < 0:
                 smoothed_path = smoothed_path[:i] + shortcut + smoothed_path[j + 1:]
             if animation:
                 self.draw_wspace([self.roadmap_start, self.roadmap_goal], self.start_conf, self.goal_conf,
@@ -11,7 +11,7 @@ from operator import itemgetter
 class RRTDW(object):
 
     def __init__(self, robot_s):
-        self.robot_s = robot_s.copy()
+        self.robot_s = robot_s.clone()
         self.roadmap = nx.Graph()
         self.start_conf = None
         self.goal_conf = None
@@ -105,7 +105,7 @@ class RRTKinodynamic(object):
         :param robot_s:
         :param extend_conf_callback: call back function for extend_conf
         """
-        self.robot_s = robot_s.copy()
+        self.robot_s = robot_s.clone()
         self.roadmap = nx.Graph()
         self.start_conf = None
         self.goal_conf = None
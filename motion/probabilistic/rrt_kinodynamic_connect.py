@@ -69,7 +69,7 @@ class RRTConnectKinodynamic(object):
         :param robot_s:
         :param extend_conf_callback: call back function for extend_conf
         """
-        self.robot_s = robot_s.copy()
+        self.robot_s = robot_s.clone()
         self.roadmap_start = nx.Graph()
         self.roadmap_goal = nx.Graph()
         self.start_conf = None
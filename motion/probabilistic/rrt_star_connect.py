@@ -66,7 +66,8 @@ class RRTStarConnect(rrtst.RRTStar):
         nearest_nid = self._get_nearest_nid(roadmap, conf)
         new_conf = self._extend_conf(roadmap.nodes[nearest_nid]['conf'], conf, ext_dist)
         if new_conf is not None:
-            if self._is_collided(component_name, new_conf, obstacle_list, otherrobot_list):
+            if self._get_first_collided_id(component_name, roadmap.nodes[nearest_nid]['conf'], [new_conf],
+                                           obstacle_list, otherrobot_list) >= 0:
                 return -1
             else:
                 new_nid = random.randint(0, 1e16)
@@ -0,0 +1,228 @@
+"""
+allowed-collision matrices (acms) of the links of a robot, generated by sampling random configurations
+a pair of links is allowed (not checked for self collision) when it is
+    adjacent: at most one joint moves them relative to each other, which includes the rigidly connected links,
+    never in contact: none of the samples collides the pair,
+    always in contact: the pair collides in at least always_ratio of the samples,
+    often in contact: the pair collides in at least often_ratio of the samples, which is mostly caused by coarse
+                      primitives of neighbouring links rather than by reachable contacts,
+    in contact at home: the pair collides at the home configurations of the components (the "default" class of moveit)
+the contacts are checked using the primitives of the collision checker, the same as the pairlist backend
+the acms are cached on disk, named by the md5 of the links, the kinematics, and the sampling parameters
+the cache directory is $WRS_ACM_CACHE_DIR or ~/.cache/wrs/acms, use set_cache_dir(None) to disable the cache
+"""
+import os
+import pickle
+import hashlib
+import tempfile
+import numpy as np
+import robot_sim._kinematics.collision_checker as cc
+
+_CACHE_VERSION = 2  # increase when the saved contents change
+_cache_dir = os.environ.get('WRS_ACM_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'wrs', 'acms'))
+_PERTURBATION = .01  # the joint values are changed by this to find the links they move
+
+
+def set_cache_dir(path):
+    """
+    :param path: a directory, None disables the cache
+    :return:
+    """
+    global _cache_dir
+    _cache_dir = path
+
+
+def get_cache_dir():
+    return _cache_dir
+
+
+def _is_elem_pairs_collided(world_cdsolids, elem_ids_a, elem_ids_b):
+    """
+    :param world_cdsolids: see collision_checker._gen_world_cdsolids
+    :param elem_ids_a: n nparray
+    :param elem_ids_b: n nparray
+    :return: n bool nparray
+    """
+    is_collided = np.zeros(len(elem_ids_a), dtype=bool)
+    pair_ids = np.flatnonzero(cc._is_aabb_overlapped(world_cdsolids['elem_mins'][elem_ids_a],
+                                                     world_cdsolids['elem_maxs'][elem_ids_a],
+                                                     world_cdsolids['elem_mins'][elem_ids_b],
+                                                     world_cdsolids['elem_maxs'][elem_ids_b]))
+    solid_ids_a, solid_ids_b = cc._expand_to_solid_pairs(world_cdsolids, elem_ids_a[pair_ids],
+                                                         world_cdsolids, elem_ids_b[pair_ids])
+    pair_ids = np.repeat(pair_ids, world_cdsolids['counts'][elem_ids_a[pair_ids]] *
+                         world_cdsolids['counts'][elem_ids_b[pair_ids]])
+    is_candidate = cc._is_aabb_overlapped(world_cdsolids['solid_mins'][solid_ids_a],
+                                          world_cdsolids['solid_maxs'][solid_ids_a],
+                                          world_cdsolids['solid_mins'][solid_ids_b],
+                                          world_cdsolids['solid_maxs'][solid_ids_b])
+    solid_ids_a, solid_ids_b, pair_ids = solid_ids_a[is_candidate], solid_ids_b[is_candidate], pair_ids[is_candidate]
+    is_collided[pair_ids[cc._is_cdsolids_collided(world_cdsolids, solid_ids_a, world_cdsolids, solid_ids_b)]] = True
+    return is_collided
+
+
+def _get_hnds(robot_s):
+    hnd_list = []
+    for hnd in robot_s.hnd_dict.values():
+        if not any(hnd is existing_hnd for existing_hnd in hnd_list):
+            hnd_list.append(hnd)
+    return hnd_list
+
+
+def _get_components(robot_s):
+    """
+    the components whose joint values can be set by fk, some robots use different sizes in get_jnt_values and fk
+    (e.g. the arms of nextage without the waist), they are covered by the other components
+    """
+    return [component_name for component_name in robot_s.manipulator_dict
+            if len(robot_s.get_jnt_values(component_name)) == len(robot_s.rand_conf(component_name))]
+
+
+def _goto_rand_conf(robot_s, component_names, hnd_list):
+    for component_name in component_names:
+        robot_s.fk(component_name, robot_s.rand_conf(component_name))
+    for hnd in hnd_list:
+        hnd.jaw_to(np.random.uniform(hnd.jawwidth_rng[0], hnd.jawwidth_rng[1]))
+
+
+def _goto_home_conf(robot_s, component_names, hnd_list):
+    for component_name in component_names:
+        robot_s.fk(component_name, robot_s.manipulator_dict[component_name].homeconf)
+    for hnd in hnd_list:
+        hnd.jaw_to(hnd.jawwidth_rng[1])
+
+
+def _get_lnk_homomats(robot_s, lnk_ids):
+    homomats = robot_s.cc.get_cdelement_homomats()[lnk_ids]
+    return np.linalg.inv(homomats[0]) @ homomats  # relative to the first link, independent of the robot pose
+
+
+def _get_moving_dofs(robot_s, component_names, hnd_list, lnk_ids):
+    """
+    the degrees of freedom moving each link, the joints moving the same links are merged
+    :return: n_lnks x n_dofs bool nparray
+    """
+    is_moved_list = []
+    homomats = _get_lnk_homomats(robot_s, lnk_ids)
+    for component_name in component_names:
+        jnt_values = robot_s.get_jnt_values(component_name)
+        for i in range(len(jnt_values)):
+            perturbed_jnt_values = jnt_values.copy()
+            perturbed_jnt_values[i] += _PERTURBATION
+            robot_s.fk(component_name, perturbed_jnt_values)
+            is_moved_list.append(np.any(np.abs(_get_lnk_homomats(robot_s, lnk_ids) - homomats) > 1e-9, axis=(1, 2)))
+        robot_s.fk(component_name, jnt_values)
+    for hnd in hnd_list:
+        jaw_width = hnd.get_jawwidth()
+        hnd.jaw_to(jaw_width + (_PERTURBATION if jaw_width < np.mean(hnd.jawwidth_rng) else -_PERTURBATION) *
+                   (hnd.jawwidth_rng[1] - hnd.jawwidth_rng[0]))
+        is_moved_list.append(np.any(np.abs(_get_lnk_homomats(robot_s, lnk_ids) - homomats) > 1e-9, axis=(1, 2)))
+        hnd.jaw_to(jaw_width)
+    return np.unique(np.array(is_moved_list).reshape(-1, len(lnk_ids)), axis=0).T
+
+
+def _fingerprint(robot_s, component_names, lnk_ids, n_samples, always_ratio, often_ratio, seed):
+    """
+    the md5 of the home configurations, the primitives, and the poses of the links at the first sampled configuration
+    """
+    md5 = hashlib.md5()
+    md5.update(str((type(robot_s).__name__, n_samples, always_ratio, often_ratio, seed, _CACHE_VERSION)).encode())
+    for component_name in component_names:
+        md5.update(np.round(np.asarray(robot_s.manipulator_dict[component_name].homeconf, dtype=np.float64),
+                            6).tobytes())
+    for lnk_id in lnk_ids:
+        for array in list(robot_s.cc._local_cdsolids[lnk_id]) + [robot_s.cc._cdscales[lnk_id]]:
+            md5.update(np.round(np.asarray(array, dtype=np.float64), 6).tobytes())
+    md5.update(np.round(_get_lnk_homomats(robot_s, lnk_ids), 6).tobytes())
+    return md5.hexdigest()
+
+
+def gen_acm(robot_s, n_samples=2000, always_ratio=.95, often_ratio=.5, seed=0):
+    """
+    sample random configurations of the components (manipulator_dict) and jaw widths of the hands (hnd_dict)
+    the joint values of the robot and the state of np.random are restored after sampling
+    :param robot_s: a robot with an enabled collision checker
+    :param n_samples:
+    :param always_ratio: pairs collided in at least this ratio of the samples are always in contact
+    :param often_ratio: pairs collided in at least this ratio of the samples are often in contact, they are also
+                        allowed; use a value larger than always_ratio to check them
+    :param seed: the samples are generated from np.random.seed(seed), so that the acms can be reproduced
+    :return: a dictionary
+             'lnk_names': the names of the links, ordered as the links in robot_s.cc.all_cdelements,
+             'contact_ratios': n_lnks x n_lnks nparray, nan for the adjacent pairs, which are not sampled,
+             'is_adjacent', 'is_never', 'is_always', 'is_often', 'is_home', and 'is_allowed': n_lnks x n_lnks bool
+             nparrays
+    """
+    if robot_s.cc is None:
+        raise ValueError("The collision checker of the robot is not enabled!")
+    lnk_ids = np.flatnonzero([jlcobj is not None for jlcobj, _ in robot_s.cc._lnk_sources])
+    random_state_bk = np.random.get_state()
+    component_names = _get_components(robot_s)
+    hnd_list = _get_hnds(robot_s)
+    jnt_values_bk = {component_name: robot_s.get_jnt_values(component_name) for component_name in component_names}
+    jaw_widths_bk = [hnd.get_jawwidth() for hnd in hnd_list]
+    np.random.seed(seed)
+    try:
+        _goto_rand_conf(robot_s, component_names, hnd_list)
+        fingerprint = _fingerprint(robot_s, component_names, lnk_ids, n_samples, always_ratio, often_ratio, seed)
+        cache_path = None if _cache_dir is None else os.path.join(_cache_dir, fingerprint + '.pkl')
+        if cache_path is not None and os.path.isfile(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    return pickle.load(f)
+            except Exception as e:
+                print(f"Failed to read the acm cache {cache_path}: {e}, regenerating it.")
+        is_moved = _get_moving_dofs(robot_s, component_names, hnd_list, lnk_ids)
+        n_jnts_between = np.sum(is_moved[:, None, :] != is_moved[None, :, :], axis=2)
+        ids_a, ids_b = np.nonzero(np.triu(n_jnts_between > 1, 1))
+        n_contacts = np.zeros(len(ids_a))
+        for _ in range(n_samples):
+            _goto_rand_conf(robot_s, component_names, hnd_list)
+            n_contacts += _is_elem_pairs_collided(robot_s.cc.gen_world_cdsolids(), lnk_ids[ids_a], lnk_ids[ids_b])
+        _goto_home_conf(robot_s, component_names, hnd_list)
+        is_home_collided = _is_elem_pairs_collided(robot_s.cc.gen_world_cdsolids(), lnk_ids[ids_a], lnk_ids[ids_b])
+    finally:
+        np.random.set_state(random_state_bk)
+        for component_name, jnt_values in jnt_values_bk.items():
+            robot_s.fk(component_name, jnt_values)
+        for hnd, jaw_width in zip(hnd_list, jaw_widths_bk):
+            hnd.jaw_to(jaw_width)
+    contact_ratios = np.full((len(lnk_ids), len(lnk_ids)), np.nan)
+    contact_ratios[ids_a, ids_b] = contact_ratios[ids_b, ids_a] = n_contacts / max(n_samples, 1)
+    is_adjacent = n_jnts_between <= 1
+    is_never = contact_ratios == 0
+    is_always = contact_ratios >= always_ratio
+    is_often = (contact_ratios >= often_ratio) & ~is_always
+    is_home = np.zeros((len(lnk_ids), len(lnk_ids)), dtype=bool)
+    is_home[ids_a, ids_b] = is_home[ids_b, ids_a] = is_home_collided
+    acm = {'lnk_names': [robot_s.cc._lnk_sources[i][0].name + '.' +
+                         robot_s.cc._lnk_sources[i][0].lnks[robot_s.cc._lnk_sources[i][1]]['name'] for i in lnk_ids],
+           'contact_ratios': contact_ratios,
+           'is_adjacent': is_adjacent,
+           'is_never': is_never,
+           'is_always': is_always,
+           'is_often': is_often,
+           'is_home': is_home,
+           'is_allowed': is_adjacent | is_never | is_always | is_often | is_home}
+    if cache_path is not None:
+        try:
+            os.makedirs(_cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=_cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(acm, f)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Failed to write the acm cache {cache_path}: {e}.")
+    return acm
+
+
+def clear_cache():
+    """
+    remove all cached acms
+    :return:
+    """
+    if _cache_dir is None or not os.path.isdir(_cache_dir):
+        return
+    for file_name in os.listdir(_cache_dir):
+        if file_name.endswith('.pkl'):
+            os.remove(os.path.join(_cache_dir, file_name))
@@ -1,18 +1,306 @@
 import copy
-
+import weakref
+import numpy as np
 import basis.data_adapter as da
 import modeling.model_collection as mc
+import modeling.collision_model as cm
+import modeling.sphere_tree as mst
+import modeling.occupancy_map as om
 from panda3d.core import NodePath, CollisionTraverser, CollisionHandlerQueue, BitMask32
+from panda3d.core import CollisionBox, CollisionSphere, CollisionPolygon, BoundingBox
+
+
+def _extract_cdsolids(cdnp):
+    """
+    the collision solids of a cdnp in its local frame, used by the pairlist backend
+    boxes are kept as boxes, spheres as spheres, polygons are replaced by their bounding boxes,
+    and the other solids by their bounding volumes
+    :param cdnp:
+    :return: [centers, half_extents, is_sphere], nx3, nx3, and n nparrays; the half extents of a sphere are its radius
+    """
+    centers, half_extents, is_sphere = [], [], []
+    cdnode = cdnp.node()
+    for i in range(cdnode.getNumSolids()):
+        solid = cdnode.getSolid(i)
+        if isinstance(solid, CollisionBox):
+            min_pnt, max_pnt = da.pdv3_to_npv3(solid.getMin()), da.pdv3_to_npv3(solid.getMax())
+        elif isinstance(solid, CollisionPolygon):
+            points = np.array([da.pdv3_to_npv3(solid.getPoint(j)) for j in range(solid.getNumPoints())])
+            min_pnt, max_pnt = points.min(axis=0), points.max(axis=0)
+        elif isinstance(solid, CollisionSphere):
+            centers.append(da.pdv3_to_npv3(solid.getCenter()))
+            half_extents.append(np.full(3, solid.getRadius()))
+            is_sphere.append(True)
+            continue
+        else:
+            bounds = solid.getBounds()
+            if isinstance(bounds, BoundingBox):
+                min_pnt, max_pnt = da.pdv3_to_npv3(bounds.getMin()), da.pdv3_to_npv3(bounds.getMax())
+            else:
+                centers.append(da.pdv3_to_npv3(bounds.getCenter()))
+                half_extents.append(np.full(3, bounds.getRadius()))
+                is_sphere.append(True)
+                continue
+        centers.append((min_pnt + max_pnt) / 2)
+        half_extents.append((max_pnt - min_pnt) / 2)
+        is_sphere.append(False)
+    return np.array(centers).reshape(-1, 3), np.array(half_extents).reshape(-1, 3), np.array(is_sphere, dtype=bool)
+
+
+_obstacle_cdsolids_cache = weakref.WeakKeyDictionary()  # obstacle: [collision node, local cdsolids]
+
+
+def _extract_obstacle_cdsolids(obstacle):
+    """
+    the obstacles are usually checked many times, their cdsolids are cached until the cdnp is changed
+    :param obstacle: collisionmodel
+    :return: see _extract_cdsolids
+    """
+    cdnp = obstacle.cdnp
+    cached = _obstacle_cdsolids_cache.get(obstacle)
+    if cached is None or cached[0] != cdnp.node():
+        cached = [cdnp.node(), _extract_cdsolids(cdnp)]
+        _obstacle_cdsolids_cache[obstacle] = cached
+    return cached[1]
+
+
+def _pack_local_cdsolids(local_cdsolids_list, scales):
+    """
+    concatenate the local collision solids of a list of cd elements and apply their scales
+    :param local_cdsolids_list: a list of [centers, half_extents, is_sphere], see _extract_cdsolids
+    :param scales: nx3 nparray, the scales of the n elements
+    :return: a dictionary of the scaled solids, and the ids of their elements
+    """
+    counts = np.array([len(lcs[2]) for lcs in local_cdsolids_list], dtype=int)
+    elem_ids = np.repeat(np.arange(len(counts)), counts)
+    solid_scales = scales.reshape(-1, 3)[elem_ids]
+    is_sphere = np.concatenate([np.zeros(0, dtype=bool)] + [lcs[2] for lcs in local_cdsolids_list])
+    half_extents = np.concatenate([np.zeros((0, 3))] + [lcs[1] for lcs in local_cdsolids_list]) * solid_scales
+    # spheres are kept as spheres under non-uniform scaling, conservatively
+    half_extents[is_sphere] = half_extents[is_sphere].max(axis=1, keepdims=True)
+    starts = np.cumsum(counts) - counts
+    return {'centers': np.concatenate([np.zeros((0, 3))] + [lcs[0] for lcs in local_cdsolids_list]) * solid_scales,
+            'half_extents': half_extents,
+            'is_sphere': is_sphere,
+            'elem_ids': elem_ids,
+            'starts': starts,
+            'counts': counts,
+            'nonempty_starts': starts[counts > 0]}
+
+
+def _tile_local_cdsolids(local_cdsolids, n):
+    """
+    repeat the local collision solids of a list of cd elements, e.g. for a batch of configurations
+    :param local_cdsolids: see _pack_local_cdsolids
+    :param n: the number of copies, the elements of the i-th copy are numbered from i * the number of elements
+    :return: see _pack_local_cdsolids
+    """
+    n_elements = len(local_cdsolids['counts'])
+    counts = np.tile(local_cdsolids['counts'], n)
+    starts = np.cumsum(counts) - counts
+    return {'centers': np.tile(local_cdsolids['centers'], (n, 1)),
+            'half_extents': np.tile(local_cdsolids['half_extents'], (n, 1)),
+            'is_sphere': np.tile(local_cdsolids['is_sphere'], n),
+            'elem_ids': (np.arange(n)[:, None] * n_elements + local_cdsolids['elem_ids']).ravel(),
+            'starts': starts,
+            'counts': counts,
+            'nonempty_starts': starts[counts > 0]}
+
+
+def _gen_world_cdsolids(local_cdsolids, poss, rotmats):
+    """
+    move the local collision solids of a list of cd elements to the world frame
+    :param local_cdsolids: see _pack_local_cdsolids
+    :param poss: nx3 nparray
+    :param rotmats: nx3x3 nparray
+    :return: a dictionary of the world solids, their aabbs, and the aabbs of the elements
+    """
+    elem_ids = local_cdsolids['elem_ids']
+    is_sphere = local_cdsolids['is_sphere']
+    half_extents = local_cdsolids['half_extents']
+    counts = local_cdsolids['counts']
+    solid_rotmats = rotmats[elem_ids]
+    gl_centers = np.einsum('nij,nj->ni', solid_rotmats, local_cdsolids['centers']) + poss[elem_ids]
+    aabb_half_extents = np.einsum('nij,nj->ni', np.abs(solid_rotmats), half_extents)
+    aabb_half_extents[is_sphere] = half_extents[is_sphere]
+    solid_mins = gl_centers - aabb_half_extents
+    solid_maxs = gl_centers + aabb_half_extents
+    elem_mins = np.full((len(counts), 3), np.inf)
+    elem_maxs = np.full((len(counts), 3), -np.inf)
+    if len(solid_mins) > 0:
+        is_nonempty = counts > 0
+        elem_mins[is_nonempty] = np.minimum.reduceat(solid_mins, local_cdsolids['nonempty_starts'])
+        elem_maxs[is_nonempty] = np.maximum.reduceat(solid_maxs, local_cdsolids['nonempty_starts'])
+    return {'centers': gl_centers,
+            'rotmats': solid_rotmats,
+            'half_extents': half_extents,
+            'is_sphere': is_sphere,
+            'solid_mins': solid_mins,
+            'solid_maxs': solid_maxs,
+            'starts': local_cdsolids['starts'],
+            'counts': counts,
+            'elem_mins': elem_mins,
+            'elem_maxs': elem_maxs}
+
+
+def _concatenate_world_cdsolids(world_cdsolids_list):
+    if len(world_cdsolids_list) == 1:
+        return world_cdsolids_list[0]
+    world_cdsolids = {key: np.concatenate([wcs[key] for wcs in world_cdsolids_list])
+                      for key in world_cdsolids_list[0].keys()}
+    world_cdsolids['starts'] = np.cumsum(world_cdsolids['counts']) - world_cdsolids['counts']
+    return world_cdsolids
+
+
+def _is_aabb_overlapped(mins_a, maxs_a, mins_b, maxs_b):
+    return np.all((mins_a <= maxs_b) & (mins_b <= maxs_a), axis=-1)
+
+
+def _is_box_box_collided(centers_a, rotmats_a, half_extents_a, centers_b, rotmats_b, half_extents_b):
+    """
+    separating axis test of n pairs of oriented boxes (the 15 axes of Gottschalk's obbtree)
+    :return: n bool nparray
+    """
+    rotmats_at = np.swapaxes(rotmats_a, 1, 2)
+    rotmats = rotmats_at @ rotmats_b  # the axes of b in the frame of a
+    t = (rotmats_at @ (centers_b - centers_a)[..., None])[..., 0]
+    abs_rotmats = np.abs(rotmats) + 1e-12  # robust to parallel edges
+    is_separated = np.any(np.abs(t) > half_extents_a + (abs_rotmats @ half_extents_b[..., None])[..., 0], axis=1)
+    t_b = (np.swapaxes(rotmats, 1, 2) @ t[..., None])[..., 0]
+    is_separated |= np.any(np.abs(t_b) > half_extents_b +
+                           (np.swapaxes(abs_rotmats, 1, 2) @ half_extents_a[..., None])[..., 0], axis=1)
+    for i in range(3):
+        i1, i2 = (i + 1) % 3, (i + 2) % 3
+        for j in range(3):
+            j1, j2 = (j + 1) % 3, (j + 2) % 3
+            projected_dist = np.abs(t[:, i2] * rotmats[:, i1, j] - t[:, i1] * rotmats[:, i2, j])
+            projected_radius = (half_extents_a[:, i1] * abs_rotmats[:, i2, j] +
+                                half_extents_a[:, i2] * abs_rotmats[:, i1, j] +
+                                half_extents_b[:, j1] * abs_rotmats[:, i, j2] +
+                                half_extents_b[:, j2] * abs_rotmats[:, i, j1])
+            is_separated |= projected_dist > projected_radius
+    return ~is_separated
+
+
+def _is_box_sphere_collided(centers_a, rotmats_a, half_extents_a, centers_b, radii_b):
+    loc_centers_b = (np.swapaxes(rotmats_a, 1, 2) @ (centers_b - centers_a)[..., None])[..., 0]
+    nearest_pnts = np.clip(loc_centers_b, -half_extents_a, half_extents_a)
+    return np.sum((loc_centers_b - nearest_pnts) ** 2, axis=1) <= radii_b ** 2
+
+
+def _is_cdsolids_collided(world_cdsolids_a, solid_ids_a, world_cdsolids_b, solid_ids_b):
+    """
+    narrow phase of the pairlist backend
+    :param world_cdsolids_a: see _gen_world_cdsolids
+    :param solid_ids_a: n nparray
+    :param world_cdsolids_b:
+    :param solid_ids_b: n nparray, (solid_ids_a[i], solid_ids_b[i]) is the i-th solid pair to check
+    :return: n bool nparray
+    """
+    is_collided = np.zeros(len(solid_ids_a), dtype=bool)
+    is_sphere_a = world_cdsolids_a['is_sphere'][solid_ids_a]
+    is_sphere_b = world_cdsolids_b['is_sphere'][solid_ids_b]
+    for (ids_a, wcs_a, ids_b, wcs_b, selection) in [
+        (solid_ids_a, world_cdsolids_a, solid_ids_b, world_cdsolids_b, ~is_sphere_a & ~is_sphere_b),
+        (solid_ids_a, world_cdsolids_a, solid_ids_b, world_cdsolids_b, ~is_sphere_a & is_sphere_b),
+        (solid_ids_b, world_cdsolids_b, solid_ids_a, world_cdsolids_a, is_sphere_a & ~is_sphere_b),
+        (solid_ids_a, world_cdsolids_a, solid_ids_b, world_cdsolids_b, is_sphere_a & is_sphere_b)]:
+        if not np.any(selection):
+            continue
+        ids_a, ids_b = ids_a[selection], ids_b[selection]
+        if wcs_a['is_sphere'][ids_a[0]] and wcs_b['is_sphere'][ids_b[0]]:
+            radii = wcs_a['half_extents'][ids_a, 0] + wcs_b['half_extents'][ids_b, 0]
+            is_collided[selection] = np.sum((wcs_a['centers'][ids_a] - wcs_b['centers'][ids_b]) ** 2,
+                                            axis=1) <= radii ** 2
+        elif wcs_b['is_sphere'][ids_b[0]]:
+            is_collided[selection] = _is_box_sphere_collided(wcs_a['centers'][ids_a],
+                                                             wcs_a['rotmats'][ids_a],
+                                                             wcs_a['half_extents'][ids_a],
+                                                             wcs_b['centers'][ids_b],
+                                                             wcs_b['half_extents'][ids_b, 0])
+        else:
+            is_collided[selection] = _is_box_box_collided(wcs_a['centers'][ids_a],
+                                                          wcs_a['rotmats'][ids_a],
+                                                          wcs_a['half_extents'][ids_a],
+                                                          wcs_b['centers'][ids_b],
+                                                          wcs_b['rotmats'][ids_b],
+                                                          wcs_b['half_extents'][ids_b])
+    return is_collided
+
+
+def _expand_to_solid_pairs(world_cdsolids_a, elem_ids_a, world_cdsolids_b, elem_ids_b):
+    """
+    all pairs of the solids of the given element pairs
+    :return: solid_ids_a, solid_ids_b
+    """
+    counts_a = world_cdsolids_a['counts'][elem_ids_a]
+    counts_b = world_cdsolids_b['counts'][elem_ids_b]
+    nsolid_pairs = counts_a * counts_b
+    pair_ids = np.repeat(np.arange(len(nsolid_pairs)), nsolid_pairs)
+    offsets = np.arange(len(pair_ids)) - np.repeat(np.cumsum(nsolid_pairs) - nsolid_pairs, nsolid_pairs)
+    solid_ids_a = world_cdsolids_a['starts'][elem_ids_a][pair_ids] + offsets // counts_b[pair_ids]
+    solid_ids_b = world_cdsolids_b['starts'][elem_ids_b][pair_ids] + offsets % counts_b[pair_ids]
+    return solid_ids_a, solid_ids_b
+
+
+def _split_obstacles(obstacle_list):
+    """
+    :return: [collision models, occupancy maps]
+    """
+    return ([obstacle for obstacle in obstacle_list if not isinstance(obstacle, om.OccupancyMap)],
+            [obstacle for obstacle in obstacle_list if isinstance(obstacle, om.OccupancyMap)])
+
+
+def _query_occupancy_collided(world_cdsolids, elem_ids, occupancy_map):
+    """
+    check the primitives of the given elements against the occupied voxels, which are looked up by the aabbs of the
+    primitives
+    :param world_cdsolids: see _gen_world_cdsolids
+    :param elem_ids:
+    :param occupancy_map: modeling.occupancy_map.OccupancyMap
+    :return: [solid_ids, voxel_centers], the collided pairs of the primitives and voxels
+    """
+    counts = world_cdsolids['counts'][elem_ids]
+    solid_ids = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) +
+                 np.repeat(world_cdsolids['starts'][elem_ids], counts))
+    query_ids, voxel_ids = occupancy_map.query_aabbs(world_cdsolids['solid_mins'][solid_ids],
+                                                     world_cdsolids['solid_maxs'][solid_ids])
+    if len(query_ids) == 0:
+        return np.zeros(0, dtype=int), np.zeros((0, 3))
+    voxel_ids, voxel_inverse = np.unique(voxel_ids, return_inverse=True)
+    n_voxels = len(voxel_ids)
+    voxel_cdsolids = {'centers': occupancy_map.get_voxel_centers(voxel_ids),
+                      'rotmats': np.tile(np.eye(3), (n_voxels, 1, 1)),
+                      'half_extents': np.full((n_voxels, 3), occupancy_map.resolution / 2),
+                      'is_sphere': np.zeros(n_voxels, dtype=bool)}
+    solid_ids = solid_ids[query_ids]
+    is_collided = _is_cdsolids_collided(world_cdsolids, solid_ids, voxel_cdsolids, voxel_inverse)
+    return solid_ids[is_collided], voxel_cdsolids['centers'][voxel_inverse[is_collided]]
+
+
+def _gen_occupancy_contact_points(world_cdsolids, elem_ids, occupancy_map):
+    """
+    :return: kx3 nparray, the centers of the overlapping aabbs of the collided primitives and voxels, empty if there
+             is no collision; see _query_occupancy_collided
+    """
+    solid_ids, voxel_centers = _query_occupancy_collided(world_cdsolids, elem_ids, occupancy_map)
+    return (np.maximum(world_cdsolids['solid_mins'][solid_ids], voxel_centers - occupancy_map.resolution / 2) +
+            np.minimum(world_cdsolids['solid_maxs'][solid_ids], voxel_centers + occupancy_map.resolution / 2)) / 2
 
 
 class CollisionChecker(object):
     """
-    A fast collision checker that allows maximum 32 collision pairs
+    A fast collision checker with two backends
+    'bitmask': the pairs are encoded as the bits of BitMask32 and checked by traversing panda3d colliders,
+               allows maximum 30 collision pairs
+    'pairlist': the pairs are kept as an explicit list of element pairs (an allowed-collision matrix),
+                candidates are selected by comparing the aabbs of the cd elements, and only their primitives are
+                checked using the separating axis test; the number of pairs is unlimited
     author: weiwei
     date: 20201214osaka
     """
 
-    def __init__(self, name="auto"):
+    def __init__(self, name="auto", backend='bitmask'):
         self.ctrav = CollisionTraverser()
         self.chan = CollisionHandlerQueue()
         self.np = NodePath(name)
@@ -20,6 +308,41 @@ class CollisionChecker(object):
         self.nbitmask = 0  # capacity 1-30
         self._bitmask_ext = BitMask32(2 ** 31)  # 31 is prepared for cd with external non-active objects
         self.all_cdelements = []  # a list of cdlnks or cdobjs for quick accessing the cd elements (cdlnks/cdobjs)
+        # the following members are aligned with self.all_cdelements and used by the pairlist backend
+        self._cdpairs = []  # [[from_id, into_id], ...], ids of self.all_cdelements
+        self._is_active = []  # active elements are checked against external obstacles and other robots
+        self._local_cdsolids = []  # [centers, half_extents, is_sphere] of each element in its local frame
+        self._cdscales = []  # the scales of the cdnps
+        self._lnk_sources = []  # [jlcobj, lnk_id] of each element, [None, None] for cdobjs
+        self._compiled_pairlist = None  # arrays compiled from the above lists, reset when they are changed
+        self._version = 0  # increased when the cd elements, the pairs, or the scene are changed, see self.get_version
+        self._is_bitmask_full = False  # some pairs could not be encoded as bits
+        self._distance_cache = {}  # see modeling.collision_model.query_min_distance
+        self._scene = None  # see self.attach_scene
+        self._scene_np = None
+        self.backend = None
+        self.set_backend(backend)
+
+    def set_backend(self, backend='pairlist'):
+        """
+        :param backend: 'bitmask' or 'pairlist'
+        :return:
+        """
+        if backend not in ['bitmask', 'pairlist']:
+            raise ValueError("Wrong collision checker backend name!")
+        if backend == 'bitmask' and self._is_bitmask_full:
+            raise ValueError("Too many collision pairs for the bitmask backend! Maximum: 30")
+        self.backend = backend
+
+    def _add_cdelement(self, cdelement, cdnp, jlcobj=None, lnk_id=None):
+        self.all_cdelements.append(cdelement)
+        self._lnk_sources.append([jlcobj, lnk_id])
+        self._is_active.append(False)
+        self._local_cdsolids.append(_extract_cdsolids(cdnp))
+        self._cdscales.append(da.pdv3_to_npv3(cdnp.getScale()))
+        self._compiled_pairlist = None
+        self._version += 1
+        return len(self.all_cdelements) - 1
 
     def add_cdlnks(self, jlcobj, lnk_idlist):
         """
@@ -36,8 +359,7 @@ class CollisionChecker(object):
             if jlcobj.lnks[id]['cdprimit_childid'] == -1:  # first time add
                 cdnp = jlcobj.lnks[id]['collisionmodel'].copy_cdnp_to(self.np, clearmask=True)
                 self.ctrav.addCollider(cdnp, self.chan)
-                self.all_cdelements.append(jlcobj.lnks[id])
-                jlcobj.lnks[id]['cdprimit_childid'] = len(self.all_cdelements) - 1
+                jlcobj.lnks[id]['cdprimit_childid'] = self._add_cdelement(jlcobj.lnks[id], cdnp, jlcobj, id)
             else:
                 raise ValueError("The link is already added!")
 
@@ -56,35 +378,82 @@ class CollisionChecker(object):
                 raise ValueError("The link needs to be added to collider using the add_cdlnks function first!")
             cdnp = self.np.getChild(cdlnk['cdprimit_childid'])
             cdnp.node().setFromCollideMask(self._bitmask_ext)
+            self._is_active[cdlnk['cdprimit_childid']] = True
+        self._compiled_pairlist = None
+        self._version += 1
 
     def set_cdpair(self, fromlist, intolist):
         """
         The given collision pair will be used for self collision detection
+        When the 30 bits are used up, the pairs are only recorded for the pairlist backend, which is switched on
         :param fromlist: [[bool, cdprimit_cache], ...]
         :param intolist: [[bool, cdprimit_cache], ...]
         :return:
         author: weiwei
         date: 20201215
         """
+        for cdlnk in fromlist + intolist:
+            if cdlnk['cdprimit_childid'] == -1:
+                raise ValueError("The link needs to be added to collider using the addjlcobj function first!")
+        self._cdpairs += [[from_cdlnk['cdprimit_childid'], into_cdlnk['cdprimit_childid']]
+                          for from_cdlnk in fromlist for into_cdlnk in intolist]
+        self._compiled_pairlist = None
+        self._version += 1
         if self.nbitmask >= 30:
-            raise ValueError("Too many collision pairs! Maximum: 29")
+            if not self._is_bitmask_full:
+                print("Too many collision pairs for the bitmask backend, switched to the pairlist backend.")
+            self._is_bitmask_full = True
+            self.backend = 'pairlist'
+            return
         cdmask = BitMask32(2 ** self.nbitmask)
         for cdlnk in fromlist:
-            if cdlnk['cdprimit_childid'] == -1:
-                raise ValueError("The link needs to be added to collider using the addjlcobj function first!")
             cdnp = self.np.getChild(cdlnk['cdprimit_childid'])
             current_from_cdmask = cdnp.node().getFromCollideMask()
             new_from_cdmask = current_from_cdmask | cdmask
             cdnp.node().setFromCollideMask(new_from_cdmask)
         for cdlnk in intolist:
-            if cdlnk['cdprimit_childid'] == -1:
-                raise ValueError("The link needs to be added to collider using the addjlcobj function first!")
             cdnp = self.np.getChild(cdlnk['cdprimit_childid'])
             current_into_cdmask = cdnp.node().getIntoCollideMask()
             new_into_cdmask = current_into_cdmask | cdmask
             cdnp.node().setIntoCollideMask(new_into_cdmask)
         self.nbitmask += 1
 
+    def set_acm(self, acm):
+        """
+        replace the self-collision pairs between the links by the pairs that are not allowed by an allowed-collision
+        matrix, see robot_sim._kinematics.collision_acm; the pairs of the objects in hand are kept
+        :param acm: see collision_acm.gen_acm
+        :return:
+        """
+        lnk_ids = np.flatnonzero([jlcobj is not None for jlcobj, _ in self._lnk_sources])
+        if len(lnk_ids) != len(acm['is_allowed']):
+            raise ValueError("The allowed-collision matrix does not match the links of the collision checker!")
+        ids_a, ids_b = np.nonzero(np.triu(~acm['is_allowed'], 1))
+        lnk_cdpairs = np.stack([lnk_ids[ids_a], lnk_ids[ids_b]], axis=1).tolist()
+        is_lnk = np.zeros(len(self.all_cdelements), dtype=bool)
+        is_lnk[lnk_ids] = True
+        cdobj_cdpairs = [cdpair for cdpair in self._cdpairs if not (is_lnk[cdpair[0]] and is_lnk[cdpair[1]])]
+        # clear the bits and encode the pairs again
+        for elem_id in range(len(self.all_cdelements)):
+            cdnp = self.np.getChild(elem_id)
+            cdnp.node().setFromCollideMask(self._bitmask_ext if self._is_active[elem_id] else BitMask32(0))
+            cdnp.node().setIntoCollideMask(BitMask32(0))
+        self._cdpairs = []
+        self.nbitmask = 0
+        self._is_bitmask_full = False
+        self._compiled_pairlist = None
+        self._version += 1
+        # each bit encodes the pairs of a link, the links with the most remaining pairs are taken first
+        while len(lnk_cdpairs) > 0:
+            from_id = np.argmax(np.bincount(np.array(lnk_cdpairs).ravel()))
+            into_ids = [cdpair[0] + cdpair[1] - from_id for cdpair in lnk_cdpairs if from_id in cdpair]
+            self.set_cdpair([self.all_cdelements[from_id]], [self.all_cdelements[into_id] for into_id in into_ids])
+            lnk_cdpairs = [cdpair for cdpair in lnk_cdpairs if from_id not in cdpair]
+        # the objects in hand keep their own bits, see self.delete_cdobj
+        for from_id in dict.fromkeys([cdpair[0] for cdpair in cdobj_cdpairs]):
+            self.set_cdpair([self.all_cdelements[from_id]],
+                            [self.all_cdelements[cdpair[1]] for cdpair in cdobj_cdpairs if cdpair[0] == from_id])
+
     def add_cdobj(self, objcm, rel_pos, rel_rotmat, intolist):
         """
         :return: cdobj_info, a dictionary that mimics a joint link; Besides that, there is an additional 'intolist'
@@ -100,8 +469,8 @@ class CollisionChecker(object):
         cdnp = objcm.copy_cdnp_to(self.np, clearmask=True)
         cdnp.node().setFromCollideMask(self._bitmask_ext)  # set active
         self.ctrav.addCollider(cdnp, self.chan)
-        self.all_cdelements.append(cdobj_info)
-        cdobj_info['cdprimit_childid'] = len(self.all_cdelements) - 1
+        cdobj_info['cdprimit_childid'] = self._add_cdelement(cdobj_info, cdnp)
+        self._is_active[cdobj_info['cdprimit_childid']] = True
         self.set_cdpair([cdobj_info], intolist)
         return cdobj_info
 
@@ -111,8 +480,17 @@ class CollisionChecker(object):
         :param objcm:
         :return:
         """
-        self.all_cdelements.remove(cdobj_info)
-        cdnp_to_delete = self.np.getChild(cdobj_info['cdprimit_childid'])
+        id_to_delete = cdobj_info['cdprimit_childid']
+        self.all_cdelements.pop(id_to_delete)
+        self._is_active.pop(id_to_delete)
+        self._local_cdsolids.pop(id_to_delete)
+        self._cdscales.pop(id_to_delete)
+        self._lnk_sources.pop(id_to_delete)
+        self._cdpairs = [[from_id - (from_id > id_to_delete), into_id - (into_id > id_to_delete)]
+                         for from_id, into_id in self._cdpairs if id_to_delete not in (from_id, into_id)]
+        self._compiled_pairlist = None
+        self._version += 1
+        cdnp_to_delete = self.np.getChild(id_to_delete)
         self.ctrav.removeCollider(cdnp_to_delete)
         for cdlnk in cdobj_info['intolist']:
             cdnp = self.np.getChild(cdlnk['cdprimit_childid'])
@@ -120,13 +498,11 @@ class CollisionChecker(object):
             new_into_cdmask = current_into_cdmask & ~cdnp_to_delete.node().getFromCollideMask()
             cdnp.node().setIntoCollideMask(new_into_cdmask)
         cdnp_to_delete.detachNode()
+        # the children after the deleted one are shifted forward
+        for cdelement in self.all_cdelements[id_to_delete:]:
+            cdelement['cdprimit_childid'] -= 1
 
-    def is_collided(self, obstacle_list=[], otherrobot_list=[], toggle_contact_points=False):
-        """
-        :param obstacle_list: staticgeometricmodel
-        :param otherrobot_list:
-        :return:
-        """
+    def _update_cdnp_poses(self):
         for cdelement in self.all_cdelements:
             pos = cdelement['gl_pos']
             rotmat = cdelement['gl_rotmat']
@@ -140,7 +516,13 @@ class CollisionChecker(object):
         #     print(collider.getMat())
         #     print("From", collider.node().getFromCollideMask())
         #     print("Into", collider.node().getIntoCollideMask())
-        # attach obstacles
+
+    def _attach_obstacles(self, obstacle_list, otherrobot_list):
+        """
+        :return: the parents of the obstacles, used by self._detach_obstacles to restore them
+        """
+        # attach obstacles, the occupancy maps are checked without panda3d
+        obstacle_list = _split_obstacles(obstacle_list)[0]
         obstacle_parent_list = []
         for obstacle in obstacle_list:
             obstacle_parent_list.append(obstacle.objpdnp.getParent())
@@ -152,10 +534,11 @@ class CollisionChecker(object):
                 new_into_cdmask = current_into_cdmask | self._bitmask_ext
                 cdnp.node().setIntoCollideMask(new_into_cdmask)
             robot.cc.np.reparentTo(self.np)
-        # collision check
-        self.ctrav.traverse(self.np)
+        return obstacle_parent_list
+
+    def _detach_obstacles(self, obstacle_list, otherrobot_list, obstacle_parent_list):
         # clear obstacles
-        for i, obstacle in enumerate(obstacle_list):
+        for i, obstacle in enumerate(_split_obstacles(obstacle_list)[0]):
             obstacle.objpdnp.reparentTo(obstacle_parent_list[i])
         # clear other robots
         for robot in otherrobot_list:
@@ -167,17 +550,466 @@ class CollisionChecker(object):
                 robot.cc.np.reparentTo(base.render)
             else:
                 robot.cc.np.detachNode()
+
+    def attach_scene(self, scene):
+        """
+        keep the obstacles of a collision scene attached, is_collided and is_collided_batch check them in addition
+        to the given obstacle_list; only the obstacles whose aabbs overlap those of the active elements are checked
+        :param scene: robot_sim._kinematics.collision_scene.CollisionScene
+        :return:
+        """
+        self.detach_scene()
+        self._scene = scene
+        # the instance is sorted after the cdnps, so that their child ids are kept
+        self._scene_np = scene.np.instanceTo(self.np, 2 ** 30)
+        self._version += 1
+
+    def detach_scene(self):
+        """
+        :return: the detached scene, None if there is no attached scene
+        """
+        scene = self._scene
+        if scene is not None:
+            self._scene_np.detachNode()
+            self._scene = None
+            self._scene_np = None
+            self._version += 1
+        return scene
+
+    def get_version(self):
+        """
+        a stamp that is changed whenever the cd elements (e.g. the objects in hand), the pairs, or the attached scene
+        are changed
+        :return: a tuple
+        """
+        return self._version, None if self._scene is None else self._scene.version
+
+    def get_jlc_states(self):
+        """
+        the joint values and the base poses of the jlchains of the cd links, which decide the poses of the cd elements
+        :return: 1d nparray
+        """
+        states = [np.zeros(0)]
+        for jlcobj, _, _ in self._compile_pairlist()['jlc_groups']:
+            states += [jlcobj.get_jnt_values(), jlcobj.pos, jlcobj.rotmat.ravel()]
+        return np.concatenate(states)
+
+    def _compile_pairlist(self):
+        if self._compiled_pairlist is None:
+            cdpairs = np.sort(np.array(self._cdpairs, dtype=int).reshape(-1, 2), axis=1)
+            cdpairs = np.unique(cdpairs[cdpairs[:, 0] != cdpairs[:, 1]], axis=0)
+            # the poses of links are read from their jlchains at once, those of the other elements one by one
+            jlc_groups = {}
+            other_ids = []
+            for elem_id, (jlcobj, lnk_id) in enumerate(self._lnk_sources):
+                if hasattr(jlcobj, 'get_lnk_gl_homomats'):
+                    jlc_groups.setdefault(id(jlcobj), [jlcobj, [], []])
+                    jlc_groups[id(jlcobj)][1].append(lnk_id)
+                    jlc_groups[id(jlcobj)][2].append(elem_id)
+                else:
+                    other_ids.append(elem_id)
+            self._compiled_pairlist = {
+                'local_cdsolids': _pack_local_cdsolids(self._local_cdsolids, np.array(self._cdscales)),
+                'cdpairs': cdpairs,
+                'active_ids': np.flatnonzero(self._is_active),
+                'jlc_groups': list(jlc_groups.values()),
+                'other_ids': other_ids}
+        return self._compiled_pairlist
+
+    def get_cdelement_homomats(self):
+        """
+        the current poses of all cd elements
+        :return: nx4x4 nparray
+        """
+        compiled = self._compile_pairlist()
+        homomats = np.tile(np.eye(4), (len(self.all_cdelements), 1, 1))
+        for jlcobj, lnk_ids, elem_ids in compiled['jlc_groups']:
+            homomats[elem_ids] = jlcobj.get_lnk_gl_homomats(lnk_ids)
+        for elem_id in compiled['other_ids']:
+            homomats[elem_id, :3, 3] = self.all_cdelements[elem_id]['gl_pos']
+            homomats[elem_id, :3, :3] = self.all_cdelements[elem_id]['gl_rotmat']
+        return homomats
+
+    def get_local_cdsolid_corners(self, elem_id):
+        """
+        the corners of the primitives of a cd element in its local frame, the spheres are bounded by cubes
+        :param elem_id: an id of self.all_cdelements
+        :return: kx3 nparray
+        """
+        local_cdsolids = self._compile_pairlist()['local_cdsolids']
+        solid_ids = np.flatnonzero(local_cdsolids['elem_ids'] == elem_id)
+        signs = np.stack(np.meshgrid([-1, 1], [-1, 1], [-1, 1], indexing='ij'), axis=-1).reshape(-1, 3)
+        return (local_cdsolids['centers'][solid_ids, None, :] +
+                local_cdsolids['half_extents'][solid_ids, None, :] * signs).reshape(-1, 3)
+
+    def gen_world_cdsolids(self):
+        """
+        the primitives of all cd elements at their current poses, used by the pairlist backend
+        :return: see _gen_world_cdsolids
+        """
+        homomats = self.get_cdelement_homomats()
+        return _gen_world_cdsolids(self._compile_pairlist()['local_cdsolids'], homomats[:, :3, 3], homomats[:, :3, :3])
+
+    def get_sphere_forest(self, radius=.01):
+        """
+        the sphere trees of the collision models of all cd elements, kept until the cd elements are changed
+        :param radius: the radius of the leaf spheres
+        :return: see modeling.sphere_tree.concatenate_trees
+        """
+        sphere_forests = self._compile_pairlist().setdefault('sphere_forests', {})
+        if radius not in sphere_forests:
+            sphere_forests[radius] = mst.concatenate_trees([cdelement['collisionmodel'].get_sphere_tree(radius)
+                                                            for cdelement in self.all_cdelements])
+        return sphere_forests[radius]
+
+    @staticmethod
+    def _gen_external_cdsolids(obstacle_list, otherrobot_list):
+        """
+        the obstacles (their cdnps are scaled together with the objpdnps) and all cd elements of the other robots
+        :return: see _gen_world_cdsolids, None if there is nothing
+        """
+        world_cdsolids_list = []
+        if len(obstacle_list) > 0:
+            scales = np.array([da.pdv3_to_npv3(obstacle.objpdnp.getScale()) for obstacle in obstacle_list])
+            local_cdsolids = _pack_local_cdsolids([_extract_obstacle_cdsolids(obstacle) for obstacle in obstacle_list],
+                                                  scales)
+            poss = np.array([obstacle.get_pos() for obstacle in obstacle_list])
+            rotmats = np.array([obstacle.get_rotmat() for obstacle in obstacle_list])
+            world_cdsolids_list.append(_gen_world_cdsolids(local_cdsolids, poss, rotmats))
+        for robot in otherrobot_list:
+            if len(robot.cc.all_cdelements) > 0:
+                world_cdsolids_list.append(robot.cc.gen_world_cdsolids())
+        if len(world_cdsolids_list) == 0:
+            return None
+        return _concatenate_world_cdsolids(world_cdsolids_list)
+
+    def _is_pairlist_collided(self, external_cdsolids, toggle_contact_points=False, occupancy_maps=[]):
+        """
+        :param external_cdsolids: see self._gen_external_cdsolids
+        :param toggle_contact_points: the centers of the overlapping aabbs of the collided primitives are returned
+                                      as approximated contact points
+        :return:
+        """
+        compiled = self._compile_pairlist()
+        world_cdsolids = self.gen_world_cdsolids()
+        contact_points = []
+        # self collision, broad phase over the aabbs of the element pairs
+        cdpairs = compiled['cdpairs']
+        is_candidate = _is_aabb_overlapped(world_cdsolids['elem_mins'][cdpairs[:, 0]],
+                                           world_cdsolids['elem_maxs'][cdpairs[:, 0]],
+                                           world_cdsolids['elem_mins'][cdpairs[:, 1]],
+                                           world_cdsolids['elem_maxs'][cdpairs[:, 1]])
+        checklist = [(world_cdsolids, cdpairs[is_candidate, 0], world_cdsolids, cdpairs[is_candidate, 1])]
+        # collision with obstacles and other robots, broad phase over the aabbs of the active and external elements
+        active_ids = compiled['active_ids']
+        if external_cdsolids is not None and len(active_ids) > 0:
+            is_candidate = _is_aabb_overlapped(world_cdsolids['elem_mins'][active_ids][:, None, :],
+                                               world_cdsolids['elem_maxs'][active_ids][:, None, :],
+                                               external_cdsolids['elem_mins'][None, :, :],
+                                               external_cdsolids['elem_maxs'][None, :, :])
+            candidate_ids, external_ids = np.nonzero(is_candidate)
+            checklist.append((world_cdsolids, active_ids[candidate_ids], external_cdsolids, external_ids))
+        if self._scene is not None and len(active_ids) > 0:
+            candidate_ids, obstacle_ids = self._scene.query_overlapped(world_cdsolids['elem_mins'][active_ids],
+                                                                       world_cdsolids['elem_maxs'][active_ids])
+            checklist.append((world_cdsolids, active_ids[candidate_ids], self._scene.get_world_cdsolids(),
+                              obstacle_ids))
+        for world_cdsolids_a, elem_ids_a, world_cdsolids_b, elem_ids_b in checklist:
+            if len(elem_ids_a) == 0:
+                continue
+            solid_ids_a, solid_ids_b = _expand_to_solid_pairs(world_cdsolids_a, elem_ids_a,
+                                                              world_cdsolids_b, elem_ids_b)
+            # the aabbs of the primitives are compared before the separating axis test
+            is_candidate = _is_aabb_overlapped(world_cdsolids_a['solid_mins'][solid_ids_a],
+                                               world_cdsolids_a['solid_maxs'][solid_ids_a],
+                                               world_cdsolids_b['solid_mins'][solid_ids_b],
+                                               world_cdsolids_b['solid_maxs'][solid_ids_b])
+            solid_ids_a, solid_ids_b = solid_ids_a[is_candidate], solid_ids_b[is_candidate]
+            is_collided = _is_cdsolids_collided(world_cdsolids_a, solid_ids_a, world_cdsolids_b, solid_ids_b)
+            if not np.any(is_collided):
+                continue
+            if not toggle_contact_points:
+                return True
+            solid_ids_a, solid_ids_b = solid_ids_a[is_collided], solid_ids_b[is_collided]
+            contact_points += list((np.maximum(world_cdsolids_a['solid_mins'][solid_ids_a],
+                                               world_cdsolids_b['solid_mins'][solid_ids_b]) +
+                                    np.minimum(world_cdsolids_a['solid_maxs'][solid_ids_a],
+                                               world_cdsolids_b['solid_maxs'][solid_ids_b])) / 2)
+        for occupancy_map in occupancy_maps:
+            occupancy_contact_points = _gen_occupancy_contact_points(world_cdsolids, active_ids, occupancy_map)
+            if len(occupancy_contact_points) == 0:
+                continue
+            if not toggle_contact_points:
+                return True
+            contact_points += list(occupancy_contact_points)
+        if toggle_contact_points:
+            return len(contact_points) > 0, contact_points
+        return False
+
+    def _gen_occupancy_contact_points(self, occupancy_maps, toggle_contact_points=False):
+        """
+        check the active elements against occupancy maps at the current poses
+        :return: a list of contact points, see _gen_occupancy_contact_points; only the first one is returned
+                 if toggle_contact_points is False
+        """
+        world_cdsolids = self.gen_world_cdsolids()
+        contact_points = []
+        for occupancy_map in occupancy_maps:
+            contact_points += list(_gen_occupancy_contact_points(world_cdsolids, self._compile_pairlist()['active_ids'],
+                                                                 occupancy_map))
+            if not toggle_contact_points and len(contact_points) > 0:
+                return contact_points[:1]
+        return contact_points
+
+    def is_collided(self, obstacle_list=[], otherrobot_list=[], toggle_contact_points=False):
+        """
+        :param obstacle_list: staticgeometricmodel, or modeling.occupancy_map.OccupancyMap
+        :param otherrobot_list:
+        :return:
+        """
+        obstacle_list, occupancy_maps = _split_obstacles(obstacle_list)
+        if self.backend == 'pairlist':
+            return self._is_pairlist_collided(self._gen_external_cdsolids(obstacle_list, otherrobot_list),
+                                              toggle_contact_points=toggle_contact_points,
+                                              occupancy_maps=occupancy_maps)
+        self._update_cdnp_poses()
+        obstacle_parent_list = self._attach_obstacles(obstacle_list, otherrobot_list)
+        # collision check
+        self.ctrav.traverse(self.np)
+        self._detach_obstacles(obstacle_list, otherrobot_list, obstacle_parent_list)
         if self.chan.getNumEntries() > 0:
             collision_result = True
         else:
             collision_result = False
+        occupancy_contact_points = []
+        if len(occupancy_maps) > 0 and (toggle_contact_points or not collision_result):
+            occupancy_contact_points = self._gen_occupancy_contact_points(occupancy_maps, toggle_contact_points)
+            collision_result = collision_result or len(occupancy_contact_points) > 0
         if toggle_contact_points:
             contact_points = [da.pdv3_to_npv3(cd_entry.getSurfacePoint(base.render)) for cd_entry in
-                              self.chan.getEntries()]
+                              self.chan.getEntries()] + occupancy_contact_points
             return collision_result, contact_points
         else:
             return collision_result
 
+    def is_collided_batch(self, goto_conf_fn, n_confs, obstacle_list=[], otherrobot_list=[], stop_at_first=False):
+        """
+        check a sequence of configurations, the obstacles and other robots are attached only once
+        :param goto_conf_fn: goto_conf_fn(i) moves the cd elements to the i-th configuration, e.g. by calling fk;
+                             it may return a known result of the configuration (e.g. cached), which is used without
+                             checking; None means unknown
+        :param n_confs:
+        :param obstacle_list: staticgeometricmodel, or modeling.occupancy_map.OccupancyMap
+        :param otherrobot_list:
+        :param stop_at_first: stop at the first collided configuration, the remaining ones are not checked
+        :return: [is_collided_array, first_collided_id], the latter is -1 if none of them is collided
+        """
+        is_collided_array = np.zeros(n_confs, dtype=bool)
+        obstacle_list, occupancy_maps = _split_obstacles(obstacle_list)
+        if self.backend == 'pairlist':
+            external_cdsolids = self._gen_external_cdsolids(obstacle_list, otherrobot_list)
+            for i in range(n_confs):
+                is_collided = goto_conf_fn(i)
+                is_collided_array[i] = self._is_pairlist_collided(external_cdsolids, occupancy_maps=occupancy_maps) \
+                    if is_collided is None else is_collided
+                if stop_at_first and is_collided_array[i]:
+                    break
+        else:
+            obstacle_parent_list = self._attach_obstacles(obstacle_list, otherrobot_list)
+            try:
+                for i in range(n_confs):
+                    is_collided = goto_conf_fn(i)
+                    if is_collided is None:
+                        self._update_cdnp_poses()
+                        self.ctrav.traverse(self.np)
+                        is_collided = self.chan.getNumEntries() > 0 or (
+                                len(occupancy_maps) > 0 and len(self._gen_occupancy_contact_points(occupancy_maps)) > 0)
+                    is_collided_array[i] = is_collided
+                    if stop_at_first and is_collided_array[i]:
+                        break
+            finally:
+                self._detach_obstacles(obstacle_list, otherrobot_list, obstacle_parent_list)
+        collided_ids = np.flatnonzero(is_collided_array)
+        return is_collided_array, int(collided_ids[0]) if len(collided_ids) > 0 else -1
+
+    def _gen_homomats_batch(self, goto_conf_fn, n_confs):
+        """
+        :param goto_conf_fn: see self.is_collided_batch, the returned results are not used
+        :return: n_confs x n_elements x4x4 nparray, the poses of all cd elements at the configurations
+        """
+        homomats = np.empty((n_confs, len(self.all_cdelements), 4, 4))
+        for i in range(n_confs):
+            goto_conf_fn(i)
+            homomats[i] = self.get_cdelement_homomats()
+        return homomats
+
+    def _is_pairlist_collided_batch(self, homomats, external_cdsolids=None, occupancy_maps=[], inflations=None):
+        """
+        the pairlist check over a batch of poses at once, the boxes and spheres may be inflated conservatively
+        :param homomats: n_confs x n_elements x4x4 nparray
+        :param external_cdsolids: see self._gen_external_cdsolids, the scene is always checked
+        :param occupancy_maps:
+        :param inflations: n_confs x n_elements nparray, None for no inflation
+        :return: a n_confs nparray of bool
+        """
+        compiled = self._compile_pairlist()
+        n_confs, n_elements = homomats.shape[:2]
+        local_cdsolids = _tile_local_cdsolids(compiled['local_cdsolids'], n_confs)
+        n_solids = len(compiled['local_cdsolids']['elem_ids'])
+        if inflations is not None:
+            # a box moving within the inflation stays in the box whose half extents are inflated
+            local_cdsolids['half_extents'] = (local_cdsolids['half_extents'] +
+                                              inflations.reshape(-1)[local_cdsolids['elem_ids'], None])
+        homomats = homomats.reshape(-1, 4, 4)
+        world_cdsolids = _gen_world_cdsolids(local_cdsolids, homomats[:, :3, 3], homomats[:, :3, :3])
+        # the elements of the i-th pose are numbered from i * n_elements
+        offsets = np.arange(n_confs)[:, None] * n_elements
+        cdpairs = compiled['cdpairs']
+        checklist = [(world_cdsolids, (offsets + cdpairs[:, 0]).ravel(),
+                      world_cdsolids, (offsets + cdpairs[:, 1]).ravel())]
+        active_ids = (offsets + compiled['active_ids']).ravel()
+        if external_cdsolids is not None and len(active_ids) > 0:
+            n_externals = len(external_cdsolids['counts'])
+            checklist.append((world_cdsolids, np.repeat(active_ids, n_externals),
+                              external_cdsolids, np.tile(np.arange(n_externals), len(active_ids))))
+        if self._scene is not None and len(active_ids) > 0:
+            candidate_ids, obstacle_ids = self._scene.query_overlapped(world_cdsolids['elem_mins'][active_ids],
+                                                                       world_cdsolids['elem_maxs'][active_ids])
+            checklist.append((world_cdsolids, active_ids[candidate_ids], self._scene.get_world_cdsolids(),
+                              obstacle_ids))
+        is_collided_array = np.zeros(n_confs, dtype=bool)
+        for world_cdsolids_a, elem_ids_a, world_cdsolids_b, elem_ids_b in checklist:
+            is_candidate = _is_aabb_overlapped(world_cdsolids_a['elem_mins'][elem_ids_a],
+                                               world_cdsolids_a['elem_maxs'][elem_ids_a],
+                                               world_cdsolids_b['elem_mins'][elem_ids_b],
+                                               world_cdsolids_b['elem_maxs'][elem_ids_b])
+            solid_ids_a, solid_ids_b = _expand_to_solid_pairs(world_cdsolids_a, elem_ids_a[is_candidate],
+                                                              world_cdsolids_b, elem_ids_b[is_candidate])
+            is_candidate = _is_aabb_overlapped(world_cdsolids_a['solid_mins'][solid_ids_a],
+                                               world_cdsolids_a['solid_maxs'][solid_ids_a],
+                                               world_cdsolids_b['solid_mins'][solid_ids_b],
+                                               world_cdsolids_b['solid_maxs'][solid_ids_b])
+            solid_ids_a, solid_ids_b = solid_ids_a[is_candidate], solid_ids_b[is_candidate]
+            is_collided = _is_cdsolids_collided(world_cdsolids_a, solid_ids_a, world_cdsolids_b, solid_ids_b)
+            is_collided_array[solid_ids_a[is_collided] // n_solids] = True
+        for occupancy_map in occupancy_maps:
+            solid_ids, _ = _query_occupancy_collided(world_cdsolids, active_ids, occupancy_map)
+            is_collided_array[solid_ids // n_solids] = True
+        return is_collided_array
+
+    def is_primitive_collided_batch(self, goto_conf_fn, n_confs, obstacle_list=[], otherrobot_list=[],
+                                    inflations=None):
+        """
+        check many configurations at once with numpy, by the same primitives, pairs, and active elements as the
+        pairlist backend; the bitmask backend checks the same primitives, except that its polygons are replaced here
+        by their bounding boxes, so a configuration is collision-free for self.is_collided if it is False here
+        :param goto_conf_fn: see self.is_collided_batch, the returned results are not used
+        :param n_confs:
+        :param obstacle_list: staticgeometricmodel, or modeling.occupancy_map.OccupancyMap
+        :param otherrobot_list: their cd elements are checked at their current poses
+        :param inflations: n_confs x n_elements nparray, the half extents of the boxes and the radii of the spheres of
+                           the cd elements are increased by these values, e.g. to cover their motion around the
+                           configurations; None for no inflation
+        :return: is_collided_array, a n_confs nparray of bool
+        """
+        obstacle_list, occupancy_maps = _split_obstacles(obstacle_list)
+        return self._is_pairlist_collided_batch(self._gen_homomats_batch(goto_conf_fn, n_confs),
+                                                self._gen_external_cdsolids(obstacle_list, otherrobot_list),
+                                                occupancy_maps=occupancy_maps,
+                                                inflations=inflations)
+
+    def is_sphere_collided_batch(self, goto_conf_fn, n_confs, obstacle_list=[], otherrobot_list=[], radius=.01,
+                                 obstacle_representation='sphere_tree', inflations=None):
+        """
+        a conservative check of the meshes without panda3d, the self-collision pairs and the active elements are the
+        same as the other backends; the pairs of cd elements and the scene are checked by their primitives, and the
+        active elements are checked against the obstacles and other robots using the sphere trees of meshes
+        the result is False if neither the primitives of the pairs nor the meshes are collided; since the obstacles are
+        not checked by their primitives, it is not a pre-check of self.is_collided, see self.is_primitive_collided_batch
+        :param goto_conf_fn: see self.is_collided_batch
+        :param n_confs:
+        :param obstacle_list: collision models, or modeling.occupancy_map.OccupancyMap, whose voxels are checked
+                              directly by the spheres
+        :param otherrobot_list: their cd elements are checked at their current poses
+        :param radius: the radius of the leaf spheres; smaller radii are tighter but slower
+        :param obstacle_representation: 'sphere_tree' or 'sdf', the latter requires computing the sdfs of the obstacles
+        :param inflations: n_confs x n_elements nparray, the spheres and primitives of the cd elements are inflated by
+                           these values, e.g. to cover their motion around the configurations; None for no inflation
+        :return: is_collided_array, a n_confs nparray of bool
+        """
+        if obstacle_representation not in ['sphere_tree', 'sdf']:
+            raise ValueError("Wrong obstacle representation name!")
+        obstacle_list, occupancy_maps = _split_obstacles(obstacle_list)
+        compiled = self._compile_pairlist()
+        forest = self.get_sphere_forest(radius)
+        homomats = self._gen_homomats_batch(goto_conf_fn, n_confs)
+        posed_forest = mst.pose_forest(forest, homomats, inflations=inflations)
+        batch_range = np.arange(n_confs)
+        # self collision and the scene, by the primitives like the exact check, the meshes may be outside of them
+        is_collided_array = self._is_pairlist_collided_batch(homomats, inflations=inflations)
+        # collision with obstacles and other robots
+        active_roots = forest['roots'][compiled['active_ids']]
+        active_roots = active_roots[active_roots >= 0]
+        external_list = []
+        if obstacle_representation == 'sphere_tree' and len(obstacle_list) > 0:
+            obstacle_forest = mst.concatenate_trees([obstacle.get_sphere_tree(radius) for obstacle in obstacle_list])
+            obstacle_homomats = np.array([obstacle.get_homomat() for obstacle in obstacle_list])
+            external_list.append([obstacle_forest, mst.pose_forest(obstacle_forest, obstacle_homomats[None])])
+        elif obstacle_representation == 'sdf':
+            for obstacle in obstacle_list:
+                is_collided_array |= mst.is_forest_sdf_collided(forest, posed_forest, obstacle, n_confs,
+                                                                np.repeat(batch_range, len(active_roots)),
+                                                                np.tile(active_roots, n_confs))
+        for occupancy_map in occupancy_maps:
+            is_collided_array |= mst.is_forest_occupancy_collided(forest, posed_forest, occupancy_map, n_confs,
+                                                                  np.repeat(batch_range, len(active_roots)),
+                                                                  np.tile(active_roots, n_confs))
+        for robot in otherrobot_list:
+            if len(robot.cc.all_cdelements) > 0:
+                robot_forest = robot.cc.get_sphere_forest(radius)
+                external_list.append([robot_forest,
+                                      mst.pose_forest(robot_forest, robot.cc.get_cdelement_homomats()[None])])
+        for external_forest, external_posed_forest in external_list:
+            external_roots = external_forest['roots'][external_forest['roots'] >= 0]
+            n_pairs = len(active_roots) * len(external_roots)
+            is_collided_array |= mst.is_forests_collided(forest, posed_forest, external_forest, external_posed_forest,
+                                                         n_confs,
+                                                         np.repeat(batch_range, n_pairs),
+                                                         np.tile(np.repeat(active_roots, len(external_roots)), n_confs),
+                                                         np.tile(external_roots, len(active_roots) * n_confs))
+        return is_collided_array
+
+    def get_min_distances(self, obstacle_list=[], max_distance=np.inf):
+        """
+        the minimum distances between the meshes of the active cd elements and the obstacles at the current poses
+        the results are cached by the poses of the elements, querying again at the same configuration is free
+        :param obstacle_list: collision models
+        :param max_distance: pairs farther than max_distance are skipped
+        :return: [distances, points, obstacle_points, obstacle_ids], ordered as self.all_cdelements;
+                 np.inf, nan, nan, -1 for the elements that are not active or farther than max_distance
+        """
+        if len(_split_obstacles(obstacle_list)[1]) > 0:
+            raise ValueError("Occupancy maps are not supported by the distance queries!")
+        n_elements = len(self.all_cdelements)
+        distances = np.full(n_elements, np.inf)
+        points = np.full((n_elements, 3), np.nan)
+        obstacle_points = np.full((n_elements, 3), np.nan)
+        obstacle_ids = np.full(n_elements, -1, dtype=int)
+        if len(obstacle_list) == 0:
+            return distances, points, obstacle_points, obstacle_ids
+        homomats = self.get_cdelement_homomats()
+        for elem_id in self._compile_pairlist()['active_ids']:
+            distance, point, obstacle_point, obstacle_id = \
+                cm.query_min_distance(self.all_cdelements[elem_id]['collisionmodel'], obstacle_list,
+                                      homomat=homomats[elem_id], max_distance=max_distance,
+                                      cache=self._distance_cache)
+            if obstacle_id >= 0:
+                distances[elem_id] = distance
+                points[elem_id] = point
+                obstacle_points[elem_id] = obstacle_point
+                obstacle_ids[elem_id] = obstacle_id
+        return distances, points, obstacle_points, obstacle_ids
+
     def show_cdprimit(self):
         # print("call show_cdprimit")
         self.np.reparentTo(base.render)
@@ -200,9 +1032,19 @@ class CollisionChecker(object):
         clear pairs and nodepath
         :return:
         """
+        self.detach_scene()
         for cdelement in self.all_cdelements:
             cdelement['cdprimit_childid'] = -1
         self.all_cdelements = []
         for child in self.np.getChildren():
             child.removeNode()
         self.nbitmask = 0
+        self._cdpairs = []
+        self._is_active = []
+        self._local_cdsolids = []
+        self._cdscales = []
+        self._lnk_sources = []
+        self._compiled_pairlist = None
+        self._version += 1
+        self._is_bitmask_full = False
+        self._distance_cache = {}
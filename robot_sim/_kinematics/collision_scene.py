@@ -0,0 +1,183 @@
+"""
+a persistent set of static obstacles for the collision checkers, see CollisionChecker.attach_scene
+the obstacles are copied and indexed once in a uniform grid over their world aabbs, so that a check only visits the
+obstacles whose aabbs overlap those of the cd elements of a robot
+"""
+import numpy as np
+import basis.data_adapter as da
+import robot_sim._kinematics.collision_checker as cc
+from panda3d.core import NodePath
+
+_MAX_CELLS = 64  # aabbs covering more cells are not put into the grid but compared with all the others
+_BLOCK_SIZE = 4  # the cdnps are grouped by blocks of 4x4x4 cells and then by cells, for the culling of panda3d
+
+
+def _gen_cell_keys(mins, maxs, cell_size):
+    """
+    the hashed keys of the grid cells covered by a list of aabbs, the empty (infinite) aabbs are skipped
+    :param mins: nx3 nparray
+    :param maxs: nx3 nparray
+    :param cell_size:
+    :return: [box_ids, keys, large_box_ids], the i-th key is covered by box_ids[i]; large boxes are not expanded
+    """
+    is_valid = np.all(np.isfinite(mins) & np.isfinite(maxs), axis=1)
+    lows = np.floor(np.where(is_valid[:, None], mins, 0) / cell_size)
+    spans = np.floor(np.where(is_valid[:, None], maxs, 0) / cell_size) - lows + 1
+    is_small = is_valid & (np.prod(spans, axis=1) <= _MAX_CELLS)
+    lows, spans = lows[is_small].astype(np.int64), spans[is_small].astype(np.int64)
+    n_cells = np.prod(spans, axis=1)
+    box_ids = np.repeat(np.flatnonzero(is_small), n_cells)
+    offsets = np.arange(len(box_ids)) - np.repeat(np.cumsum(n_cells) - n_cells, n_cells)
+    lows, spans = np.repeat(lows, n_cells, axis=0), np.repeat(spans, n_cells, axis=0)
+    cells = lows + np.stack([offsets % spans[:, 0],
+                             offsets // spans[:, 0] % spans[:, 1],
+                             offsets // (spans[:, 0] * spans[:, 1])], axis=1)
+    keys = (cells[:, 0] * 73856093) ^ (cells[:, 1] * 19349663) ^ (cells[:, 2] * 83492791)
+    return box_ids, keys, np.flatnonzero(is_valid & ~is_small)
+
+
+class CollisionScene(object):
+    """
+    the obstacles are copied at their poses when they are added, call update_obstacle after moving one of them
+    self.version is increased whenever the scene is changed
+    """
+
+    def __init__(self, obstacle_list=[], cell_size=.1, name="collision_scene"):
+        """
+        :param obstacle_list: collision models
+        :param cell_size: the edge length of the grid cells, similar to the sizes of the links works well
+        :param name:
+        """
+        self.np = NodePath(name)
+        self.cell_size = cell_size
+        self.obstacle_list = []
+        self.version = 0
+        self._cdnps = []  # the copied cdnps, under the nodes of the cells of their aabb centers
+        self._cells = []  # [block, cell] of each obstacle
+        self._local_cdsolids = []
+        self._scales = []
+        self._poss = []
+        self._rotmats = []
+        self._cell_nps = {}  # block: NodePath, (block, cell): NodePath
+        self._compiled = None  # the world cdsolids and the grid, reset when the scene is changed
+        for obstacle in obstacle_list:
+            self.add_obstacle(obstacle)
+
+    def _get_cell_np(self, block, cell):
+        if (block, cell) not in self._cell_nps:
+            if block not in self._cell_nps:
+                self._cell_nps[block] = self.np.attachNewNode("block")
+            self._cell_nps[(block, cell)] = self._cell_nps[block].attachNewNode("cell")
+        return self._cell_nps[(block, cell)]
+
+    def _remove_cell_np(self, block, cell):
+        if self._cell_nps[(block, cell)].getNumChildren() == 0:
+            self._cell_nps.pop((block, cell)).removeNode()
+            if self._cell_nps[block].getNumChildren() == 0:
+                self._cell_nps.pop(block).removeNode()
+
+    def add_obstacle(self, obstacle):
+        """
+        :param obstacle: collision model
+        :return:
+        """
+        if any(obstacle is existing_obstacle for existing_obstacle in self.obstacle_list):
+            raise ValueError("The obstacle is already in the scene!")
+        local_cdsolids = cc._extract_obstacle_cdsolids(obstacle)
+        scale = da.pdv3_to_npv3(obstacle.objpdnp.getScale())
+        pos, rotmat = obstacle.get_pos(), obstacle.get_rotmat()
+        world_cdsolids = cc._gen_world_cdsolids(cc._pack_local_cdsolids([local_cdsolids], scale[None]),
+                                                pos[None], rotmat[None])
+        center = (world_cdsolids['elem_mins'][0] + world_cdsolids['elem_maxs'][0]) / 2
+        if not np.all(np.isfinite(center)):
+            center = pos
+        cell = tuple(np.floor(center / self.cell_size).astype(int))
+        block = tuple(np.floor(center / (self.cell_size * _BLOCK_SIZE)).astype(int))
+        self.obstacle_list.append(obstacle)
+        self._cdnps.append(obstacle.copy_cdnp_to(self._get_cell_np(block, cell)))
+        self._cells.append([block, cell])
+        self._local_cdsolids.append(local_cdsolids)
+        self._scales.append(scale)
+        self._poss.append(pos)
+        self._rotmats.append(rotmat)
+        self._compiled = None
+        self.version += 1
+
+    def remove_obstacle(self, obstacle):
+        """
+        :param obstacle: collision model
+        :return:
+        """
+        ids = [i for i, existing_obstacle in enumerate(self.obstacle_list) if existing_obstacle is obstacle]
+        if len(ids) == 0:
+            raise ValueError("The obstacle is not in the scene!")
+        self.obstacle_list.pop(ids[0])
+        self._cdnps.pop(ids[0]).removeNode()
+        self._remove_cell_np(*self._cells.pop(ids[0]))
+        self._local_cdsolids.pop(ids[0])
+        self._scales.pop(ids[0])
+        self._poss.pop(ids[0])
+        self._rotmats.pop(ids[0])
+        self._compiled = None
+        self.version += 1
+
+    def update_obstacle(self, obstacle):
+        """
+        copy a moved obstacle again, it is moved to the end of self.obstacle_list
+        :param obstacle: collision model
+        :return:
+        """
+        self.remove_obstacle(obstacle)
+        self.add_obstacle(obstacle)
+
+    def _compile(self):
+        if self._compiled is None:
+            local_cdsolids = cc._pack_local_cdsolids(self._local_cdsolids, np.array(self._scales).reshape(-1, 3))
+            world_cdsolids = cc._gen_world_cdsolids(local_cdsolids,
+                                                    np.array(self._poss).reshape(-1, 3),
+                                                    np.array(self._rotmats).reshape(-1, 3, 3))
+            obstacle_ids, keys, large_ids = _gen_cell_keys(world_cdsolids['elem_mins'], world_cdsolids['elem_maxs'],
+                                                           self.cell_size)
+            order = np.argsort(keys, kind='stable')
+            self._compiled = {'world_cdsolids': world_cdsolids,
+                              'keys': keys[order],
+                              'obstacle_ids': obstacle_ids[order],
+                              'large_ids': large_ids}
+        return self._compiled
+
+    def get_world_cdsolids(self):
+        """
+        the primitives of the obstacles, one cd element per obstacle, ordered as self.obstacle_list
+        :return: see collision_checker._gen_world_cdsolids
+        """
+        return self._compile()['world_cdsolids']
+
+    def query_overlapped(self, mins, maxs):
+        """
+        the obstacles whose aabbs overlap the given aabbs
+        :param mins: nx3 nparray
+        :param maxs: nx3 nparray
+        :return: [query_ids, obstacle_ids], the overlapped pairs
+        """
+        compiled = self._compile()
+        world_cdsolids = compiled['world_cdsolids']
+        n_obstacles = len(self.obstacle_list)
+        query_ids, keys, large_query_ids = _gen_cell_keys(mins, maxs, self.cell_size)
+        lefts = np.searchsorted(compiled['keys'], keys, side='left')
+        counts = np.searchsorted(compiled['keys'], keys, side='right') - lefts
+        positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lefts, counts)
+        # the large aabbs on either side are compared with all the others
+        large_ids = compiled['large_ids']
+        query_ids = np.concatenate([np.repeat(query_ids, counts),
+                                    np.repeat(large_query_ids, n_obstacles),
+                                    np.repeat(np.arange(len(mins)), len(large_ids))])
+        obstacle_ids = np.concatenate([compiled['obstacle_ids'][positions],
+                                       np.tile(np.arange(n_obstacles), len(large_query_ids)),
+                                       np.tile(large_ids, len(mins))])
+        # the same pair is found once per shared cell
+        pair_keys = np.unique(query_ids * max(n_obstacles, 1) + obstacle_ids)
+        query_ids, obstacle_ids = pair_keys // max(n_obstacles, 1), pair_keys % max(n_obstacles, 1)
+        is_overlapped = cc._is_aabb_overlapped(mins[query_ids], maxs[query_ids],
+                                               world_cdsolids['elem_mins'][obstacle_ids],
+                                               world_cdsolids['elem_maxs'][obstacle_ids])
+        return query_ids[is_overlapped], obstacle_ids[is_overlapped]
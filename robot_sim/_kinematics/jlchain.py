@@ -1,11 +1,118 @@
 import math
 import copy
 import numpy as np
+from collections.abc import MutableMapping
 import basis.robot_math as rm
 import robot_sim._kinematics.jlchain_mesh as jlm
 import robot_sim._kinematics.jlchain_ik as jlik
 
 
+_JNT_TYPES = ['end', 'revolute', 'prismatic']  # the index of a type is its code in JLChain._jnt_types
+
+
+class _JLView(MutableMapping):
+    """
+    A dictionary-like view of a joint or a link of a JLChain
+    The keys registered in _in_keys and _out_keys are read from and written to the contiguous arrays of the owner
+    JLChain, the other keys (name, meshfile, collisionmodel, etc.) are kept in a plain dictionary.
+    _in_keys are returned as writable array views; _out_keys are computed by fk and returned as copies
+    so that a value read before fk does not change after fk (the same behavior as the old list of dictionaries).
+    Two views are equal only if they are the same object
+    """
+    __slots__ = ('_jlc', '_id', '_extras')
+    _in_keys = {}  # key: (name of the array attribute, index appended after the joint/link id)
+    _out_keys = {}
+
+    def __init__(self, jlc, id):
+        self._jlc = jlc
+        self._id = id
+        self._extras = {}
+
+    def __getitem__(self, key):
+        if key in self._in_keys:
+            attr, index = self._in_keys[key]
+            return getattr(self._jlc, attr)[(self._id,) + index]
+        if key in self._out_keys:
+            attr, index = self._out_keys[key]
+            return getattr(self._jlc, attr)[(self._id,) + index].copy()
+        return self._extras[key]
+
+    def __setitem__(self, key, value):
+        if key in self._in_keys:
+            attr, index = self._in_keys[key]
+        elif key in self._out_keys:
+            attr, index = self._out_keys[key]
+        else:
+            self._extras[key] = value
+            return
+        getattr(self._jlc, attr)[(self._id,) + index] = value
+
+    def __delitem__(self, key):
+        if key in self._in_keys or key in self._out_keys:
+            raise KeyError(f"{key} is backed by the arrays of the jlchain and cannot be deleted!")
+        del self._extras[key]
+
+    def __iter__(self):
+        yield from self._in_keys
+        yield from self._out_keys
+        yield from self._extras
+
+    def __len__(self):
+        return len(self._in_keys) + len(self._out_keys) + len(self._extras)
+
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())})"
+
+
+class _JntView(_JLView):
+    __slots__ = ()
+    _in_keys = {'loc_pos': ('_jnt_loc_homomat', (slice(0, 3), 3)),
+                'loc_rotmat': ('_jnt_loc_homomat', (slice(0, 3), slice(0, 3))),
+                'loc_motionax': ('_jnt_loc_motionax', ()),
+                'motion_rng': ('_jnt_motion_rng', ())}
+    _out_keys = {'gl_pos0': ('_jnt_gl_homomat0', (slice(0, 3), 3)),
+                 'gl_rotmat0': ('_jnt_gl_homomat0', (slice(0, 3), slice(0, 3))),
+                 'gl_motionax': ('_jnt_gl_motionax', ()),
+                 'gl_posq': ('_jnt_gl_homomatq', (slice(0, 3), 3)),
+                 'gl_rotmatq': ('_jnt_gl_homomatq', (slice(0, 3), slice(0, 3)))}
+
+    def __getitem__(self, key):
+        if key == 'type':
+            return _JNT_TYPES[self._jlc._jnt_types[self._id]]
+        if key == 'motion_val':
+            return float(self._jlc._jnt_motion_vals[self._id])
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        if key == 'type':
+            if value not in _JNT_TYPES:
+                raise ValueError(f"The joint type must be one of {_JNT_TYPES}!")
+            self._jlc._jnt_types[self._id] = _JNT_TYPES.index(value)
+        elif key == 'motion_val':
+            self._jlc._jnt_motion_vals[self._id] = value
+        else:
+            super().__setitem__(key, value)
+
+    def __iter__(self):
+        yield 'type'
+        yield 'motion_val'
+        yield from super().__iter__()
+
+    def __len__(self):
+        return super().__len__() + 2
+
+
+class _LnkView(_JLView):
+    __slots__ = ()
+    _in_keys = {'loc_pos': ('_lnk_loc_homomat', (slice(0, 3), 3)),
+                'loc_rotmat': ('_lnk_loc_homomat', (slice(0, 3), slice(0, 3)))}
+    _out_keys = {'gl_pos': ('_lnk_gl_homomat', (slice(0, 3), 3)),
+                 'gl_rotmat': ('_lnk_gl_homomat', (slice(0, 3), slice(0, 3)))}
+
+
 class JLChain(object):
     """
     Joint Link Chain, no branches allowed
@@ -14,6 +121,8 @@ class JLChain(object):
     2. Define multiple instances of this class to compose a complicated structure
     Notes:
     The joint types include "revolute", "prismatic", "end"; One JlChain object alwyas has two "end" joints
+    The kinematic state is kept in contiguous arrays (self._jnt_xxx, self._lnk_xxx);
+    self.jnts and self.lnks are lists of dictionary-like views over these arrays
     """
 
     def __init__(self,
@@ -45,6 +154,7 @@ class JLChain(object):
         # initialize joints and links
         self.lnks, self.jnts = self._init_jlchain()
         self._tgtjnts = range(1, self.ndof + 1)
+        self._tgtjnt_ids = np.arange(1, self.ndof + 1)
         self.goto_homeconf()
         # default tcp
         self.tcp_jntid = -1
@@ -65,13 +175,29 @@ class JLChain(object):
         joints: a list of dictionaries with each dictionary holding the properties of a joint
         njoints is assumed to be equal to nlinks+1
         joint i connects link i-1 and link i
+        the dictionaries are views over the arrays allocated here, see _JntView and _LnkView
         :return:
         author: weiwei
         date: 20161202tsukuba, 20190328toyonaka, 20200330toyonaka
         """
-        lnks = [dict() for i in range(self.ndof + 1)]
-        jnts = [dict() for i in range(self.ndof + 2)]
-        for id in range(self.ndof + 1):
+        njnts = self.ndof + 2
+        nlnks = self.ndof + 1
+        # joint arrays
+        self._jnt_types = np.full(njnts, _JNT_TYPES.index('revolute'), dtype=np.int8)
+        self._jnt_loc_homomat = np.tile(np.eye(4), (njnts, 1, 1))
+        self._jnt_loc_motionax = np.zeros((njnts, 3))
+        self._jnt_motion_rng = np.zeros((njnts, 2))
+        self._jnt_motion_vals = np.zeros(njnts)
+        self._jnt_gl_homomat0 = np.tile(np.eye(4), (njnts, 1, 1))  # to be updated by self._update_fk
+        self._jnt_gl_homomatq = np.tile(np.eye(4), (njnts, 1, 1))  # to be updated by self._update_fk
+        self._jnt_gl_motionax = np.zeros((njnts, 3))  # to be updated by self._update_fk
+        # link arrays
+        self._lnk_loc_homomat = np.tile(np.eye(4), (nlnks, 1, 1))
+        self._lnk_gl_homomat = np.tile(np.eye(4), (nlnks, 1, 1))  # to be updated by self._update_fk
+        self._fk_inputs = None  # the inputs of the last self._update_fk, see self._fk_changes
+        lnks = [_LnkView(self, id) for id in range(nlnks)]
+        jnts = [_JntView(self, id) for id in range(njnts)]
+        for id in range(nlnks):
             lnks[id]['name'] = 'link0'
             lnks[id]['loc_pos'] = np.array([0, 0, 0])
             lnks[id]['loc_rotmat'] = rm.rotmat_from_euler(0, 0, 0)
@@ -83,69 +209,149 @@ class JLChain(object):
             lnks[id]['cdprimit_childid'] = -1  # id of the CollisionChecker.np.Child
             lnks[id]['scale'] = [1, 1, 1]  # 3 list
             lnks[id]['rgba'] = [.7, .7, .7, 1]  # 4 list
-        for id in range(self.ndof + 2):
+        for id in range(njnts):
             jnts[id]['type'] = 'revolute'
             jnts[id]['parent'] = id - 1
             jnts[id]['child'] = id + 1
             jnts[id]['loc_pos'] = np.array([0, .1, 0]) if id > 0 else np.array([0, 0, 0])
             jnts[id]['loc_rotmat'] = np.eye(3)
             jnts[id]['loc_motionax'] = np.array([0, 0, 1])  # rot ax for rev joint, linear ax for pris joint
-            jnts[id]['gl_pos0'] = jnts[id]['loc_pos']  # to be updated by self._update_fk
-            jnts[id]['gl_rotmat0'] = jnts[id]['loc_rotmat']  # to be updated by self._update_fk
-            jnts[id]['gl_motionax'] = jnts[id]['loc_motionax']  # to be updated by self._update_fk
-            jnts[id]['gl_posq'] = jnts[id]['gl_pos0']  # to be updated by self._update_fk
-            jnts[id]['gl_rotmatq'] = jnts[id]['gl_rotmat0']  # to be updated by self._update_fk
             jnts[id]['motion_rng'] = [-math.pi, math.pi]  # min, max
             jnts[id]['motion_val'] = 0
-        jnts[0]['gl_pos0'] = self.pos  # This is not necessary, for easy read
-        jnts[0]['gl_rotmat0'] = self.rotmat
         jnts[0]['type'] = 'end'
         jnts[self.ndof + 1]['loc_pos'] = np.array([0, 0, 0])
         jnts[self.ndof + 1]['child'] = -1
         jnts[self.ndof + 1]['type'] = 'end'
         return lnks, jnts
 
+    def _jnt_type_mask(self, type):
+        """
+        :param type: 'revolute', 'prismatic', or 'end'
+        :return: a boolean nparray indicating the joints of the given type
+        """
+        return self._jnt_types == _JNT_TYPES.index(type)
+
+    def _motion_consts(self):
+        """
+        the quantities that only depend on the joint types and motion axes, recomputed only when they are changed
+        :return: [is_revolute, is_prismatic, skewmats, outermats] where the last two are njnts*3*3 nparrays
+                 computed from the unit motion axes
+        """
+        key = self._jnt_types.tobytes() + self._jnt_loc_motionax.tobytes()
+        if getattr(self, '_motion_consts_cache', (None,))[0] != key:
+            unit_axes = self._jnt_loc_motionax / np.linalg.norm(self._jnt_loc_motionax, axis=1, keepdims=True)
+            skewmats = np.zeros((len(unit_axes), 3, 3))
+            skewmats[:, 0, 1], skewmats[:, 0, 2], skewmats[:, 1, 2] = -unit_axes[:, 2], unit_axes[:, 1], -unit_axes[:, 0]
+            skewmats -= skewmats.transpose(0, 2, 1)
+            outermats = unit_axes[:, :, np.newaxis] * unit_axes[:, np.newaxis, :]
+            self._motion_consts_cache = (key, [self._jnt_type_mask('revolute'),
+                                               self._jnt_type_mask('prismatic'),
+                                               skewmats,
+                                               outermats])
+        return self._motion_consts_cache[1]
+
+    def _motion_homomats(self, motion_vals, start_id=0):
+        """
+        the homogeneous transformations caused by the motion of each joint
+        all joints are computed at once; "end" joints do not move
+        :param motion_vals: njnts nparray, or a n*njnts nparray for a batch of configurations;
+                            only the joints from start_id are included if start_id > 0
+        :param start_id: the id of the first joint
+        :return: njnts*4*4 or n*njnts*4*4 nparray
+        """
+        motion_vals = np.asarray(motion_vals, dtype=np.float64)
+        is_revolute, is_prismatic, skewmats, outermats = [value[start_id:] for value in self._motion_consts()]
+        # rodrigues, the motion values of non-revolute joints are set to 0 to get identity matrices
+        angles = np.where(is_revolute, motion_vals, 0)[..., np.newaxis, np.newaxis]
+        cos_angles = np.cos(angles)
+        homomats = np.zeros(motion_vals.shape + (4, 4))
+        homomats[..., :3, :3] = cos_angles * np.eye(3) + np.sin(angles) * skewmats + (1 - cos_angles) * outermats
+        homomats[..., :3, 3] = np.where(is_prismatic, motion_vals, 0)[..., np.newaxis] * \
+                               self._jnt_loc_motionax[start_id:]
+        homomats[..., 3, 3] = 1
+        return homomats
+
+    def _accumulate_fk(self, motion_vals, out=None, start_id=0):
+        """
+        compute the global poses of all joints after their motions (gl_posq and gl_rotmatq)
+        the local transformations and motions of all joints are computed at once using the arrays,
+        only the accumulation along the chain is sequential
+        :param motion_vals: njnts nparray, or a n*njnts nparray for a batch of configurations
+        :param out: njnts*4*4 or n*njnts*4*4 nparray to hold the results, a new one is created if None
+        :param start_id: only the joints from start_id are recomputed, out must hold the poses of the joints before it
+        :return: njnts*4*4 or n*njnts*4*4 nparray
+        """
+        motion_vals = np.asarray(motion_vals, dtype=np.float64)
+        motion_homomats = self._motion_homomats(motion_vals[..., start_id:], start_id)
+        loc_motion_homomats = self._jnt_loc_homomat[start_id:] @ motion_homomats
+        if out is None:
+            out = np.empty(motion_vals.shape + (4, 4))
+        if start_id == 0:
+            base_homomat = rm.homomat_from_posrot(self.pos, self.rotmat)
+            np.matmul(base_homomat, motion_homomats[..., 0, :, :], out=out[..., 0, :, :])  # loc pose of jnt 0 is ignored
+        for id in range(max(start_id, 1), out.shape[-3]):
+            np.matmul(out[..., id - 1, :, :], loc_motion_homomats[..., id - start_id, :, :], out=out[..., id, :, :])
+        return out
+
+    def _fk_changes(self):
+        """
+        examine the changes since the last self._update_fk
+        the base pose and the local transformations are compared as bytes, the motion values are compared joint by joint
+        :return: [start_id, is_base_moved]: start_id is the id of the first joint to recompute, None if no joint
+                 needs a recomputation; is_base_moved is True if only the base is moved (all poses move rigidly)
+        """
+        base_key = np.asarray(self.pos, dtype=np.float64).tobytes() + np.asarray(self.rotmat, dtype=np.float64).tobytes()
+        geometry_key = (self._jnt_types.tobytes() + self._jnt_loc_homomat.tobytes() +
+                        self._jnt_loc_motionax.tobytes() + self._lnk_loc_homomat.tobytes())
+        inputs = self._fk_inputs
+        if inputs is None or inputs[1] != geometry_key:
+            start_id = 0
+        else:
+            changed_ids = np.flatnonzero(inputs[2] != self._jnt_motion_vals)
+            start_id = int(changed_ids[0]) if len(changed_ids) > 0 else None
+            if start_id is not None and inputs[0] != base_key:
+                start_id = 0
+        is_base_moved = start_id is None and inputs[0] != base_key
+        self._fk_inputs = (base_key, geometry_key, self._jnt_motion_vals.copy())
+        return start_id, is_base_moved
+
     def _update_fk(self):
         """
         Update the kinematics
         Note that this function should not be called explicitly
         It is called automatically by functions like movexxx
+        only the joints and links after the first changed joint are recomputed;
+        if only the base is moved (e.g. fix_to of hands), all poses are moved rigidly using a single transformation
         :return: updated links and joints
         author: weiwei
         date: 20161202, 20201009osaka
         """
-        id = 0
-        while id != -1:
-            # update joint values
-            pjid = self.jnts[id]['parent']
-            if pjid == -1:
-                self.jnts[id]['gl_pos0'] = self.pos
-                self.jnts[id]['gl_rotmat0'] = self.rotmat
-            else:
-                self.jnts[id]['gl_pos0'] = self.jnts[pjid]['gl_posq'] + np.dot(self.jnts[pjid]['gl_rotmatq'],
-                                                                               self.jnts[id]['loc_pos'])
-                self.jnts[id]['gl_rotmat0'] = np.dot(self.jnts[pjid]['gl_rotmatq'], self.jnts[id]['loc_rotmat'])
-            self.jnts[id]['gl_motionax'] = np.dot(self.jnts[id]['gl_rotmat0'], self.jnts[id]['loc_motionax'])
-            if self.jnts[id]['type'] == "end":
-                self.jnts[id]['gl_rotmatq'] = self.jnts[id]['gl_rotmat0']
-                self.jnts[id]['gl_posq'] = self.jnts[id]['gl_pos0']
-            elif self.jnts[id]['type'] == "revolute":
-                self.jnts[id]['gl_rotmatq'] = np.dot(self.jnts[id]['gl_rotmat0'],
-                                                     rm.rotmat_from_axangle(self.jnts[id]['loc_motionax'],
-                                                                            self.jnts[id]['motion_val']))
-                self.jnts[id]['gl_posq'] = self.jnts[id]['gl_pos0']
-            elif self.jnts[id]['type'] == "prismatic":
-                self.jnts[id]['gl_rotmatq'] = self.jnts[id]['gl_rotmat0']
-                tmp_translation = np.dot(self.jnts[id]['gl_rotmatq'],
-                                         self.jnts[id]['loc_motionax'] * self.jnts[id]['motion_val'])
-                self.jnts[id]['gl_posq'] = self.jnts[id]['gl_pos0'] + tmp_translation
-            # update link values, child link id = id
-            if id < self.ndof + 1:
-                self.lnks[id]['gl_pos'] = np.dot(self.jnts[id]['gl_rotmatq'], self.lnks[id]['loc_pos']) + \
-                                          self.jnts[id]['gl_posq']
-                self.lnks[id]['gl_rotmat'] = np.dot(self.jnts[id]['gl_rotmatq'], self.lnks[id]['loc_rotmat'])
-                # self.lnks[id]['cdprimit_cache'][0] = True
-            id = self.jnts[id]['child']
+        start_id, is_base_moved = self._fk_changes()
+        if is_base_moved:
+            # self._jnt_gl_homomat0[0] is the pose of the previous base
+            base_homomat = rm.homomat_from_posrot(self.pos, self.rotmat)
+            transform = base_homomat @ rm.homomat_inverse(self._jnt_gl_homomat0[0])
+            np.matmul(transform, self._jnt_gl_homomatq, out=self._jnt_gl_homomatq)
+            np.matmul(transform, self._jnt_gl_homomat0, out=self._jnt_gl_homomat0)
+            self._jnt_gl_homomat0[0] = base_homomat  # avoid accumulating the rounding errors at the base
+            np.matmul(self._jnt_gl_motionax, transform[:3, :3].T, out=self._jnt_gl_motionax)
+            np.matmul(transform, self._lnk_gl_homomat, out=self._lnk_gl_homomat)
+            return self.lnks, self.jnts
+        if start_id is None:  # nothing is changed since the last update
+            return self.lnks, self.jnts
+        gl_homomatq = self._accumulate_fk(self._jnt_motion_vals, out=self._jnt_gl_homomatq, start_id=start_id)
+        if start_id == 0:
+            self._jnt_gl_homomat0[0] = rm.homomat_from_posrot(self.pos, self.rotmat)
+        jnt_start_id = max(start_id, 1)
+        np.matmul(gl_homomatq[jnt_start_id - 1:-1], self._jnt_loc_homomat[jnt_start_id:],
+                  out=self._jnt_gl_homomat0[jnt_start_id:])
+        self._jnt_gl_motionax[start_id:] = np.einsum('nij,nj->ni', self._jnt_gl_homomat0[start_id:, :3, :3],
+                                                     self._jnt_loc_motionax[start_id:])
+        # update link values, child link id = id
+        nlnks = len(self._lnk_gl_homomat)
+        if start_id < nlnks:
+            np.matmul(gl_homomatq[start_id:nlnks], self._lnk_loc_homomat[start_id:],
+                      out=self._lnk_gl_homomat[start_id:])
         return self.lnks, self.jnts
 
     @property
@@ -163,6 +369,7 @@ class JLChain(object):
     @tgtjnts.setter
     def tgtjnts(self, values):
         self._tgtjnts = values
+        self._tgtjnt_ids = np.array(values, dtype=int)
         self._ikt = jlik.JLChainIK(self)
 
     def fix_to(self, pos, rotmat, jnt_values=None):
@@ -229,10 +436,15 @@ class JLChain(object):
         date: 20180602, 20200704osaka
         author: weiwei
         """
-        jnt_limits = []
-        for id in self.tgtjnts:
-            jnt_limits.append([self.jnts[id]['motion_rng'][0], self.jnts[id]['motion_rng'][1]])
-        return jnt_limits
+        return self._jnt_motion_rng[self._tgtjnt_ids].tolist()
+
+    def get_lnk_gl_homomats(self, lnk_ids):
+        """
+        the global poses of the given links, updated by fk
+        :param lnk_ids: a list of link ids
+        :return: nx4x4 nparray
+        """
+        return self._lnk_gl_homomat[lnk_ids]
 
     def fk(self, jnt_values=None):
         """
@@ -243,12 +455,36 @@ class JLChain(object):
         date: 20161205, 20201009osaka
         """
         if jnt_values is not None:
-            counter = 0
-            for id in self.tgtjnts:
-                self.jnts[id]['motion_val'] = jnt_values[counter]
-                counter += 1
+            self._jnt_motion_vals[self._tgtjnt_ids] = jnt_values
         self._update_fk()
 
+    def fk_batch(self, jnt_values_array, tcp_jntid=None, tcp_loc_pos=None, tcp_loc_rotmat=None):
+        """
+        forward kinematics of a batch of configurations, vectorized over the configurations
+        the current state of the chain (joint values, link poses, etc.) is not changed
+        tcp_jntid, tcp_loc_pos, tcp_loc_rotmat are the tool center pose parameters. They are
+        used for temporary computation, the self.tcp_xxx parameters will not be changed
+        in case None is provided, the self.tcp_jntid, self.tcp_loc_pos, self.tcp_loc_rotmat will be used
+        :param jnt_values_array: nxndof nparray, each row is a configuration of self.tgtjnts
+        :param tcp_jntid: a joint ID in the self.tgtjnts, single value
+        :param tcp_loc_pos: 1x3 nparray, decribed in the local frame of self.jnts[tcp_jntid], single value
+        :param tcp_loc_rotmat: 3x3 nparray, decribed in the local frame of self.jnts[tcp_jntid], single value
+        :return: [lnk_homomats, tcp_homomats], n*nlinks*4*4 and n*4*4 nparrays
+        """
+        if tcp_jntid is None:
+            tcp_jntid = self.tcp_jntid
+        if tcp_loc_pos is None:
+            tcp_loc_pos = self.tcp_loc_pos
+        if tcp_loc_rotmat is None:
+            tcp_loc_rotmat = self.tcp_loc_rotmat
+        jnt_values_array = np.asarray(jnt_values_array, dtype=np.float64).reshape(-1, len(self._tgtjnt_ids))
+        motion_vals = np.tile(self._jnt_motion_vals, (len(jnt_values_array), 1))
+        motion_vals[:, self._tgtjnt_ids] = jnt_values_array
+        gl_homomatq = self._accumulate_fk(motion_vals)
+        lnk_homomats = gl_homomatq[:, :len(self._lnk_gl_homomat)] @ self._lnk_loc_homomat
+        tcp_homomats = gl_homomatq[:, tcp_jntid] @ rm.homomat_from_posrot(tcp_loc_pos, tcp_loc_rotmat)
+        return lnk_homomats, tcp_homomats
+
     def goto_homeconf(self):
         """
         move the robot_s to initial pose
@@ -274,12 +510,7 @@ class JLChain(object):
         author: weiwei
         date: 20161205tsukuba
         """
-        jnt_values = np.zeros(len(self.tgtjnts))
-        counter = 0
-        for id in self.tgtjnts:
-            jnt_values[counter] = self.jnts[id]['motion_val']
-            counter += 1
-        return jnt_values
+        return self._jnt_motion_vals[self._tgtjnt_ids]
 
     def rand_conf(self):
         """
@@ -287,12 +518,8 @@ class JLChain(object):
         author: weiwei
         date: 20200326
         """
-        jnt_values = np.zeros(len(self.tgtjnts))
-        counter = 0
-        for i in self.tgtjnts:
-            jnt_values[counter] = np.random.uniform(self.jnts[i]['motion_rng'][0], self.jnts[i]['motion_rng'][1])
-            counter += 1
-        return jnt_values
+        jnt_rngs = self._jnt_motion_rng[self._tgtjnt_ids]
+        return np.random.uniform(jnt_rngs[:, 0], jnt_rngs[:, 1])
 
     def ik(self,
            tgt_pos,
@@ -331,6 +558,37 @@ class JLChain(object):
                                 local_minima=local_minima,
                                 toggle_debug=toggle_debug)
 
+    def ik_batch(self,
+                 tgt_pos_array,
+                 tgt_rotmat_array,
+                 seed_jnt_values=None,
+                 tcp_jntid=None,
+                 tcp_loc_pos=None,
+                 tcp_loc_rotmat=None,
+                 max_niter=100,
+                 local_minima="accept"):
+        """
+        Numerical IK of many goals at once, vectorized over the goals
+        the current state of the chain is not changed
+        :param tgt_pos_array: mx3 nparray
+        :param tgt_rotmat_array: mx3x3 nparray
+        :param seed_jnt_values: None (homeconf), a 1xn nparray shared by all goals, or a mxn nparray
+        :param tcp_jntid: a joint ID in the self.tgtjnts, single value
+        :param tcp_loc_pos: 1x3 nparray, decribed in the local frame of self.jnts[tcp_jntid], single value
+        :param tcp_loc_rotmat: 3x3 nparray, decribed in the local frame of self.jnts[tcp_jntid], single value
+        :param max_niter
+        :param local_minima: what to do at local minima: "accept", "randomrestart", "end"
+        :return: a list of m elements, each is a 1xn nparray or None
+        """
+        return self._ikt.num_ik_batch(tgt_pos_array=tgt_pos_array,
+                                      tgt_rotmat_array=tgt_rotmat_array,
+                                      seed_jnt_values=seed_jnt_values,
+                                      max_niter=max_niter,
+                                      tcp_jntid=tcp_jntid,
+                                      tcp_loc_pos=tcp_loc_pos,
+                                      tcp_loc_rotmat=tcp_loc_rotmat,
+                                      local_minima=local_minima)
+
     def manipulability(self):
         return self._ikt.manipulability()
 
@@ -3,6 +3,99 @@ import numpy as np
 import basis.robot_math as rm
 import warnings as wns
 
+# IK macros
+WT_POS = 0.628  # 0.628m->1 == 0.01->0.00628m
+WT_AGL = 1 / (math.pi * math.pi)  # pi->1 == 0.01->0.18degree
+
+
+def deltaw_between_rotmat_batch(rotmati, rotmatj):
+    """
+    vectorized version of rm.deltaw_between_rotmat
+    :param rotmati: mx3x3 nparray
+    :param rotmatj: mx3x3 nparray
+    :return: mx3 nparray
+    """
+    deltarot = rotmatj @ rotmati.transpose(0, 2, 1)
+    tempvec = np.stack([deltarot[:, 2, 1] - deltarot[:, 1, 2],
+                        deltarot[:, 0, 2] - deltarot[:, 2, 0],
+                        deltarot[:, 1, 0] - deltarot[:, 0, 1]], axis=1)
+    tempveclength = np.linalg.norm(tempvec, axis=1)
+    diag = np.diagonal(deltarot, axis1=1, axis2=2)
+    deltaw = math.pi / 2 * (diag + 1)
+    deltaw[np.all(diag > 0, axis=1)] = 0
+    selection = tempveclength > 1e-6
+    deltaw[selection] = (np.arctan2(tempveclength[selection], diag[selection].sum(axis=1) - 1.0) /
+                         tempveclength[selection])[:, np.newaxis] * tempvec[selection]
+    return deltaw
+
+
+def tcp_error_batch(tcp_gl_homomat, tgt_pos_array, tgt_rotmat_array):
+    """
+    the errors of a batch of tcps, see JLChainIK.tcp_error
+    :param tcp_gl_homomat: mx4x4 nparray
+    :param tgt_pos_array: mx3 nparray
+    :param tgt_rotmat_array: mx3x3 nparray
+    :return: [err, errnorm], mx6 nparray and the weighted squared norms of the errors
+    """
+    err = np.empty((len(tcp_gl_homomat), 6))
+    err[:, :3] = tgt_pos_array - tcp_gl_homomat[:, :3, 3]
+    err[:, 3:] = deltaw_between_rotmat_batch(tcp_gl_homomat[:, :3, :3], tgt_rotmat_array)
+    return err, (err * err * np.array([WT_POS, WT_POS, WT_POS, WT_AGL, WT_AGL, WT_AGL])).sum(axis=1)
+
+
+def wln_weights(jnt_values, jmvmin, jmvmax, wln_ratio=.05):
+    """
+    the diagonal of the wln weightmat, the motion is damped near the joint limits
+    :param jnt_values: 1xn nparray, or mxn nparray for a batch of configurations
+    :param jmvmin: 1xn nparray, the lower limits of the joints
+    :param jmvmax: 1xn nparray
+    :param wln_ratio: the ratio of the joint ranges where the motion is damped
+    :return: an nparray with the same shape as jnt_values
+    """
+    jmvrng = jmvmax - jmvmin
+    jmvmin_threshhold = jmvmin + jmvrng * wln_ratio
+    jmvmax_threshhold = jmvmax - jmvrng * wln_ratio
+    wts = np.ones_like(jnt_values, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # min damping interval
+        normalized_diff = (jnt_values - jmvmin) / (jmvmin_threshhold - jmvmin)
+        wts = np.where(jnt_values < jmvmin_threshhold,
+                       -2 * np.power(normalized_diff, 3) + 3 * np.power(normalized_diff, 2), wts)
+        # max damping interval
+        normalized_diff = (jmvmax - jnt_values) / (jmvmax - jmvmax_threshhold)
+        wts = np.where(jnt_values > jmvmax_threshhold,
+                       -2 * np.power(normalized_diff, 3) + 3 * np.power(normalized_diff, 2), wts)
+    wts[jnt_values >= jmvmax] = 0
+    wts[jnt_values <= jmvmin] = 0
+    return wts
+
+
+def wln_step_batch(j, err, errnorm, jnt_values, dqref_init, jmvmin, jmvmax, wln_ratio=.05):
+    """
+    one weighted least-norm levenberg-marquardt update of a batch of configurations, see JLChainIK.num_ik
+    :param j: mx6xn nparray, the jacobians at jnt_values
+    :param err: see tcp_error_batch
+    :param errnorm:
+    :param jnt_values: mxn nparray
+    :param dqref_init: mxn nparray, the motion towards the reference configurations, projected to the null space
+    :param jmvmin: 1xn nparray, the lower limits of the joints
+    :param jmvmax: 1xn nparray
+    :param wln_ratio: see wln_weights
+    :return: mxn nparray, the updated joint values
+    """
+    qs_wts = wln_weights(jnt_values, jmvmin, jmvmax, wln_ratio)
+    w_jt = qs_wts[:, :, np.newaxis] * j.transpose(0, 2, 1)
+    j_w_jt = j @ w_jt
+    damper = (1e-3 * errnorm + 1e-6)[:, np.newaxis, np.newaxis] * np.identity(6)
+    jsharp = w_jt @ np.linalg.inv(j_w_jt + damper)
+    # joint clamping
+    phi_q = (2 * jnt_values - (jmvmax + jmvmin) / 2) / (jmvmax - jmvmin)
+    clamping = -(1 - qs_wts) * phi_q
+    dq = .1 * (jsharp @ err[:, :, np.newaxis])[..., 0]
+    ns_projmat = np.identity(jnt_values.shape[1]) - jsharp @ j
+    dqref_on_ns = (ns_projmat @ (dqref_init + clamping)[:, :, np.newaxis])[..., 0]
+    return jnt_values + dq + dqref_on_ns
+
 
 class JLChainIK(object):
 
@@ -10,19 +103,13 @@ class JLChainIK(object):
         self.jlc_object = jlc_object
         self.wln_ratio = wln_ratio
         # IK macros
-        wt_pos = 0.628  # 0.628m->1 == 0.01->0.00628m
-        wt_agl = 1 / (math.pi * math.pi)  # pi->1 == 0.01->0.18degree
-        self.ws_wtlist = [wt_pos, wt_pos, wt_pos, wt_agl, wt_agl, wt_agl]
+        self.ws_wtlist = [WT_POS, WT_POS, WT_POS, WT_AGL, WT_AGL, WT_AGL]
         # maximum reach
         self.max_rng = 20.0
         # extract min max for quick access
-        self.jmvmin = np.zeros(len(self.jlc_object.tgtjnts))
-        self.jmvmax = np.zeros(len(self.jlc_object.tgtjnts))
-        counter = 0
-        for id in self.jlc_object.tgtjnts:
-            self.jmvmin[counter] = self.jlc_object.jnts[id]['motion_rng'][0]
-            self.jmvmax[counter] = self.jlc_object.jnts[id]['motion_rng'][1]
-            counter += 1
+        jnt_rngs = np.array(self.jlc_object.get_jnt_ranges()).reshape(-1, 2)
+        self.jmvmin = jnt_rngs[:, 0]
+        self.jmvmax = jnt_rngs[:, 1]
         self.jmvrng = self.jmvmax - self.jmvmin
         self.jmvmiddle = (self.jmvmax + self.jmvmin) / 2
         self.jmvmin_threshhold = self.jmvmin + self.jmvrng * self.wln_ratio
@@ -37,21 +124,28 @@ class JLChainIK(object):
         author: weiwei
         date: 20161202, 20200331, 20200706
         """
-        j = np.zeros((6, len(self.jlc_object.tgtjnts)))
-        counter = 0
-        for jid in self.jlc_object.tgtjnts:
-            grax = self.jlc_object.jnts[jid]["gl_motionax"]
-            if self.jlc_object.jnts[jid]["type"] == 'revolute':
-                diffq = self.jlc_object.jnts[tcp_jntid]["gl_posq"] - self.jlc_object.jnts[jid]["gl_posq"]
-                j[:3, counter] = np.cross(grax, diffq)
-                j[3:6, counter] = grax
-            if self.jlc_object.jnts[jid]["type"] == 'prismatic':
-                j[:3, counter] = grax
-            counter += 1
-            if jid == tcp_jntid:
-                break
+        jids = self.jlc_object._tgtjnt_ids
+        is_revolute = self.jlc_object._jnt_type_mask('revolute')[jids, np.newaxis]
+        is_prismatic = self.jlc_object._jnt_type_mask('prismatic')[jids, np.newaxis]
+        gl_posq = self.jlc_object._jnt_gl_homomatq[:, :3, 3]
+        grax = self.jlc_object._jnt_gl_motionax[jids]
+        diffq = gl_posq[tcp_jntid] - gl_posq[jids]
+        j = np.zeros((6, len(jids)))
+        cross = grax[:, [1, 2, 0]] * diffq[:, [2, 0, 1]] - grax[:, [2, 0, 1]] * diffq[:, [1, 2, 0]]  # np.cross is slow
+        j[:3, :] = (cross * is_revolute + grax * is_prismatic).T
+        j[3:6, :] = (grax * is_revolute).T
+        if tcp_jntid in self.jlc_object.tgtjnts:
+            j[:, list(self.jlc_object.tgtjnts).index(tcp_jntid) + 1:] = 0
         return j
 
+    def _wln_weights(self, jnt_values):
+        """
+        get the diagonal of the wln weightmat
+        :param jnt_values: 1xn nparray, or mxn nparray for a batch of configurations
+        :return: an nparray with the same shape as jnt_values
+        """
+        return wln_weights(jnt_values, self.jmvmin, self.jmvmax, self.wln_ratio)
+
     def _wln_weightmat(self, jntvalues):
         """
         get the wln weightmat
@@ -60,18 +154,7 @@ class JLChainIK(object):
         author: weiwei
         date: 20201126
         """
-        wtmat = np.ones(len(self.jlc_object.tgtjnts))
-        # min damping interval
-        selection = jntvalues < self.jmvmin_threshhold
-        normalized_diff_at_selected = ((jntvalues - self.jmvmin) / (self.jmvmin_threshhold - self.jmvmin))[selection]
-        wtmat[selection] = -2 * np.power(normalized_diff_at_selected, 3) + 3 * np.power(normalized_diff_at_selected, 2)
-        # max damping interval
-        selection = jntvalues > self.jmvmax_threshhold
-        normalized_diff_at_selected = ((self.jmvmax - jntvalues) / (self.jmvmax - self.jmvmax_threshhold))[selection]
-        wtmat[selection] = -2 * np.power(normalized_diff_at_selected, 3) + 3 * np.power(normalized_diff_at_selected, 2)
-        wtmat[jntvalues >= self.jmvmax] = 0
-        wtmat[jntvalues <= self.jmvmin] = 0
-        return np.diag(wtmat)
+        return np.diag(self._wln_weights(jntvalues))
 
     def jacobian(self, tcp_jntid):
         """
@@ -145,20 +228,19 @@ class JLChainIK(object):
             tcp_loc_pos = self.jlc_object.tcp_loc_pos
         if tcp_loc_rotmat is None:
             tcp_loc_rotmat = self.jlc_object.tcp_loc_rotmat
+        gl_homomatq = self.jlc_object._jnt_gl_homomatq
         if isinstance(tcp_jnt_id, list):
             returnposlist = []
             returnrotmatlist = []
             for i, jid in enumerate(tcp_jnt_id):
-                tcp_gl_pos = np.dot(self.jlc_object.jnts[jid]["gl_rotmatq"], tcp_loc_pos[i]) + \
-                             self.jlc_object.jnts[jid]["gl_posq"]
-                tcp_gl_rotmat = np.dot(self.jlc_object.jnts[jid]["gl_rotmatq"], tcp_loc_rotmat[i])
+                tcp_gl_pos = np.dot(gl_homomatq[jid, :3, :3], tcp_loc_pos[i]) + gl_homomatq[jid, :3, 3]
+                tcp_gl_rotmat = np.dot(gl_homomatq[jid, :3, :3], tcp_loc_rotmat[i])
                 returnposlist.append(tcp_gl_pos)
                 returnrotmatlist.append(tcp_gl_rotmat)
             return [returnposlist, returnrotmatlist]
         else:
-            tcp_gl_pos = np.dot(self.jlc_object.jnts[tcp_jnt_id]["gl_rotmatq"], tcp_loc_pos) + \
-                         self.jlc_object.jnts[tcp_jnt_id]["gl_posq"]
-            tcp_gl_rotmat = np.dot(self.jlc_object.jnts[tcp_jnt_id]["gl_rotmatq"], tcp_loc_rotmat)
+            tcp_gl_pos = np.dot(gl_homomatq[tcp_jnt_id, :3, :3], tcp_loc_pos) + gl_homomatq[tcp_jnt_id, :3, 3]
+            tcp_gl_rotmat = np.dot(gl_homomatq[tcp_jnt_id, :3, :3], tcp_loc_rotmat)
             return tcp_gl_pos, tcp_gl_rotmat
 
     def tcp_error(self, tgt_pos, tgt_rot, tcp_jntid, tcp_loc_pos, tcp_loc_rotmat):
@@ -462,6 +544,115 @@ class JLChainIK(object):
         print('Failed to solve the IK, returning None.')
         return None
 
+    def _jacobian_batch(self, gl_homomatq, tcp_jntid):
+        """
+        compute the jacobian matrices of a batch of configurations, see _jacobian_sgl
+        :param gl_homomatq: mxnjntsx4x4 nparray, the global joint poses computed by jlc._accumulate_fk
+        :param tcp_jntid: the joint id where the tool center pose is specified, single vlaue
+        :return: mx6xn nparray
+        """
+        jids = self.jlc_object._tgtjnt_ids
+        is_revolute = self.jlc_object._jnt_type_mask('revolute')[jids, np.newaxis]
+        is_prismatic = self.jlc_object._jnt_type_mask('prismatic')[jids, np.newaxis]
+        # gl_rotmatq.dot(loc_motionax) equals gl_motionax for both revolute and prismatic joints
+        tgt_gl_homomatq = gl_homomatq[:, jids]
+        grax = np.einsum('mjab,jb->mja', tgt_gl_homomatq[..., :3, :3], self.jlc_object._jnt_loc_motionax[jids])
+        diffq = gl_homomatq[:, tcp_jntid, np.newaxis, :3, 3] - tgt_gl_homomatq[..., :3, 3]
+        cross = grax[..., [1, 2, 0]] * diffq[..., [2, 0, 1]] - grax[..., [2, 0, 1]] * diffq[..., [1, 2, 0]]
+        j = np.zeros((len(gl_homomatq), 6, len(jids)))
+        j[:, :3, :] = (cross * is_revolute + grax * is_prismatic).transpose(0, 2, 1)
+        j[:, 3:6, :] = (grax * is_revolute).transpose(0, 2, 1)
+        if tcp_jntid in self.jlc_object.tgtjnts:
+            j[:, :, list(self.jlc_object.tgtjnts).index(tcp_jntid) + 1:] = 0
+        return j
+
+    def num_ik_batch(self,
+                     tgt_pos_array,
+                     tgt_rotmat_array,
+                     seed_jnt_values=None,
+                     max_niter=100,
+                     tcp_jntid=None,
+                     tcp_loc_pos=None,
+                     tcp_loc_rotmat=None,
+                     local_minima="randomrestart"):
+        """
+        solve the ik of many goals at once using the same WLN Levenberg-Marquardt update as num_ik
+        the update is computed for all unsolved goals as stacked nparrays; solved goals are dropped from the iteration
+        the current state of the jlc_object is not changed
+        :param tgt_pos_array: mx3 nparray
+        :param tgt_rotmat_array: mx3x3 nparray
+        :param seed_jnt_values: None (homeconf), a 1xn nparray shared by all goals, or a mxn nparray
+        :param max_niter: max number of numercial iternations
+        :param tcp_jntid: a joint ID in the self.tgtjnts, single value
+        :param tcp_loc_pos: 1x3 nparray, decribed in the local frame of self.jnts[tcp_jntid], single value
+        :param tcp_loc_rotmat: 3x3 nparray, decribed in the local frame of self.jnts[tcp_jntid], single value
+        :param local_minima: what to do at local minima: "accept", "randomrestart", "end"
+        :return: a list of m elements, each is a 1xn nparray or None
+        """
+        jlc = self.jlc_object
+        jids = jlc._tgtjnt_ids
+        ndof = len(jids)
+        if tcp_jntid is None:
+            tcp_jntid = jlc.tcp_jntid
+        if tcp_loc_pos is None:
+            tcp_loc_pos = jlc.tcp_loc_pos
+        if tcp_loc_rotmat is None:
+            tcp_loc_rotmat = jlc.tcp_loc_rotmat
+        if isinstance(tcp_jntid, list):
+            tcp_jntid = tcp_jntid[0]
+            tcp_loc_pos = tcp_loc_pos[0]
+            tcp_loc_rotmat = tcp_loc_rotmat[0]
+        tcp_loc_homomat = rm.homomat_from_posrot(tcp_loc_pos, tcp_loc_rotmat)
+        tgt_pos_array = np.asarray(tgt_pos_array, dtype=np.float64).reshape(-1, 3)
+        tgt_rotmat_array = np.asarray(tgt_rotmat_array, dtype=np.float64).reshape(-1, 3, 3)
+        n_goals = len(tgt_pos_array)
+        if seed_jnt_values is None:
+            seed_jnt_values = jlc.homeconf
+        jnt_values_iter = np.array(seed_jnt_values, dtype=np.float64).reshape(-1, ndof)
+        if len(jnt_values_iter) == 1:
+            jnt_values_iter = np.tile(jnt_values_iter, (n_goals, 1))
+        jnt_values_ref = jnt_values_iter.copy()
+        w_init = np.full(n_goals, .1)  # set to 0 after a random restart
+        errnormlast = np.zeros(n_goals)
+        results = [None] * n_goals
+        # goals outside the maximum range are never iterated
+        active = np.flatnonzero(np.linalg.norm(tgt_pos_array - jlc.pos, axis=1) <= self.max_rng)
+        for _ in range(max_niter):
+            if len(active) == 0:
+                break
+            jnt_values = jnt_values_iter[active]
+            motion_vals = np.tile(jlc._jnt_motion_vals, (len(active), 1))
+            motion_vals[:, jids] = jnt_values
+            gl_homomatq = jlc._accumulate_fk(motion_vals)
+            tcp_gl_homomat = gl_homomatq[:, tcp_jntid] @ tcp_loc_homomat
+            err, errnorm = tcp_error_batch(tcp_gl_homomat, tgt_pos_array[active], tgt_rotmat_array[active])
+            is_solved = errnorm < 1e-6
+            is_stuck = np.logical_and(~is_solved, np.abs(errnorm - errnormlast[active]) < 1e-12)
+            if local_minima == 'accept':
+                is_solved = np.logical_or(is_solved, is_stuck)
+            elif local_minima == 'randomrestart':
+                restart_ids = active[is_stuck]
+                jnt_values_iter[restart_ids] = np.random.uniform(self.jmvmin, self.jmvmax, (len(restart_ids), ndof))
+                w_init[restart_ids] = 0
+            for id in np.flatnonzero(is_solved):
+                results[active[id]] = jnt_values[id].copy()
+            is_updated = np.logical_and(~is_solved, ~is_stuck)
+            # WLN update, see num_ik for the details
+            j = self._jacobian_batch(gl_homomatq[is_updated], tcp_jntid)
+            err = err[is_updated]
+            errnorm = errnorm[is_updated]
+            jnt_values = jnt_values[is_updated]
+            updated_ids = active[is_updated]
+            dqref_init = w_init[updated_ids, np.newaxis] * (jnt_values_ref[updated_ids] - jnt_values)
+            jnt_values_iter[updated_ids] = wln_step_batch(j, err, errnorm, jnt_values, dqref_init,
+                                                          self.jmvmin, self.jmvmax, self.wln_ratio)
+            errnormlast[updated_ids] = errnorm
+            if local_minima == 'randomrestart':
+                active = active[np.logical_or(is_updated, is_stuck)]
+            else:
+                active = updated_ids
+        return results
+
     def numik_rel(self, deltapos, deltarotmat, tcp_jntid=None, tcp_loc_pos=None, tcp_loc_rotmat=None):
         """
         add deltapos, deltarotmat to the current end
@@ -0,0 +1,195 @@
+import pickle
+import numpy as np
+import basis.robot_math as rm
+from scipy.spatial import cKDTree
+
+
+class JLChainIKSeedDB(object):
+    """
+    a database of solved ik pairs used to warm start the numerical ik
+    the poses of the end joint (self.jlc_object.jnts[-1]) are stored in the local frame of the base,
+    so that the database stays valid after the chain is moved by fix_to
+    a pose is indexed by the feature [pos, rot_weight*rotmat.flatten()] using a kd-tree;
+    new entries are kept in a small buffer and merged into the kd-tree when the buffer is full
+    """
+
+    def __init__(self, jlc_object, rot_weight=.1, min_dist=1e-3, buffer_size=256):
+        """
+        :param jlc_object:
+        :param rot_weight: the weight (in meter) of the rotation part of the features
+        :param min_dist: entries closer than min_dist to an existing one are not added
+        :param buffer_size: the number of new entries kept outside of the kd-tree
+        """
+        self.jlc_object = jlc_object
+        self.rot_weight = rot_weight
+        self.min_dist = min_dist
+        self.buffer_size = buffer_size
+        self._features = np.zeros((0, 12))
+        self._jnt_values = np.zeros((0, jlc_object.ndof))
+        self._kdt = None
+        self._n_kdt = 0  # the first self._n_kdt entries are in the kd-tree, the others are in the buffer
+
+    def __len__(self):
+        return len(self._features)
+
+    def _signature(self):
+        jlc = self.jlc_object
+        return {'ndof': jlc.ndof,
+                'jnt_loc_homomat': jlc._jnt_loc_homomat.copy(),
+                'jnt_loc_motionax': jlc._jnt_loc_motionax.copy(),
+                'tgtjnt_ids': np.asarray(jlc._tgtjnt_ids).copy()}
+
+    def is_applicable(self, tcp_jntid):
+        """
+        the stored poses are the poses of the end joint, the tcp must be rigidly attached to the last link
+        :param tcp_jntid:
+        :return:
+        """
+        return tcp_jntid in [-1, self.jlc_object.ndof, self.jlc_object.ndof + 1]
+
+    def _features_from_homomats(self, homomats):
+        """
+        :param homomats: mx4x4 nparray, global poses of the end joint
+        :return: mx12 nparray
+        """
+        base_rotmat = np.asarray(self.jlc_object.rotmat)
+        loc_pos = (homomats[:, :3, 3] - np.asarray(self.jlc_object.pos)) @ base_rotmat
+        loc_rotmat = base_rotmat.T @ homomats[:, :3, :3]
+        return np.hstack((loc_pos, self.rot_weight * loc_rotmat.reshape(-1, 9)))
+
+    def _features_from_tcp(self, tgt_pos_array, tgt_rotmat_array, tcp_jntid, tcp_loc_pos, tcp_loc_rotmat):
+        """
+        convert the tcp goals to the poses of the end joint and then to features
+        :return: mx12 nparray
+        """
+        jlc = self.jlc_object
+        if tcp_jntid is None:
+            tcp_jntid = jlc.tcp_jntid
+        if tcp_loc_pos is None:
+            tcp_loc_pos = jlc.tcp_loc_pos
+        if tcp_loc_rotmat is None:
+            tcp_loc_rotmat = jlc.tcp_loc_rotmat
+        tgt_pos_array = np.asarray(tgt_pos_array, dtype=np.float64).reshape(-1, 3)
+        homomats = np.tile(np.eye(4), (len(tgt_pos_array), 1, 1))
+        homomats[:, :3, :3] = np.asarray(tgt_rotmat_array, dtype=np.float64).reshape(-1, 3, 3)
+        homomats[:, :3, 3] = tgt_pos_array
+        homomats = homomats @ np.linalg.inv(rm.homomat_from_posrot(tcp_loc_pos, tcp_loc_rotmat))
+        if tcp_jntid == jlc.ndof:
+            homomats = homomats @ jlc._jnt_loc_homomat[-1]
+        return self._features_from_homomats(homomats)
+
+    def _nearest(self, features, k):
+        """
+        k nearest entries of the kd-tree and the buffer
+        :param features: mx12 nparray
+        :return: [dists, ids], mxk nparrays sorted by the distances, missing entries have dists=np.inf
+        """
+        n_features = len(features)
+        k = min(k, len(self))
+        dists = np.full((n_features, 0), np.inf)
+        ids = np.zeros((n_features, 0), dtype=int)
+        if self._n_kdt > 0:
+            kdt_dists, kdt_ids = self._kdt.query(features, k=min(k, self._n_kdt))
+            dists = np.hstack((dists, kdt_dists.reshape(n_features, -1)))
+            ids = np.hstack((ids, kdt_ids.reshape(n_features, -1)))
+        if len(self) > self._n_kdt:
+            buffer_dists = np.linalg.norm(features[:, np.newaxis] - self._features[np.newaxis, self._n_kdt:], axis=2)
+            dists = np.hstack((dists, buffer_dists))
+            ids = np.hstack((ids, np.tile(np.arange(self._n_kdt, len(self)), (n_features, 1))))
+        order = np.argsort(dists, axis=1)[:, :k]
+        return np.take_along_axis(dists, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+    def _rebuild(self):
+        self._kdt = cKDTree(self._features) if len(self) > 0 else None
+        self._n_kdt = len(self)
+
+    def add(self, jnt_values_array):
+        """
+        add solved configurations; the poses are computed by forward kinematics,
+        so that local minima accepted by the numerical ik never pollute the database
+        :param jnt_values_array: mxn nparray or a 1xn nparray
+        :return: the number of added entries
+        """
+        jnt_values_array = np.asarray(jnt_values_array, dtype=np.float64).reshape(-1, self.jlc_object.ndof)
+        _, homomats = self.jlc_object.fk_batch(jnt_values_array, tcp_jntid=-1,
+                                               tcp_loc_pos=np.zeros(3), tcp_loc_rotmat=np.eye(3))
+        features = self._features_from_homomats(homomats)
+        is_new = np.ones(len(features), dtype=bool)
+        if len(self) > 0:
+            dists, _ = self._nearest(features, k=1)
+            is_new = dists[:, 0] > self.min_dist
+        # also drop the duplicates inside the given batch
+        pairs = cKDTree(features).query_pairs(self.min_dist, output_type='ndarray')
+        is_new[pairs.max(axis=1)] = False
+        self._features = np.vstack((self._features, features[is_new]))
+        self._jnt_values = np.vstack((self._jnt_values, jnt_values_array[is_new]))
+        if len(self) - self._n_kdt > self.buffer_size:
+            self._rebuild()
+        return int(np.count_nonzero(is_new))
+
+    def query(self, tgt_pos, tgt_rotmat, k=3, tcp_jntid=None, tcp_loc_pos=None, tcp_loc_rotmat=None):
+        """
+        :param tgt_pos: 1x3 nparray
+        :param tgt_rotmat: 3x3 nparray
+        :param k: the number of seeds
+        :return: a kxn nparray sorted by the distances to the goal, at most k rows
+        """
+        return self.query_batch(np.asarray(tgt_pos)[np.newaxis], np.asarray(tgt_rotmat)[np.newaxis], k=k,
+                                tcp_jntid=tcp_jntid, tcp_loc_pos=tcp_loc_pos, tcp_loc_rotmat=tcp_loc_rotmat)[0]
+
+    def query_batch(self, tgt_pos_array, tgt_rotmat_array, k=1, tcp_jntid=None, tcp_loc_pos=None,
+                    tcp_loc_rotmat=None):
+        """
+        :param tgt_pos_array: mx3 nparray
+        :param tgt_rotmat_array: mx3x3 nparray
+        :param k: the number of seeds per goal
+        :return: an mxkxn nparray, k is reduced to len(self) if the database is smaller
+        """
+        features = self._features_from_tcp(tgt_pos_array, tgt_rotmat_array, tcp_jntid, tcp_loc_pos, tcp_loc_rotmat)
+        if len(self) == 0:
+            return np.zeros((len(features), 0, self.jlc_object.ndof))
+        _, ids = self._nearest(features, k)
+        return self._jnt_values[ids]
+
+    def sample(self, n_samples=10000):
+        """
+        fill the database offline using random configurations
+        :param n_samples:
+        :return: the number of added entries
+        """
+        jnt_rngs = np.asarray(self.jlc_object.get_jnt_ranges())
+        jnt_values_array = np.random.uniform(jnt_rngs[:, 0], jnt_rngs[:, 1], (n_samples, self.jlc_object.ndof))
+        n_added = self.add(jnt_values_array)
+        self._rebuild()
+        return n_added
+
+    def save(self, path):
+        """
+        :param path: a pickle file
+        :return:
+        """
+        with open(path, 'wb') as f:
+            pickle.dump({'signature': self._signature(),
+                         'rot_weight': self.rot_weight,
+                         'features': self._features,
+                         'jnt_values': self._jnt_values}, f)
+
+    def load(self, path):
+        """
+        load the entries saved by save; the chain must be the same as the one used to save them
+        :param path: a pickle file
+        :return:
+        """
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        signature = self._signature()
+        saved_signature = data['signature']
+        if saved_signature['ndof'] != signature['ndof'] or any(
+                saved_signature[key].shape != signature[key].shape or
+                not np.allclose(saved_signature[key], signature[key]) for key in signature if key != 'ndof'):
+            raise ValueError("The ik seed database at " + path + " was saved for a different kinematic chain!")
+        self._features = data['features']
+        self._jnt_values = data['jnt_values']
+        if data['rot_weight'] != self.rot_weight:
+            self._features[:, 3:] *= self.rot_weight / data['rot_weight']
+        self._rebuild()
@@ -0,0 +1,264 @@
+import math
+import numpy as np
+import basis.robot_math as rm
+
+
+class JLChainURIK(object):
+    """
+    closed-form ik of the 6R chains with the UR geometry:
+    jnt1 is perpendicular to jnt2; jnt2, jnt3 and jnt4 are parallel; jnt5 is perpendicular to jnt4;
+    jnt5 and jnt6 intersect at the wrist center
+    the geometry is read from the chain at the zero configuration (product of exponentials),
+    the ik is decomposed into Paden-Kahan subproblems, giving at most 8 solutions
+    all branches of all goals are computed at once as stacked nparrays
+    """
+
+    def __init__(self, jlc_object):
+        self.jlc_object = jlc_object
+        if self.jlc_object.ndof != 6:
+            raise ValueError("The UR analytic ik only supports 6-dof chains!")
+        self._geometry_cache = None
+
+    def _geometry(self):
+        """
+        the constants of the closed-form solution, computed at the zero configuration of the chain
+        the results are cached and recomputed only when the base or the local transformations change
+        :return: a dict
+        """
+        jlc = self.jlc_object
+        key = (np.asarray(jlc.pos).tobytes() + np.asarray(jlc.rotmat).tobytes() + jlc._jnt_types.tobytes() +
+               jlc._jnt_loc_homomat.tobytes() + jlc._jnt_loc_motionax.tobytes())
+        if self._geometry_cache is not None and self._geometry_cache[0] == key:
+            return self._geometry_cache[1]
+        gl_homomatq = jlc._accumulate_fk(np.zeros_like(jlc._jnt_motion_vals))
+        axes = np.einsum('jab,jb->ja', gl_homomatq[1:7, :3, :3], jlc._jnt_loc_motionax[1:7])
+        axes = axes / np.linalg.norm(axes, axis=1, keepdims=True)
+        positions = gl_homomatq[1:7, :3, 3]
+        a1, a2, a3, a4, a5, a6 = axes
+        geometry = {'gl_homomats': gl_homomatq, 'axes': axes, 'positions': positions}
+        # check the UR geometry
+        a5_x_a6 = np.cross(a5, a6)
+        geometry['is_ur'] = bool(np.all(jlc._jnt_type_mask('revolute')[1:7]) and
+                                 abs(a1 @ a2) < 1e-6 and abs(a4 @ a5) < 1e-6 and
+                                 np.linalg.norm(np.cross(a2, a3)) < 1e-6 and np.linalg.norm(np.cross(a2, a4)) < 1e-6 and
+                                 np.linalg.norm(a5_x_a6) > 1e-6 and
+                                 abs((positions[5] - positions[4]) @ a5_x_a6) / np.linalg.norm(a5_x_a6) < 1e-6)
+        if not geometry['is_ur']:
+            self._geometry_cache = (key, geometry)
+            return geometry
+        geometry['skewmats'] = np.array([[[0, -ax[2], ax[1]], [ax[2], 0, -ax[0]], [-ax[1], ax[0], 0]] for ax in axes])
+        geometry['outermats'] = geometry['skewmats'] @ geometry['skewmats']
+        # wrist center, the intersection of jnt5 and jnt6
+        n = np.cross(a6, a5_x_a6)
+        geometry['wrist'] = positions[4] + a5 * ((positions[5] - positions[4]) @ n) / (a5 @ n)
+        geometry['a1_x_a2'] = np.cross(a1, a2)
+        # q5: a*cos(q5)+b*sin(q5) = the projection of a6 onto a2 - c
+        geometry['q5_coeffs'] = np.array([a2 @ a6 - (a2 @ a5) * (a5 @ a6), a2 @ a5_x_a6, (a2 @ a5) * (a5 @ a6)])
+        # q3: the origin of jnt4 rotates around jnt3, its distance to jnt2 decides q3
+        u = positions[3] - positions[2]
+        u_p = u - a3 * (a3 @ u)
+        w = positions[1] - positions[2]
+        w_p = w - a3 * (a3 @ w)
+        geometry['q3_coeffs'] = np.array([u_p @ u_p + w_p @ w_p,
+                                          max(2 * np.linalg.norm(u_p) * np.linalg.norm(w_p), 1e-12),
+                                          (a3 @ (positions[3] - positions[1])) ** 2,
+                                          math.atan2(np.cross(u_p, w_p) @ a3, u_p @ w_p)])
+        self._geometry_cache = (key, geometry)
+        return geometry
+
+    def is_applicable(self, tcp_jntid):
+        """
+        check if the chain and the tcp fit the UR geometry
+        :param tcp_jntid: the tcp must be rigidly attached to the last link
+        :return: True or False
+        """
+        jlc = self.jlc_object
+        if tcp_jntid not in [-1, jlc.ndof, jlc.ndof + 1]:
+            return False
+        if list(jlc.tgtjnts) != list(range(1, 7)):
+            return False
+        return self._geometry()['is_ur']
+
+    @staticmethod
+    def _rotmats(geometry, id, angles):
+        """
+        rodrigues formula for the axis of joint id+1 and an nparray of angles
+        :return: nparray with the shape of angles + (3, 3)
+        """
+        angles = angles[..., np.newaxis, np.newaxis]
+        return np.eye(3) + np.sin(angles) * geometry['skewmats'][id] + \
+               (1 - np.cos(angles)) * geometry['outermats'][id]
+
+    @staticmethod
+    def _subproblem1(geometry, id, u, v, default):
+        """
+        the angles to rotate vectors u around the axis of joint id+1 to reach v (Paden-Kahan subproblem 1)
+        :param u, v: ...x3 nparrays
+        :param default: the angles to use where they are undetermined (u or v on the axis)
+        :return: ... nparray
+        """
+        ax = geometry['axes'][id]
+        u_ax = u @ ax
+        v_ax = v @ ax
+        # ax.(u_p x v_p) = -u.(ax x v), u_p.v_p = u.v - (u.ax)(v.ax)
+        angles = np.arctan2(-(u * (v @ geometry['skewmats'][id].T)).sum(axis=-1), (u * v).sum(axis=-1) - u_ax * v_ax)
+        is_undetermined = ((u * u).sum(axis=-1) - u_ax * u_ax < 1e-18) | ((v * v).sum(axis=-1) - v_ax * v_ax < 1e-18)
+        return np.where(is_undetermined, default, angles)
+
+    @staticmethod
+    def _acos_pm(phi, cos_val):
+        """
+        phi +- acos(cos_val)
+        :return: [angles, is_solvable], ...x2 and ... nparrays; cos_val beyond [-1, 1] is clipped and marked unsolvable
+        """
+        is_solvable = np.abs(cos_val) <= 1 + 1e-9
+        delta = np.arccos(np.minimum(np.maximum(cos_val, -1.0), 1.0))  # np.clip is slow
+        return np.stack([phi + delta, phi - delta], axis=-1), is_solvable
+
+    def _wrap_to_rng(self, jnt_values, seed_jnt_values):
+        """
+        shift the joint values by 2pi to be near the seed, and then into the joint ranges
+        :param jnt_values: ...x6 nparray
+        :param seed_jnt_values: nparray that broadcasts to jnt_values
+        :return: [jnt_values, is_inrng], ...x6 and ... nparrays
+        """
+        jmvmin = self.jlc_object._jnt_motion_rng[1:7, 0]
+        jmvmax = self.jlc_object._jnt_motion_rng[1:7, 1]
+        results = jnt_values + 2 * math.pi * np.round((seed_jnt_values - jnt_values) / (2 * math.pi))
+        results = np.where(results > jmvmax, results - 2 * math.pi, results)
+        results = np.where(results < jmvmin, results + 2 * math.pi, results)
+        is_inrng = ((results >= jmvmin - 1e-9) & (results <= jmvmax + 1e-9)).all(axis=-1)
+        return np.minimum(np.maximum(results, jmvmin), jmvmax), is_inrng
+
+    def _solve(self, tgt_pos_array, tgt_rotmat_array, seed_jnt_values_array, tcp_jntid, tcp_loc_pos, tcp_loc_rotmat):
+        """
+        the 8 closed-form branches (shoulder, wrist, elbow) of m goals
+        :param tgt_pos_array: mx3 nparray
+        :param tgt_rotmat_array: mx3x3 nparray
+        :param seed_jnt_values_array: mx6 nparray, used at singularities and to pick among 2pi-shifted values
+        :return: [jnt_values, is_valid], mx8x6 and mx8 nparrays; invalid branches are unreachable or out of range
+        """
+        geometry = self._geometry()
+        a1, a2, a3, a4, a5, a6 = geometry['axes']
+        p1, p2, p3, p4, p5, p6 = geometry['positions']
+        wrist0 = geometry['wrist']
+        a1_x_a2 = geometry['a1_x_a2']
+        n_goals = len(tgt_pos_array)
+        # g = exp(xi1 q1)...exp(xi6 q6) = tgt_homomat inv(tcp_homomat0), described in the world frame
+        tcp_homomat0 = geometry['gl_homomats'][tcp_jntid] @ rm.homomat_from_posrot(tcp_loc_pos, tcp_loc_rotmat)
+        g_rotmat = tgt_rotmat_array @ tcp_homomat0[:3, :3].T
+        g_pos = tgt_pos_array - g_rotmat @ tcp_homomat0[:3, 3]
+        # the wrist center is not moved by q5 and q6
+        wrist = g_rotmat @ wrist0 + g_pos
+        # q1 (2 branches, m*2): the wrist center stays in a plane perpendicular to the parallel axes
+        v = wrist - p1
+        a = v @ a2
+        b = v @ a1_x_a2
+        q1, is_q1_solvable = self._acos_pm(np.arctan2(b, a), (a2 @ (wrist0 - p1)) / np.maximum(np.hypot(a, b), 1e-12))
+        rotmat1 = self._rotmats(geometry, 0, q1)
+        rotmat_r = rotmat1.swapaxes(-1, -2) @ g_rotmat[:, np.newaxis]  # = R(a2, q2+q3+q4) R5 R6
+        # q5 (2x2 branches, m*2*2): the projection of a6 onto a2 is only changed by q5
+        a, b, c = geometry['q5_coeffs']
+        q5, is_q5_solvable = self._acos_pm(math.atan2(b, a), ((rotmat_r @ a6) @ a2 - c) / max(math.hypot(a, b), 1e-12))
+        rotmat5 = self._rotmats(geometry, 4, q5)
+        rotmat_r = rotmat_r[:, :, np.newaxis]
+        # q6: R6 (rotmat_r.T a2) = R5.T a2, undetermined at wrist singularities where the seed is kept
+        q6 = self._subproblem1(geometry, 5, a2 @ rotmat_r, a2 @ rotmat5,
+                               seed_jnt_values_array[:, np.newaxis, np.newaxis, 5])
+        rotmat6 = self._rotmats(geometry, 5, q6)
+        # theta = q2+q3+q4, rotmat234 is a rotation around a2 (a1_x_a2, a1, a2 are orthonormal)
+        rotmat234_x = rotmat_r @ rotmat6.swapaxes(-1, -2) @ rotmat5.swapaxes(-1, -2) @ a1_x_a2
+        theta = np.arctan2(rotmat234_x @ a1, rotmat234_x @ a1_x_a2)
+        # q3 (2x2x2 branches, m*2*2*2): subproblem 3, planar 2R for the origin of jnt4
+        wrist_r = np.einsum('mkba,mb->mka', rotmat1, wrist - p1) + p1
+        p4_tgt = wrist_r[:, :, np.newaxis] - self._rotmats(geometry, 1, theta) @ (wrist0 - p4)
+        uu_ww, two_u_w, offset_sq, theta0 = geometry['q3_coeffs']
+        dist_p_sq = ((p4_tgt - p2) ** 2).sum(axis=-1) - offset_sq
+        q3, is_q3_solvable = self._acos_pm(theta0, (uu_ww - dist_p_sq) / two_u_w)
+        # q2: subproblem 1, q4: the remainder of theta
+        p4_q3 = self._rotmats(geometry, 2, q3) @ (p4 - p3) + p3
+        q2 = self._subproblem1(geometry, 1, p4_q3 - p2, p4_tgt[..., np.newaxis, :] - p2,
+                               seed_jnt_values_array[:, np.newaxis, np.newaxis, np.newaxis, 1])
+        q4 = theta[..., np.newaxis] - q2 - q3
+        jnt_values = np.stack(np.broadcast_arrays(q1[:, :, np.newaxis, np.newaxis], q2, q3, q4,
+                                                  q5[..., np.newaxis], q6[..., np.newaxis]), axis=-1)
+        jnt_values = (jnt_values.reshape(n_goals, 8, 6) + math.pi) % (2 * math.pi) - math.pi
+        jnt_values, is_inrng = self._wrap_to_rng(jnt_values, seed_jnt_values_array[:, np.newaxis])
+        is_solvable = is_q1_solvable[:, np.newaxis, np.newaxis] & is_q5_solvable[:, :, np.newaxis] & is_q3_solvable
+        return jnt_values, np.repeat(is_solvable.reshape(n_goals, 4), 2, axis=1) & is_inrng
+
+    def ik(self,
+           tgt_pos,
+           tgt_rotmat,
+           seed_jnt_values=None,
+           tcp_jntid=None,
+           tcp_loc_pos=None,
+           tcp_loc_rotmat=None,
+           toggle_all_solutions=False):
+        """
+        closed-form ik
+        :param tgt_pos: 1x3 nparray
+        :param tgt_rotmat: 3x3 nparray
+        :param seed_jnt_values: the solution closest to it is returned, the current joint values are used if None
+        :param tcp_jntid: must be the last joint
+        :param tcp_loc_pos: 1x3 nparray, decribed in the local frame of self.jnts[tcp_jntid]
+        :param tcp_loc_rotmat: 3x3 nparray, decribed in the local frame of self.jnts[tcp_jntid]
+        :param toggle_all_solutions: return the list of all (at most 8) solutions sorted by their distances to the seed
+        :return: a 1xn nparray or None; a list if toggle_all_solutions is True
+        """
+        return self.ik_batch([tgt_pos], [tgt_rotmat],
+                             seed_jnt_values=seed_jnt_values,
+                             tcp_jntid=tcp_jntid,
+                             tcp_loc_pos=tcp_loc_pos,
+                             tcp_loc_rotmat=tcp_loc_rotmat,
+                             toggle_all_solutions=toggle_all_solutions)[0]
+
+    def ik_batch(self,
+                 tgt_pos_array,
+                 tgt_rotmat_array,
+                 seed_jnt_values=None,
+                 tcp_jntid=None,
+                 tcp_loc_pos=None,
+                 tcp_loc_rotmat=None,
+                 toggle_all_solutions=False):
+        """
+        closed-form ik of many goals at once
+        :param tgt_pos_array: mx3 nparray
+        :param tgt_rotmat_array: mx3x3 nparray
+        :param seed_jnt_values: None (the current joint values), a 1xn nparray shared by all goals, or a mxn nparray
+        :param tcp_jntid: must be the last joint
+        :param tcp_loc_pos: 1x3 nparray, decribed in the local frame of self.jnts[tcp_jntid]
+        :param tcp_loc_rotmat: 3x3 nparray, decribed in the local frame of self.jnts[tcp_jntid]
+        :param toggle_all_solutions: return all solutions of each goal (sorted by their distances to the seed)
+        :return: a list of m elements, each is the solution closest to the seed or None;
+                 each is a list of solutions if toggle_all_solutions is True
+        """
+        jlc = self.jlc_object
+        if tcp_jntid is None:
+            tcp_jntid = jlc.tcp_jntid
+        if tcp_loc_pos is None:
+            tcp_loc_pos = jlc.tcp_loc_pos
+        if tcp_loc_rotmat is None:
+            tcp_loc_rotmat = jlc.tcp_loc_rotmat
+        tgt_pos_array = np.asarray(tgt_pos_array, dtype=np.float64).reshape(-1, 3)
+        tgt_rotmat_array = np.asarray(tgt_rotmat_array, dtype=np.float64).reshape(-1, 3, 3)
+        if seed_jnt_values is None:
+            seed_jnt_values = jlc.get_jnt_values()
+        seed_jnt_values_array = np.array(seed_jnt_values, dtype=np.float64).reshape(-1, 6)
+        if len(seed_jnt_values_array) == 1:
+            seed_jnt_values_array = np.tile(seed_jnt_values_array, (len(tgt_pos_array), 1))
+        jnt_values, is_valid = self._solve(tgt_pos_array, tgt_rotmat_array, seed_jnt_values_array,
+                                           tcp_jntid, tcp_loc_pos, tcp_loc_rotmat)
+        dist = np.where(is_valid, ((jnt_values - seed_jnt_values_array[:, np.newaxis]) ** 2).sum(axis=-1), np.inf)
+        if not toggle_all_solutions:
+            best_ids = np.argmin(dist, axis=1)
+            return [jnt_values[i, id] if is_valid[i, id] else None for i, id in enumerate(best_ids)]
+        results = []
+        for i in range(len(tgt_pos_array)):
+            solutions = []
+            for id in np.argsort(dist[i])[:is_valid[i].sum()]:
+                # coinciding branches at singularities are removed
+                if not any(np.abs(jnt_values[i, id] - x).max() < 1e-6 for x in solutions):
+                    solutions.append(jnt_values[i, id])
+            results.append(solutions)
+        return results
@@ -1,6 +1,5 @@
 import math
 import numpy as np
-import basis.robot_math as rm
 
 
 class Jnt(object):
@@ -18,8 +17,8 @@ class Jnt(object):
                  rng_max=+math.pi,
                  motion_val=.0,
                  p_name=None,
-                 chd_name_list=[],
-                 lnk_name_dict={}):
+                 chd_name_list=None,
+                 lnk_name_dict=None):
         self.name = name
         self.type = type
         self.loc_pos = loc_pos
@@ -34,8 +33,8 @@ class Jnt(object):
         self.rng_max = rng_max
         self.motion_val = motion_val
         self.p_name = p_name  # a single value
-        self.chd_name_list = chd_name_list  # a list, may include only a single value
-        self.lnk_name_dict = lnk_name_dict  # a dictionary, {chd_name: lnk_name, ...}
+        self.chd_name_list = [] if chd_name_list is None else chd_name_list  # a list, may include only a single value
+        self.lnk_name_dict = {} if lnk_name_dict is None else lnk_name_dict  # a dictionary, {chd_name: lnk_name, ...}
 
 
 class Lnk(object):
@@ -52,6 +51,7 @@ class Lnk(object):
                  collisionmodel=None,
                  rgba=np.array([.7, .7, .7, 1])):
         self.name = name
+        self.refjnt_name = refjnt_name  # the link moves with the gl_posq and gl_rotmatq of this joint
         self.loc_pos = loc_pos
         self.loc_rotmat = loc_rotmat
         self.gl_pos = gl_pos
@@ -66,7 +66,10 @@ class Lnk(object):
 
 class JLTree(object):
     """
-    Define Joint Links using Networkx DiGraph
+    Define Joint Links as a tree, the joints are connected by p_name and chd_name_list
+    the tree is compiled into flat arrays in a topological order (see self._compile) and fk, jacobian, and change_base
+    run over the arrays; the compilation is redone only when the structure or the local transformations change
+    (see self._compile_key)
     """
 
     def __init__(self, position=np.zeros(3), rotmat=np.eye(3), initconf=np.zeros(6), name='manipulator'):
@@ -81,143 +84,247 @@ class JLTree(object):
         self.rotmat = np.array(rotmat)
         self.ndof = initconf.shape[0]
         self.jntrng_safemargin = 0
-        # base: an nx1 list of compactly connected nodes, comprises at least two jnt_names
-        self.jnt_collection, self.lnk_collection, self._base = self._initjntlnks()
-        self.tgtjnt_ids = ['jnt' + str(id) for id in range(self.ndof)]
+        # base: an nx1 list of compactly connected nodes, their gl_posq and gl_rotmatq are fixed
+        self.jnt_collection, self.lnk_collection, self._base = self._initgraph()
+        self.tgtjnt_names = [self.name + '_j' + str(id) for id in range(self.ndof)]
+        self._compiled = None
+        self._compiled_key = None
+        self.fk(jnt_motion_vals=initconf.tolist())
 
     def _initgraph(self):
         """
-        :return:  jnt_collection, lnk_collection,
+        :return:  jnt_collection, lnk_collection, base
         """
         # links
         lnk_collection = {}
         lnk_name = self.name + '_lnk_f0j0'
-        lnk_collection[lnk_name] = Lnk()
+        lnk_collection[lnk_name] = Lnk(name=lnk_name, refjnt_name=self.name + '_f0')
         for id in range(self.ndof - 1):
-            lnk_name = self.name + '_link_j' + str(id) + 'j' + str(id + 1)
-            lnk_collection[lnk_name] = Lnk()
-        lnk_name = self.name + '_link_j' + str(self.ndof - 1) + 'f1'
-        lnk_collection[lnk_name] = Lnk()
+            lnk_name = self.name + '_lnk_j' + str(id) + 'j' + str(id + 1)
+            lnk_collection[lnk_name] = Lnk(name=lnk_name, refjnt_name=self.name + '_j' + str(id))
+        lnk_name = self.name + '_lnk_j' + str(self.ndof - 1) + 'f1'
+        lnk_collection[lnk_name] = Lnk(name=lnk_name, refjnt_name=self.name + '_j' + str(self.ndof - 1))
         # joints
         jnt_collection = {}
         jnt_name = self.name + '_f0'
-        jnt_collection[jnt_name] = Jnt(type='fixed')
+        jnt_collection[jnt_name] = Jnt(name=jnt_name, type='fixed', loc_pos=self.position, loc_rotmat=self.rotmat)
         jnt_collection[jnt_name].p_name = None
         jnt_collection[jnt_name].chd_name_list = [self.name + '_j0']
-        jnt_collection[jnt_name].lnk_name_dict[self.name + '_j0'] = [self.name + '_lnk_f0j0']
+        jnt_collection[jnt_name].lnk_name_dict[self.name + '_j0'] = self.name + '_lnk_f0j0'
         for id in range(self.ndof):
             jnt_name = self.name + '_j' + str(id)
-            jnt_collection[jnt_name] = Jnt()
-            if id == 0:
-                jnt_collection[jnt_name].p_name = self.name + '_f0'
-                jnt_collection[jnt_name].chd_name_list = [self.name + '_j1']
-                jnt_collection[jnt_name].lnk_name_dict[self.name + '_j1'] = [self.name + '_lnk_f0j1']
-            elif id == self.ndof - 1:
-                jnt_collection[jnt_name].p_name = self.name + '_j' + str(id - 1)
+            jnt_collection[jnt_name] = Jnt(name=jnt_name)
+            jnt_collection[jnt_name].p_name = self.name + '_f0' if id == 0 else self.name + '_j' + str(id - 1)
+            if id == self.ndof - 1:
                 jnt_collection[jnt_name].chd_name_list = [self.name + '_f1']
-                jnt_collection[jnt_name].lnk_name_dict[self.name + '_f1'] = [self.name + '_lnk_j' + str(id) + 'f1']
+                jnt_collection[jnt_name].lnk_name_dict[self.name + '_f1'] = self.name + '_lnk_j' + str(id) + 'f1'
             else:
-                jnt_collection[jnt_name].p_name = self.name + '_j' + str(id - 1)
                 jnt_collection[jnt_name].chd_name_list = [self.name + '_j' + str(id + 1)]
-                jnt_collection[jnt_name].lnk_name_dict[self.name + '_j' + str(id + 1)] = [self.name + '_lnk_j' + str(id) + 'j' + str(id + 1)]
+                jnt_collection[jnt_name].lnk_name_dict[self.name + '_j' + str(id + 1)] = \
+                    self.name + '_lnk_j' + str(id) + 'j' + str(id + 1)
         jnt_name = self.name + '_f1'
-        jnt_collection[jnt_name] = Jnt(type='fixed')
-        jnt_collection[jnt_name].p_name = self.name + '_joint' + str(self.ndof - 1)
+        jnt_collection[jnt_name] = Jnt(name=jnt_name, type='fixed')
+        jnt_collection[jnt_name].p_name = self.name + '_j' + str(self.ndof - 1)
         jnt_collection[jnt_name].chd_name_list = []
         jnt_collection[jnt_name].lnk_name_dict = {}
-        return jnt_collection, lnk_collection, [self.name + '_fixed0', self.name + '_joint0']
+        return jnt_collection, lnk_collection, [self.name + '_f0']
 
-    def _update_jnt_fk(self, jnt_name):
+    def _compile_key(self):
         """
-        update fk tree recursively
-        author: weiwei
-        date: 20201204osaka
+        everything used by self._compile, the motion values are excluded
+        the local transformations are compared by their values, so that modifying them in place is also detected
         """
-        p_jnt_name = self.jnt_collection[jnt_name].p_name
-        cur_jnt = self.jnt_collection[jnt_name]
-        # update gl_pos0 and gl_rotmat0
-        if p_jnt_name is None:
-            cur_jnt.gl_pos0 = cur_jnt.loc_pos
-            cur_jnt.gl_rotmat0 = cur_jnt.loc_rotmat
-        else:
-            p_jnt = self.jnt_collection[p_jnt_name]
-            curjnt_loc_pos = np.dot(p_jnt.gl_rotmatq, cur_jnt.loc_pos)
-            cur_jnt.gl_pos0 = p_jnt.gl_posq + curjnt_loc_pos
-            cur_jnt.gl_rotmat0 = np.dot(p_jnt.gl_rotmatq, cur_jnt.loc_rotmat)
-            cur_jnt.gl_motionax = np.dot(cur_jnt.gl_rotmat0, cur_jnt.loc_motionax)
-        # update gl_pos_q and gl_rotmat_q
-        if cur_jnt.type == "dummy":
-            cur_jnt.gl_posq = cur_jnt.gl_pos0
-            cur_jnt.gl_rotmatq = cur_jnt.gl_rotmat0
-        elif cur_jnt.type == "revolute":
-            cur_jnt.gl_posq = cur_jnt.gl_pos0
-            curjnt_loc_rotmat = rm.rotmat_from_axangle(cur_jnt.loc_motionax, cur_jnt.motion_val)
-            cur_jnt.gl_rotmatq = np.dot(cur_jnt.gl_rotmat0, curjnt_loc_rotmat)
-        elif cur_jnt.type == "prismatic":
-            cur_jnt.gl_posq = cur_jnt.gl_pos0 + cur_jnt.motion_val * cur_jnt.loc_motionax
-            cur_jnt.gl_rotmatq = cur_jnt.gl_rotmat0
-        else:
-            raise ValueError("The given joint type is not available!")
-        for each_jnt_name in cur_jnt.chd_name_list:
-            self._update_jnt_fk(each_jnt_name)
+        key = [tuple(self._base), tuple(self.tgtjnt_names)]
+        loc_values = []
+        for jnt_name, jnt in self.jnt_collection.items():
+            key.append((jnt_name, jnt.type, jnt.p_name, tuple(jnt.chd_name_list)))
+            loc_values += [jnt.loc_pos, jnt.loc_rotmat, jnt.loc_motionax]
+        for lnk_name, lnk in self.lnk_collection.items():
+            key.append((lnk_name, lnk.refjnt_name))
+            loc_values += [lnk.loc_pos, lnk.loc_rotmat]
+        key.append(b''.join([np.asarray(value, dtype=np.float64).tobytes() for value in loc_values]))
+        return tuple(key)
 
-    def _update_jnt_fk_faster(self, jnt_name):
+    def _compile(self):
         """
-        is this fastedr than _update_jnt_fk?
+        flatten the tree into arrays
+        the joints are traversed from the base joints; a joint reached from its child (the base is below it)
+        is marked as reversed, its pose is computed by inverting the transformations of the child
+        the joints are grouped into levels (the distance to the base), the joints in a level are computed at once
+        the joint values are copied from the jnt_collection to self._compiled['motion_vals'] by self._update_fk
+        :return:
         author: weiwei
-        date: 20201203osaka
+        date: 20201204osaka
         """
-        while jnt_name is not None:
-            cur_jnt = self.jnt_collection[jnt_name]
-            p_jnt_name = cur_jnt.p_name
-            # update gl_pos0 and gl_rotmat0
-            if p_jnt_name is None:
-                cur_jnt.gl_pos0 = cur_jnt.loc_pos
-                cur_jnt.gl_rotmat0 = cur_jnt.loc_rotmat
+        jnt_names = list(self.jnt_collection.keys())
+        jnt_ids = {jnt_name: id for id, jnt_name in enumerate(jnt_names)}
+        njnts = len(jnt_names)
+        jnts = [self.jnt_collection[jnt_name] for jnt_name in jnt_names]
+        loc_homomats = np.tile(np.eye(4), (njnts, 1, 1))
+        loc_motionax = np.zeros((njnts, 3))
+        is_revolute = np.zeros(njnts, dtype=bool)
+        is_prismatic = np.zeros(njnts, dtype=bool)
+        for id, jnt in enumerate(jnts):
+            loc_homomats[id, :3, :3] = jnt.loc_rotmat
+            loc_homomats[id, :3, 3] = jnt.loc_pos
+            loc_motionax[id] = jnt.loc_motionax
+            if jnt.type == "revolute":
+                is_revolute[id] = True
+            elif jnt.type == "prismatic":
+                is_prismatic[id] = True
+            elif jnt.type not in ["fixed", "dummy"]:
+                raise ValueError("The given joint type is not available!")
+        # breadth-first traversal from the base over the undirected tree
+        parent_ids = np.full(njnts, -1)
+        is_reversed = np.zeros(njnts, dtype=bool)
+        depths = np.full(njnts, -1)
+        base_ids = [jnt_ids[jnt_name] for jnt_name in self._base]
+        depths[base_ids] = 0
+        queue = list(base_ids)
+        for id in queue:
+            jnt = jnts[id]
+            neighbors = [(jnt_ids[chd_name], False) for chd_name in jnt.chd_name_list]
+            if jnt.p_name is not None:
+                neighbors.append((jnt_ids[jnt.p_name], True))
+            for nb_id, nb_is_reversed in neighbors:
+                if depths[nb_id] < 0:
+                    depths[nb_id] = depths[id] + 1
+                    parent_ids[nb_id] = id
+                    is_reversed[nb_id] = nb_is_reversed
+                    queue.append(nb_id)
+        if np.any(depths < 0):
+            raise ValueError("Some joints are not connected to the base!")
+        # [(ids, parent_ids), ...], a level with a single joint uses int ids for fast indexing
+        levels = []
+        for depth in range(1, depths.max() + 1):
+            level_ids = np.flatnonzero(depths == depth)
+            if len(level_ids) == 1:
+                levels.append((int(level_ids[0]), int(parent_ids[level_ids[0]])))
             else:
-                p_jnt = self.jnt_collection[p_jnt_name]
-                curjnt_loc_pos = np.dot(p_jnt.gl_rotmatq, cur_jnt.loc_pos)
-                cur_jnt.gl_pos0 = p_jnt.gl_posq + curjnt_loc_pos
-                cur_jnt.gl_rotmat0 = np.dot(p_jnt.gl_rotmatq, cur_jnt.loc_rotmat)
-                cur_jnt.gl_motionax = np.dot(cur_jnt.gl_rotmat0, cur_jnt.loc_motionax)
-            # update gl_pos_q and gl_rotmat_q
-            if cur_jnt.type == "dummy":
-                cur_jnt.gl_posq = cur_jnt.gl_pos0
-                cur_jnt.gl_rotmatq = cur_jnt.gl_rotmat0
-            elif cur_jnt.type == "revolute":
-                cur_jnt.gl_posq = cur_jnt.gl_pos0
-                curjnt_loc_rotmat = rm.rotmat_from_axangle(cur_jnt.loc_motionax, cur_jnt.motion_val)
-                cur_jnt.gl_rotmatq = np.dot(cur_jnt.gl_rotmat0, curjnt_loc_rotmat)
-            elif cur_jnt.type == "prismatic":
-                cur_jnt.gl_posq = cur_jnt.gl_pos0 + cur_jnt.motion_val * cur_jnt.loc_motionax
-                cur_jnt.gl_rotmatq = cur_jnt.gl_rotmat0
+                levels.append((level_ids, parent_ids[level_ids]))
+        # motion_signs[i, j] = +1/-1 if the motion of joint j moves joint i forward/reversely, see self.jacobian
+        motion_signs = np.zeros((njnts, njnts))
+        for id in queue[len(base_ids):]:
+            motion_signs[id] = motion_signs[parent_ids[id]]
+            if is_reversed[id]:
+                motion_signs[id, parent_ids[id]] = -1
             else:
-                raise ValueError("The given joint type is not available!")
-            for each_jnt_name in cur_jnt.chd_name_list:
-                self._update_jnt_fk(each_jnt_name)
+                motion_signs[id, id] = 1
+        lnk_names = list(self.lnk_collection.keys())
+        lnk_loc_homomats = np.tile(np.eye(4), (len(lnk_names), 1, 1))
+        for id, lnk_name in enumerate(lnk_names):
+            lnk_loc_homomats[id, :3, :3] = self.lnk_collection[lnk_name].loc_rotmat
+            lnk_loc_homomats[id, :3, 3] = self.lnk_collection[lnk_name].loc_pos
+        # rodrigues constants of the unit motion axes
+        unit_axes = loc_motionax / np.maximum(np.linalg.norm(loc_motionax, axis=1, keepdims=True), 1e-12)
+        skewmats = np.zeros((njnts, 3, 3))
+        skewmats[:, 0, 1], skewmats[:, 0, 2], skewmats[:, 1, 2] = -unit_axes[:, 2], unit_axes[:, 1], -unit_axes[:, 0]
+        skewmats -= skewmats.transpose(0, 2, 1)
+        self._compiled = {'jnt_names': jnt_names,
+                          'jnt_ids': jnt_ids,
+                          'loc_homomats': loc_homomats,
+                          'loc_motionax': loc_motionax,
+                          'is_revolute': is_revolute,
+                          'is_prismatic': is_prismatic,
+                          'skewmats': skewmats,
+                          'outermats': unit_axes[:, :, np.newaxis] * unit_axes[:, np.newaxis, :],
+                          'base_ids': np.array(base_ids),
+                          'parent_ids': parent_ids,
+                          'is_reversed': is_reversed,
+                          'reversed_ids': np.flatnonzero(is_reversed),
+                          'forward_ids': np.flatnonzero((parent_ids >= 0) & ~is_reversed),
+                          'levels': levels,
+                          'motion_signs': motion_signs,
+                          'motion_vals': np.array([jnt.motion_val for jnt in jnts], dtype=np.float64),
+                          'tgtjnt_ids': np.array([jnt_ids[jnt_name] for jnt_name in self.tgtjnt_names], dtype=int),
+                          'lnk_names': lnk_names,
+                          'lnk_refjnt_ids': np.array([jnt_ids[self.lnk_collection[lnk_name].refjnt_name]
+                                                      for lnk_name in lnk_names], dtype=int),
+                          'lnk_loc_homomats': lnk_loc_homomats,
+                          'gl_homomat0': np.tile(np.eye(4), (njnts, 1, 1)),
+                          'gl_homomatq': np.tile(np.eye(4), (njnts, 1, 1))}
+        # the base joints keep their current global poses
+        for id in base_ids:
+            if jnts[id].p_name is None:  # the original root, fixed at loc_pos and loc_rotmat
+                self._compiled['gl_homomatq'][id] = loc_homomats[id] @ self._motion_homomats(id)
+            else:
+                self._compiled['gl_homomatq'][id, :3, :3] = jnts[id].gl_rotmatq
+                self._compiled['gl_homomatq'][id, :3, 3] = jnts[id].gl_posq
+        self._compiled_key = self._compile_key()
 
-    def _update_lnk_fk(self, base=None):
+    def _motion_homomats(self, ids=slice(None)):
         """
-        note:
-        author: weiwei
-        date: 20201203osaka
+        the homogeneous transformations caused by the motion of the joints, computed at once
+        :param ids: joint ids in self._compiled
+        :return: n*4*4 nparray
+        """
+        compiled = self._compiled
+        motion_vals = compiled['motion_vals'][ids]
+        angles = np.where(compiled['is_revolute'][ids], motion_vals, 0)[..., np.newaxis, np.newaxis]
+        cos_angles = np.cos(angles)
+        homomats = np.zeros(np.shape(motion_vals) + (4, 4))
+        homomats[..., :3, :3] = cos_angles * np.eye(3) + np.sin(angles) * compiled['skewmats'][ids] + \
+                                (1 - cos_angles) * compiled['outermats'][ids]
+        homomats[..., :3, 3] = np.where(compiled['is_prismatic'][ids], motion_vals, 0)[..., np.newaxis] * \
+                               compiled['loc_motionax'][ids]
+        homomats[..., 3, 3] = 1
+        return homomats
+
+    @staticmethod
+    def _inv_homomats(homomats):
+        """
+        the inverses of rigid transformations
+        :param homomats: n*4*4 nparray
+        :return:
         """
-        for lnk_name in self.lnk_collection.keys():
-            cur_lnk = self.lnk_collection[lnk_name]
-            ref_jnt = self.jnt_collection[cur_lnk.refjnt_name]
-            cur_lnk.gl_pos = np.dot(ref_jnt.gl_rotmatq, cur_lnk.loc_pos) + ref_jnt.gl_posq
-            cur_lnk.gl_rotmat = np.dot(ref_jnt.gl_rotmatq, cur_lnk.loc_rotmat)
+        inv_homomats = np.zeros_like(homomats)
+        inv_homomats[:, :3, :3] = homomats[:, :3, :3].transpose(0, 2, 1)
+        inv_homomats[:, :3, 3] = -np.einsum('nji,nj->ni', homomats[:, :3, :3], homomats[:, :3, 3])
+        inv_homomats[:, 3, 3] = 1
+        return inv_homomats
 
-    def _update_fk(self, base=None):
-        if base is None:
-            base = self._base
-        for jnt_name in base:
-            for chd_name in self.jnt_collection[jnt_name].chd_name_list:
-                if chd_name not in base:
-                    self._update_jnt_fk(jnt_name=chd_name)
-        self._update_lnk_fk()
+    def _update_fk(self):
+        """
+        compute the global poses of the joints level by level, and write them to the jnt_collection and lnk_collection
+        forward: gl0[i] = glq[parent] @ loc[i], glq[i] = gl0[i] @ motion[i]
+        reversed: glq[i] = glq[parent] @ inv(motion[parent]) @ inv(loc[parent]), gl0[i] = glq[i] @ inv(motion[i])
+        :return:
+        """
+        if self._compiled is None or self._compiled_key != self._compile_key():
+            self._compile()
+        else:
+            self._compiled['motion_vals'][:] = [jnt.motion_val for jnt in self.jnt_collection.values()]
+        compiled = self._compiled
+        parent_ids = compiled['parent_ids']
+        loc_homomats = compiled['loc_homomats']
+        motion_homomats = self._motion_homomats()
+        # the transformation from the parent to each joint
+        edge_homomats = loc_homomats @ motion_homomats
+        reversed_ids = compiled['reversed_ids']
+        if len(reversed_ids) > 0:
+            edge_homomats[reversed_ids] = self._inv_homomats(edge_homomats[parent_ids[reversed_ids]])
+        gl_homomatq = compiled['gl_homomatq']
+        for level_ids, level_parent_ids in compiled['levels']:
+            gl_homomatq[level_ids] = gl_homomatq[level_parent_ids] @ edge_homomats[level_ids]
+        gl_homomat0 = compiled['gl_homomat0']
+        gl_homomat0[:] = gl_homomatq @ self._inv_homomats(motion_homomats)
+        forward_ids = compiled['forward_ids']
+        gl_homomat0[forward_ids] = gl_homomatq[parent_ids[forward_ids]] @ loc_homomats[forward_ids]
+        gl_motionax = np.einsum('nij,nj->ni', gl_homomat0[:, :3, :3], compiled['loc_motionax'])
+        lnk_gl_homomats = gl_homomatq[compiled['lnk_refjnt_ids']] @ compiled['lnk_loc_homomats']
+        for id, jnt_name in enumerate(compiled['jnt_names']):
+            jnt = self.jnt_collection[jnt_name]
+            jnt.gl_pos0 = gl_homomat0[id, :3, 3].copy()
+            jnt.gl_rotmat0 = gl_homomat0[id, :3, :3].copy()
+            jnt.gl_motionax = gl_motionax[id]
+            jnt.gl_posq = gl_homomatq[id, :3, 3].copy()
+            jnt.gl_rotmatq = gl_homomatq[id, :3, :3].copy()
+        for id, lnk_name in enumerate(compiled['lnk_names']):
+            lnk = self.lnk_collection[lnk_name]
+            lnk.gl_pos = lnk_gl_homomats[id, :3, 3]
+            lnk.gl_rotmat = lnk_gl_homomats[id, :3, :3]
 
-    def fk(self, root=None, jnt_motion_vals=None):
+    def fk(self, jnt_motion_vals=None):
         """
         move the joints using forward kinematics
         :param jnt_motion_vals: a nx1 list, each element indicates the value of a joint (in radian or meter);
@@ -226,63 +333,65 @@ class JLTree(object):
         author: weiwei
         date: 20161205, 20201009osaka
         """
-        if isinstance(jnt_motion_vals, list):
+        if isinstance(jnt_motion_vals, (list, np.ndarray)):
             if len(jnt_motion_vals) != len(self.tgtjnt_names):
                 raise ValueError("The number of given joint motion values must be coherent with self.tgtjnt_names!")
-            counter = 0
-            for jnt_name in self.tgtjnt_names:
-                self.jnt_collection[jnt_name].motion_val = jnt_motion_vals[counter]
-                counter += 1
+            jnt_motion_vals = dict(zip(self.tgtjnt_names, jnt_motion_vals))
         if isinstance(jnt_motion_vals, dict):
-            pass
+            for jnt_name, motion_val in jnt_motion_vals.items():
+                self.jnt_collection[jnt_name].motion_val = motion_val
         self._update_fk()
 
+    def jacobian(self, tcp_jnt_name=None, tcp_loc_pos=np.zeros(3)):
+        """
+        the jacobian of a tcp attached to the gl_posq and gl_rotmatq of tcp_jnt_name, w.r.t. self.tgtjnt_names
+        the columns of the joints that do not move the tcp are zero;
+        the joints between the base and the tcp move the tcp reversely if the base is below them
+        :param tcp_jnt_name: the last joint of self.tgtjnt_names is used if None
+        :param tcp_loc_pos: 1x3 nparray, described in the local frame of tcp_jnt_name
+        :return: 6xn nparray
+        """
+        if self._compiled is None or self._compiled_key != self._compile_key():
+            self._update_fk()
+        compiled = self._compiled
+        if tcp_jnt_name is None:
+            tcp_jnt_name = self.tgtjnt_names[-1]
+        tcp_id = compiled['jnt_ids'][tcp_jnt_name]
+        tgtjnt_ids = compiled['tgtjnt_ids']
+        gl_homomat0 = compiled['gl_homomat0'][tgtjnt_ids]
+        gl_motionax = np.einsum('nij,nj->ni', gl_homomat0[:, :3, :3], compiled['loc_motionax'][tgtjnt_ids])
+        gl_tcp_pos = compiled['gl_homomatq'][tcp_id, :3, :3] @ tcp_loc_pos + compiled['gl_homomatq'][tcp_id, :3, 3]
+        signs = compiled['motion_signs'][tcp_id, tgtjnt_ids]
+        is_revolute = compiled['is_revolute'][tgtjnt_ids, np.newaxis]
+        is_prismatic = compiled['is_prismatic'][tgtjnt_ids, np.newaxis]
+        diffq = gl_tcp_pos - gl_homomat0[:, :3, 3]
+        cross = gl_motionax[:, [1, 2, 0]] * diffq[:, [2, 0, 1]] - gl_motionax[:, [2, 0, 1]] * diffq[:, [1, 2, 0]]
+        j = np.zeros((6, len(tgtjnt_ids)))
+        j[:3] = (signs[:, np.newaxis] * (cross * is_revolute + gl_motionax * is_prismatic)).T
+        j[3:] = (signs[:, np.newaxis] * gl_motionax * is_revolute).T
+        return j
+
     def change_base(self, base):
         """
         two joints determine a base
         notes:
-        # if a joint is a child, the family flow below it alway goes downward
-        # if a joint has a parent, the family flow is not clear. The original base might be above it at some where
-        # thus, we only need to reverse the parent
+        # the gl_posq and gl_rotmat_q of the base joints are fixed at their current values
+        # the family relations (p_name, chd_name_list) are kept; the joints above the base are computed reversely
+        # in the compiled arrays, see self._compile
         # when a list jnt_names is set to be a base, the family relation among them is ignored but kept
         # they will be udpated when another list is set as the base
-        :param base: an nx1 list of compactly connected nodes, comprises at least two jnt_names
+        :param base: an nx1 list of compactly connected nodes
         :return:
         author: weiwei
         date: 20201203
         """
-        self._base = base
-        for jnt_name in base:
-            cur_jnt = self.jnt_collection[jnt_name]
-            cur_jnt.loc_pos = cur_jnt.gl_posq
-            cur_jnt.loc_rotmat = cur_jnt.gl_posq
-            if cur_jnt.p_name not in base:  # each joint has only one parent joint
-                p_jnt_name = cur_jnt.p_name
-                cur_jnt.p_name = None
-                while p_jnt_name is not None:
-                    # reverse all parents of cur_jnt
-                    p_jnt = self.jnt_collection[p_jnt_name]
-                    p_jnt.p_name = jnt_name
-                    cur_jnt.chd_name_list = cur_jnt.chd_name_list + [p_jnt_name]
-                    p_jnt.chd_name_list.remove(jnt_name)
-                    # reverse lnk
-                    lnk_name = p_jnt.lnk_name_dict[jnt_name]
-                    cur_jnt.lnk_name_dict[p_jnt_name] = lnk_name
-                    p_lnk = self.lnk_collection[lnk_name]
-                    p_lnk.loc_pos = p_jnt.loc_pos + np.dot(p_jnt.loc_rotmat, p_lnk.loc_pos)
-                    p_lnk.loc_rotmat = np.dot(p_jnt.loc_rotmat, p_lnk.loc_rotmat)
-                    # TODO
-                    # p_lnk.com = com
-                    # p_lnk.intertia = intertia
-                    # p_lnk.mass = mass
-                    # reverse rotation
-                    p_jnt.loc_motionax = -p_jnt.loc_motionax
-                    # iteration
-                    p_jnt.lnk_name_dict.pop[jnt_name]
-                    cur_jnt = p_jnt
-                    p_jnt_name = cur_jnt.p_name
-                    cur_jnt.p_name = None
+        self._base = list(base)
+        self._compile()
+        self._update_fk()
 
 
 if __name__ == '__main__':
-    jl = JntLnks()
+    jlt = JLTree(initconf=np.zeros(6))
+    jlt.fk(jnt_motion_vals=[0, math.pi / 6, 0, math.pi / 3, 0, 0])
+    print(jlt.jnt_collection['manipulator_f1'].gl_posq)
+    print(jlt.jacobian())
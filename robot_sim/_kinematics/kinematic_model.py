@@ -0,0 +1,199 @@
+"""
+an immutable and picklable kinematic model of a jlchain, and pure functions (fk, jacobian, ik) over it
+the model only holds nparrays, numbers, and strings; it can be sent to worker processes once
+and reused for many queries without copying the robot (panda3d nodes, colliders, etc.)
+usage:
+    model = robot_s.get_kinematic_model("arm")
+    with multiprocessing.Pool(initializer=..., initargs=(model,)) as pool: ...
+    lnk_homomats, tcp_homomat = km.fk(model, jnt_values)
+"""
+import collections
+import numpy as np
+import basis.robot_math as rm
+import robot_sim._kinematics.jlchain_ik as jlik
+
+_FIELDS = ['name',
+           'base_homomat',  # 4x4, the pose of the chain when the model is exported
+           'jnt_types',  # njnts, the codes of robot_sim._kinematics.jlchain._JNT_TYPES
+           'jnt_loc_homomat',  # njnts*4*4
+           'jnt_loc_motionax',  # njnts*3
+           'jnt_motion_rng',  # njnts*2
+           'jnt_motion_vals',  # njnts, the values of the joints that are not in tgtjnt_ids
+           'jnt_skewmats',  # njnts*3*3, the rodrigues constants of the unit motion axes
+           'jnt_outermats',  # njnts*3*3
+           'tgtjnt_ids',  # ndof
+           'homeconf',  # ndof
+           'lnk_loc_homomat',  # nlnks*4*4
+           'lnk_cd_descriptors',  # nlnks tuples (name, meshfile, scale), meshfile is None for links without meshes
+           'cdprimitive_type',
+           'cdmesh_type',
+           'tcp_jntid',
+           'tcp_loc_homomat']  # 4x4
+
+
+class KinematicModel(collections.namedtuple('KinematicModel', _FIELDS)):
+    """
+    the nparrays are read-only, use model._replace(...) to derive a new model (e.g. a new base_homomat)
+    """
+    __slots__ = ()
+
+    def __new__(cls, *args, **kwargs):
+        model = super().__new__(cls, *args, **kwargs)
+        for value in model:
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+        return model
+
+    @property
+    def ndof(self):
+        return len(self.tgtjnt_ids)
+
+
+def from_jlchain(jlc, name=None):
+    """
+    export the current state of a jlchain
+    :param jlc: a robot_sim._kinematics.jlchain.JLChain object, with a single tcp
+    :param name:
+    :return: a KinematicModel
+    """
+    if isinstance(jlc.tcp_jntid, (list, tuple, np.ndarray)):
+        raise ValueError("The kinematic model supports a single tcp only, set tcp_jntid to a single joint id first!")
+    is_revolute = jlc._jnt_type_mask('revolute')
+    is_prismatic = jlc._jnt_type_mask('prismatic')
+    unit_axes = np.zeros_like(jlc._jnt_loc_motionax)
+    is_moving = np.logical_or(is_revolute, is_prismatic)
+    unit_axes[is_moving] = jlc._jnt_loc_motionax[is_moving] / np.linalg.norm(jlc._jnt_loc_motionax[is_moving],
+                                                                              axis=1, keepdims=True)
+    skewmats = np.zeros((len(unit_axes), 3, 3))
+    skewmats[:, 0, 1], skewmats[:, 0, 2], skewmats[:, 1, 2] = -unit_axes[:, 2], unit_axes[:, 1], -unit_axes[:, 0]
+    skewmats -= skewmats.transpose(0, 2, 1)
+    lnk_cd_descriptors = tuple((lnk['name'], lnk['meshfile'], tuple(lnk['scale'])) for lnk in jlc.lnks)
+    return KinematicModel(name=jlc.name if name is None else name,
+                          base_homomat=rm.homomat_from_posrot(jlc.pos, jlc.rotmat),
+                          jnt_types=jlc._jnt_types.copy(),
+                          jnt_loc_homomat=jlc._jnt_loc_homomat.copy(),
+                          jnt_loc_motionax=jlc._jnt_loc_motionax.copy(),
+                          jnt_motion_rng=jlc._jnt_motion_rng.copy(),
+                          jnt_motion_vals=jlc._jnt_motion_vals.copy(),
+                          jnt_skewmats=skewmats,
+                          jnt_outermats=unit_axes[:, :, np.newaxis] * unit_axes[:, np.newaxis, :],
+                          tgtjnt_ids=np.array(jlc._tgtjnt_ids, dtype=int),
+                          homeconf=np.array(jlc.homeconf, dtype=np.float64),
+                          lnk_loc_homomat=jlc._lnk_loc_homomat.copy(),
+                          lnk_cd_descriptors=lnk_cd_descriptors,
+                          cdprimitive_type=jlc.cdprimitive_type,
+                          cdmesh_type=jlc.cdmesh_type,
+                          tcp_jntid=int(jlc.tcp_jntid),
+                          tcp_loc_homomat=rm.homomat_from_posrot(jlc.tcp_loc_pos, jlc.tcp_loc_rotmat))
+
+
+def _jnt_gl_homomatq(model, jnt_values):
+    """
+    the global poses of all joints after their motions
+    :param model:
+    :param jnt_values: ndof nparray, or mxndof nparray
+    :return: njnts*4*4 or m*njnts*4*4 nparray
+    """
+    jnt_values = np.asarray(jnt_values, dtype=np.float64)
+    motion_vals = np.broadcast_to(model.jnt_motion_vals, jnt_values.shape[:-1] + model.jnt_motion_vals.shape).copy()
+    motion_vals[..., model.tgtjnt_ids] = jnt_values
+    # rodrigues, see JLChain._motion_homomats
+    is_revolute = model.jnt_types == 1
+    is_prismatic = model.jnt_types == 2
+    angles = np.where(is_revolute, motion_vals, 0)[..., np.newaxis, np.newaxis]
+    cos_angles = np.cos(angles)
+    motion_homomats = np.zeros(motion_vals.shape + (4, 4))
+    motion_homomats[..., :3, :3] = cos_angles * np.eye(3) + np.sin(angles) * model.jnt_skewmats + \
+                                   (1 - cos_angles) * model.jnt_outermats
+    motion_homomats[..., :3, 3] = np.where(is_prismatic, motion_vals, 0)[..., np.newaxis] * model.jnt_loc_motionax
+    motion_homomats[..., 3, 3] = 1
+    loc_motion_homomats = model.jnt_loc_homomat @ motion_homomats
+    gl_homomatq = np.empty_like(motion_homomats)
+    gl_homomatq[..., 0, :, :] = model.base_homomat @ motion_homomats[..., 0, :, :]  # loc pose of jnt 0 is ignored
+    for id in range(1, gl_homomatq.shape[-3]):
+        np.matmul(gl_homomatq[..., id - 1, :, :], loc_motion_homomats[..., id, :, :], out=gl_homomatq[..., id, :, :])
+    return gl_homomatq
+
+
+def fk(model, jnt_values):
+    """
+    :param model:
+    :param jnt_values: ndof nparray, or mxndof nparray for a batch of configurations
+    :return: [lnk_homomats, tcp_homomat], nlnks*4*4 and 4x4 nparrays (with a leading m for a batch)
+    """
+    gl_homomatq = _jnt_gl_homomatq(model, jnt_values)
+    lnk_homomats = gl_homomatq[..., :len(model.lnk_loc_homomat), :, :] @ model.lnk_loc_homomat
+    tcp_homomat = gl_homomatq[..., model.tcp_jntid, :, :] @ model.tcp_loc_homomat
+    return lnk_homomats, tcp_homomat
+
+
+def _jacobian_from_homomatq(model, gl_homomatq):
+    jids = model.tgtjnt_ids
+    is_revolute = (model.jnt_types[jids] == 1)[:, np.newaxis]
+    is_prismatic = (model.jnt_types[jids] == 2)[:, np.newaxis]
+    tgt_gl_homomatq = gl_homomatq[..., jids, :, :]
+    grax = np.einsum('...jab,jb->...ja', tgt_gl_homomatq[..., :3, :3], model.jnt_loc_motionax[jids])
+    tcp_pos = (gl_homomatq[..., model.tcp_jntid, :, :] @ model.tcp_loc_homomat)[..., :3, 3]
+    diffq = tcp_pos[..., np.newaxis, :] - tgt_gl_homomatq[..., :3, 3]
+    cross = grax[..., [1, 2, 0]] * diffq[..., [2, 0, 1]] - grax[..., [2, 0, 1]] * diffq[..., [1, 2, 0]]
+    j = np.zeros(gl_homomatq.shape[:-3] + (6, len(jids)))
+    j[..., :3, :] = np.swapaxes(cross * is_revolute + grax * is_prismatic, -1, -2)
+    j[..., 3:, :] = np.swapaxes(grax * is_revolute, -1, -2)
+    tcp_jntid = model.tcp_jntid % len(model.jnt_types)
+    j[..., :, jids > tcp_jntid] = 0
+    return j
+
+
+def jacobian(model, jnt_values):
+    """
+    the jacobian of the tcp (including tcp_loc_pos) w.r.t. the target joints
+    :param model:
+    :param jnt_values: ndof nparray, or mxndof nparray for a batch of configurations
+    :return: 6xndof nparray, or mx6xndof nparray
+    """
+    return _jacobian_from_homomatq(model, _jnt_gl_homomatq(model, jnt_values))
+
+
+def ik(model, tgt_pos, tgt_rotmat, seed_jnt_values=None, max_niter=100, wln_ratio=.05):
+    """
+    numerical ik using the same weighted least-norm update as JLChainIK.num_ik_batch,
+    local minima are reported as failures (local_minima="end")
+    :param model:
+    :param tgt_pos: 1x3 nparray, or mx3 nparray for a batch of goals
+    :param tgt_rotmat: 3x3 nparray, or mx3x3 nparray
+    :param seed_jnt_values: None (homeconf), a 1xn nparray, or a mxn nparray
+    :param max_niter:
+    :param wln_ratio: the ratio of the joint ranges where the motion is damped
+    :return: a 1xn nparray or None; a list of them for a batch of goals
+    """
+    is_batch = np.ndim(tgt_pos) == 2
+    tgt_pos_array = np.asarray(tgt_pos, dtype=np.float64).reshape(-1, 3)
+    tgt_rotmat_array = np.asarray(tgt_rotmat, dtype=np.float64).reshape(-1, 3, 3)
+    n_goals, ndof = len(tgt_pos_array), model.ndof
+    if seed_jnt_values is None:
+        seed_jnt_values = model.homeconf
+    jnt_values_iter = np.array(np.broadcast_to(seed_jnt_values, (n_goals, ndof)), dtype=np.float64)
+    jnt_values_ref = jnt_values_iter.copy()
+    jmvmin, jmvmax = model.jnt_motion_rng[model.tgtjnt_ids].T
+    errnormlast = np.zeros(n_goals)
+    results = [None] * n_goals
+    active = np.arange(n_goals)
+    for _ in range(max_niter):
+        if len(active) == 0:
+            break
+        jnt_values = jnt_values_iter[active]
+        gl_homomatq = _jnt_gl_homomatq(model, jnt_values)
+        tcp_gl_homomat = gl_homomatq[:, model.tcp_jntid] @ model.tcp_loc_homomat
+        err, errnorm = jlik.tcp_error_batch(tcp_gl_homomat, tgt_pos_array[active], tgt_rotmat_array[active])
+        is_solved = errnorm < 1e-6
+        for id in np.flatnonzero(is_solved):
+            results[active[id]] = jnt_values[id].copy()
+        is_updated = np.logical_and(~is_solved, np.abs(errnorm - errnormlast[active]) >= 1e-12)
+        j = _jacobian_from_homomatq(model, gl_homomatq[is_updated])
+        err, errnorm, jnt_values = err[is_updated], errnorm[is_updated], jnt_values[is_updated]
+        active = active[is_updated]
+        jnt_values_iter[active] = jlik.wln_step_batch(j, err, errnorm, jnt_values,
+                                                      .1 * (jnt_values_ref[active] - jnt_values),
+                                                      jmvmin, jmvmax, wln_ratio)
+        errnormlast[active] = errnorm
+    return results if is_batch else results[0]
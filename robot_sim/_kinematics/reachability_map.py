@@ -0,0 +1,270 @@
+import math
+import numpy as np
+import basis.robot_math as rm
+
+
+class ReachabilityMap(object):
+    """
+    a voxel grid over the workspace of a jlchain, built by sampling the forward kinematics
+    each voxel keeps a bit mask of the reached tcp approaching directions (the z axes of the tcp, binned to
+    n_dirs directions evenly distributed on a sphere), the number of samples, and the maximum manipulability
+    the grid is described in the local frame of the base, it stays valid after the chain is moved by fix_to
+    the tcp used in the queries must be the same as the one used to build the map, see is_tcp_matched
+    """
+
+    def __init__(self, jlc_object, resolution=.05, n_dirs=32):
+        """
+        :param jlc_object:
+        :param resolution: the edge length of the voxels
+        :param n_dirs: the number of approaching directions, at most 64
+        """
+        if n_dirs > 64:
+            raise ValueError("The number of approaching directions must be no more than 64!")
+        self.jlc_object = jlc_object
+        self.resolution = resolution
+        self.dirs = self._fibonacci_sphere(n_dirs)
+        self.origin = np.zeros(3)  # the local position of the corner of voxel [0, 0, 0]
+        self.dir_masks = np.zeros((0, 0, 0), dtype=np.uint64)
+        self.n_samples = np.zeros((0, 0, 0), dtype=np.uint32)
+        self.manipulability = np.zeros((0, 0, 0), dtype=np.float32)
+        self.tcp = None
+
+    @staticmethod
+    def _fibonacci_sphere(n_dirs):
+        ids = np.arange(n_dirs) + .5
+        polar = np.arccos(1 - 2 * ids / n_dirs)
+        azimuth = math.pi * (1 + 5 ** .5) * ids
+        return np.stack((np.cos(azimuth) * np.sin(polar), np.sin(azimuth) * np.sin(polar), np.cos(polar)), axis=1)
+
+    def _get_jlc_tcp(self, tcp_jntid=None, tcp_loc_pos=None, tcp_loc_rotmat=None):
+        """
+        :return: (tcp_jntid, tcp_loc_pos, tcp_loc_rotmat), self.jlc_object.tcp_xxx are used for the None values
+        """
+        jlc = self.jlc_object
+        if tcp_jntid is None:
+            tcp_jntid = jlc.tcp_jntid
+        if tcp_loc_pos is None:
+            tcp_loc_pos = jlc.tcp_loc_pos
+        if tcp_loc_rotmat is None:
+            tcp_loc_rotmat = jlc.tcp_loc_rotmat
+        return tcp_jntid, np.array(tcp_loc_pos, dtype=np.float64), np.array(tcp_loc_rotmat, dtype=np.float64)
+
+    @staticmethod
+    def _is_signature_matched(signature_a, signature_b):
+        for key, value in signature_a.items():
+            value, other_value = np.asarray(value), np.asarray(signature_b[key])
+            if other_value.shape != value.shape or not np.allclose(other_value, value, equal_nan=True):
+                return False
+        return True
+
+    @staticmethod
+    def _tcp_signature(tcp):
+        """
+        :param tcp: (tcp_jntid, tcp_loc_pos, tcp_loc_rotmat)
+        :return:
+        """
+        return {'tcp_jntid': np.asarray(tcp[0]), 'tcp_loc_pos': tcp[1], 'tcp_loc_rotmat': tcp[2]}
+
+    def _signature(self, tcp):
+        jlc = self.jlc_object
+        return {'jnt_loc_homomat': jlc._jnt_loc_homomat,
+                'jnt_loc_motionax': jlc._jnt_loc_motionax,
+                'jnt_motion_rng': jlc._jnt_motion_rng,
+                'tgtjnt_ids': np.asarray(jlc._tgtjnt_ids),
+                **self._tcp_signature(tcp)}
+
+    def is_tcp_matched(self, tcp_jntid=None, tcp_loc_pos=None, tcp_loc_rotmat=None):
+        """
+        if the map was built for the given tcp
+        :param tcp_jntid, tcp_loc_pos, tcp_loc_rotmat: self.jlc_object.tcp_xxx are used if None
+        :return:
+        """
+        if self.tcp is None:
+            return False
+        tcp = self._get_jlc_tcp(tcp_jntid, tcp_loc_pos, tcp_loc_rotmat)
+        return self._is_signature_matched(self._tcp_signature(tcp), self._tcp_signature(self.tcp))
+
+    def _to_loc(self, pos_array, rotmat_array):
+        """
+        :return: [loc_pos_array, loc_approach_dirs], mx3 nparrays
+        """
+        base_rotmat = np.asarray(self.jlc_object.rotmat)
+        loc_pos_array = (np.asarray(pos_array, dtype=np.float64).reshape(-1, 3) - self.jlc_object.pos) @ base_rotmat
+        loc_dirs = np.asarray(rotmat_array, dtype=np.float64).reshape(-1, 3, 3)[:, :, 2] @ base_rotmat
+        return loc_pos_array, loc_dirs
+
+    def _voxel_ids(self, loc_pos_array):
+        """
+        :return: [ids, is_inside], ids is a mx3 int nparray, is_inside is a 1xm bool nparray
+        """
+        ids = np.floor((loc_pos_array - self.origin) / self.resolution).astype(int)
+        is_inside = np.all((ids >= 0) & (ids < self.dir_masks.shape), axis=1)
+        ids[~is_inside] = 0
+        return ids, is_inside
+
+    def _dir_bits(self, loc_dirs):
+        return np.left_shift(np.uint64(1), np.argmax(loc_dirs @ self.dirs.T, axis=1).astype(np.uint64))
+
+    def _dilated_dir_bits(self, loc_dirs):
+        """
+        the bits of all directions within the spacing of the directions, used in building to avoid false negatives
+        at the borders of the direction bins
+        """
+        cos_spacing = math.cos(math.sqrt(4 * math.pi / len(self.dirs)))
+        is_near = (loc_dirs @ self.dirs.T) >= cos_spacing
+        return np.bitwise_or.reduce(np.where(is_near, np.left_shift(np.uint64(1), np.arange(len(self.dirs),
+                                                                                          dtype=np.uint64)),
+                                             np.uint64(0)), axis=1) | self._dir_bits(loc_dirs)
+
+    def build(self, n_samples=1000000, batch_size=20000, n_dilations=1, tcp_jntid=None, tcp_loc_pos=None,
+              tcp_loc_rotmat=None):
+        """
+        sample random configurations and register the reached tcp poses
+        :param n_samples:
+        :param batch_size: the number of configurations computed at once
+        :param n_dilations: the reached directions are propagated to the 6-neighbouring voxels n_dilations times,
+                            this reduces the false negatives caused by the sparse sampling
+        :param tcp_jntid, tcp_loc_pos, tcp_loc_rotmat: self.jlc_object.tcp_xxx are used if None
+        :return:
+        """
+        jlc = self.jlc_object
+        self.tcp = self._get_jlc_tcp(tcp_jntid, tcp_loc_pos, tcp_loc_rotmat)
+        tcp_jntid, tcp_loc_pos, tcp_loc_rotmat = self.tcp
+        tcp_loc_homomat = rm.homomat_from_posrot(tcp_loc_pos, tcp_loc_rotmat)
+        jids = jlc._tgtjnt_ids
+        jnt_rngs = jlc._jnt_motion_rng[jids]
+        pos_list = []
+        dir_list = []
+        manipulability_list = []
+        for start in range(0, n_samples, batch_size):
+            n_batch = min(batch_size, n_samples - start)
+            motion_vals = np.tile(jlc._jnt_motion_vals, (n_batch, 1))
+            motion_vals[:, jids] = np.random.uniform(jnt_rngs[:, 0], jnt_rngs[:, 1], (n_batch, len(jids)))
+            gl_homomatq = jlc._accumulate_fk(motion_vals)
+            tcp_gl_homomat = gl_homomatq[:, tcp_jntid] @ tcp_loc_homomat
+            loc_pos_array, loc_dirs = self._to_loc(tcp_gl_homomat[:, :3, 3], tcp_gl_homomat[:, :3, :3])
+            pos_list.append(loc_pos_array)
+            dir_list.append(loc_dirs)
+            # yoshikawa manipulability, see JLChainIK.manipulability
+            j = jlc._ikt._jacobian_batch(gl_homomatq, tcp_jntid)
+            manipulability_list.append(np.sqrt(np.abs(np.linalg.det(j @ j.transpose(0, 2, 1)))))
+        loc_pos_array = np.vstack(pos_list)
+        self.origin = loc_pos_array.min(axis=0) - self.resolution / 2
+        shape = np.floor((loc_pos_array.max(axis=0) - self.origin) / self.resolution).astype(int) + 2
+        self.dir_masks = np.zeros(shape, dtype=np.uint64)
+        self.n_samples = np.zeros(shape, dtype=np.uint32)
+        self.manipulability = np.zeros(shape, dtype=np.float32)
+        ids, _ = self._voxel_ids(loc_pos_array)
+        ids = tuple(ids.T)
+        np.bitwise_or.at(self.dir_masks, ids, self._dilated_dir_bits(np.vstack(dir_list)))
+        for _ in range(n_dilations):
+            dir_masks = self.dir_masks.copy()
+            for axis in range(3):
+                dir_masks[(slice(None),) * axis + (slice(1, None),)] |= \
+                    self.dir_masks[(slice(None),) * axis + (slice(None, -1),)]
+                dir_masks[(slice(None),) * axis + (slice(None, -1),)] |= \
+                    self.dir_masks[(slice(None),) * axis + (slice(1, None),)]
+            self.dir_masks = dir_masks
+        np.add.at(self.n_samples, ids, 1)
+        np.maximum.at(self.manipulability, ids, np.hstack(manipulability_list).astype(np.float32))
+
+    def is_likely_reachable(self, tgt_pos, tgt_rotmat):
+        """
+        O(1) check, a False means the tcp pose was never reached by the samples
+        :param tgt_pos: 1x3 nparray
+        :param tgt_rotmat: 3x3 nparray
+        :return:
+        """
+        return bool(self.is_likely_reachable_batch(tgt_pos, tgt_rotmat)[0])
+
+    def is_likely_reachable_batch(self, tgt_pos_array, tgt_rotmat_array):
+        """
+        :param tgt_pos_array: mx3 nparray
+        :param tgt_rotmat_array: mx3x3 nparray
+        :return: 1xm bool nparray
+        """
+        loc_pos_array, loc_dirs = self._to_loc(tgt_pos_array, tgt_rotmat_array)
+        ids, is_inside = self._voxel_ids(loc_pos_array)
+        dir_masks = self.dir_masks[tuple(ids.T)]
+        return is_inside & (np.bitwise_and(dir_masks, self._dir_bits(loc_dirs)) != 0)
+
+    def reachability_index(self, tgt_pos):
+        """
+        the ratio of the reached approaching directions at tgt_pos
+        :param tgt_pos: 1x3 nparray
+        :return: a value in [0, 1]
+        """
+        loc_pos_array, _ = self._to_loc(tgt_pos, np.eye(3))
+        ids, is_inside = self._voxel_ids(loc_pos_array)
+        if not is_inside[0]:
+            return 0.0
+        return bin(int(self.dir_masks[tuple(ids[0])])).count('1') / len(self.dirs)
+
+    def inverse_reachability(self, tgt_pos, tgt_rotmat, n_yaws=36, base_z=None):
+        """
+        candidate base poses for reaching a tcp pose, the bases are rotated around the global z axis
+        (e.g. manipulators on mobile platforms) and kept at the height base_z
+        :param tgt_pos: 1x3 nparray
+        :param tgt_rotmat: 3x3 nparray
+        :param n_yaws: the number of sampled rotations around the global z axis
+        :param base_z: the height of the base, the current height is used if None
+        :return: [base_pos_array, base_rotmat_array, manipulability_array], sorted by the manipulability
+        """
+        if base_z is None:
+            base_z = self.jlc_object.pos[2]
+        tgt_pos = np.asarray(tgt_pos, dtype=np.float64)
+        approach_dir = np.asarray(tgt_rotmat, dtype=np.float64)[:, 2]
+        voxel_ids = np.stack(np.nonzero(self.dir_masks), axis=1)
+        loc_centers = self.origin + (voxel_ids + .5) * self.resolution
+        dir_masks = self.dir_masks[tuple(voxel_ids.T)]
+        base_pos_list = []
+        base_rotmat_list = []
+        manipulability_list = []
+        for yaw in np.linspace(0, 2 * math.pi, n_yaws, endpoint=False):
+            base_rotmat = rm.rotmat_from_euler(0, 0, yaw) @ self.jlc_object.rotmat
+            dir_bit = self._dir_bits((approach_dir @ base_rotmat)[np.newaxis])[0]
+            base_pos_array = tgt_pos - loc_centers @ base_rotmat.T
+            selection = (np.bitwise_and(dir_masks, dir_bit) != 0) & (
+                    np.abs(base_pos_array[:, 2] - base_z) <= self.resolution / 2)
+            base_pos_list.append(base_pos_array[selection])
+            base_rotmat_list.append(np.tile(base_rotmat, (np.count_nonzero(selection), 1, 1)))
+            manipulability_list.append(self.manipulability[tuple(voxel_ids[selection].T)])
+        manipulability_array = np.hstack(manipulability_list)
+        order = np.argsort(-manipulability_array)
+        return np.vstack(base_pos_list)[order], np.vstack(base_rotmat_list)[order], manipulability_array[order]
+
+    def save(self, path):
+        """
+        :param path: a compressed .npz file
+        :return:
+        """
+        signature = self._signature(self.tcp)
+        np.savez_compressed(path,
+                            resolution=self.resolution,
+                            dirs=self.dirs,
+                            origin=self.origin,
+                            dir_masks=self.dir_masks,
+                            n_samples=self.n_samples,
+                            manipulability=self.manipulability,
+                            **{'signature_' + key: value for key, value in signature.items()})
+
+    def load(self, path, tcp_jntid=None, tcp_loc_pos=None, tcp_loc_rotmat=None):
+        """
+        load a map saved by save; the chain and the tcp must be the same as the ones used to build it
+        :param path: a compressed .npz file
+        :param tcp_jntid, tcp_loc_pos, tcp_loc_rotmat: self.jlc_object.tcp_xxx are used if None
+        :return:
+        """
+        data = np.load(path)
+        tcp = self._get_jlc_tcp(tcp_jntid, tcp_loc_pos, tcp_loc_rotmat)
+        signature = self._signature(tcp)
+        if not all(('signature_' + key) in data for key in signature) or not self._is_signature_matched(
+                signature, {key: data['signature_' + key] for key in signature}):
+            raise ValueError("The reachability map at " + path + " was built for a different kinematic chain or tcp!")
+        self.resolution = float(data['resolution'])
+        self.dirs = data['dirs']
+        self.origin = data['origin']
+        self.dir_masks = data['dir_masks']
+        self.n_samples = data['n_samples']
+        self.manipulability = data['manipulability']
+        self.tcp = tcp
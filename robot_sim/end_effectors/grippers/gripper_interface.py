@@ -1,5 +1,6 @@
 import copy
 import numpy as np
+import modeling.geometric_model as gm
 import modeling.model_collection as mc
 import basis.robot_math as rm
 import robot_sim._kinematics.jlchain as jl
@@ -58,7 +59,6 @@ class GripperInterface(object):
                     for objcm in objcm_list:
                         objcm.show_cdmesh()
                     for point in collided_points:
-                        import modeling.geometric_model as gm
                         gm.gen_sphere(point, radius=.001).attach_to(base)
                     print("collided")
                 return True
@@ -158,3 +158,16 @@ class GripperInterface(object):
                 self_copy.cc.ctrav.addCollider(child, self_copy.cc.chan)
         return self_copy
 
+    def clone(self):
+        """
+        a lightweight copy for planning, the meshes, trimeshes, and collision models are shared with self
+        and must be treated as read-only; the joint values, tcp, objects in hand, and collision checker are copied
+        :return:
+        """
+        self_clone = copy.deepcopy(self, {gm.SHARE_IN_DEEPCOPY: True})
+        # deepcopying colliders are problematic, I have to update it manually
+        if self.cc is not None:
+            for child in self_clone.cc.np.getChildren():
+                self_clone.cc.ctrav.addCollider(child, self_clone.cc.chan)
+        return self_clone
+
@@ -1,6 +1,12 @@
+import os
 import copy
 import numpy as np
+import modeling.geometric_model as gm
+import modeling.sdf as msdf
 import robot_sim._kinematics.collision_checker as cc
+import robot_sim._kinematics.jlchain_ikseed as jlikseed
+import robot_sim._kinematics.reachability_map as rmap
+import robot_sim._kinematics.kinematic_model as km
 
 
 class ManipulatorInterface(object):
@@ -13,6 +19,15 @@ class ManipulatorInterface(object):
         self.jlc = None
         # collision detection
         self.cc = None
+        # ik solvers, 'numerical' (self.jlc.ik) is always available
+        # analytical ones are registered by the child classes as {name: solver}, see register_ik_solver
+        self.ik_solvers = {}
+        self.default_ik_solver = 'numerical'
+        # ik seed database, see enable_ik_seed_db
+        self.ik_seed_db = None
+        self.n_ik_seeds = 3
+        # reachability map, see enable_reachability_map
+        self.reachability_map = None
 
     @property
     def jnts(self):
@@ -69,6 +84,101 @@ class ManipulatorInterface(object):
         if tcp_loc_rotmat is not None:
             self.jlc.tcp_loc_rotmat = tcp_loc_rotmat
 
+    def register_ik_solver(self, name, ik_solver, toggle_default=True):
+        """
+        :param name: the name used by the solver parameter of ik and ik_batch
+        :param ik_solver: an object with is_applicable(tcp_jntid), ik(...) and ik_batch(...), see JLChainURIK
+        :param toggle_default: use it as the default solver
+        :return:
+        """
+        self.ik_solvers[name] = ik_solver
+        if toggle_default:
+            self.default_ik_solver = name
+
+    def enable_ik_seed_db(self, path=None, n_seeds=3, n_samples=0):
+        """
+        warm start the numerical ik using the nearest solved goals
+        the database is filled by successful numerical ik and saved by save_ik_seed_db
+        :param path: a pickle file, loaded if it exists
+        :param n_seeds: the number of nearest seeds tried before the default seed
+        :param n_samples: the number of random configurations used to pre-fill the database
+        :return:
+        """
+        self.ik_seed_db = jlikseed.JLChainIKSeedDB(self.jlc)
+        self.n_ik_seeds = n_seeds
+        if path is not None and os.path.isfile(path):
+            self.ik_seed_db.load(path)
+        if n_samples > 0:
+            self.ik_seed_db.sample(n_samples)
+
+    def disable_ik_seed_db(self):
+        self.ik_seed_db = None
+
+    def save_ik_seed_db(self, path):
+        if self.ik_seed_db is None:
+            raise ValueError("The ik seed database is not enabled!")
+        self.ik_seed_db.save(path)
+
+    def enable_reachability_map(self, path=None, resolution=.05, n_samples=1000000):
+        """
+        the map is built for the current tcp
+        :param path: a compressed .npz file, loaded if it exists and was built for the current chain and tcp,
+                     otherwise the built map is saved to it
+        :param resolution: the edge length of the voxels
+        :param n_samples: the number of random configurations used to build the map
+        :return:
+        """
+        self.reachability_map = rmap.ReachabilityMap(self.jlc, resolution=resolution)
+        if path is not None and os.path.isfile(path):
+            try:
+                self.reachability_map.load(path)
+                return
+            except ValueError as e:
+                print(str(e) + " Rebuilding.")
+        self.reachability_map.build(n_samples=n_samples)
+        if path is not None:
+            self.reachability_map.save(path)
+
+    def disable_reachability_map(self):
+        self.reachability_map = None
+
+    def is_likely_reachable(self, tgt_pos, tgt_rotmat):
+        """
+        a quick check before ik; always True if the reachability map is not enabled, or if it was built for another tcp
+        (e.g. the hand or the tcp was changed after enabling it)
+        :param tgt_pos: 1x3 nparray
+        :param tgt_rotmat: 3x3 nparray
+        :return:
+        """
+        if self.reachability_map is None or not self.reachability_map.is_tcp_matched():
+            return True
+        return self.reachability_map.is_likely_reachable(tgt_pos, tgt_rotmat)
+
+    def _get_ik_seed_db(self, tcp_jntid):
+        """
+        the seed database, or None if it is disabled or does not fit the tcp (e.g. a tcp at a middle joint)
+        """
+        if self.ik_seed_db is None:
+            return None
+        if not self.ik_seed_db.is_applicable(self.jlc.tcp_jntid if tcp_jntid is None else tcp_jntid):
+            return None
+        return self.ik_seed_db
+
+    def _get_ik_solver(self, solver, tcp_jntid):
+        """
+        the registered solver, or None if the numerical ik is to be used
+        a registered solver that does not fit the tcp (e.g. a tcp at a middle joint) falls back to the numerical ik
+        """
+        if solver is None:
+            solver = self.default_ik_solver
+        if solver == 'numerical':
+            return None
+        if solver not in self.ik_solvers:
+            raise ValueError("The ik solver " + solver + " is not registered!")
+        if not self.ik_solvers[solver].is_applicable(self.jlc.tcp_jntid if tcp_jntid is None else tcp_jntid):
+            return None
+        return self.ik_solvers[solver]
+
     def get_gl_tcp(self,
                    tcp_jnt_id=None,
                    tcp_loc_pos=None,
@@ -80,6 +190,17 @@ class ManipulatorInterface(object):
     def get_jnt_ranges(self):
         return self.jlc.get_jnt_ranges()
 
+    def get_lnk_gl_homomats(self, lnk_ids):
+        return self.jlc.get_lnk_gl_homomats(lnk_ids)
+
+    def get_kinematic_model(self):
+        """
+        a picklable snapshot of self.jlc (current pose and tcp) for the pure functions in
+        robot_sim._kinematics.kinematic_model
+        :return:
+        """
+        return km.from_jlchain(self.jlc, name=self.name)
+
     def goto_homeconf(self):
         self.jlc.fk(jnt_values=self.jlc.homeconf)
 
@@ -92,6 +213,14 @@ class ManipulatorInterface(object):
     def fk(self, jnt_values):
         return self.jlc.fk(jnt_values=jnt_values)
 
+    def fk_batch(self, jnt_values_array):
+        """
+        see JLChain.fk_batch; the current state of the manipulator is not changed
+        :param jnt_values_array: nxndof nparray
+        :return: [lnk_homomats, tcp_homomats], n*nlinks*4*4 and n*4*4 nparrays
+        """
+        return self.jlc.fk_batch(jnt_values_array)
+
     def get_jnt_values(self):
         return self.jlc.get_jnt_values()
 
@@ -107,16 +236,103 @@ class ManipulatorInterface(object):
            tcp_loc_pos=None,
            tcp_loc_rotmat=None,
            local_minima="accept",
-           toggle_debug=False):
-        return self.jlc.ik(tgt_pos=tgt_pos,
-                           tgt_rotmat=tgt_rotmat,
-                           seed_jnt_values=seed_jnt_values,
-                           max_niter=max_niter,
-                           tcp_jntid=tcp_jntid,
-                           tcp_loc_pos=tcp_loc_pos,
-                           tcp_loc_rotmat=tcp_loc_rotmat,
-                           local_minima=local_minima,
-                           toggle_debug=toggle_debug)
+           toggle_debug=False,
+           solver=None,
+           toggle_all_solutions=False):
+        """
+        :param solver: 'numerical' or the name of a registered solver, self.default_ik_solver is used if None
+        :param toggle_all_solutions: return a list of solutions sorted by their distances to seed_jnt_values,
+                                     the numerical solver returns at most one
+        other parameters: see JLChain.ik; max_niter, local_minima and toggle_debug only work for the numerical solver
+        :return: a 1xn nparray or None; a list if toggle_all_solutions is True
+        """
+        ik_solver = self._get_ik_solver(solver, tcp_jntid)
+        if ik_solver is not None:
+            return ik_solver.ik(tgt_pos,
+                                tgt_rotmat,
+                                seed_jnt_values=seed_jnt_values,
+                                tcp_jntid=tcp_jntid,
+                                tcp_loc_pos=tcp_loc_pos,
+                                tcp_loc_rotmat=tcp_loc_rotmat,
+                                toggle_all_solutions=toggle_all_solutions)
+        jnt_values = None
+        # the goals of multiple tcps are given as lists, the database only stores the poses of the end joint
+        ik_seed_db = None if isinstance(tgt_pos, list) else self._get_ik_seed_db(tcp_jntid)
+        if ik_seed_db is not None and seed_jnt_values is None:
+            # try the nearest solved goals first; fall back to the default seed if they all end in local minima
+            for nearest_seed_jnt_values in ik_seed_db.query(tgt_pos, tgt_rotmat, k=self.n_ik_seeds,
+                                                            tcp_jntid=tcp_jntid,
+                                                            tcp_loc_pos=tcp_loc_pos,
+                                                            tcp_loc_rotmat=tcp_loc_rotmat):
+                jnt_values = self.jlc.ik(tgt_pos=tgt_pos,
+                                         tgt_rotmat=tgt_rotmat,
+                                         seed_jnt_values=nearest_seed_jnt_values,
+                                         max_niter=max_niter,
+                                         tcp_jntid=tcp_jntid,
+                                         tcp_loc_pos=tcp_loc_pos,
+                                         tcp_loc_rotmat=tcp_loc_rotmat,
+                                         local_minima="end",
+                                         toggle_debug=toggle_debug)
+                if jnt_values is not None:
+                    break
+        if jnt_values is None:
+            jnt_values = self.jlc.ik(tgt_pos=tgt_pos,
+                                     tgt_rotmat=tgt_rotmat,
+                                     seed_jnt_values=seed_jnt_values,
+                                     max_niter=max_niter,
+                                     tcp_jntid=tcp_jntid,
+                                     tcp_loc_pos=tcp_loc_pos,
+                                     tcp_loc_rotmat=tcp_loc_rotmat,
+                                     local_minima=local_minima,
+                                     toggle_debug=toggle_debug)
+        if ik_seed_db is not None and jnt_values is not None:
+            ik_seed_db.add(jnt_values)
+        if toggle_all_solutions:
+            return [] if jnt_values is None else [jnt_values]
+        return jnt_values
+
+    def ik_batch(self,
+                 tgt_pos_array,
+                 tgt_rotmat_array,
+                 seed_jnt_values=None,
+                 max_niter=100,
+                 tcp_jntid=None,
+                 tcp_loc_pos=None,
+                 tcp_loc_rotmat=None,
+                 local_minima="accept",
+                 solver=None):
+        """
+        see JLChain.ik_batch; the current state of the manipulator is not changed
+        :param solver: 'numerical' or the name of a registered solver, self.default_ik_solver is used if None
+        :return: a list of m elements, each is a 1xn nparray or None
+        """
+        ik_solver = self._get_ik_solver(solver, tcp_jntid)
+        if ik_solver is not None:
+            return ik_solver.ik_batch(tgt_pos_array,
+                                      tgt_rotmat_array,
+                                      seed_jnt_values=seed_jnt_values,
+                                      tcp_jntid=tcp_jntid,
+                                      tcp_loc_pos=tcp_loc_pos,
+                                      tcp_loc_rotmat=tcp_loc_rotmat)
+        ik_seed_db = self._get_ik_seed_db(tcp_jntid)
+        if ik_seed_db is not None and seed_jnt_values is None and len(ik_seed_db) > 0:
+            seed_jnt_values = ik_seed_db.query_batch(tgt_pos_array, tgt_rotmat_array, k=1,
+                                                     tcp_jntid=tcp_jntid,
+                                                     tcp_loc_pos=tcp_loc_pos,
+                                                     tcp_loc_rotmat=tcp_loc_rotmat)[:, 0]
+        jnt_values_list = self.jlc.ik_batch(tgt_pos_array=tgt_pos_array,
+                                            tgt_rotmat_array=tgt_rotmat_array,
+                                            seed_jnt_values=seed_jnt_values,
+                                            max_niter=max_niter,
+                                            tcp_jntid=tcp_jntid,
+                                            tcp_loc_pos=tcp_loc_pos,
+                                            tcp_loc_rotmat=tcp_loc_rotmat,
+                                            local_minima=local_minima)
+        if ik_seed_db is not None:
+            solved_jnt_values = [jnt_values for jnt_values in jnt_values_list if jnt_values is not None]
+            if len(solved_jnt_values) > 0:
+                ik_seed_db.add(np.array(solved_jnt_values))
+        return jnt_values_list
 
     def manipulability(self):
         return self.jlc.manipulability()
@@ -163,6 +379,43 @@ class ManipulatorInterface(object):
         return self.cc.is_collided(obstacle_list=obstacle_list,
                                    otherrobot_list=otherrobot_list)
 
+    def gen_lnk_surface_spheres(self, radius=.01):
+        """
+        spheres covering the collision models of the links, in the local frames of the links
+        :param radius: see CollisionModel.gen_surface_spheres
+        :return: [centers, radii, lnk_ids], mx3, m, and m nparrays
+        """
+        centers_list, radii_list, lnk_ids_list = [np.zeros((0, 3))], [np.zeros(0)], [np.zeros(0, dtype=int)]
+        for lnk_id, lnk in enumerate(self.jlc.lnks):
+            if lnk['collisionmodel'] is None:
+                continue
+            centers, radii = lnk['collisionmodel'].gen_surface_spheres(radius=radius)
+            centers_list.append(centers)
+            radii_list.append(radii)
+            lnk_ids_list.append(np.full(len(radii), lnk_id))
+        return np.concatenate(centers_list), np.concatenate(radii_list), np.concatenate(lnk_ids_list)
+
+    def get_clearances_batch(self, jnt_values_array, obstacle_list, sphere_radius=.01):
+        """
+        the clearances between the links and the obstacles for a batch of configurations,
+        computed using the sdfs of the obstacles and the surface spheres of the links;
+        the current state of the manipulator is not changed
+        :param jnt_values_array: nxndof nparray
+        :param obstacle_list: collision models
+        :param sphere_radius: the radius of the surface spheres, the clearances are smaller than the exact ones
+                              by up to twice this value; farther than the sdf padding from the obstacles, they are
+                              smaller by more, see modeling.sdf.SDF.query
+        :return: n x nlnks nparray, negative values are penetrations, inf for links without collision models
+        """
+        lnk_homomats, _ = self.fk_batch(jnt_values_array)
+        centers, radii, lnk_ids = self.gen_lnk_surface_spheres(radius=sphere_radius)
+        sphere_homomats = lnk_homomats[:, lnk_ids]
+        gl_centers = np.einsum('nsij,sj->nsi', sphere_homomats[..., :3, :3], centers) + sphere_homomats[..., :3, 3]
+        sphere_clearances = msdf.query_spheres_clearances(obstacle_list, gl_centers, radii)
+        clearances = np.full((len(lnk_homomats), len(self.jlc.lnks)), np.inf)
+        np.minimum.at(clearances.T, lnk_ids, sphere_clearances.T)
+        return clearances
+
     def show_cdprimit(self):
         self.cc.show_cdprimit()
 
@@ -234,3 +487,16 @@ class ManipulatorInterface(object):
             for child in self_copy.cc.np.getChildren():  # empty NodePathCollection if the np does not have a child
                 self_copy.cc.ctrav.addCollider(child, self_copy.cc.chan)
         return self_copy
+
+    def clone(self):
+        """
+        a lightweight copy for planning, the meshes, trimeshes, and collision models are shared with self
+        and must be treated as read-only; the joint values, tcp, objects in hand, and collision checker are copied
+        :return:
+        """
+        self_clone = copy.deepcopy(self, {gm.SHARE_IN_DEEPCOPY: True})
+        # deepcopying colliders are problematic, I have to update it manually
+        if self.cc is not None:
+            for child in self_clone.cc.np.getChildren():  # empty NodePathCollection if the np does not have a child
+                self_clone.cc.ctrav.addCollider(child, self_clone.cc.chan)
+        return self_clone
@@ -3,6 +3,7 @@ import math
 import numpy as np
 import basis.robot_math as rm
 import robot_sim._kinematics.jlchain as jl
+import robot_sim._kinematics.jlchain_ur_ik as jlurik
 import robot_sim.manipulators.manipulator_interface as mi
 
 
@@ -75,6 +76,8 @@ class UR3(mi.ManipulatorInterface):
         self.jlc.lnks[6]['meshfile'] = os.path.join(this_dir, "meshes", "wrist3.stl")
         self.jlc.lnks[6]['rgba'] = [.5,.5,.5, 1.0]
         self.jlc.reinitialize()
+        # closed-form ik
+        self.register_ik_solver('analytical', jlurik.JLChainURIK(self.jlc))
         # collision detection
         if enable_cc:
             self.enable_cc()
@@ -3,6 +3,7 @@ import math
 import numpy as np
 import basis.robot_math as rm
 import robot_sim._kinematics.jlchain as jl
+import robot_sim._kinematics.jlchain_ur_ik as jlurik
 import robot_sim.manipulators.manipulator_interface as mi
 
 class UR3E(mi.ManipulatorInterface):
@@ -70,6 +71,8 @@ class UR3E(mi.ManipulatorInterface):
         self.jlc.lnks[6]['meshfile'] = os.path.join(this_dir, "meshes", "wrist3.dae")
         self.jlc.lnks[6]['rgba'] = [.5,.5,.5, 1.0]
         self.jlc.reinitialize()
+        # closed-form ik
+        self.register_ik_solver('analytical', jlurik.JLChainURIK(self.jlc))
         # collision checker
         if enable_cc:
             super().enable_cc()
@@ -366,6 +366,45 @@ class Nextage(ri.RobotInterface):
         else:
             raise ValueError("The given component name is not available!")
 
+    def ik_batch(self,
+                 component_name,
+                 tgt_pos_array,
+                 tgt_rotmat_array,
+                 seed_jnt_values=None,
+                 max_niter=100,
+                 tcp_jntid=None,
+                 tcp_loc_pos=None,
+                 tcp_loc_rotmat=None,
+                 local_minima="accept"):
+        if component_name == 'lft_arm' or component_name == 'rgt_arm':
+            old_tgt_jnts = self.manipulator_dict[component_name].tgtjnts
+            self.manipulator_dict[component_name].tgtjnts = range(2, self.manipulator_dict[component_name].ndof + 1)
+            ik_results = self.manipulator_dict[component_name].ik_batch(tgt_pos_array,
+                                                                        tgt_rotmat_array,
+                                                                        seed_jnt_values=seed_jnt_values,
+                                                                        max_niter=max_niter,
+                                                                        tcp_jntid=tcp_jntid,
+                                                                        tcp_loc_pos=tcp_loc_pos,
+                                                                        tcp_loc_rotmat=tcp_loc_rotmat,
+                                                                        local_minima=local_minima)
+            self.manipulator_dict[component_name].tgtjnts = old_tgt_jnts
+            return ik_results
+        elif component_name == 'lft_arm_waist' or component_name == 'rgt_arm_waist':
+            return self.manipulator_dict[component_name].ik_batch(tgt_pos_array,
+                                                                  tgt_rotmat_array,
+                                                                  seed_jnt_values=seed_jnt_values,
+                                                                  max_niter=max_niter,
+                                                                  tcp_jntid=tcp_jntid,
+                                                                  tcp_loc_pos=tcp_loc_pos,
+                                                                  tcp_loc_rotmat=tcp_loc_rotmat,
+                                                                  local_minima=local_minima)
+        elif component_name == 'both_arm':
+            raise NotImplementedError
+        elif component_name == 'all':
+            raise NotImplementedError
+        else:
+            raise ValueError("The given component name is not available!")
+
     def rand_conf(self, component_name):
         """
         override robot_interface.rand_conf
@@ -1,6 +1,8 @@
 import copy
 import numpy as np
+import modeling.geometric_model as gm
 import robot_sim._kinematics.collision_checker as cc
+import robot_sim._kinematics.collision_acm as cacm
 
 
 class RobotInterface(object):
@@ -12,6 +14,7 @@ class RobotInterface(object):
         self.rotmat = rotmat
         # collision detection
         self.cc = None
+        self._collision_cache = None  # see self.enable_collision_cache
         # component map for quick access
         self.manipulator_dict = {}
         self.ft_sensor_dict = {}
@@ -38,6 +41,16 @@ class RobotInterface(object):
     def fk(self, component_name, jnt_values):
         return NotImplementedError
 
+    def fk_batch(self, component_name, jnt_values_array):
+        """
+        batched forward kinematics of a manipulator; the current state of the robot is not changed
+        only the links of the manipulator are computed, the tcp poses include the hand offsets (tcp_loc_pos, etc.)
+        :param component_name:
+        :param jnt_values_array: nxndof nparray
+        :return: [lnk_homomats, tcp_homomats], n*nlinks*4*4 and n*4*4 nparrays
+        """
+        return self.manipulator_dict[component_name].fk_batch(jnt_values_array)
+
     def jaw_to(self, hnd_name, jaw_width):
         self.hnd_dict[hnd_name].jaw_to(jawwidth=jaw_width)
 
@@ -54,7 +67,8 @@ class RobotInterface(object):
            tcp_loc_pos=None,
            tcp_loc_rotmat=None,
            local_minima="accept",
-           toggle_debug=False):
+           toggle_debug=False,
+           solver=None):
         return self.manipulator_dict[component_name].ik(tgt_pos,
                                                         tgt_rotmat,
                                                         seed_jnt_values=seed_jnt_values,
@@ -63,7 +77,44 @@ class RobotInterface(object):
                                                         tcp_loc_pos=tcp_loc_pos,
                                                         tcp_loc_rotmat=tcp_loc_rotmat,
                                                         local_minima=local_minima,
-                                                        toggle_debug=toggle_debug)
+                                                        toggle_debug=toggle_debug,
+                                                        solver=solver)
+
+    def ik_batch(self,
+                 component_name,
+                 tgt_pos_array,
+                 tgt_rotmat_array,
+                 seed_jnt_values=None,
+                 max_niter=100,
+                 tcp_jntid=None,
+                 tcp_loc_pos=None,
+                 tcp_loc_rotmat=None,
+                 local_minima="accept",
+                 solver=None):
+        """
+        solve the ik of many goals at once; the current state of the robot is not changed
+        :param component_name:
+        :param tgt_pos_array: mx3 nparray
+        :param tgt_rotmat_array: mx3x3 nparray
+        :param seed_jnt_values: None, a 1xn nparray shared by all goals, or a mxn nparray
+        :param solver: see ManipulatorInterface.ik
+        :return: a list of m elements, each is a 1xn nparray or None
+        """
+        return self.manipulator_dict[component_name].ik_batch(tgt_pos_array,
+                                                              tgt_rotmat_array,
+                                                              seed_jnt_values=seed_jnt_values,
+                                                              max_niter=max_niter,
+                                                              tcp_jntid=tcp_jntid,
+                                                              tcp_loc_pos=tcp_loc_pos,
+                                                              tcp_loc_rotmat=tcp_loc_rotmat,
+                                                              local_minima=local_minima,
+                                                              solver=solver)
+
+    def is_likely_reachable(self, component_name, tgt_pos, tgt_rotmat):
+        return self.manipulator_dict[component_name].is_likely_reachable(tgt_pos, tgt_rotmat)
+
+    def get_kinematic_model(self, component_name='arm'):
+        return self.manipulator_dict[component_name].get_kinematic_model()
 
     def manipulability(self, component_name='arm'):
         return self.manipulator_dict[component_name].manipulability()
@@ -98,6 +149,70 @@ class RobotInterface(object):
     def cvt_loc_tcp_to_gl(self, manipulator_name, rel_obj_pos, rel_obj_rotmat):
         return self.manipulator_dict[manipulator_name].cvt_loc_tcp_to_gl(rel_obj_pos, rel_obj_rotmat)
 
+    def enable_collision_cache(self, quantization=1e-3, max_size=100000):
+        """
+        memoize the results of is_collided and is_collided_batch by the quantized joint values and base poses of
+        the jlchains (see CollisionChecker.get_jlc_states); the configurations in a quantization cell share a result,
+        coarser cells give more hits but may miss the collisions near the boundaries of obstacles
+        the cache is cleared when the obstacles (ids and poses), the other robots, the attached scene, or the cd
+        elements (e.g. by hold and release) are changed; the least recently used results are dropped at max_size
+        :param quantization: the size of the cells, radian or meter
+        :param max_size:
+        :return:
+        """
+        if self.cc is None:
+            raise ValueError("The collision checker of the robot is not enabled!")
+        self._collision_cache = {'quantization': quantization,
+                                 'max_size': max_size,
+                                 'stamp': None,  # the obstacles, the other robots, and the version of the checker
+                                 'results': {},  # quantized state: is_collided, ordered from the least recently used
+                                 'n_hits': 0,
+                                 'n_misses': 0}
+
+    def disable_collision_cache(self):
+        self._collision_cache = None
+
+    def get_collision_cache_stats(self):
+        """
+        :return: a dictionary of the numbers of hits, misses, and cached results; None if the cache is not enabled
+        """
+        if self._collision_cache is None:
+            return None
+        return {'n_hits': self._collision_cache['n_hits'],
+                'n_misses': self._collision_cache['n_misses'],
+                'n_results': len(self._collision_cache['results'])}
+
+    def _update_collision_cache_stamp(self, obstacle_list, otherrobot_list):
+        stamp = [self.cc.get_version(),
+                 [(id(obstacle), getattr(obstacle, 'version', None)) for obstacle in obstacle_list],  # occupancy maps
+                 np.array([obstacle.get_homomat() for obstacle in obstacle_list]).tobytes(),
+                 [(id(robot), robot.cc.get_version(), robot.cc.get_jlc_states().tobytes())
+                  for robot in otherrobot_list]]
+        if stamp != self._collision_cache['stamp']:
+            self._collision_cache['stamp'] = stamp
+            self._collision_cache['results'] = {}
+
+    def _get_collision_cache_key(self):
+        return np.round(self.cc.get_jlc_states() / self._collision_cache['quantization']).astype(np.int64).tobytes()
+
+    def _get_cached_collision(self, key):
+        """
+        :return: the cached result, None if missed
+        """
+        results = self._collision_cache['results']
+        if key not in results:
+            return None
+        results[key] = results.pop(key)  # the most recently used ones are kept at the end
+        self._collision_cache['n_hits'] += 1
+        return results[key]
+
+    def _set_cached_collision(self, key, is_collided):
+        results = self._collision_cache['results']
+        if len(results) >= self._collision_cache['max_size']:
+            results.pop(next(iter(results)))
+        results[key] = bool(is_collided)
+        self._collision_cache['n_misses'] += 1
+
     def is_collided(self, obstacle_list=[], otherrobot_list=[], toggle_contact_points=False):
         """
         Interface for "is cdprimit collided", must be implemented in child class
@@ -108,11 +223,289 @@ class RobotInterface(object):
         author: weiwei
         date: 20201223
         """
+        if self._collision_cache is not None and not toggle_contact_points:
+            self._update_collision_cache_stamp(obstacle_list, otherrobot_list)
+            key = self._get_collision_cache_key()
+            is_collided = self._get_cached_collision(key)
+            if is_collided is None:
+                is_collided = self.cc.is_collided(obstacle_list=obstacle_list, otherrobot_list=otherrobot_list)
+                self._set_cached_collision(key, is_collided)
+            return is_collided
         collision_info = self.cc.is_collided(obstacle_list=obstacle_list,
                                              otherrobot_list=otherrobot_list,
                                              toggle_contact_points=toggle_contact_points)
         return collision_info
 
+    def is_collided_batch(self, component_name, conf_array, obstacle_list=[], otherrobot_list=[],
+                          stop_at_first=False):
+        """
+        check many configurations of a component at once, e.g. the interpolated configurations of an edge
+        the obstacles are attached to the collision checker only once; the joint values are restored after checking
+        :param component_name:
+        :param conf_array: mxn nparray or a list of 1xn nparrays
+        :param obstacle_list:
+        :param otherrobot_list:
+        :param stop_at_first: stop at the first collided configuration (edge checks), the remaining ones stay False
+        :return: [is_collided_array, first_collided_id], the latter is -1 if none of them is collided
+        """
+        if self.cc is None:
+            # robots without a collision checker implement is_collided by themselves, their joint values are not restored
+            is_collided_array = np.zeros(len(conf_array), dtype=bool)
+            for i, conf in enumerate(conf_array):
+                self.fk(component_name, conf)
+                is_collided_array[i] = self.is_collided(obstacle_list=obstacle_list, otherrobot_list=otherrobot_list)
+                if stop_at_first and is_collided_array[i]:
+                    break
+            collided_ids = np.flatnonzero(is_collided_array)
+            return is_collided_array, int(collided_ids[0]) if len(collided_ids) > 0 else -1
+        jnt_values_bk = self.get_jnt_values(component_name)
+        try:
+            if self._collision_cache is not None:
+                return self._is_collided_batch_cached(component_name, conf_array, obstacle_list, otherrobot_list,
+                                                      stop_at_first)
+            return self.cc.is_collided_batch(lambda i: self.fk(component_name, conf_array[i]),
+                                             len(conf_array),
+                                             obstacle_list=obstacle_list,
+                                             otherrobot_list=otherrobot_list,
+                                             stop_at_first=stop_at_first)
+        finally:
+            self.fk(component_name, jnt_values_bk)
+
+    def _is_collided_batch_cached(self, component_name, conf_array, obstacle_list, otherrobot_list, stop_at_first):
+        """
+        the cached results are returned by the goto_conf_fn of CollisionChecker.is_collided_batch, see its doc
+        """
+        self._update_collision_cache_stamp(obstacle_list, otherrobot_list)
+        missed_keys = {}  # conf id: key
+
+        def goto_conf(i):
+            self.fk(component_name, conf_array[i])
+            key = self._get_collision_cache_key()
+            is_collided = self._get_cached_collision(key)
+            if is_collided is None:
+                missed_keys[i] = key
+            return is_collided
+
+        is_collided_array, first_collided_id = self.cc.is_collided_batch(goto_conf,
+                                                                         len(conf_array),
+                                                                         obstacle_list=obstacle_list,
+                                                                         otherrobot_list=otherrobot_list,
+                                                                         stop_at_first=stop_at_first)
+        for i, key in missed_keys.items():
+            self._set_cached_collision(key, is_collided_array[i])
+        return is_collided_array, first_collided_id
+
+    def is_primitive_collided_batch(self, component_name, conf_array, obstacle_list=[], otherrobot_list=[],
+                                    inflations=None):
+        """
+        a conservative pre-check of many configurations with numpy, see CollisionChecker.is_primitive_collided_batch
+        False means is_collided is also False; True means the configuration may be collided and is_collided is needed
+        the joint values are restored after checking
+        :param component_name:
+        :param conf_array: mxn nparray or a list of 1xn nparrays
+        :param obstacle_list:
+        :param otherrobot_list:
+        :param inflations: len(conf_array) x n_cdelements nparray, see CollisionChecker.is_primitive_collided_batch
+        :return: is_collided_array
+        """
+        jnt_values_bk = self.get_jnt_values(component_name)
+        try:
+            return self.cc.is_primitive_collided_batch(lambda i: self.fk(component_name, conf_array[i]),
+                                                       len(conf_array),
+                                                       obstacle_list=obstacle_list,
+                                                       otherrobot_list=otherrobot_list,
+                                                       inflations=inflations)
+        finally:
+            self.fk(component_name, jnt_values_bk)
+
+    def is_sphere_collided_batch(self, component_name, conf_array, obstacle_list=[], otherrobot_list=[], radius=.01,
+                                 obstacle_representation='sphere_tree', inflations=None):
+        """
+        a conservative check of the meshes of many configurations using sphere trees,
+        see CollisionChecker.is_sphere_collided_batch
+        False means neither the primitives of the self-collision pairs nor the meshes against the obstacles are
+        collided; it is not a pre-check of is_collided, which checks the primitives of the obstacles
+        the joint values are restored after checking
+        :param component_name:
+        :param conf_array: mxn nparray or a list of 1xn nparrays
+        :param obstacle_list:
+        :param otherrobot_list:
+        :param radius:
+        :param obstacle_representation: 'sphere_tree' or 'sdf'
+        :param inflations: len(conf_array) x n_cdelements nparray, see CollisionChecker.is_sphere_collided_batch
+        :return: is_collided_array
+        """
+        jnt_values_bk = self.get_jnt_values(component_name)
+        try:
+            return self.cc.is_sphere_collided_batch(lambda i: self.fk(component_name, conf_array[i]),
+                                                    len(conf_array),
+                                                    obstacle_list=obstacle_list,
+                                                    otherrobot_list=otherrobot_list,
+                                                    radius=radius,
+                                                    obstacle_representation=obstacle_representation,
+                                                    inflations=inflations)
+        finally:
+            self.fk(component_name, jnt_values_bk)
+
+    def gen_swept_radii(self, component_name):
+        """
+        configuration-independent bounds of how far the primitives of the cd elements move when the joints of a
+        component move
+        no point of the primitives of element k moves farther than swept_radii[k] @ np.abs(delta_conf): for a revolute
+        joint, the radius is the chain length from the joint to the last joint moving the element plus the farthest
+        corner of the primitives of the element from that last joint; for a prismatic joint it is 1
+        :param component_name: a component in self.manipulator_dict
+        :return: n_cdelements x ndof nparray
+        """
+        if component_name not in self.manipulator_dict:
+            raise ValueError("The swept radii are only available for the components in manipulator_dict!")
+        jlc = self.manipulator_dict[component_name].jlc
+        tgtjnts = list(jlc.tgtjnts)
+        cdelements = self.cc.all_cdelements
+        # the lengths between successive joints, a prismatic joint may be extended by its motion range
+        jnt_lengths = np.array([np.linalg.norm(jnt['loc_pos']) +
+                                (np.max(np.abs(jnt['motion_rng'])) if jnt['type'] == 'prismatic' else 0)
+                                for jnt in jlc.jnts])
+        jnt_values_bk = self.get_jnt_values(component_name)
+        try:
+            homomats = self.cc.get_cdelement_homomats()
+            # the joints moving each element are found by moving them one by one
+            is_moved = np.zeros((len(cdelements), len(tgtjnts)), dtype=bool)
+            for i in range(len(tgtjnts)):
+                jnt_values = jnt_values_bk.copy()
+                jnt_values[i] += .01
+                self.fk(component_name, jnt_values)
+                is_moved[:, i] = np.any(np.abs(self.cc.get_cdelement_homomats() - homomats) > 1e-9, axis=(1, 2))
+            self.fk(component_name, jnt_values_bk)
+            swept_radii = np.zeros((len(cdelements), len(tgtjnts)))
+            for elem_id in np.flatnonzero(np.any(is_moved, axis=1)):
+                last_id = np.flatnonzero(is_moved[elem_id])[-1]
+                corners = self.cc.get_local_cdsolid_corners(elem_id)
+                reach = np.max(np.linalg.norm(corners @ homomats[elem_id, :3, :3].T + homomats[elem_id, :3, 3] -
+                                              jlc.jnts[tgtjnts[last_id]]['gl_posq'], axis=1), initial=0)
+                for i in np.flatnonzero(is_moved[elem_id]):
+                    if jlc.jnts[tgtjnts[i]]['type'] == 'prismatic':
+                        swept_radii[elem_id, i] = 1
+                    else:
+                        swept_radii[elem_id, i] = np.sum(jnt_lengths[tgtjnts[i] + 1:tgtjnts[last_id] + 1]) + reach
+        finally:
+            self.fk(component_name, jnt_values_bk)
+        return swept_radii
+
+    def is_edge_collided(self, component_name, start_conf, goal_conf, obstacle_list=[], otherrobot_list=[],
+                         min_step=.05, max_step=.2, swept_radii=None):
+        """
+        continuous check of the straight edge between two configurations, by bisection with swept bounds
+        the edge is split into segments no longer than max_step, a segment is certified collision-free if the
+        primitives of the cd elements, inflated by how far they may move within the segment (see gen_swept_radii), are
+        not collided at the middle of the segment (see is_primitive_collided_batch), so no configuration in it is
+        collided for is_collided; the other segments are halved until they are shorter than min_step, where the
+        configurations at their ends are checked by is_collided_batch, the same as a discrete check at the resolution
+        of min_step
+        start_conf is assumed to be collision-free; the joint values are restored after checking
+        :param component_name:
+        :param start_conf:
+        :param goal_conf:
+        :param obstacle_list:
+        :param otherrobot_list:
+        :param min_step: the joint-space length of the shortest segments
+        :param max_step: the joint-space length of the longest segments, the longer ones are inflated too much to be
+                         certified and are only worth halving
+        :param swept_radii: the output of gen_swept_radii, computed if None
+        :return: [is_collided, free_ratio], the edge is free before start_conf + free_ratio * (goal_conf - start_conf)
+        """
+        if swept_radii is None:
+            swept_radii = self.gen_swept_radii(component_name)
+        delta = goal_conf - start_conf
+        length = np.linalg.norm(delta)
+        if length == 0:
+            return False, 1.0
+        # the farthest displacements of the elements per unit of the edge parameter
+        speeds = swept_radii @ np.abs(delta)
+        ends = np.linspace(0, 1, max(int(np.ceil(length / max_step)), 1) + 1)
+        segments = np.stack([ends[:-1], ends[1:]], axis=1)
+        collided_ratio = np.inf
+        while len(segments) > 0:
+            # the segments after a collision do not change the result
+            segments = segments[segments[:, 0] < collided_ratio]
+            if len(segments) == 0:
+                break
+            half_widths = (segments[:, 1] - segments[:, 0]) / 2
+            is_maybe_collided = self.is_primitive_collided_batch(component_name,
+                                                                 start_conf + segments.mean(axis=1)[:, None] * delta,
+                                                                 obstacle_list=obstacle_list,
+                                                                 otherrobot_list=otherrobot_list,
+                                                                 inflations=half_widths[:, None] * speeds)
+            segments = segments[is_maybe_collided]
+            if len(segments) == 0:
+                break
+            # the ends of the short segments are checked exactly along the edge
+            is_short = (segments[:, 1] - segments[:, 0]) * length <= min_step
+            _, first_collided_id = self.is_collided_batch(component_name,
+                                                          start_conf + segments[is_short, 1][:, None] * delta,
+                                                          obstacle_list=obstacle_list,
+                                                          otherrobot_list=otherrobot_list,
+                                                          stop_at_first=True)
+            if first_collided_id >= 0:
+                # the inside of a short segment is not checked, the edge is only known free before its start
+                collided_ratio = min(collided_ratio, segments[is_short][first_collided_id, 0])
+            segments = segments[~is_short]
+            mids = segments.mean(axis=1)
+            segments = np.concatenate([np.stack([segments[:, 0], mids], axis=1),
+                                       np.stack([mids, segments[:, 1]], axis=1)])
+            segments = segments[np.argsort(segments[:, 0])]
+        if collided_ratio == np.inf:
+            return False, 1.0
+        return True, float(collided_ratio)
+
+    def get_clearances_batch(self, component_name, jnt_values_array, obstacle_list, sphere_radius=.01):
+        """
+        the clearances between the links of a manipulator and the obstacles; the current state is not changed
+        see ManipulatorInterface.get_clearances_batch
+        :param component_name:
+        :param jnt_values_array: nxndof nparray
+        :param obstacle_list:
+        :param sphere_radius:
+        :return: n x nlnks nparray
+        """
+        return self.manipulator_dict[component_name].get_clearances_batch(jnt_values_array,
+                                                                          obstacle_list,
+                                                                          sphere_radius=sphere_radius)
+
+    def min_distance(self, obstacle_list=[], max_distance=np.inf):
+        """
+        the minimum distances between the links (cd elements) and the obstacles at the current configuration
+        see CollisionChecker.get_min_distances; repeated queries at the same configuration are answered from a cache
+        :param obstacle_list:
+        :param max_distance: obstacles farther than max_distance are skipped
+        :return: [distances, points, obstacle_points, obstacle_ids], ordered as self.cc.all_cdelements
+        """
+        return self.cc.get_min_distances(obstacle_list=obstacle_list, max_distance=max_distance)
+
+    def enable_auto_acm(self, n_samples=2000, always_ratio=.95, often_ratio=.5):
+        """
+        replace the hand-written self-collision pairs of the links by an allowed-collision matrix sampled from random
+        configurations, the matrix is cached per robot model, see robot_sim._kinematics.collision_acm
+        :param n_samples:
+        :param always_ratio:
+        :param often_ratio:
+        :return: the acm
+        """
+        acm = cacm.gen_acm(self, n_samples=n_samples, always_ratio=always_ratio, often_ratio=often_ratio)
+        self.cc.set_acm(acm)
+        return acm
+
+    def attach_scene(self, scene):
+        """
+        keep the static obstacles of a collision scene attached, see CollisionChecker.attach_scene
+        :param scene: robot_sim._kinematics.collision_scene.CollisionScene
+        :return:
+        """
+        self.cc.attach_scene(scene)
+
+    def detach_scene(self):
+        self.cc.detach_scene()
+
     def show_cdprimit(self):
         self.cc.show_cdprimit()
 
@@ -151,10 +544,28 @@ class RobotInterface(object):
             cdelement['cdprimit_childid'] = -1
         self.cc = None
 
-    def copy(self):
-        self_copy = copy.deepcopy(self)
+    def _deepcopy_with_cc(self, memo=None):
+        """
+        the attached collision scene is shared by the copy instead of being copied
+        """
+        scene = None if self.cc is None else self.cc.detach_scene()
+        self_copy = copy.deepcopy(self, memo)
         # deepcopying colliders are problematic, I have to update it manually
         if self_copy.cc is not None:
             for child in self_copy.cc.np.getChildren():
                 self_copy.cc.ctrav.addCollider(child, self_copy.cc.chan)
+        if scene is not None:
+            self.cc.attach_scene(scene)
+            self_copy.cc.attach_scene(scene)
         return self_copy
+
+    def copy(self):
+        return self._deepcopy_with_cc()
+
+    def clone(self):
+        """
+        a lightweight copy for planning, the meshes, trimeshes, and collision models are shared with self
+        and must be treated as read-only; the joint values, tcp, objects in hand, and collision checker are copied
+        :return:
+        """
+        return self._deepcopy_with_cc({gm.SHARE_IN_DEEPCOPY: True})